@@ -23,11 +23,12 @@ Usage:
 - Auth WebSocket dengan get_user_from_token()
 """
 
+import logging
 import uuid
 from datetime import datetime, timedelta
-from typing import Union, Optional
+from typing import Union, Optional, Tuple
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -39,12 +40,20 @@ from .config import settings
 from .database import get_db
 from .models.role import Role
 from .models.user import User
+from .services.password_hasher import password_hasher
+from .services.principal_cache import Principal, principal_cache
+
+logger = logging.getLogger(__name__)
 
 # Password hashing configuration - pake bcrypt yang proven secure
+# min/max rounds = rounds aktif: hash dengan cost lain dianggap perlu update
+# dan di-rehash otomatis saat login berhasil (lihat authenticate_user)
 pwd_context = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto",
-    bcrypt__rounds=12,  # Strong hashing, computational cost
+    bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS,  # Strong hashing, computational cost
+    bcrypt__min_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
     bcrypt__ident="2b"  # Modern bcrypt variant
 )
 
@@ -134,6 +143,26 @@ def get_password_hash(password: str) -> str:
         return hashlib.sha256(truncated_password.encode()).hexdigest()
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifikasi password sekaligus cek apakah hash perlu di-upgrade.
+
+    Returns:
+        (valid, new_hash) - new_hash berisi hash baru kalau password benar tapi
+        hash lama pakai cost/algoritma yang sudah tidak sesuai config, selain itu None.
+    """
+    try:
+        return pwd_context.verify_and_update(plain_password[:72], hashed_password)
+    except Exception as e:
+        logger.error(f"Error verifying password: {e}")
+        return False, None
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash versi async - bcrypt jalan di pool hashing, bukan di event loop."""
+    return await password_hasher.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None) -> str:
     """
     Buat JWT access token buat authentication.
@@ -231,8 +260,9 @@ async def authenticate_user(email: str, password: str, db: AsyncSession) -> Unio
 
     Authentication flow:
     1. Cari user di database berdasarkan email
-    2. Verify password dengan bcrypt
-    3. Return user object kalau semua valid
+    2. Verify password dengan bcrypt (di pool hashing, di luar event loop)
+    3. Rehash password kalau cost bcrypt di config sudah berubah
+    4. Return user object kalau semua valid
 
     Security features:
     - Email case sensitive (sesuai database)
@@ -255,9 +285,21 @@ async def authenticate_user(email: str, password: str, db: AsyncSession) -> Unio
     result = await db.execute(query)
     user = result.scalar_one_or_none()
 
-    if not user or not verify_password(password, user.password):
+    if not user:
         return None
 
+    # bcrypt jalan di pool hashing supaya login tidak memblokir event loop
+    valid, new_hash = await password_hasher.run(verify_and_update_password, password, user.password)
+    if not valid:
+        return None
+
+    if new_hash:
+        # Cost bcrypt berubah sejak password ini di-hash - simpan hash baru (transparan buat user)
+        user.password = new_hash
+        await db.commit()
+        principal_cache.invalidate_user(user.id)
+        logger.info(f"Password hash user {user.id} di-upgrade ke cost {settings.PASSWORD_BCRYPT_ROUNDS}")
+
     return user
 
 
@@ -450,7 +492,32 @@ def verify_access_token(token: str) -> dict:
         raise JWTError("Invalid token")
 
 
-async def get_current_active_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+async def load_principal(db: AsyncSession, user_id: int) -> Principal | None:
+    """
+    Ambil user beserta role & permissions, lewat principal_cache.
+
+    Cache miss = satu query user + selectinload role/permissions, lalu disalin
+    ke snapshot Principal (frozen, tidak terikat session) dan disimpan. Untuk
+    update data user, ambil object ORM lewat db.get().
+    """
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    version = principal_cache.version(user_id)
+    query = select(User).where(User.id == user_id).options(selectinload(User.role).selectinload(Role.permissions))
+    user = (await db.execute(query)).scalar_one_or_none()
+    if user is None:
+        return None
+
+    principal = Principal.from_user(user)
+    principal_cache.put(user_id, principal, version)
+    return principal
+
+
+async def get_current_active_user(
+    request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+) -> Principal:
     """
     FastAPI dependency buat dapatkan current user dari JWT token.
     Ini function yang dipake di protected endpoints.
@@ -460,7 +527,7 @@ async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Async
         db: Database session (auto inject)
 
     Returns:
-        User object dengan role dan permissions loaded
+        Principal (snapshot read-only user + role + permissions)
 
     Raises:
         HTTPException 401: Kalau token invalid atau user tidak ada
@@ -469,8 +536,8 @@ async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Async
     1. Extract token dari Authorization header
     2. Verify token signature dan expiration
     3. Extract user ID dari token payload
-    4. Query user dari database dengan permissions
-    5. Return user object
+    4. Ambil user + permissions dari principal_cache (query database kalau miss)
+    5. Simpan ke request.state.principal lalu return user object
 
     Usage in FastAPI:
         @router.get("/profile")
@@ -496,12 +563,13 @@ async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Async
     except JWTError:
         raise credentials_exception
 
-    query = select(User).where(User.id == int(user_id)).options(selectinload(User.role).selectinload(Role.permissions))
-    result = await db.execute(query)
-    user = result.scalar_one_or_none()
+    user = await load_principal(db, int(user_id))
 
     if user is None:
         raise credentials_exception
+
+    # Dipakai ulang middleware activity log tanpa decode token / query lagi
+    request.state.principal = user
     return user
 
 
@@ -542,7 +610,7 @@ def has_permission(required_permission: str):
     - Consistent error messages
     """
 
-    async def permission_checker(current_user: User = Depends(get_current_active_user)):
+    async def permission_checker(current_user: Principal = Depends(get_current_active_user)):
         # Ambil semua nama permission yang dimiliki user
         user_permissions = {p.name for p in current_user.role.permissions}
 
@@ -557,7 +625,7 @@ def has_permission(required_permission: str):
 
 
 # --- WEBSOCKET AUTHENTICATION ---
-async def get_user_from_token(token: str, db: AsyncSession) -> User | None:
+async def get_user_from_token(token: str, db: AsyncSession) -> Principal | None:
     """
     Extract user dari JWT token buat WebSocket authentication.
     Mirip get_current_active_user tapi tanpa FastAPI dependencies.
@@ -567,7 +635,7 @@ async def get_user_from_token(token: str, db: AsyncSession) -> User | None:
         db: Database session
 
     Returns:
-        User object kalau valid, None kalau invalid
+        Principal kalau valid, None kalau invalid
 
     Difference dengan HTTP auth:
     - Tidak pake dependency injection
@@ -623,9 +691,7 @@ async def get_user_from_token(token: str, db: AsyncSession) -> User | None:
 
     # Ambil user dari database
     try:
-        query = select(User).where(User.id == int(user_id)).options(selectinload(User.role).selectinload(Role.permissions))
-        user = (await db.execute(query)).scalar_one_or_none()
-        return user
+        return await load_principal(db, int(user_id))
     except (ValueError, Exception) as e:
         # Handle conversion errors and database errors
         import logging
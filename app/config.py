@@ -9,7 +9,7 @@
 # ====================================================================
 
 import os
-from typing import List
+from typing import Dict, List
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -115,6 +115,51 @@ class Settings(BaseSettings):
     # Ini mengurangi frequency refresh token biar lebih efisien
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 120
 
+    # ====================================================================
+    # KONFIGURASI PASSWORD HASHING
+    # ====================================================================
+
+    # Cost factor bcrypt. Kalau diubah, hash lama otomatis di-rehash saat user berhasil login
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+
+    # Thread pool khusus bcrypt (bcrypt melepas GIL, jadi tidak perlu process pool)
+    # Hash/verify tidak lagi jalan di event loop, jadi login tidak memblokir request lain
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Maksimal operasi hash/verify yang boleh antri; lebih dari ini login ditolak 503
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Cache user + role + permissions hasil get_current_active_user (per proses)
+    # TTL membatasi seberapa lama worker lain bisa ketinggalan setelah role/user diubah; 0 = nonaktif
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60.0
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 1000
+
+    # Cache tabel system_settings (maintenance mode, dll) - di-load saat startup,
+    # di-refresh di background setelah TTL. Write lewat /settings langsung update cache
+    SYSTEM_SETTINGS_CACHE_TTL_SECONDS: float = 10.0
+
+    # Activity log (middleware log_requests_and_activity) ditulis batch di background
+    # Flush tiap interval atau tiap batch penuh; kalau queue penuh, log baru dibuang (dihitung)
+    ACTIVITY_LOG_QUEUE_SIZE: int = 10000
+    ACTIVITY_LOG_BATCH_SIZE: int = 200
+    ACTIVITY_LOG_FLUSH_INTERVAL_MS: int = 500
+
+    # ====================================================================
+    # KONFIGURASI LOGGING
+    # ====================================================================
+
+    # Logger cuma enqueue; tulis ke file/console dikerjakan thread QueueListener
+    LOG_ASYNC: bool = True
+    # Kalau queue penuh, record baru dibuang (dihitung di get_logging_stats)
+    LOG_QUEUE_SIZE: int = 10000
+    # "text" (default) atau "json" (JSON lines compact)
+    LOG_FORMAT: str = "text"
+    # Sampling per logger (prefix -> fraksi record < WARNING yang disimpan)
+    # contoh env: LOG_SAMPLING='{"app.services.traffic_monitoring_service": 0.1}'
+    LOG_SAMPLING: Dict[str, float] = {}
+    # Rate limit per logger (prefix -> maksimal record < WARNING per detik)
+    LOG_RATE_LIMITS: Dict[str, int] = {"app.middleware": 50}
+
     # ====================================================================
     # KONFIGURASI XENDIT PAYMENT GATEWAY
     # ====================================================================
@@ -132,6 +177,43 @@ class Settings(BaseSettings):
     # URL endpoint API Xendit buat create invoice
     XENDIT_API_URL: str = "https://api.xendit.co/v2/invoices"
 
+    # Rate limit pembuatan invoice (token bucket per akun Xendit / API key)
+    # Rate = request per detik rata-rata, burst = request yang boleh langsung jalan
+    XENDIT_RATE_LIMIT_PER_SECOND: float = 5.0
+    XENDIT_RATE_LIMIT_BURST: int = 10
+    # Override per akun, contoh env: XENDIT_RATE_LIMIT_OVERRIDES='{"JELANTIK": 2.0}'
+    XENDIT_RATE_LIMIT_OVERRIDES: Dict[str, float] = {}
+    # Maksimal invoice yang dibuat bersamaan oleh job generate invoice
+    XENDIT_INVOICE_CONCURRENCY: int = 10
+
+    # HTTP client Xendit (satu client long-lived per akun, dibuka saat startup)
+    XENDIT_HTTP2: bool = False                  # Opt-in: butuh package h2 (pip install "httpx[http2]")
+    XENDIT_HTTP_TIMEOUT: float = 30.0
+    XENDIT_HTTP_MAX_CONNECTIONS: int = 20
+    XENDIT_HTTP_MAX_KEEPALIVE: int = 10
+    XENDIT_HTTP_KEEPALIVE_EXPIRY: float = 30.0  # Detik koneksi idle dipertahankan
+    XENDIT_LOG_MAX_CHARS: int = 2000            # Batas panjang payload/response yang di-log
+
+    # Rekonsiliasi pembayaran (job_verify_payments) - incremental per akun dengan high-water mark
+    XENDIT_RECONCILE_PAGE_SIZE: int = 100          # Invoice per halaman API
+    XENDIT_RECONCILE_MAX_PAGES: int = 50           # Batas halaman per akun per run
+    XENDIT_RECONCILE_LOOKBACK_DAYS: int = 3        # Run pertama (belum ada high-water mark)
+    XENDIT_RECONCILE_OVERLAP_SECONDS: int = 300    # Mundur sedikit dari mark untuk pembayaran yang telat ter-index
+    XENDIT_RECONCILE_MATCH_CHUNK: int = 500        # external_id per query IN saat matching ke invoices
+
+    # ====================================================================
+    # KONFIGURASI INVOICE OUTBOX (ANTRIAN XENDIT PERSISTEN)
+    # ====================================================================
+
+    INVOICE_OUTBOX_WORKER_ENABLED: bool = True      # Worker drain outbox jalan di setiap proses aplikasi
+    INVOICE_OUTBOX_POLL_INTERVAL: float = 5.0       # Detik jeda kalau antrian kosong
+    INVOICE_OUTBOX_BATCH_SIZE: int = 20             # Entry yang di-claim sekaligus per worker
+    INVOICE_OUTBOX_VISIBILITY_TIMEOUT: int = 120    # Detik sebelum entry 'processing' boleh di-claim ulang
+    INVOICE_OUTBOX_MAX_ATTEMPTS: int = 6            # Setelah ini masuk dead-letter
+    INVOICE_OUTBOX_BACKOFF_BASE: float = 30.0       # Backoff retry: base * 2^(attempt-1) detik
+    INVOICE_OUTBOX_BACKOFF_MAX: float = 3600.0
+    INVOICE_OUTBOX_COMPLETED_RETENTION_HOURS: int = 72  # Entry completed dihapus setelah ini
+
     # ====================================================================
     # KONFIGURASI ENCRYPTION
     # ====================================================================
@@ -140,6 +222,99 @@ class Settings(BaseSettings):
     # HARUS DIUBAH DI PRODUCTION! Pakai Fernet key yang valid
     ENCRYPTION_KEY: str = "default_encryption_key_change_in_production"
 
+    # Jumlah maksimum pasangan ciphertext -> plaintext yang disimpan di memory
+    # (field terenkripsi didekripsi saat dibaca, bukan saat object di-load). 0 = tanpa cache
+    ENCRYPTION_DECRYPT_CACHE_SIZE: int = 20000
+
+    # ====================================================================
+    # KONFIGURASI MIKROTIK API
+    # ====================================================================
+
+    # Ukuran thread pool untuk call routeros_api (blocking) dari async code
+    # Satu router lambat hanya makan satu worker, event loop tetap jalan
+    MIKROTIK_API_MAX_WORKERS: int = 16
+
+    # Connection pool RouterOS API (per router)
+    MIKROTIK_POOL_MAX_PER_HOST: int = 10  # Hard cap koneksi per router
+    MIKROTIK_POOL_ACQUIRE_TIMEOUT: float = 30.0  # Maks. tunggu slot kalau pool penuh (detik)
+    MIKROTIK_POOL_IDLE_TIMEOUT: int = 300  # Koneksi idle lebih lama dari ini ditutup
+    MIKROTIK_POOL_KEEPALIVE_INTERVAL: int = 60  # Interval keepalive/eviction di background
+    MIKROTIK_POOL_MAX_LIFETIME: int = 3600  # Koneksi di-recycle setelah umur ini
+
+    # Health monitor: probe TCP ke port API setiap router di background (tanpa login)
+    MIKROTIK_HEALTH_INTERVAL_SECONDS: float = 30.0  # Jeda antar putaran probe
+    MIKROTIK_HEALTH_JITTER_SECONDS: float = 5.0  # Probe tiap router diacak 0..jitter supaya tidak serentak
+    MIKROTIK_HEALTH_TIMEOUT_SECONDS: float = 3.0  # Connect lebih lama dari ini = probe gagal
+    MIKROTIK_HEALTH_FAILURE_THRESHOLD: int = 2  # Probe gagal berturut-turut sebelum router dianggap down
+    MIKROTIK_HEALTH_CONCURRENCY: int = 20  # Maksimal probe yang jalan bersamaan
+
+    # ====================================================================
+    # KONFIGURASI WEBSOCKET BUS (NOTIFIKASI ANTAR WORKER)
+    # ====================================================================
+
+    # "memory" = satu worker saja; "database" = lewat tabel websocket_events (beberapa worker/host)
+    WEBSOCKET_BUS_BACKEND: str = "memory"
+    WEBSOCKET_BUS_POLL_INTERVAL_MS: int = 250  # Interval worker membaca event baru
+    WEBSOCKET_BUS_BATCH_SIZE: int = 500  # Event maksimal per polling
+    WEBSOCKET_BUS_RETENTION_SECONDS: int = 300  # Event lebih tua dari ini dihapus
+
+    # ====================================================================
+    # KONFIGURASI KONEKSI WEBSOCKET (MULTI-SESSION & ANTRIAN KIRIM)
+    # ====================================================================
+
+    WEBSOCKET_MAX_CONNECTIONS_PER_USER: int = 5  # Tab/device per user; lebih dari ini koneksi tertua ditutup
+    WEBSOCKET_SEND_QUEUE_SIZE: int = 100  # Antrian kirim per koneksi; penuh = pesan tertua dibuang
+    WEBSOCKET_SEND_TIMEOUT_SECONDS: float = 10.0  # Satu send lebih lama dari ini = client terlalu lambat, koneksi ditutup
+
+    # ====================================================================
+    # KONFIGURASI DASHBOARD SNAPSHOT
+    # ====================================================================
+
+    DASHBOARD_SNAPSHOT_REFRESH_SECONDS: float = 300.0  # Hitung ulang semua widget setiap interval ini
+    DASHBOARD_SNAPSHOT_DEBOUNCE_SECONDS: float = 5.0  # Jeda setelah invoice/langganan/pelanggan berubah sebelum widget terkait dihitung ulang
+    DASHBOARD_SNAPSHOT_PERSIST: bool = False  # Simpan snapshot ke tabel dashboard_snapshots (warm start worker baru)
+
+    # ====================================================================
+    # KONFIGURASI IP POOL PELANGGAN
+    # ====================================================================
+
+    # Pool CIDR per server Mikrotik (key = nama server), contoh JSON di .env:
+    # IP_POOL_CIDRS={"MKT-MAIN-01": ["10.10.0.0/22"], "MKT-CLUSTER-B": ["10.20.1.0/24"]}
+    # Server yang tidak dikonfigurasi: pool = jaringan /IP_POOL_DEFAULT_PREFIX dari IP yang sudah dipakai
+    IP_POOL_CIDRS: Dict[str, List[str]] = {}
+    IP_POOL_DEFAULT_PREFIX: int = 24
+    IP_POOL_RESERVED_HOSTS: int = 1  # Host pertama tiap jaringan tidak dibagikan (gateway)
+    IP_POOL_RESERVATION_TTL_SECONDS: float = 600.0  # IP dari /next-ip ditahan selama ini
+    IP_POOL_SYNC_INTERVAL_SECONDS: float = 300.0  # Sinkronisasi index dari database + PPP secrets router
+
+    # ====================================================================
+    # KONFIGURASI TRAFFIC MONITORING
+    # ====================================================================
+
+    # Maksimal router yang di-collect bersamaan (ukuran thread pool collector)
+    TRAFFIC_COLLECTION_MAX_WORKERS: int = 8
+
+    # Deadline per router (detik) untuk connect + download snapshot traffic
+    # Router yang lewat deadline dicatat sebagai error, router lain tetap jalan
+    TRAFFIC_COLLECTION_ROUTER_TIMEOUT: float = 60.0
+
+    # Timeout socket (detik) untuk connect dan setiap read ke router. Thread collector
+    # tidak bisa di-cancel, jadi ini yang membebaskan worker dari router yang hang
+    TRAFFIC_COLLECTION_SOCKET_TIMEOUT: float = 15.0
+
+    # Retention data traffic per level (hari, 0 = simpan selamanya)
+    TRAFFIC_RETENTION_RAW_DAYS: int = 30  # traffic_history (sample 5 menit mentah)
+    TRAFFIC_RETENTION_5M_DAYS: int = 7  # traffic_rollup_5m
+    TRAFFIC_RETENTION_HOURLY_DAYS: int = 90  # traffic_rollup_hourly
+    TRAFFIC_RETENTION_DAILY_DAYS: int = 730  # traffic_rollup_daily
+
+    # Jumlah row per DELETE saat purge (commit per batch supaya lock tidak lama)
+    TRAFFIC_RETENTION_DELETE_CHUNK: int = 5000
+
+    # MySQL: DROP partition harian (pYYYYMMDD) kalau tabel sudah di-partition
+    TRAFFIC_RETENTION_USE_PARTITIONS: bool = True
+    TRAFFIC_RETENTION_PARTITIONS_AHEAD: int = 7  # Partition hari ke depan yang disiapkan
+
     @property
     def XENDIT_API_KEYS(self) -> dict:
         return {
@@ -18,10 +18,14 @@ Keamanan:
 
 import base64
 import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from sqlalchemy.ext.hybrid import hybrid_property
 
 from .config import settings  # Import settings
 
@@ -60,6 +64,13 @@ class EncryptionService:
         # Fernet expects the URL-safe base64-encoded key as bytes.
         self.cipher_suite = Fernet(key.encode())
 
+        # LRU ciphertext -> plaintext buat decrypt_cached()
+        self.decrypt_cache_size = settings.ENCRYPTION_DECRYPT_CACHE_SIZE
+        self._decrypt_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._decrypt_cache_lock = threading.Lock()
+        self.decrypt_cache_hits = 0
+        self.decrypt_cache_misses = 0
+
     def is_encrypted(self, value: str) -> bool:
         """
         Cek apakah sebuah nilai sudah terenkripsi atau belum.
@@ -146,12 +157,93 @@ class EncryptionService:
             # Mengembalikan ciphertext agar tidak crash, tapi ini menandakan masalah besar.
             return ciphertext
 
+    def _remember(self, ciphertext: str, plaintext: str) -> None:
+        if self.decrypt_cache_size <= 0:
+            return
+        with self._decrypt_cache_lock:
+            self._decrypt_cache[ciphertext] = plaintext
+            self._decrypt_cache.move_to_end(ciphertext)
+            while len(self._decrypt_cache) > self.decrypt_cache_size:
+                self._decrypt_cache.popitem(last=False)
+
+    def decrypt_cached(self, ciphertext: str) -> str:
+        """
+        Sama seperti decrypt(), tapi hasilnya disimpan di LRU (ENCRYPTION_DECRYPT_CACHE_SIZE).
+
+        Token Fernet selalu unik per enkripsi (ada IV + timestamp), jadi ciphertext
+        aman dipakai sebagai key. Dekripsi yang gagal tidak di-cache.
+        """
+        if not ciphertext or not self.is_encrypted(ciphertext):
+            return ciphertext
+
+        with self._decrypt_cache_lock:
+            plaintext = self._decrypt_cache.get(ciphertext)
+            if plaintext is not None:
+                self._decrypt_cache.move_to_end(ciphertext)
+                self.decrypt_cache_hits += 1
+                return plaintext
+            self.decrypt_cache_misses += 1
+
+        plaintext = self.decrypt(ciphertext)
+        if plaintext != ciphertext:
+            self._remember(ciphertext, plaintext)
+        return plaintext
+
+    def encrypt_cached(self, plaintext: str) -> str:
+        """encrypt() + simpan pasangan ciphertext -> plaintext di LRU (baca setelah tulis tidak perlu dekripsi)."""
+        ciphertext = self.encrypt(plaintext)
+        if ciphertext and ciphertext != plaintext:
+            self._remember(ciphertext, plaintext)
+        return ciphertext
+
+    def get_decrypt_cache_stats(self) -> Dict[str, Any]:
+        with self._decrypt_cache_lock:
+            total = self.decrypt_cache_hits + self.decrypt_cache_misses
+            return {
+                "entries": len(self._decrypt_cache),
+                "max_entries": self.decrypt_cache_size,
+                "hits": self.decrypt_cache_hits,
+                "misses": self.decrypt_cache_misses,
+                "hit_ratio": round(self.decrypt_cache_hits / total, 3) if total else 0.0,
+            }
+
 
 # Singleton instance - global object buat encryption service
 # Ini penting biar semua bagian aplikasi pake instance yang sama
 # dan nggak perlu initialize berulang kali
 encryption_service = EncryptionService()
 
+
+def encrypted_field(column_attr: str, doc: Optional[str] = None) -> hybrid_property:
+    """
+    Bikin attribute terenkripsi di model: dekripsi baru jalan saat attribute dibaca.
+
+    Sebelumnya listener 'load' di encryption_utils mendekripsi setiap object yang
+    di-load dari database, walaupun field-nya tidak pernah dipakai (list 5.000
+    pelanggan = 5.000 dekripsi Fernet). Sekarang:
+    - Baca   : decrypt_cached(ciphertext) - lazy + LRU
+    - Tulis  : langsung dienkripsi (menggantikan listener before_insert/before_update)
+    - Query  : Model.field mengarah ke kolom aslinya (berisi ciphertext)
+
+    Usage:
+        _no_ktp: Mapped[str] = mapped_column("no_ktp", String(191))
+        no_ktp = encrypted_field("_no_ktp")
+    """
+
+    def getter(self):
+        return encryption_service.decrypt_cached(getattr(self, column_attr))
+
+    def setter(self, value):
+        setattr(self, column_attr, encryption_service.encrypt_cached(value) if value else value)
+
+    def expression(cls):
+        return getattr(cls, column_attr)
+
+    prop = hybrid_property(getter, setter, expr=expression)
+    if doc:
+        prop.__doc__ = doc
+    return prop
+
 """
 Cara pakai encryption service di seluruh aplikasi:
 
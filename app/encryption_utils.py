@@ -8,6 +8,12 @@ Cara kerja:
 - before_insert/before_update: encrypt data sebelum disimpan
 - load: decrypt data setelah diambil dari database
 
+Update: User.password dan Pelanggan.no_ktp tidak lagi pakai listener di sini.
+Keduanya didefinisikan dengan encrypted_field() (app/encryption.py):
+enkripsi saat attribute di-set, dekripsi saat attribute dibaca (lazy + LRU).
+Listener 'load' yang lama mendekripsi setiap object yang di-load walaupun
+field-nya tidak dipakai - mahal buat list/export ribuan pelanggan.
+
 Data yang dienkripsi otomatis:
 - Password user (login sistem)
 - Password PPPoE pelanggan (internet)
@@ -21,12 +27,10 @@ Security benefits:
 - Zero-impact ke existing code base
 """
 
-from sqlalchemy import event
 from sqlalchemy.orm import Session
 
 from .encryption import encryption_service
 from .models.mikrotik_server import MikrotikServer
-from .models.user import User
 
 
 # Import models inside functions to avoid circular imports
@@ -60,45 +64,6 @@ def setup_datateknis_listeners():
             target.password_pppoe = encryption_service.decrypt(target.password_pppoe)
 
 
-def setup_pelanggan_listeners():
-    """
-    Setup event listeners buat model Pelanggan.
-    Fokusnya buat enkripsi nomor KTP pelanggan.
-
-    Yang diproteksi:
-    - Nomor KTP (data pribadi sensitif)
-    - Auto encrypt saat simpan data baru atau update
-    - Auto decrypt saat ambil data dari database
-
-    Privacy protection:
-    - KTP itu data pribadi yang sangat sensitif
-    - Harus dienkripsi di database compliance ke privacy laws
-    - Decrypt hanya saat dibaca di aplikasi
-
-    Error handling:
-    - Graceful fallback kalau gagal decrypt
-    - Log error buat debugging
-    - Biarkan nilai tetap terenkripsi kalau error
-    """
-    from .models.pelanggan import Pelanggan
-
-    @event.listens_for(Pelanggan, "before_insert")
-    @event.listens_for(Pelanggan, "before_update")
-    def encrypt_nik(mapper, connection, target):
-        if target.no_ktp and not encryption_service.is_encrypted(target.no_ktp):
-            target.no_ktp = encryption_service.encrypt(target.no_ktp)
-
-    @event.listens_for(Pelanggan, "load")
-    def decrypt_nik(target, context):
-        if target.no_ktp and encryption_service.is_encrypted(target.no_ktp):
-            try:
-                target.no_ktp = encryption_service.decrypt(target.no_ktp)
-            except Exception as e:
-                # Jika gagal mendekripsi, log error dan biarkan nilai tetap seperti adanya
-                print(f"Peringatan: Gagal mendekripsi no_ktp untuk pelanggan ID {getattr(target, 'id', 'unknown')}: {e}")
-                # Biarkan nilai tetap terenkripsi agar tidak menyebabkan error validasi
-
-
 def encrypt_sensitive_data():
     """
     Setup semua event listeners buat ENKRIPSI data sensitif.
@@ -120,13 +85,6 @@ def encrypt_sensitive_data():
     - Must dipanggil sebelum operasi database dimulai
     """
 
-    # Enkripsi password user sebelum insert/update
-    @event.listens_for(User, "before_insert")
-    @event.listens_for(User, "before_update")
-    def encrypt_user_password(mapper, connection, target):
-        if target.password and not target.password.startswith("gAAAAAB"):
-            target.password = encryption_service.encrypt(target.password)
-
     # Enkripsi password Mikrotik sebelum insert/update
     # @event.listens_for(MikrotikServer, 'before_insert')
     # @event.listens_for(MikrotikServer, 'before_update')
@@ -135,7 +93,6 @@ def encrypt_sensitive_data():
             target.password = encryption_service.encrypt(target.password)
 
     setup_datateknis_listeners()
-    setup_pelanggan_listeners()
 
 
 def decrypt_sensitive_data():
@@ -164,17 +121,8 @@ def decrypt_sensitive_data():
     - Plaintext hanya di application memory
     """
 
-    # Dekripsi password user setelah select
-    @event.listens_for(User, "load")
-    def decrypt_user_password(target, context):
-        if target.password and target.password.startswith("gAAAAAB"):
-            target.password = encryption_service.decrypt(target.password)
-
     # Dekripsi password Mikrotik setelah select
     # @event.listens_for(MikrotikServer, 'load')
     def decrypt_mikrotik_password(target, context):
         if target.password and target.password.startswith("gAAAAAB"):
             target.password = encryption_service.decrypt(target.password)
-
-    setup_datateknis_listeners()
-    setup_pelanggan_listeners()
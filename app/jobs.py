@@ -6,13 +6,17 @@ Misalnya bikin invoice, suspend pelanggan, cek pembayaran, dll.
 Ini penting banget buat sistem yang jalan 24/7 tanpa perlu campur tangan admin.
 """
 
+import asyncio
 import logging
 import math
+import re
 import traceback
 import uuid
 import calendar
 import time
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
 from sqlalchemy import Date as SQLDate
 
 from dateutil.relativedelta import relativedelta
@@ -24,6 +28,7 @@ from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 
 # Impor komponen
+from .config import settings
 from .database import AsyncSessionLocal
 from .database import get_db
 from .websocket_manager import manager
@@ -36,136 +41,167 @@ from .models import Invoice as InvoiceModel
 from .models import Langganan as LanggananModel
 from .models import Pelanggan as PelangganModel
 from .routers.invoice import _process_successful_payment
-from .services import mikrotik_service, xendit_service
+from .models.invoice_outbox import InvoiceOutbox
+from .services.batch_iterator import KeysetBatchIterator
+from .services.invoice_outbox import invoice_outbox
+from .services.mikrotik_batch import SecretStatusChange, mikrotik_batch_service
 from .services.rate_limiter import create_invoice_with_rate_limit, InvoicePriority
+from .services.xendit_reconciliation import xendit_reconciliation
 
 logger = logging.getLogger("app.jobs")
 
 
-import re
-
-# ... (rest of the imports)
-
-async def generate_single_invoice(db: AsyncSession, langganan: LanggananModel) -> None:
-    # ... (try block starts)
-    try:
-        pelanggan = langganan.pelanggan
-        paket = langganan.paket_layanan
-        brand = pelanggan.harga_layanan
-        data_teknis = pelanggan.data_teknis
-
-        if not all([pelanggan, paket, brand, data_teknis]):
-            logger.error(f"Data tidak lengkap untuk langganan ID {langganan.id}. Skip.")
-            return
-
-        harga_dasar = float(paket.harga)
-        pajak_persen = float(brand.pajak)
-        pajak_mentah = harga_dasar * (pajak_persen / 100)
-        pajak = math.floor(pajak_mentah + 0.5)
-        total_harga = harga_dasar + pajak
-
-        # --- MODIFICATION FOR INVOICE NUMBER ---
-        # 1. Sanitize and prepare customer name and address
-        import calendar
-        nama_pelanggan_singkat = re.sub(r'[^a-zA-Z0-9]', '', pelanggan.nama).upper()
-        alamat_singkat = re.sub(r'[^a-zA-Z0-9]', '', pelanggan.alamat or '').upper()
-        brand_singkat = re.sub(r'[^a-zA-Z0-9]', '', brand.brand or '').upper()
-
-        # 2. Format untuk bulan-tahun
-        bulan_tahun = f"{calendar.month_name[date.today().month].upper()}-{date.today().year}"
-
-        # 3. Generate new invoice number (sama format dengan manual)
-        nomor_invoice_baru = f"{brand_singkat}/ftth/{nama_pelanggan_singkat}/{bulan_tahun}/{alamat_singkat}/{str(data_teknis.id_pelanggan)[-3:]}"
-
-        # 4. Check for duplicate invoice number and add timestamp if needed
-        existing_invoice_number = (await db.execute(
-            select(InvoiceModel.id).where(InvoiceModel.invoice_number == nomor_invoice_baru)
-        )).scalar_one_or_none()
-
-        if existing_invoice_number:
-            # Generate nomor unik dengan tambahan timestamp atau random
-            import time
-            timestamp = str(int(time.time()))[-6:]  # 6 digit terakhir timestamp
-            nomor_invoice_baru = f"{nomor_invoice_baru}/{timestamp}"
-        # --- END OF MODIFICATION ---
-
-        new_invoice_data = {
-            "invoice_number": nomor_invoice_baru, # Use the new invoice number
-            "pelanggan_id": pelanggan.id,
-            "id_pelanggan": data_teknis.id_pelanggan,
-            "brand": brand.brand,
-            "total_harga": total_harga,
-            "no_telp": pelanggan.no_telp,
-            "email": pelanggan.email,
-            "tgl_invoice": date.today(),
-            "tgl_jatuh_tempo": langganan.tgl_jatuh_tempo,
-            "status_invoice": "Belum Dibayar",
-        }
-
-        db_invoice = InvoiceModel(**new_invoice_data)
-        # ... (rest of the function)
-
-        deskripsi_xendit = ""
-        jatuh_tempo_str_lengkap = datetime.combine(date.fromisoformat(str(db_invoice.tgl_jatuh_tempo)), datetime.min.time()).strftime("%d/%m/%Y")
-
-        if langganan.metode_pembayaran == "Prorate":
-            
-
-            # Hitung harga normal untuk perbandingan
-            harga_normal_full = float(paket.harga) * (1 + (float(brand.pajak) / 100))
-
-            # Cek apakah ini invoice gabungan
-            if db_invoice.total_harga > (harga_normal_full + 1):
-                # INI TAGIHAN GABUNGAN
-                invoice_date = date.fromisoformat(str(db_invoice.tgl_invoice))
-                jatuh_tempo_date = date.fromisoformat(str(db_invoice.tgl_jatuh_tempo))
-
-                start_day = invoice_date.day
-                end_day = jatuh_tempo_date.day
-                periode_prorate_str = datetime.combine(jatuh_tempo_date, datetime.min.time()).strftime("%B %Y")
-                periode_berikutnya_str = datetime.combine(jatuh_tempo_date + relativedelta(months=1), datetime.min.time()).strftime("%B %Y")
-
-                deskripsi_xendit = (
-                    f"Biaya internet up to {paket.kecepatan} Mbps. "
-                    f"Periode Prorate {start_day}-{end_day} {periode_prorate_str} + "
-                    f"Periode {periode_berikutnya_str}"
-                )
-            else:
-                # INI TAGIHAN PRORATE BIASA
-                invoice_date = date.fromisoformat(str(db_invoice.tgl_invoice))
-                jatuh_tempo_date = date.fromisoformat(str(db_invoice.tgl_jatuh_tempo))
-
-                start_day = invoice_date.day
-                end_day = jatuh_tempo_date.day
-                periode_str = datetime.combine(jatuh_tempo_date, datetime.min.time()).strftime("%B %Y")
-                deskripsi_xendit = (
-                    f"Biaya berlangganan internet up to {paket.kecepatan} Mbps, "
-                    f"Periode Tgl {start_day}-{end_day} {periode_str}"
-                )
+@dataclass
+class PreparedInvoice:
+    """Invoice yang sudah dihitung & siap dikirim ke Xendit (belum di-add ke session)."""
+
+    langganan: LanggananModel
+    invoice: InvoiceModel
+    deskripsi_xendit: str
+    pajak: float
+    no_telp_xendit: str
+    priority: InvoicePriority
+    base_invoice_number: str
+
+
+def _prepare_invoice(langganan: LanggananModel) -> Optional[PreparedInvoice]:
+    """Hitung harga, nomor invoice dan deskripsi Xendit. Tidak ada I/O."""
+    pelanggan = langganan.pelanggan
+    paket = langganan.paket_layanan
+    brand = pelanggan.harga_layanan
+    data_teknis = pelanggan.data_teknis
+
+    if not all([pelanggan, paket, brand, data_teknis]):
+        logger.error(f"Data tidak lengkap untuk langganan ID {langganan.id}. Skip.")
+        return None
+
+    harga_dasar = float(paket.harga)
+    pajak_persen = float(brand.pajak)
+    pajak_mentah = harga_dasar * (pajak_persen / 100)
+    pajak = math.floor(pajak_mentah + 0.5)
+    total_harga = harga_dasar + pajak
+
+    # --- MODIFICATION FOR INVOICE NUMBER ---
+    # 1. Sanitize and prepare customer name and address
+    nama_pelanggan_singkat = re.sub(r'[^a-zA-Z0-9]', '', pelanggan.nama).upper()
+    alamat_singkat = re.sub(r'[^a-zA-Z0-9]', '', pelanggan.alamat or '').upper()
+    brand_singkat = re.sub(r'[^a-zA-Z0-9]', '', brand.brand or '').upper()
+
+    # 2. Format untuk bulan-tahun
+    bulan_tahun = f"{calendar.month_name[date.today().month].upper()}-{date.today().year}"
+
+    # 3. Generate new invoice number (sama format dengan manual)
+    nomor_invoice_baru = f"{brand_singkat}/ftth/{nama_pelanggan_singkat}/{bulan_tahun}/{alamat_singkat}/{str(data_teknis.id_pelanggan)[-3:]}"
+    # Cek duplikat dilakukan per batch di _dedupe_invoice_numbers
+    # --- END OF MODIFICATION ---
+
+    db_invoice = InvoiceModel(
+        invoice_number=nomor_invoice_baru,
+        pelanggan_id=pelanggan.id,
+        id_pelanggan=data_teknis.id_pelanggan,
+        brand=brand.brand,
+        total_harga=total_harga,
+        no_telp=pelanggan.no_telp,
+        email=pelanggan.email,
+        tgl_invoice=date.today(),
+        tgl_jatuh_tempo=langganan.tgl_jatuh_tempo,
+        status_invoice="Belum Dibayar",
+    )
+
+    deskripsi_xendit = ""
+    jatuh_tempo_str_lengkap = datetime.combine(date.fromisoformat(str(db_invoice.tgl_jatuh_tempo)), datetime.min.time()).strftime("%d/%m/%Y")
+
+    if langganan.metode_pembayaran == "Prorate":
+        # Hitung harga normal untuk perbandingan
+        harga_normal_full = float(paket.harga) * (1 + (float(brand.pajak) / 100))
+
+        # Cek apakah ini invoice gabungan
+        if db_invoice.total_harga > (harga_normal_full + 1):
+            # INI TAGIHAN GABUNGAN
+            invoice_date = date.fromisoformat(str(db_invoice.tgl_invoice))
+            jatuh_tempo_date = date.fromisoformat(str(db_invoice.tgl_jatuh_tempo))
+
+            start_day = invoice_date.day
+            end_day = jatuh_tempo_date.day
+            periode_prorate_str = datetime.combine(jatuh_tempo_date, datetime.min.time()).strftime("%B %Y")
+            periode_berikutnya_str = datetime.combine(jatuh_tempo_date + relativedelta(months=1), datetime.min.time()).strftime("%B %Y")
 
-        else:  # Otomatis
             deskripsi_xendit = (
-                f"Biaya berlangganan internet up to {paket.kecepatan} Mbps "
-                f"jatuh tempo pembayaran tanggal {jatuh_tempo_str_lengkap}"
+                f"Biaya internet up to {paket.kecepatan} Mbps. "
+                f"Periode Prorate {start_day}-{end_day} {periode_prorate_str} + "
+                f"Periode {periode_berikutnya_str}"
+            )
+        else:
+            # INI TAGIHAN PRORATE BIASA
+            invoice_date = date.fromisoformat(str(db_invoice.tgl_invoice))
+            jatuh_tempo_date = date.fromisoformat(str(db_invoice.tgl_jatuh_tempo))
+
+            start_day = invoice_date.day
+            end_day = jatuh_tempo_date.day
+            periode_str = datetime.combine(jatuh_tempo_date, datetime.min.time()).strftime("%B %Y")
+            deskripsi_xendit = (
+                f"Biaya berlangganan internet up to {paket.kecepatan} Mbps, "
+                f"Periode Tgl {start_day}-{end_day} {periode_str}"
             )
 
-        no_telp_xendit = f"+62{pelanggan.no_telp.lstrip('0')}" if pelanggan.no_telp else ""
-
-        # Determine priority for rate limiting
-        priority = InvoicePriority.NORMAL
-        if hasattr(pelanggan, 'is_vip') and getattr(pelanggan, 'is_vip', False):
-            priority = InvoicePriority.HIGH
-        elif hasattr(pelanggan, 'tipe') and getattr(pelanggan, 'tipe', '') == 'bulk':
-            priority = InvoicePriority.LOW
+    else:  # Otomatis
+        deskripsi_xendit = (
+            f"Biaya berlangganan internet up to {paket.kecepatan} Mbps "
+            f"jatuh tempo pembayaran tanggal {jatuh_tempo_str_lengkap}"
+        )
 
+    no_telp_xendit = f"+62{pelanggan.no_telp.lstrip('0')}" if pelanggan.no_telp else ""
+
+    # Determine priority for rate limiting
+    priority = InvoicePriority.NORMAL
+    if hasattr(pelanggan, 'is_vip') and getattr(pelanggan, 'is_vip', False):
+        priority = InvoicePriority.HIGH
+    elif hasattr(pelanggan, 'tipe') and getattr(pelanggan, 'tipe', '') == 'bulk':
+        priority = InvoicePriority.LOW
+
+    return PreparedInvoice(
+        langganan=langganan,
+        invoice=db_invoice,
+        deskripsi_xendit=deskripsi_xendit,
+        pajak=pajak,
+        no_telp_xendit=no_telp_xendit,
+        priority=priority,
+        base_invoice_number=nomor_invoice_baru,
+    )
+
+
+async def _dedupe_invoice_numbers(db: AsyncSession, prepared: List[PreparedInvoice]) -> None:
+    """Satu query untuk cek nomor invoice yang sudah ada; duplikat (di DB atau di batch) diberi suffix timestamp."""
+    numbers = [p.base_invoice_number for p in prepared]
+    if not numbers:
+        return
+    taken = set((await db.execute(select(InvoiceModel.invoice_number).where(InvoiceModel.invoice_number.in_(numbers)))).scalars())
+
+    timestamp = str(int(time.time()))[-6:]  # 6 digit terakhir timestamp
+    for index, item in enumerate(prepared):
+        number = item.base_invoice_number
+        if number in taken:
+            # Generate nomor unik dengan tambahan timestamp (+ urutan kalau bentrok di batch yang sama)
+            number = f"{number}/{timestamp}"
+            if number in taken:
+                number = f"{number}{index}"
+        item.invoice.invoice_number = number
+        taken.add(number)
+
+
+async def _request_payment_link(item: PreparedInvoice) -> bool:
+    """Minta payment link ke Xendit (lewat rate limiter). Hasil ditulis ke item.invoice, tanpa I/O DB."""
+    db_invoice = item.invoice
+    pelanggan = item.langganan.pelanggan
+    try:
         xendit_response = await create_invoice_with_rate_limit(
             invoice=db_invoice,
             pelanggan=pelanggan,
-            paket=paket,
-            deskripsi_xendit=deskripsi_xendit,
-            pajak=pajak,
-            no_telp_xendit=no_telp_xendit,
-            priority=priority
+            paket=item.langganan.paket_layanan,
+            deskripsi_xendit=item.deskripsi_xendit,
+            pajak=item.pajak,
+            no_telp_xendit=item.no_telp_xendit,
+            priority=item.priority
         )
 
         # VALIDASI RESPONSE dari Xendit
@@ -176,30 +212,74 @@ async def generate_single_invoice(db: AsyncSession, langganan: LanggananModel) -
         db_invoice.xendit_id = xendit_response.get("id")
         db_invoice.xendit_external_id = xendit_response.get("external_id")
 
-        db.add(db_invoice)
         logger.info(f"✅ Invoice {db_invoice.invoice_number} BERHASIL dengan payment link dan WhatsApp notification")
         logger.info(f"📱 WhatsApp notification sent to: {pelanggan.nama} ({pelanggan.no_telp})")
+        return True
 
     except Exception as e:
         # 🔧 FIX: Save invoice even if Xendit fails, but log for manual retry
-        logger.error(f"⚠️ Xendit API gagal untuk Langganan ID {langganan.id}: {e}")
-        logger.error(f"📝 Invoice {new_invoice_data.get('invoice_number', 'UNKNOWN')} akan disimpan tanpa payment link untuk retry otomatis")
+        logger.error(f"⚠️ Xendit API gagal untuk Langganan ID {item.langganan.id}: {e}")
+        logger.error(f"📝 Invoice {db_invoice.invoice_number} akan disimpan tanpa payment link untuk retry otomatis")
+
+        # Tambah field retry tracking (diambil job_retry_failed_invoices)
+        db_invoice.xendit_status = "failed"
+        db_invoice.xendit_error_message = str(e)
+        db_invoice.xendit_retry_count = 0
+        return False
+
 
-        # Save invoice tanpa payment link untuk retry otomatis nanti
+async def generate_invoices_batch(db: AsyncSession, langganan_list: List[LanggananModel]) -> Dict[str, int]:
+    """
+    Buat invoice untuk banyak langganan sekaligus.
+
+    1. Hitung semua invoice (tanpa I/O) + satu query cek nomor duplikat
+    2. Request payment link ke Xendit secara bersamaan, dibatasi XENDIT_INVOICE_CONCURRENCY
+       dan token bucket per akun Xendit di rate_limiter
+    3. Semua invoice di-add ke session sekaligus; yang gagal di-enqueue ke invoice_outbox.
+       Caller yang commit (satu commit per batch)
+    """
+    prepared: List[PreparedInvoice] = []
+    for langganan in langganan_list:
         try:
-            # Tambah field retry tracking
-            new_invoice_data.update({
-                'xendit_status': 'failed',
-                'xendit_error_message': str(e),
-                'xendit_retry_count': 0,
-            })
+            item = _prepare_invoice(langganan)
+        except Exception as e:
+            logger.error(f"❌ Gagal menyiapkan invoice untuk Langganan ID {langganan.id}: {e}")
+            continue
+        if item:
+            prepared.append(item)
+    await _dedupe_invoice_numbers(db, prepared)
+
+    semaphore = asyncio.Semaphore(max(1, settings.XENDIT_INVOICE_CONCURRENCY))
+
+    async def _bounded(item: PreparedInvoice) -> bool:
+        async with semaphore:
+            return await _request_payment_link(item)
+
+    results = await asyncio.gather(*(_bounded(item) for item in prepared))
+
+    db.add_all([item.invoice for item in prepared])
+
+    # Yang gagal masuk outbox persisten (retry dengan backoff oleh worker, tahan restart)
+    failed_items = [item for item, ok in zip(prepared, results) if not ok]
+    if failed_items:
+        await db.flush()
+        for item in failed_items:
+            await invoice_outbox.enqueue(
+                db,
+                item.invoice,
+                deskripsi_xendit=item.deskripsi_xendit,
+                pajak=item.pajak,
+                no_telp_xendit=item.no_telp_xendit,
+                priority=item.priority,
+            )
+
+    linked = sum(1 for ok in results if ok)
+    return {"created": len(prepared), "linked": linked, "failed": len(prepared) - linked}
 
-            db_invoice = InvoiceModel(**new_invoice_data)
-            db.add(db_invoice)
-            logger.info(f"🔄 Invoice {db_invoice.invoice_number} disimpan tanpa payment link (akan di-retry otomatis)")
-        except Exception as db_error:
-            logger.error(f"❌ Database error juga: {db_error}")
-        # Re-raise biar scheduler tau ada issue
+
+async def generate_single_invoice(db: AsyncSession, langganan: LanggananModel) -> None:
+    """Buat satu invoice + payment link. Wrapper generate_invoices_batch untuk satu langganan."""
+    await generate_invoices_batch(db, [langganan])
 
 
 # ==========================================================
@@ -223,6 +303,7 @@ async def job_generate_invoices() -> None:
     - Batch processing (100 records per batch)
     - Eager loading relasi buat minimize database queries
     - Single query buat cek existing invoice
+    - Payment link Xendit dibuat bersamaan sampai batas token bucket per akun
 
     Returns:
         None (hasilnya langsung di-log)
@@ -236,30 +317,26 @@ async def job_generate_invoices() -> None:
     target_due_date = date.today() + timedelta(days=5)
     total_invoices_created = 0
     BATCH_SIZE = 100
-    offset = 0
 
-    async with SessionType() as db:
-        while True:
-            try:
-                base_stmt = (
-                    select(LanggananModel)
-                    .where(
-                        LanggananModel.tgl_jatuh_tempo == target_due_date,
-                        LanggananModel.status == "Aktif",
-                    )
-                    .options(
-                        selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.harga_layanan),
-                        selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.data_teknis),
-                        selectinload(LanggananModel.paket_layanan),
-                    )
-                )
-
-                batch_stmt = base_stmt.offset(offset).limit(BATCH_SIZE)
-                subscriptions_batch = (await db.execute(batch_stmt)).scalars().unique().all()
-
-                if not subscriptions_batch:
-                    break
+    base_stmt = (
+        select(LanggananModel)
+        .where(
+            LanggananModel.tgl_jatuh_tempo == target_due_date,
+            LanggananModel.status == "Aktif",
+        )
+        .options(
+            selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.harga_layanan),
+            selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.data_teknis),
+            selectinload(LanggananModel.paket_layanan),
+        )
+    )
 
+    async with SessionType() as db:
+        batches = KeysetBatchIterator(
+            db, base_stmt, LanggananModel.id, BATCH_SIZE, job_name="job_generate_invoices", run_key=str(target_due_date)
+        )
+        try:
+            async for subscriptions_batch in batches:
                 # OPTIMISASI: Ambil semua invoice yang sudah ada untuk batch ini dalam satu query
                 pelanggan_ids_in_batch = [s.pelanggan_id for s in subscriptions_batch]
 
@@ -279,20 +356,30 @@ async def job_generate_invoices() -> None:
                 )
                 existing_invoices_pelanggan_ids = {row[0] for row in await db.execute(existing_invoices_stmt)}
 
-                for langganan in subscriptions_batch:
-                    # Cek dari data yang sudah di-prefetch, bukan query baru
-                    if langganan.pelanggan_id not in existing_invoices_pelanggan_ids:
-                        await generate_single_invoice(db, langganan)
-                        total_invoices_created += 1
+                # Cek dari data yang sudah di-prefetch, bukan query baru
+                to_invoice = [
+                    langganan for langganan in subscriptions_batch
+                    if langganan.pelanggan_id not in existing_invoices_pelanggan_ids
+                ]
+                if to_invoice:
+                    # Payment link dibuat bersamaan (dibatasi token bucket Xendit), hasil ditulis sekaligus
+                    batch_stats = await generate_invoices_batch(db, to_invoice)
+                    total_invoices_created += batch_stats["created"]
+                    logger.info(
+                        f"[job_generate_invoices] Batch: {batch_stats['created']} invoice, "
+                        f"{batch_stats['linked']} dengan payment link, {batch_stats['failed']} menunggu retry"
+                    )
 
                 await db.commit()
-                offset += BATCH_SIZE
 
-            except Exception as e:
-                await db.rollback()
-                error_details = traceback.format_exc()
-                logger.error(f"[FAIL] Scheduler 'job_generate_invoices' failed at offset {offset}. Details:\n{error_details}")
-                break
+        except Exception as e:
+            await db.rollback()
+            error_details = traceback.format_exc()
+            logger.error(
+                f"[FAIL] Scheduler 'job_generate_invoices' failed after Langganan ID {batches.last_key}. Details:\n{error_details}"
+            )
+
+    logger.info(f"[job_generate_invoices] {batches.summary()}")
 
     if total_invoices_created > 0:
         log_scheduler_event(
@@ -335,7 +422,9 @@ async def job_suspend_services() -> None:
     - Audit logging
 
     Performance:
-    - Batch processing (50 records per batch)
+    - Batch processing (50 records per batch, keyset by langganan.id)
+    - Mikrotik per router: secret & session aktif diambil sekali, satu koneksi, router paralel
+    - Update DB set-based (UPDATE ... WHERE id IN), satu commit per batch
     - Transaction rollback kalau ada error
     """
     log_scheduler_event(logger, "job_suspend_services", "started")
@@ -343,7 +432,6 @@ async def job_suspend_services() -> None:
     total_invoices_overdue = 0
     current_date = date.today()
     BATCH_SIZE = 50
-    offset = 0
 
     # LOGIKA BISNIS YANG BENAR:
     # Cek apakah hari ini adalah tanggal 5 untuk melakukan suspend utama
@@ -373,124 +461,112 @@ async def job_suspend_services() -> None:
 
     logger.info(f"🔍 Mencari pelanggan yang jatuh tempo tanggal {target_due_date.strftime('%d %B %Y')} dan belum bayar")
 
-    async with SessionType() as db:
-        while True:
-            try:
-                # Filter tambahan untuk retroactive: hindari yang sudah disuspend
-                if is_retroactive_day:
-                    logger.info(f"🔍 Retroactive mode: mencari pelanggan yang belum disuspend dari tanggal 5")
-                    base_stmt = (
-                        select(LanggananModel)
-                        .join(
-                            InvoiceModel,
-                            LanggananModel.pelanggan_id == InvoiceModel.pelanggan_id,
-                        )
-                        .where(
-                            InvoiceModel.tgl_jatuh_tempo == target_due_date,  # Cari yang jatuh tempo tepat tanggal 1
-                            LanggananModel.status == "Aktif",  # Masih aktif (belum suspend)
-                            InvoiceModel.status_invoice == "Belum Dibayar",  # Invoice belum lunas
-                        )
-                        .distinct(LanggananModel.id)  # Pastikan setiap langganan hanya diproses sekali
-                        .options(selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.data_teknis))
-                    )
-                else:
-                    # Normal mode (tanggal 5)
-                    base_stmt = (
-                        select(LanggananModel)
-                        .join(
-                            InvoiceModel,
-                            LanggananModel.pelanggan_id == InvoiceModel.pelanggan_id,
-                        )
-                        .where(
-                            InvoiceModel.tgl_jatuh_tempo == target_due_date,  # Cari yang jatuh tempo tepat tanggal 1
-                            LanggananModel.status == "Aktif",
-                            InvoiceModel.status_invoice == "Belum Dibayar",
-                        )
-                        .distinct(LanggananModel.id)  # Pastikan setiap langganan hanya diproses sekali
-                        .options(selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.data_teknis))
-                    )
-
-                batch_stmt = base_stmt.offset(offset).limit(BATCH_SIZE)
-                overdue_batch = (await db.execute(batch_stmt)).scalars().unique().all()
+    suspend_type = "RETROACTIVE" if is_retroactive_day else "SCHEDULED"
+    if is_retroactive_day:
+        logger.info(f"🔍 Retroactive mode: mencari pelanggan yang belum disuspend dari tanggal 5")
+
+    # Query sama untuk normal (tanggal 5) dan retroactive: status 'Aktif' otomatis
+    # melewati langganan yang sudah disuspend sebelumnya
+    base_stmt = (
+        select(LanggananModel)
+        .join(
+            InvoiceModel,
+            LanggananModel.pelanggan_id == InvoiceModel.pelanggan_id,
+        )
+        .where(
+            InvoiceModel.tgl_jatuh_tempo == target_due_date,  # Cari yang jatuh tempo tepat tanggal 1
+            LanggananModel.status == "Aktif",  # Masih aktif (belum suspend)
+            InvoiceModel.status_invoice == "Belum Dibayar",  # Invoice belum lunas
+        )
+        .distinct(LanggananModel.id)  # Pastikan setiap langganan hanya diproses sekali
+        .options(selectinload(LanggananModel.pelanggan).selectinload(PelangganModel.data_teknis))
+    )
 
-                if not overdue_batch:
-                    break
+    async with SessionType() as db:
+        # Keyset (id > last_id), bukan offset: baris yang baru disuspend keluar dari filter
+        # sehingga offset akan melompati pelanggan berikutnya
+        batches = KeysetBatchIterator(
+            db, base_stmt, LanggananModel.id, BATCH_SIZE, job_name="job_suspend_services", run_key=str(target_due_date)
+        )
+        try:
+            async for overdue_batch in batches:
+                last_id = overdue_batch[-1].id
 
+                # 1. Mikrotik dulu, dikelompokkan per router (satu koneksi per router, router paralel).
+                #    Gagal di Mikrotik TIDAK membatalkan suspend di DB (business priority).
+                changes = []
                 for langganan in overdue_batch:
-                    suspend_type = "RETROACTIVE" if is_retroactive_day else "SCHEDULED"
-                    logger.warning(f"⚠️ {suspend_type} SUSPEND: Melakukan suspend layanan untuk Langganan ID: {langganan.id} - Pelanggan: {langganan.pelanggan.nama}")
-
+                    logger.warning(
+                        f"⚠️ {suspend_type} SUSPEND: Melakukan suspend layanan untuk Langganan ID: {langganan.id} - Pelanggan: {langganan.pelanggan.nama}"
+                    )
                     data_teknis = langganan.pelanggan.data_teknis
-                    mikrotik_success = False
-                    mikrotik_error_msg = None
-
-                    # Opsi 2: Database First - Coba Mikrotik dulu tapi DB priority
-                    if data_teknis:
-                        try:
-                            # 1. Coba update Mikrotik DULU (tapi tidak akan rollback DB jika gagal)
-                            logger.info(f"🔄 Mencoba update Mikrotik untuk Langganan ID: {langganan.id}...")
-                            await mikrotik_service.trigger_mikrotik_update(db, langganan, data_teknis, data_teknis.id_pelanggan)
-                            mikrotik_success = True
-                            logger.info(f"✅ Mikrotik update SUKSES untuk Langganan ID: {langganan.id}")
-
-                        except Exception as mikrotik_error:
-                            # Log error tapi LANJUTKAN proses DB (business priority)
-                            mikrotik_error_msg = str(mikrotik_error)
-                            logger.error(f"❌ Mikrotik update GAGAL untuk Langganan ID: {langganan.id}, tetapi suspend di DB akan tetap dijalankan. Error: {mikrotik_error}")
-
-                            # Tandai untuk retry otomatis nanti
-                            if data_teknis:
-                                data_teknis.mikrotik_sync_pending = True
-                                db.add(data_teknis)
-                                logger.info(f"🔄 Ditandai untuk retry otomatis: Langganan ID {langganan.id}")
+                    if data_teknis and data_teknis.id_pelanggan:
+                        changes.append(SecretStatusChange.from_models(langganan.id, data_teknis, "Suspended"))
                     else:
                         logger.warning(f"⚠️ Data Teknis tidak ditemukan untuk langganan ID {langganan.id}, suspend hanya di DB.")
 
-                    # 2. UPDATE DATABASE (Priority - pastikan ini selalu jalan)
-                    try:
-                        # Update invoice menjadi kadaluarsa
-                        update_invoice_stmt = (
-                            update(InvoiceModel)
-                            .where(InvoiceModel.pelanggan_id == langganan.pelanggan_id)
-                            .where(InvoiceModel.status_invoice == "Belum Dibayar")
-                            .values(status_invoice="Kadaluarsa")
-                        )
-                        invoice_update_result: Result = await db.execute(update_invoice_stmt)
-                        total_invoices_overdue += invoice_update_result.rowcount  # type: ignore
+                batch_result = await mikrotik_batch_service.apply(db, changes)
+                failed = batch_result.failed
+                for langganan_id, error in failed.items():
+                    logger.error(
+                        f"❌ Mikrotik update GAGAL untuk Langganan ID: {langganan_id}, tetapi suspend di DB akan tetap dijalankan. Error: {error}"
+                    )
+
+                # 2. UPDATE DATABASE set-based (Priority - pastikan ini selalu jalan), satu commit per batch
+                langganan_ids = [langganan.id for langganan in overdue_batch]
+                pelanggan_ids = list({langganan.pelanggan_id for langganan in overdue_batch})
+                pending_data_teknis_ids = [c.data_teknis_id for c in changes if c.langganan_id in failed]
 
-                        # Update langganan menjadi Suspended (ini PASTI jalan)
-                        langganan.status = "Suspended"
-                        db.add(langganan)
+                try:
+                    # Update invoice menjadi kadaluarsa
+                    invoice_update_result: Result = await db.execute(
+                        update(InvoiceModel)
+                        .where(InvoiceModel.pelanggan_id.in_(pelanggan_ids))
+                        .where(InvoiceModel.status_invoice == "Belum Dibayar")
+                        .values(status_invoice="Kadaluarsa")
+                        .execution_options(synchronize_session=False)
+                    )
 
-                        # Commit perubahan DB
-                        await db.commit()
-                        logger.info(f"✅ DB update SUKSES untuk Langganan ID: {langganan.id}. Status = Suspended.")
+                    # Update langganan menjadi Suspended (ini PASTI jalan)
+                    await db.execute(
+                        update(LanggananModel)
+                        .where(LanggananModel.id.in_(langganan_ids))
+                        .values(status="Suspended")
+                        .execution_options(synchronize_session=False)
+                    )
 
-                        total_services_suspended += 1
+                    # Tandai untuk retry otomatis nanti (job_retry_mikrotik_syncs)
+                    if pending_data_teknis_ids:
+                        await db.execute(
+                            update(DataTeknisModel)
+                            .where(DataTeknisModel.id.in_(pending_data_teknis_ids))
+                            .values(mikrotik_sync_pending=True)
+                            .execution_options(synchronize_session=False)
+                        )
 
-                        if mikrotik_success:
-                            logger.info(f"🔒 Layanan SUKSES di-suspend lengkap (DB + Mikrotik) untuk: {langganan.pelanggan.nama}")
-                        else:
-                            logger.warning(f"⚠️ Layanan di-suspend di DB saja (Mikrotik gagal) untuk: {langganan.pelanggan.nama}")
-                            if mikrotik_error_msg:
-                                logger.warning(f"📝 Mikrotik error detail: {mikrotik_error_msg}")
-
-                    except Exception as db_error:
-                        # Ini ERROR SEVERE - tidak bisa update DB
-                        logger.error(f"❌ KRITIK: Gagal update DB untuk Langganan ID {langganan.id}. Error: {db_error}")
-                        await db.rollback()
-                        logger.error(f"🔄 Rollback DB SELESAI untuk Langganan ID: {langganan.id}.")
-                        # Lanjut ke pelanggan berikutnya
-                        continue
-
-                offset += BATCH_SIZE
-
-            except Exception as e:
-                await db.rollback()
-                logger.error(
-                    f"[FAIL] Scheduler 'job_suspend_services' failed at offset {offset}. Details: {traceback.format_exc()}"
+                    await db.commit()
+                except Exception as db_error:
+                    # Ini ERROR SEVERE - tidak bisa update DB
+                    logger.error(f"❌ KRITIK: Gagal update DB untuk Langganan ID {langganan_ids}. Error: {db_error}")
+                    await db.rollback()
+                    logger.error(f"🔄 Rollback DB SELESAI untuk batch sampai Langganan ID: {last_id}.")
+                    # Lanjut ke batch berikutnya
+                    continue
+
+                total_invoices_overdue += invoice_update_result.rowcount  # type: ignore
+                total_services_suspended += len(langganan_ids)
+                logger.info(
+                    f"🔒 Batch suspend sampai Langganan ID {last_id}: {len(langganan_ids)} di-suspend di DB, "
+                    f"{len(batch_result.succeeded)} sukses di Mikrotik, {len(failed)} ditandai retry"
                 )
-                break
+
+        except Exception as e:
+            await db.rollback()
+            logger.error(
+                f"[FAIL] Scheduler 'job_suspend_services' failed after Langganan ID {batches.last_key}. Details: {traceback.format_exc()}"
+            )
+
+    logger.info(f"[job_suspend_services] {batches.summary()}")
 
     if total_services_suspended > 0:
         log_scheduler_event(
@@ -534,40 +610,37 @@ async def job_send_payment_reminders() -> None:
     total_reminders_sent = 0
     target_due_date = date.today() + timedelta(days=3)
     BATCH_SIZE = 100
-    offset = 0
-
-    async with SessionType() as db:
-        while True:
-            try:
-                base_stmt = (
-                    select(LanggananModel)
-                    .where(
-                        LanggananModel.tgl_jatuh_tempo == target_due_date,
-                        LanggananModel.status == "Aktif",
-                    )
-                    .options(selectinload(LanggananModel.pelanggan))
-                )
-
-                batch_stmt = base_stmt.offset(offset).limit(BATCH_SIZE)
-                reminder_batch = (await db.execute(batch_stmt)).scalars().unique().all()
 
-                if not reminder_batch:
-                    break
+    base_stmt = (
+        select(LanggananModel)
+        .where(
+            LanggananModel.tgl_jatuh_tempo == target_due_date,
+            LanggananModel.status == "Aktif",
+        )
+        .options(selectinload(LanggananModel.pelanggan))
+    )
 
+    async with SessionType() as db:
+        # Checkpoint mencegah pengingat terkirim dua kali kalau job diulang setelah terputus
+        batches = KeysetBatchIterator(
+            db, base_stmt, LanggananModel.id, BATCH_SIZE, job_name="job_send_payment_reminders", run_key=str(target_due_date)
+        )
+        try:
+            async for reminder_batch in batches:
                 for langganan in reminder_batch:
                     pelanggan = langganan.pelanggan
                     logger.info(f"Mengirim pengingat pembayaran untuk pelanggan ID: {pelanggan.id} ({pelanggan.nama})")
                     # Di sini Anda bisa menambahkan logika pengiriman notifikasi (WA, Email, dll)
                     total_reminders_sent += 1
 
-                # Tidak ada db.commit() karena kita hanya membaca data
-                offset += BATCH_SIZE
+                # Tidak ada db.commit() untuk data - hanya checkpoint yang ditulis iterator
 
-            except Exception as e:
-                logger.error(
-                    f"[FAIL] Scheduler 'job_send_payment_reminders' failed at offset {offset}. Details: {traceback.format_exc()}"
-                )
-                break
+        except Exception as e:
+            logger.error(
+                f"[FAIL] Scheduler 'job_send_payment_reminders' failed after Langganan ID {batches.last_key}. Details: {traceback.format_exc()}"
+            )
+
+    logger.info(f"[job_send_payment_reminders] {batches.summary()}")
 
     if total_reminders_sent > 0:
         log_scheduler_event(
@@ -591,7 +664,7 @@ async def job_verify_payments() -> None:
     Kadang ada pembayaran yang masuk tapi callback dari Xendit gagal diterima.
 
     Tugasnya:
-    1. Cek pembayaran yang udah lunas di Xendit (3 hari terakhir)
+    1. Cek pembayaran yang udah lunas di Xendit sejak run terakhir (high-water mark per akun)
     2. Bandingin dengan status di database
     3. Proses pembayaran yang belum tercatat di sistem
     4. Update status invoice jadi 'Lunas'
@@ -618,48 +691,23 @@ async def job_verify_payments() -> None:
             # Bagian 1: Logika Kadaluarsa SUDAH DIHAPUS DARI SINI
 
             # Bagian 2: Rekonsiliasi Pembayaran Terlewat
-            paid_invoice_ids = await xendit_service.get_paid_invoice_ids_since(days=3)
-
-            if not paid_invoice_ids:
-                log_scheduler_event(
-                    logger,
-                    "job_verify_payments",
-                    "completed",
-                    "Tidak ada pembayaran baru di Xendit.",
-                )
-                await db.commit()  # Tetap commit untuk menutup transaksi
-                return
-
-            # PERBAIKAN: Eager load semua relasi yang dibutuhkan oleh _process_successful_payment
-            unprocessed_stmt = (
-                select(InvoiceModel)
-                .where(
-                    InvoiceModel.xendit_external_id.in_(paid_invoice_ids),
-                    InvoiceModel.status_invoice != "Lunas",
-                )
-                .options(
-                    selectinload(InvoiceModel.pelanggan).options(
-                        selectinload(PelangganModel.harga_layanan),
-                        selectinload(PelangganModel.langganan).selectinload(LanggananModel.paket_layanan),
-                        selectinload(PelangganModel.data_teknis),
-                    )
-                )
-            )
-            invoices_to_process = (await db.execute(unprocessed_stmt)).scalars().unique().all()
+            # Incremental per akun Xendit (high-water mark paid_after), semua halaman,
+            # di-match per chunk ke xendit_external_id. Commit dilakukan di dalam reconcile().
+            report = await xendit_reconciliation.reconcile(db, _process_successful_payment)
 
-            processed_count = 0
-            if invoices_to_process:
-                logger.warning(f"[VERIFY] Menemukan {len(invoices_to_process)} pembayaran terlewat. Memproses...")
-                for invoice in invoices_to_process:
-                    await _process_successful_payment(db, invoice)
-                    processed_count += 1
+            if report["processed"]:
+                logger.warning(f"[VERIFY] Memproses {report['processed']} pembayaran terlewat.")
+            for account in report["accounts"]:
+                if account["error"] or account["truncated"]:
+                    logger.warning(f"[VERIFY] Rekonsiliasi {account['brand']} belum lengkap: {account}")
 
-            await db.commit()
             log_scheduler_event(
                 logger,
                 "job_verify_payments",
                 "completed",
-                f"Memproses {processed_count} pembayaran terlewat.",
+                f"Memproses {report['processed']} pembayaran terlewat "
+                f"({report['fetched']} PAID ditarik, {report['throughput_per_second']}/s, "
+                f"lag maks {report['max_lag_seconds']:.0f}s).",
             )
 
         except Exception as e:
@@ -696,46 +744,55 @@ async def job_retry_failed_invoices() -> None:
     MAX_RETRY = 3
     RETRY_INTERVAL_HOURS = 1
     BATCH_SIZE = 50
-    offset = 0
     total_retried = 0
     total_success = 0
     total_failed = 0
 
-    async with SessionType() as db:
-        while True:
-            try:
-                # Cari invoice yang gagal (belum ada xendit_id)
-                stmt = (
-                    select(InvoiceModel)
-                    .where(
-                        InvoiceModel.xendit_id.is_(None),
-                        InvoiceModel.status_invoice == "Belum Dibayar",
-                        InvoiceModel.xendit_retry_count < MAX_RETRY,
-                    )
-                    .where(
-                        # Cek interval retry (1 jam sejak retry terakhir)
-                        (InvoiceModel.xendit_last_retry.is_(None)) |
-                        (
-                            InvoiceModel.xendit_last_retry <
-                            datetime.now() - timedelta(hours=RETRY_INTERVAL_HOURS)
-                        )
-                    )
-                    .options(
-                        selectinload(InvoiceModel.pelanggan).options(
-                            selectinload(PelangganModel.harga_layanan),
-                            selectinload(PelangganModel.data_teknis),
-                            selectinload(PelangganModel.langganan).selectinload(LanggananModel.paket_layanan),
-                        )
-                    )
-                    .order_by(InvoiceModel.created_at.desc())  # Prioritaskan yang paling lama
-                )
-
-                batch_stmt = stmt.offset(offset).limit(BATCH_SIZE)
-                failed_invoices = (await db.execute(batch_stmt)).scalars().unique().all()
-
-                if not failed_invoices:
-                    break
+    # Cari invoice yang gagal (belum ada xendit_id)
+    stmt = (
+        select(InvoiceModel)
+        .where(
+            InvoiceModel.xendit_id.is_(None),
+            InvoiceModel.status_invoice == "Belum Dibayar",
+            InvoiceModel.xendit_retry_count < MAX_RETRY,
+        )
+        .where(
+            # Cek interval retry (1 jam sejak retry terakhir)
+            (InvoiceModel.xendit_last_retry.is_(None)) |
+            (
+                InvoiceModel.xendit_last_retry <
+                datetime.now() - timedelta(hours=RETRY_INTERVAL_HOURS)
+            )
+        )
+        # Invoice yang masih antri / sedang diproses di outbox di-handle worker outbox.
+        # Entry dead-letter tetap ikut di-retry di sini (dan masuk alert admin kalau tetap gagal).
+        .where(
+            ~select(InvoiceOutbox.id)
+            .where(
+                InvoiceOutbox.invoice_id == InvoiceModel.id,
+                InvoiceOutbox.status.in_(("pending", "processing")),
+            )
+            .exists()
+        )
+        .options(
+            selectinload(InvoiceModel.pelanggan).options(
+                selectinload(PelangganModel.harga_layanan),
+                selectinload(PelangganModel.data_teknis),
+                selectinload(PelangganModel.langganan).selectinload(LanggananModel.paket_layanan),
+            )
+        )
+    )
 
+    async with SessionType() as db:
+        # Keyset by id (ascending = yang paling lama duluan). Invoice yang di-retry keluar dari
+        # filter (xendit_last_retry di-update), jadi offset akan melompati invoice lain.
+        # run_key per jam: run yang terputus lanjut dari checkpoint di jam yang sama.
+        batches = KeysetBatchIterator(
+            db, stmt, InvoiceModel.id, BATCH_SIZE,
+            job_name="job_retry_failed_invoices", run_key=datetime.now().strftime("%Y-%m-%d %H"),
+        )
+        try:
+            async for failed_invoices in batches:
                 for invoice in failed_invoices:
                     try:
                         logger.info(f"🔄 Retrying invoice {invoice.invoice_number} (attempt {invoice.xendit_retry_count + 1}/{MAX_RETRY})")
@@ -815,12 +872,14 @@ async def job_retry_failed_invoices() -> None:
                     total_retried += 1
 
                 await db.commit()
-                offset += BATCH_SIZE
 
-            except Exception as e:
-                await db.rollback()
-                logger.error(f"[FAIL] Scheduler 'job_retry_failed_invoices' failed at offset {offset}. Details: {traceback.format_exc()}")
-                break
+        except Exception as e:
+            await db.rollback()
+            logger.error(
+                f"[FAIL] Scheduler 'job_retry_failed_invoices' failed after Invoice ID {batches.last_key}. Details: {traceback.format_exc()}"
+            )
+
+    logger.info(f"[job_retry_failed_invoices] {batches.summary()}")
 
     # Log hasil proses
     if total_retried > 0:
@@ -849,16 +908,9 @@ async def job_retry_failed_invoices() -> None:
                         "action_url": "/invoices?filter=failed"
                     }
                 }
-                # Dapatkan semua user dengan role admin dan super_admin
-                admin_users = manager.get_users_by_role("admin")
-                super_admin_users = manager.get_users_by_role("super_admin")
-                all_admin_users = list(set(admin_users + super_admin_users))  # Remove duplicates
-
-                if all_admin_users:
-                    await manager.broadcast_to_roles(notification_data, all_admin_users)
-                    logger.info(f"📢 Notifikasi error terkirim ke {len(all_admin_users)} admin via WebSocket")
-                else:
-                    logger.warning("⚠️ Tidak ada admin user yang aktif untuk notifikasi")
+                # Kirim ke semua user online dengan role admin / super_admin (di semua worker)
+                await manager.broadcast_to_role_names(notification_data, ["admin", "super_admin"])
+                logger.info("📢 Notifikasi error terkirim ke admin via WebSocket")
             except Exception as notif_error:
                 logger.error(f"Gagal mengirim notifikasi ke admin: {notif_error}")
     else:
@@ -919,20 +971,32 @@ async def job_retry_mikrotik_syncs() -> None:
                 return
 
             logger.info(f"Found {len(pending_syncs)} pending Mikrotik syncs to retry.")
+            # Kelompokkan per router dan kirim sekaligus (status target = status langganan sekarang)
+            changes = []
             for data_teknis in pending_syncs:
-                try:
-                    langganan = data_teknis.pelanggan.langganan[0]
-                    # Coba jalankan lagi fungsi update ke Mikrotik DENGAN ARGUMEN LENGKAP
-                    await mikrotik_service.trigger_mikrotik_update(db, langganan, data_teknis, data_teknis.id_pelanggan)
-
-                    # Jika berhasil, set flag kembali ke False
-                    setattr(data_teknis, 'mikrotik_sync_pending', False)
-                    db.add(data_teknis)
-                    logger.info(f"Successfully synced pending update for Data Teknis ID: {data_teknis.id}")
-                    total_retried += 1
-                except Exception as e:
-                    # Jika masih gagal, biarkan flag tetap True dan catat error
-                    logger.error(f"Still failing to sync Mikrotik for Data Teknis ID {data_teknis.id}: {e}")
+                if not data_teknis.pelanggan or not data_teknis.pelanggan.langganan or not data_teknis.id_pelanggan:
+                    logger.error(f"Still failing to sync Mikrotik for Data Teknis ID {data_teknis.id}: langganan tidak ditemukan")
+                    continue
+                langganan = data_teknis.pelanggan.langganan[0]
+                changes.append(SecretStatusChange.from_models(langganan.id, data_teknis, langganan.status))
+
+            batch_result = await mikrotik_batch_service.apply(db, changes)
+            for langganan_id, error in batch_result.failed.items():
+                # Jika masih gagal, biarkan flag tetap True dan catat error
+                logger.error(f"Still failing to sync Mikrotik for Langganan ID {langganan_id}: {error}")
+
+            # Jika berhasil, set flag kembali ke False (satu UPDATE untuk semua)
+            succeeded = set(batch_result.succeeded)
+            synced_ids = [c.data_teknis_id for c in changes if c.langganan_id in succeeded]
+            if synced_ids:
+                await db.execute(
+                    update(DataTeknisModel)
+                    .where(DataTeknisModel.id.in_(synced_ids))
+                    .values(mikrotik_sync_pending=False)
+                    .execution_options(synchronize_session=False)
+                )
+                logger.info(f"Successfully synced pending update for Data Teknis ID: {synced_ids}")
+            total_retried = len(synced_ids)
 
             await db.commit()
             log_scheduler_event(
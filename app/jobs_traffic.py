@@ -55,6 +55,10 @@ async def job_collect_traffic_data():
             logger.info(f"   - Servers processed: {result.get('servers_processed', 0)}")
             logger.info(f"   - Total users: {result.get('total_users', 0)}")
             logger.info(f"   - Errors: {len(result.get('errors', []))}")
+            logger.info(
+                f"   - Router fetch: {result.get('fetch_wall_ms', 0):.0f} ms wall, "
+                f"slowest {result.get('slowest_router_ms', 0):.0f} ms, sum {result.get('sum_router_ms', 0):.0f} ms"
+            )
 
             if result.get('errors'):
                 logger.warning(f"⚠️ Collection errors occurred:")
@@ -78,32 +82,22 @@ async def job_cleanup_old_traffic_data():
 
     async with get_async_db() as db:
         try:
-            # Cleanup old data using service
-            retention_days = traffic_monitoring_service.retention_days
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=retention_days)
-
-            # Query old records
-            from .models.traffic_history import TrafficHistory
-            from sqlalchemy import select
-
-            query = select(TrafficHistory).where(TrafficHistory.timestamp < cutoff_date)
-            result = await db.execute(query)
-            old_records = result.scalars().all()
-
-            # Delete old records
-            deleted_count = 0
-            for record in old_records:
-                await db.delete(record)
-                deleted_count += 1
-
-            await db.commit()
+            # Purge set-based per level (raw + rollup), tanpa load ORM object
+            report = await traffic_monitoring_service._cleanup_old_data(db)
 
             # Log results
             end_time = datetime.now(timezone.utc)
             duration = (end_time - start_time).total_seconds()
 
             logger.info(f"✅ {job_name} Completed in {duration:.2f}s")
-            logger.info(f"🗑️ Deleted {deleted_count} old traffic records (older than {cutoff_date})")
+            logger.info(f"🗑️ Reclaimed {report['rows_reclaimed']} traffic rows in {report['duration_ms']:.0f} ms")
+            for level, stats in report["levels"].items():
+                logger.info(
+                    f"   - {level}: {stats['rows_deleted']} rows, {stats['partitions_dropped']} partitions dropped "
+                    f"(older than {stats['cutoff']}, {stats['duration_ms']:.0f} ms)"
+                )
+                if stats.get("error"):
+                    logger.warning(f"⚠️ Retention {level} error: {stats['error']}")
 
         except Exception as e:
             logger.error(f"❌ {job_name} Failed: {str(e)}")
@@ -12,6 +12,10 @@ Features:
 - Structured logging functions buat consistency
 - Sensitive data filtering
 - Module-specific log routing
+- Non-blocking pipeline: logger cuma enqueue (QueueHandler), I/O file & console
+  dikerjakan thread QueueListener di luar event loop
+- Sampling & rate-limit per logger buat logger yang berisik
+- Optional format JSON lines (LOG_FORMAT=json)
 
 Log files generated:
 - logs/app.log (Main application log, 10MB, 5 backups)
@@ -27,13 +31,22 @@ Usage:
     log_scheduler_event(logger, "job_name", "started", "details")
 """
 
+import json
 import logging
 import logging.config
+import logging.handlers
 import os
 import platform
+import queue
+import random
 import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import settings
 
 # Import our custom logging utilities
 try:
@@ -320,6 +333,8 @@ class EnhancedColoredFormatter(logging.Formatter):
             self.use_colors = True
 
     def format(self, record: logging.LogRecord) -> str:
+        # Kerja di salinan: record yang sama juga dipakai handler lain (file, JSON)
+        record = logging.makeLogRecord(record.__dict__)
         if self.use_colors:
             color = self.COLORS.get(record.levelname, self.COLORS["RESET"])
             reset = self.COLORS["RESET"]
@@ -340,10 +355,204 @@ class FileFormatter(logging.Formatter):
     """Clean formatter for file output without colors"""
 
     def format(self, record: logging.LogRecord) -> str:
+        record = logging.makeLogRecord(record.__dict__)
         record.name = record.name.replace("app.", "").upper()
         return super().format(record)
 
 
+class JsonLinesFormatter(logging.Formatter):
+    """Satu record = satu baris JSON compact (buat log shipper / grep pakai jq)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# --- Non-blocking Pipeline (QueueHandler + QueueListener) ---
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sampling & rate-limit per logger (prefix nama logger, paling spesifik menang).
+    Hanya berlaku untuk record di bawah WARNING - warning/error selalu lolos.
+
+    - sampling: {"app.services.traffic_monitoring_service": 0.1} -> simpan ~10% record
+    - rate_limits: {"app.middleware": 50} -> maksimal 50 record/detik, sisanya dibuang
+    """
+
+    def __init__(self, sampling: Dict[str, float], rate_limits: Dict[str, int]) -> None:
+        super().__init__()
+        self.sampling = dict(sampling)
+        self.rate_limits = dict(rate_limits)
+        self.sampled_out: Dict[str, int] = {}
+        self.rate_limited: Dict[str, int] = {}
+        self._windows: Dict[str, List[float]] = {}  # prefix -> [awal window (detik), jumlah record]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _match(name: str, rules: Dict[str, Any]) -> Optional[str]:
+        best = None
+        for prefix in rules:
+            if (name == prefix or name.startswith(prefix + ".")) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return best
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        prefix = self._match(record.name, self.sampling)
+        if prefix is not None and random.random() >= self.sampling[prefix]:
+            with self._lock:
+                self.sampled_out[prefix] = self.sampled_out.get(prefix, 0) + 1
+            return False
+
+        prefix = self._match(record.name, self.rate_limits)
+        if prefix is not None:
+            now = time.monotonic()
+            with self._lock:
+                window = self._windows.setdefault(prefix, [now, 0])
+                if now - window[0] >= 1.0:
+                    window[0], window[1] = now, 0
+                if window[1] >= self.rate_limits[prefix]:
+                    self.rate_limited[prefix] = self.rate_limited.get(prefix, 0) + 1
+                    return False
+                window[1] += 1
+        return True
+
+
+class PipelineQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler untuk satu route; queue penuh = record dibuang (dihitung), tidak memblokir caller."""
+
+    def __init__(self, pipeline: "LogPipeline", route: str) -> None:
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+        self.route = route
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.log_route = self.route
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.record_dropped()
+
+
+class _RouteDispatcher(logging.Handler):
+    """Dijalankan thread QueueListener: kirim record ke handler asli milik route-nya."""
+
+    def __init__(self, pipeline: "LogPipeline") -> None:
+        super().__init__()
+        self.pipeline = pipeline
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in self.pipeline.routes.get(getattr(record, "log_route", ""), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:  # pragma: no cover - handle() sudah override
+        self.handle(record)
+
+
+class LogPipeline:
+    """
+    Satu queue + satu thread listener untuk semua logger.
+
+    install() mengganti handler setiap logger yang dikonfigurasi dengan satu
+    PipelineQueueHandler; handler asli (console, file) disimpan per route dan
+    hanya dipanggil dari thread listener. Routing per logger tetap sama
+    seperti konfigurasi dictConfig.
+    """
+
+    def __init__(self, queue_size: int, sampling: SamplingFilter) -> None:
+        self.queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, queue_size))
+        self.sampling = sampling
+        self.routes: Dict[str, List[logging.Handler]] = {}
+        self.dropped = 0
+        self._installed: List[tuple] = []  # (logger, handler asli) buat dikembalikan saat stop()
+        self._listener = logging.handlers.QueueListener(self.queue, _RouteDispatcher(self))
+
+    def record_dropped(self) -> None:
+        self.dropped += 1
+
+    def install(self, logger_names: List[str]) -> None:
+        queue_handlers: Dict[tuple, PipelineQueueHandler] = {}
+        for name in logger_names:
+            target = logging.getLogger(name) if name else logging.getLogger()
+            handlers = list(target.handlers)
+            if not handlers:
+                continue
+            key = tuple(id(h) for h in handlers)
+            if key not in queue_handlers:
+                route = f"route{len(queue_handlers)}"
+                self.routes[route] = handlers
+                queue_handler = PipelineQueueHandler(self, route)
+                queue_handler.addFilter(self.sampling)
+                queue_handlers[key] = queue_handler
+            self._installed.append((target, handlers))
+            target.handlers = [queue_handlers[key]]
+
+    def start(self) -> None:
+        self._listener.start()
+
+    def stop(self) -> None:
+        """Flush sisa queue, hentikan thread listener, lalu kembalikan handler asli (logging sinkron lagi)."""
+        self._listener.stop()
+        for target, handlers in self._installed:
+            target.handlers = handlers
+        self._installed = []
+        for handler in {id(h): h for handlers in self.routes.values() for h in handlers}.values():
+            handler.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.dropped,
+            "sampled_out": dict(self.sampling.sampled_out),
+            "rate_limited": dict(self.sampling.rate_limited),
+        }
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    """Statistik pipeline logging: record yang dibuang (queue penuh), di-sampling, dan kena rate-limit."""
+    if _pipeline is None:
+        return {"async": False}
+    return {"async": True, **_pipeline.get_stats()}
+
+
+def shutdown_logging() -> None:
+    """Flush dan hentikan pipeline logging (dipanggil saat aplikasi shutdown)."""
+    global _pipeline
+    if _pipeline is None:
+        return
+    stats = _pipeline.get_stats()
+    _pipeline.stop()
+    _pipeline = None
+    logging.getLogger("app.main").info(
+        f"Logging pipeline stopped | dropped={stats['dropped']} sampled_out={sum(stats['sampled_out'].values())} "
+        f"rate_limited={sum(stats['rate_limited'].values())}"
+    )
+
+
 # --- Core Logging Setup ---
 
 
@@ -370,6 +579,7 @@ def setup_logging() -> logging.Logger:
     - access.log: API access, simple format, 10MB rotation
 
     Handler features:
+    - QueueHandler/QueueListener: logger cuma enqueue, I/O di thread terpisah (LOG_ASYNC)
     - RotatingFileHandler: Automatic log rotation
     - UTF-8 encoding: Support Unicode characters
     - Sensitive data filtering: Hide passwords/API keys
@@ -391,6 +601,11 @@ def setup_logging() -> logging.Logger:
     - Handles Unicode encoding errors gracefully
     """
 
+    global _pipeline
+    if _pipeline is not None:
+        # setup_logging dipanggil ulang - matikan pipeline lama dulu
+        shutdown_logging()
+
     # Create log directory
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
@@ -428,6 +643,9 @@ def setup_logging() -> logging.Logger:
                 "format": f"%(asctime)s | %(levelname)-8s | %(message)s",
                 "datefmt": "%Y-%m-%d %H:%M:%S",
             },
+            "json": {
+                "()": JsonLinesFormatter,
+            },
         },
         "handlers": {
             "console": {
@@ -508,9 +726,23 @@ def setup_logging() -> logging.Logger:
         },
     }
 
+    # LOG_FORMAT=json: semua handler tulis JSON lines (satu record per baris)
+    if settings.LOG_FORMAT.lower() == "json":
+        for handler_config in logging_config["handlers"].values():
+            handler_config["formatter"] = "json"
+
     # Apply logging configuration
     logging.config.dictConfig(logging_config)
 
+    # Pindahkan semua I/O handler ke thread QueueListener
+    if settings.LOG_ASYNC:
+        _pipeline = LogPipeline(
+            settings.LOG_QUEUE_SIZE,
+            SamplingFilter(settings.LOG_SAMPLING, settings.LOG_RATE_LIMITS),
+        )
+        _pipeline.install([""] + list(logging_config["loggers"].keys()))
+        _pipeline.start()
+
     # Get main logger
     logger = logging.getLogger("app.main")
 
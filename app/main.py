@@ -33,8 +33,6 @@ from fastapi.staticfiles import StaticFiles
 from jose import JWTError, jwt
 
 # Database components
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import modul-modul lokal
 from . import config
@@ -54,12 +52,12 @@ from .jobs import (
 )
 
 # Import untuk logging
-from .logging_config import setup_logging
+from .logging_config import setup_logging, shutdown_logging
 
 # Import models (database tables)
-from .models.activity_log import ActivityLog
-from .models.system_setting import SystemSetting as SettingModel
 from .models.user import User as UserModel
+from .services.activity_log_writer import activity_log_writer
+from .services.settings_cache import system_settings_cache
 
 # Import semua router (API endpoints)
 from .routers import (
@@ -196,27 +194,18 @@ async def maintenance_mode_middleware(request: Request, call_next):
     if any(request.url.path.startswith(path) for path in allowed_paths):
         return await call_next(request)
 
-    async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
-        # Ambil status maintenance dari database dengan query berdasarkan key
-        stmt_active = select(SettingModel).where(SettingModel.setting_key == "maintenance_active")
-        maintenance_active_setting = (await db.execute(stmt_active)).scalar_one_or_none()
-        is_active = maintenance_active_setting and maintenance_active_setting.setting_value.lower() == "true"
-
-        if is_active:
-            # Jika maintenance aktif, ambil pesannya
-            stmt_message = select(SettingModel).where(SettingModel.setting_key == "maintenance_message")
-            maintenance_message_setting = (await db.execute(stmt_message)).scalar_one_or_none()
-            message = (
-                maintenance_message_setting.setting_value
-                if maintenance_message_setting
-                else "Sistem sedang dalam perbaikan. Silakan coba lagi nanti."
-            )
+    # Status maintenance dari cache system_settings (tanpa query database per request)
+    if await system_settings_cache.get_bool("maintenance_active"):
+        # Jika maintenance aktif, ambil pesannya
+        message = await system_settings_cache.get(
+            "maintenance_message", "Sistem sedang dalam perbaikan. Silakan coba lagi nanti."
+        )
 
-            # Kembalikan response 503 Service Unavailable
-            return JSONResponse(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                content={"detail": message},
-            )
+        # Kembalikan response 503 Service Unavailable
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": message},
+        )
 
     # Jika tidak maintenance, lanjutkan ke request berikutnya
     response = await call_next(request)
@@ -228,9 +217,9 @@ async def maintenance_mode_middleware(request: Request, call_next):
 
 
 # --- FUNGSI BANTU UNTUK MENDAPATKAN USER DARI TOKEN (VERSI AMAN UNTUK LOGGING) ---
-async def get_user_from_token_for_logging(token: str, db: AsyncSession) -> UserModel | None:
+def get_user_id_from_token_for_logging(token: str) -> int | None:
     """
-    Mendekode token dan mengambil data user untuk keperluan logging.
+    Mendekode token dan mengambil user id untuk keperluan logging (tanpa query database).
     Fungsi ini aman dan akan mengembalikan None jika terjadi error, tanpa menghentikan aplikasi.
     """
     if not token:
@@ -240,13 +229,27 @@ async def get_user_from_token_for_logging(token: str, db: AsyncSession) -> UserM
         user_id: str | None = payload.get("sub")
         if user_id is None:
             return None
-        user = await db.get(UserModel, int(user_id))
-        return user
+        return int(user_id)
     except (JWTError, ValueError, TypeError):
         # Menangkap semua kemungkinan error (token tidak valid, user_id bukan angka, dll)
         return None
 
 
+def describe_request_body(content_type: str, body: bytes) -> str | None:
+    """Isi kolom details ActivityLog dari body request."""
+    if not body:
+        return None
+    try:
+        # Hanya coba decode JSON untuk content-type application/json
+        if "application/json" in content_type:
+            return json.dumps(json.loads(body.decode("utf-8")))
+        # Skip JSON parsing untuk non-JSON content (file uploads, etc.)
+        return f"[Binary data, Content-Type: {content_type}]"
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+        # Tangkap berbagai jenis decode error
+        return f"[Parse error - {str(e)}, Content-Type: {content_type}"
+
+
 # Tambahan middleware untuk logging request
 @app.middleware("http")
 async def log_requests_and_activity(request: Request, call_next):
@@ -255,60 +258,60 @@ async def log_requests_and_activity(request: Request, call_next):
 
     # Log semua request yang masuk
     logger.info(f"Incoming request: {request.method} {request.url}")
-    logger.info(f"Headers: {dict(request.headers)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Headers: {dict(request.headers)}")
+
+    url = str(request.url)
+    content_type = request.headers.get("content-type", "")
+    is_activity = request.method in ["POST", "PATCH", "DELETE"] and "/token" not in url and "/login" not in url
+    is_xendit_callback = "xendit-callback" in url
+
+    # Body hanya dibaca (di-buffer) kalau memang akan dicatat: JSON untuk activity log
+    # dan webhook Xendit. Upload file / request lain diteruskan apa adanya (streaming).
+    req_body_bytes = b""
+    if is_xendit_callback or (is_activity and "application/json" in content_type):
+        req_body_bytes = await request.body()
 
-    # --- LOGIKA BARU: BACA BODY REQUEST DI AWAL ---
-    # Kita harus membaca body di sini agar bisa digunakan untuk logging nanti.
-    req_body_bytes = await request.body()
+        # Buat ulang request agar endpoint tetap bisa membaca body-nya.
+        async def receive():
+            return {"type": "http.request", "body": req_body_bytes, "more_body": False}
 
-    # Buat ulang request agar endpoint tetap bisa membaca body-nya.
-    async def receive():
-        return {"type": "http.request", "body": req_body_bytes, "more_body": False}
+        request = Request(request.scope, receive)
 
-    request_with_body = Request(request.scope, receive)
-    # --- AKHIR LOGIKA BACA BODY ---
+    # Pastikan scope["state"] sudah ada supaya request.state.principal yang diisi
+    # get_current_active_user di endpoint terlihat juga dari middleware ini
+    request.scope.setdefault("state", {})
 
     # Jika ini adalah webhook Xendit, log lebih detail
-    if "xendit-callback" in str(request.url):
+    if is_xendit_callback:
         logger.info(f"Xendit webhook body: {req_body_bytes.decode('utf-8') if req_body_bytes else 'Empty body'}")
 
-    response = await call_next(request_with_body)
+    response = await call_next(request)
 
     process_time = time.time() - start_time
     logger.info(f"Response status: {response.status_code} in {process_time:.2f}s")
 
-    # --- LOGIKA BARU: SIMPAN ACTIVITY LOG KE DATABASE ---
-    if request.method in ["POST", "PATCH", "DELETE"] and 200 <= response.status_code < 300:
-        if "/token" not in str(request.url) and "/login" not in str(request.url):
-            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
-                try:
-                    auth_header = request.headers.get("Authorization", "")
-                    token = auth_header.replace("Bearer ", "")
-                    user = await get_user_from_token_for_logging(token, db)
-                    if user:
-                        details = None
-                        if req_body_bytes:
-                            try:
-                                # Hanya coba decode JSON untuk content-type application/json
-                                content_type = request.headers.get('content-type', '')
-                                if 'application/json' in content_type:
-                                    details = json.dumps(json.loads(req_body_bytes.decode('utf-8')))
-                                else:
-                                    # Skip JSON parsing untuk non-JSON content (file uploads, etc.)
-                                    details = f"[Binary data, Content-Type: {content_type}]"
-                            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
-                                # Tangkap berbagai jenis decode error
-                                details = f"[Parse error - {str(e)}, Content-Type: {request.headers.get('content-type')}"
-                        log_entry = ActivityLog(
-                            user_id=user.id,
-                            action=f"{request.method} {request.url.path}",
-                            details=details,
-                        )
-                        db.add(log_entry)
-                        await db.commit()
-                        logger.info(f"Activity logged for user {user.email}: {log_entry.action}")
-                except Exception as e:
-                    logger.error(f"Failed to log activity: {e}", exc_info=True)
+    # Activity log di-antrikan ke writer background (bulk insert), bukan insert + commit di sini
+    if is_activity and 200 <= response.status_code < 300:
+        try:
+            # Principal yang sudah di-resolve endpoint (get_current_active_user), kalau ada
+            principal = getattr(request.state, "principal", None)
+            if principal is not None:
+                user_id = principal.id
+            else:
+                auth_header = request.headers.get("Authorization", "")
+                user_id = get_user_id_from_token_for_logging(auth_header.replace("Bearer ", ""))
+            if user_id:
+                if "application/json" in content_type:
+                    details = describe_request_body(content_type, req_body_bytes)
+                else:
+                    has_body = request.headers.get("content-length", "0") != "0" or "transfer-encoding" in request.headers
+                    details = f"[Binary data, Content-Type: {content_type}]" if has_body else None
+                action = f"{request.method} {request.url.path}"
+                if activity_log_writer.enqueue(user_id, action, details):
+                    logger.info(f"Activity queued for user {user_id}: {action}")
+        except Exception as e:
+            logger.error(f"Failed to log activity: {e}", exc_info=True)
 
     return response
 
@@ -414,16 +417,17 @@ async def websocket_status():
     metrics = manager.get_metrics()
     active_connections = list(manager.active_connections.keys())
 
-    # Get connection metadata
+    # Get connection metadata (satu user bisa punya beberapa sesi)
     connection_details = {}
     for user_id in active_connections:
-        if user_id in manager.connection_metadata:
-            metadata = manager.connection_metadata[user_id]
+        sessions = [conn.get_info() for conn in manager.active_connections.get(user_id, ())]
+        if sessions:
             connection_details[user_id] = {
-                "connected_at": metadata.get("connected_at", 0),
-                "last_activity": metadata.get("last_activity", 0),
-                "messages_sent": metadata.get("messages_sent", 0),
-                "roles": list(manager.user_roles.get(user_id, []))
+                "connected_at": min(session["connected_at"] for session in sessions),
+                "last_activity": max(session["last_activity"] for session in sessions),
+                "messages_sent": sum(session["messages_sent"] for session in sessions),
+                "roles": list(manager.user_roles.get(user_id, [])),
+                "sessions": sessions,
             }
 
     return {
@@ -532,12 +536,12 @@ async def websocket_notifications(websocket: WebSocket, token: str = Query(...))
 
         logger.info(f"[{endpoint_name}] Authentication successful: {user.name} (ID: {user.id}, Email: {user.email})")
 
-        # Connect WebSocket menggunakan manager
-        await manager.connect(websocket, user.id)
+        # Connect WebSocket menggunakan manager (role disimpan untuk broadcast per role)
+        connection = await manager.connect(websocket, user.id, roles=[user.role.name] if user.role else [])
         logger.info(f"[{endpoint_name}] Connection established for user {user.id} from IP {client_ip}")
 
-        # Kirim pesan konfirmasi ke client
-        await websocket.send_text(json.dumps({
+        # Semua pengiriman ke socket ini lewat antrian koneksi (satu writer per socket)
+        connection.enqueue(json.dumps({
             "type": "connection_established",
             "message": "WebSocket connected successfully",
             "user_id": user.id,
@@ -553,15 +557,16 @@ async def websocket_notifications(websocket: WebSocket, token: str = Query(...))
             while True:
                 # Tunggu pesan dari client
                 data = await websocket.receive_text()
+                connection.touch()
                 log_message = data[:100] + "..." if len(data) > 100 else data
                 logger.debug(f"[{endpoint_name}] Message from user {user.id}: {log_message}")
 
                 # Handle ping/pong untuk keep-alive
                 if data.lower() == "ping":
-                    await websocket.send_text(json.dumps({
+                    connection.enqueue(json.dumps({
                         "type": "pong",
                         "timestamp": datetime.now().isoformat()
-                    }))
+                    }), coalesce_key="pong")
                     continue
 
                 # Handle JSON commands
@@ -570,7 +575,7 @@ async def websocket_notifications(websocket: WebSocket, token: str = Query(...))
                     command = msg_data.get("command")
 
                     if command == "get_status":
-                        await websocket.send_text(json.dumps({
+                        connection.enqueue(json.dumps({
                             "type": "status_response",
                             "status": "connected",
                             "user_id": user.id,
@@ -585,7 +590,7 @@ async def websocket_notifications(websocket: WebSocket, token: str = Query(...))
         except Exception as e:
             logger.error(f"[{endpoint_name}] WebSocket error for user {user.id}: {e}")
         finally:
-            await manager.disconnect(user.id)
+            await manager.disconnect(user.id, connection)
 
     except Exception as e:
         logger.error(f"[{endpoint_name}] WebSocket connection error: {e}")
@@ -660,6 +665,40 @@ async def startup_event():
     # 6. Mulai scheduler
     scheduler.start()
     print("Scheduler telah dimulai...")
+
+    # 7. Keepalive + eviction koneksi Mikrotik di background (bukan probe per checkout)
+    from .services.mikrotik_connection_pool import mikrotik_pool
+    mikrotik_pool.start_maintenance()
+
+    # 8. Cache system_settings (dipakai maintenance_mode_middleware di setiap request)
+    await system_settings_cache.load()
+
+    # 9. HTTP client Xendit long-lived (keep-alive per akun)
+    from .services.xendit_service import xendit_clients
+    await xendit_clients.start()
+
+    # 10. Writer activity log (bulk insert di background)
+    activity_log_writer.start()
+
+    # 11. Worker antrian invoice_outbox (bisa jalan di banyak proses sekaligus)
+    if settings.INVOICE_OUTBOX_WORKER_ENABLED:
+        from .services.invoice_outbox import invoice_outbox
+        invoice_outbox.start_worker()
+
+    # 12. Index IP pool per server Mikrotik (database + PPP secret router, sinkron di background)
+    from .services.ip_pool_allocator import ip_pool_allocator
+    ip_pool_allocator.start_worker()
+
+    # 13. Bus WebSocket antar worker (notifikasi sampai ke socket di worker mana pun)
+    await manager.start_bus()
+
+    # 14. Snapshot widget dashboard (dihitung di background, GET /dashboard tanpa query agregat)
+    from .services.dashboard_snapshot import dashboard_snapshot
+    dashboard_snapshot.start_worker()
+
+    # 15. Health monitor Mikrotik (probe up/down router di background, dibaca dashboard & /mikrotik_servers)
+    from .services.mikrotik_health_monitor import mikrotik_health_monitor
+    mikrotik_health_monitor.start_worker()
     logger.info("Application startup complete")
 
 
@@ -667,8 +706,51 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     scheduler.shutdown()
+
+    # Matikan thread pool collector traffic
+    from .services.traffic_monitoring_service import traffic_monitoring_service
+    traffic_monitoring_service.shutdown()
+
+    # Matikan thread pool Mikrotik API
+    from .services import mikrotik_service
+    mikrotik_service.shutdown_executor()
+    mikrotik_service.mikrotik_pool.stop_maintenance()
+    mikrotik_service.mikrotik_pool.close_all_connections()
+
+    # Matikan thread pool bcrypt
+    from .services.password_hasher import password_hasher
+    password_hasher.shutdown()
+
+    # Stop worker outbox dulu (entry yang sedang diproses akan di-claim ulang setelah visibility timeout)
+    from .services.invoice_outbox import invoice_outbox
+    await invoice_outbox.stop_worker()
+
+    # Stop sinkronisasi IP pool
+    from .services.ip_pool_allocator import ip_pool_allocator
+    await ip_pool_allocator.stop_worker()
+
+    # Stop probe health monitor Mikrotik
+    from .services.mikrotik_health_monitor import mikrotik_health_monitor
+    await mikrotik_health_monitor.stop_worker()
+
+    # Stop subscriber bus WebSocket
+    await manager.stop_bus()
+
+    # Stop refresh snapshot dashboard
+    from .services.dashboard_snapshot import dashboard_snapshot
+    await dashboard_snapshot.stop_worker()
+
+    # Flush sisa activity log di queue sebelum koneksi database ditutup
+    await activity_log_writer.stop()
+
+    # Tutup HTTP client Xendit
+    from .services.xendit_service import xendit_clients
+    await xendit_clients.close()
     print("Scheduler telah dimatikan.")
 
+    # Terakhir: flush pipeline logging supaya log shutdown di atas ikut tertulis
+    shutdown_logging()
+
 
 # API_PREFIX = os.getenv("API_PREFIX", "")
 
@@ -21,3 +21,7 @@ from .trouble_ticket import TroubleTicket, TicketHistory, ActionTaken, TicketSta
 from .traffic_history import TrafficHistory
 from .payment_callback_log import PaymentCallbackLog
 from .syarat_ketentuan import SyaratKetentuan
+from .traffic_rollup import TrafficRollup5m, TrafficRollupHourly, TrafficRollupDaily
+from .invoice_outbox import InvoiceOutbox
+from .websocket_event import WebSocketEvent
+from .dashboard_snapshot import DashboardSnapshot
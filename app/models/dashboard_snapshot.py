@@ -0,0 +1,38 @@
+# ====================================================================
+# MODEL DASHBOARD SNAPSHOT - HASIL AGREGAT WIDGET DASHBOARD
+# ====================================================================
+# Dipakai DashboardSnapshotService kalau DASHBOARD_SNAPSHOT_PERSIST=True.
+# Satu row per widget (revenue_summary, lokasi_chart, ...) berisi payload
+# JSON hasil perhitungan terakhir. Saat worker baru start, snapshot dibaca
+# dari tabel ini supaya request pertama tidak perlu menunggu semua query
+# agregat dijalankan ulang.
+# ====================================================================
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from datetime import datetime
+
+from sqlalchemy import DateTime, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import DeclarativeBase as Base
+else:
+    from ..database import Base
+
+
+class DashboardSnapshot(Base):
+    """Hasil perhitungan terakhir satu widget dashboard."""
+
+    __tablename__ = "dashboard_snapshots"
+
+    # Nama widget = nama field di DashboardData (plus "pelanggan_stats" / "server_stats")
+    widget: Mapped[str] = mapped_column(String(64), primary_key=True)
+
+    # Payload JSON widget (null kalau perhitungan terakhir gagal)
+    payload: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    computed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<DashboardSnapshot(widget='{self.widget}', computed_at={self.computed_at})>"
@@ -136,6 +136,12 @@ class Invoice(Base):
     # Relasi ke Pelanggan - Customer yang punya invoice ini
     pelanggan = relationship("Pelanggan", back_populates="invoices")
 
+    # Relasi ke InvoiceOutbox - antrian pembuatan payment link Xendit
+    # passive_deletes: row outbox dihapus database (ON DELETE CASCADE), tidak di-load dulu oleh ORM
+    outbox_entry = relationship(
+        "InvoiceOutbox", back_populates="invoice", uselist=False, cascade="all, delete-orphan", passive_deletes=True
+    )
+
     def to_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
@@ -0,0 +1,78 @@
+# ====================================================================
+# MODEL INVOICE OUTBOX - ANTRIAN PEMBUATAN PAYMENT LINK XENDIT
+# ====================================================================
+# Antrian persisten untuk request pembuatan invoice Xendit. Pengganti list
+# in-memory di RateLimiterService: tidak hilang saat restart/deploy dan
+# bisa di-drain oleh beberapa worker / proses sekaligus.
+#
+# Siklus status:
+#   pending --(claim)--> processing --(sukses)--> completed
+#                            |
+#                            +--(gagal, attempts < max)--> pending (available_at = now + backoff)
+#                            +--(gagal, attempts >= max)--> dead (dead-letter)
+#
+# Visibility timeout: row 'processing' yang available_at-nya lewat (worker
+# mati di tengah jalan) boleh di-claim ulang oleh worker lain.
+# ====================================================================
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Float, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import DeclarativeBase as Base
+else:
+    from ..database import Base
+
+if TYPE_CHECKING:
+    from .invoice import Invoice
+
+
+class InvoiceOutbox(Base):
+    """Satu request pembuatan payment link Xendit untuk satu invoice."""
+
+    __tablename__ = "invoice_outbox"
+
+    __table_args__ = (
+        # Query claim: status + available_at, urut priority lalu id
+        Index("idx_outbox_claim", "status", "available_at", "priority", "id"),
+        Index("idx_outbox_completed", "status", "completed_at"),
+        Index("idx_outbox_claim_token", "claim_token"),
+    )
+
+    # Primary Key
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    # Satu entry aktif per invoice (ikut terhapus saat invoice dihapus)
+    invoice_id: Mapped[int] = mapped_column(ForeignKey("invoices.id", ondelete="CASCADE"), unique=True, nullable=False)
+
+    # 0 = HIGH, 1 = NORMAL, 2 = LOW (lihat InvoicePriority)
+    priority: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)  # pending/processing/completed/dead
+
+    # Data request (disimpan saat enqueue supaya worker tidak perlu hitung ulang)
+    deskripsi_xendit: Mapped[str] = mapped_column(Text, nullable=False)
+    pajak: Mapped[float] = mapped_column(Float, default=0.0)
+    no_telp_xendit: Mapped[str | None] = mapped_column(String(50), nullable=True)
+
+    # Retry & visibility
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=6, nullable=False)
+    available_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+    claim_token: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    claimed_by: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    # Timestamps
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    # Relasi
+    invoice: Mapped["Invoice"] = relationship("Invoice", back_populates="outbox_entry")
+
+    def __repr__(self):
+        return f"<InvoiceOutbox(id={self.id}, invoice_id={self.invoice_id}, status='{self.status}', attempts={self.attempts})>"
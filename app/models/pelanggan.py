@@ -20,6 +20,8 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import TYPE_CHECKING, Optional
 from datetime import datetime
 
+from ..encryption import encrypted_field
+
 # Import Base dengan type annotation yang benar buat mypy
 if TYPE_CHECKING:
     from sqlalchemy.orm import DeclarativeBase as Base
@@ -70,7 +72,10 @@ class Pelanggan(Base):
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
 
     # Data Identitas Pelanggan
-    no_ktp: Mapped[str] = mapped_column(String(191))          # Nomor KTP untuk verifikasi (index di composite)
+    # Nomor KTP untuk verifikasi (index di composite). Disimpan terenkripsi di kolom no_ktp,
+    # didekripsi saat pelanggan.no_ktp dibaca (lihat encrypted_field)
+    _no_ktp: Mapped[str] = mapped_column("no_ktp", String(191))
+    no_ktp = encrypted_field("_no_ktp")
     nama: Mapped[str] = mapped_column(String(191))            # Nama lengkap pelanggan (index di composite)
     alamat: Mapped[str] = mapped_column(String(191))          # Alamat utama (index di composite)
     alamat_custom: Mapped[str | None] = mapped_column(String(191))  # Alamat custom/keterangan tambahan
@@ -0,0 +1,111 @@
+# ====================================================================
+# MODEL TRAFFIC ROLLUP - PRE-AGGREGATED BANDWIDTH TIME SERIES
+# ====================================================================
+# Tabel rollup untuk traffic_history supaya query history/summary tidak perlu
+# scan raw sample 5 menitan selama 30 hari.
+#
+# Level rollup:
+# - traffic_rollup_5m     : bucket 5 menit  (dari traffic_history)
+# - traffic_rollup_hourly : bucket 1 jam    (dari traffic_rollup_5m)
+# - traffic_rollup_daily  : bucket 1 hari   (dari traffic_rollup_hourly)
+#
+# Kolom disimpan sebagai SUM + jumlah sample (bukan AVG) supaya level di atasnya
+# bisa dihitung ulang dengan benar: avg = *_mbps_sum / samples.
+# Di-maintain oleh TrafficRollupService setiap collection cycle.
+# ====================================================================
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from sqlalchemy import ForeignKey, Integer, BigInteger, Float, DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import DeclarativeBase as Base
+else:
+    from ..database import Base
+
+
+class TrafficRollupMixin:
+    """Kolom bersama untuk semua level rollup traffic."""
+
+    # Primary Key
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    # Foreign Keys
+    data_teknis_id: Mapped[int] = mapped_column(ForeignKey("data_teknis.id"))
+    mikrotik_server_id: Mapped[int] = mapped_column(ForeignKey("mikrotik_servers.id"))
+
+    # Awal bucket (UTC) - bucket_start + bucket_seconds = akhir bucket
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    # Agregat bandwidth (Mbps)
+    samples: Mapped[int] = mapped_column(Integer, default=0)  # Jumlah raw sample di bucket
+    rx_mbps_sum: Mapped[float] = mapped_column(Float, default=0.0)  # Download
+    tx_mbps_sum: Mapped[float] = mapped_column(Float, default=0.0)  # Upload
+    total_mbps_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    total_mbps_max: Mapped[float] = mapped_column(Float, default=0.0)  # Peak di bucket
+
+    @property
+    def rx_mbps(self) -> float:
+        return self.rx_mbps_sum / self.samples if self.samples else 0.0
+
+    @property
+    def tx_mbps(self) -> float:
+        return self.tx_mbps_sum / self.samples if self.samples else 0.0
+
+    @property
+    def total_mbps(self) -> float:
+        return self.total_mbps_sum / self.samples if self.samples else 0.0
+
+    def to_dict(self) -> dict:
+        """Convert ke dictionary untuk API response."""
+        return {
+            "data_teknis_id": self.data_teknis_id,
+            "mikrotik_server_id": self.mikrotik_server_id,
+            "timestamp": self.bucket_start,
+            "samples": self.samples,
+            "rx_mbps": round(self.rx_mbps, 2),
+            "tx_mbps": round(self.tx_mbps, 2),
+            "total_mbps": round(self.total_mbps, 2),
+            "max_mbps": round(self.total_mbps_max, 2),
+        }
+
+
+class TrafficRollup5m(TrafficRollupMixin, Base):
+    """Rollup 5 menit - dipakai untuk grafik sampai 24 jam."""
+
+    __tablename__ = "traffic_rollup_5m"
+    bucket_seconds = 300
+
+    __table_args__ = (
+        Index("uq_traffic_5m_user_bucket", "data_teknis_id", "bucket_start", unique=True),
+        Index("idx_traffic_5m_server_bucket", "mikrotik_server_id", "bucket_start"),
+        Index("idx_traffic_5m_bucket", "bucket_start"),
+    )
+
+
+class TrafficRollupHourly(TrafficRollupMixin, Base):
+    """Rollup per jam - dipakai untuk grafik sampai 7 hari dan summary server."""
+
+    __tablename__ = "traffic_rollup_hourly"
+    bucket_seconds = 3600
+
+    __table_args__ = (
+        Index("uq_traffic_hourly_user_bucket", "data_teknis_id", "bucket_start", unique=True),
+        Index("idx_traffic_hourly_server_bucket", "mikrotik_server_id", "bucket_start"),
+        Index("idx_traffic_hourly_bucket", "bucket_start"),
+    )
+
+
+class TrafficRollupDaily(TrafficRollupMixin, Base):
+    """Rollup per hari - dipakai untuk range lebih dari 7 hari."""
+
+    __tablename__ = "traffic_rollup_daily"
+    bucket_seconds = 86400
+
+    __table_args__ = (
+        Index("uq_traffic_daily_user_bucket", "data_teknis_id", "bucket_start", unique=True),
+        Index("idx_traffic_daily_server_bucket", "mikrotik_server_id", "bucket_start"),
+        Index("idx_traffic_daily_bucket", "bucket_start"),
+    )
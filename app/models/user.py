@@ -23,6 +23,8 @@ from datetime import datetime
 from sqlalchemy import String, BigInteger, func, DateTime, TIMESTAMP, ForeignKey
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
+from ..encryption import encrypted_field
+
 # Import Base dengan type annotation yang benar untuk mypy
 if TYPE_CHECKING:
     from sqlalchemy.orm import DeclarativeBase as Base
@@ -55,7 +57,9 @@ class User(Base):
     email: Mapped[str] = mapped_column(String(191), unique=True, index=True, nullable=False)  # Email login (unique)
 
     # Data Autentikasi
-    password: Mapped[str] = mapped_column(String(191), nullable=False)      # Password (hash/bcrypt)
+    # Password (hash bcrypt, disimpan terenkripsi Fernet) - didekripsi saat user.password dibaca
+    _password: Mapped[str] = mapped_column("password", String(191), nullable=False)
+    password = encrypted_field("_password")
     remember_token: Mapped[str | None] = mapped_column(String(100), nullable=True)  # Token buat "remember me"
     email_verified_at: Mapped[datetime | None] = mapped_column(TIMESTAMP, nullable=True)  # Waktu verifikasi email
 
@@ -0,0 +1,45 @@
+# ====================================================================
+# MODEL WEBSOCKET EVENT - BACKPLANE NOTIFIKASI ANTAR WORKER
+# ====================================================================
+# Dipakai DatabaseWebSocketBus (WEBSOCKET_BUS_BACKEND="database"). Setiap
+# send_to_user / broadcast_to_roles menulis satu row; setiap worker uvicorn
+# membaca row baru (id > id terakhir yang dilihat) lalu mengirim ke socket
+# yang terhubung di worker itu sendiri.
+#
+# Row hanya perlu hidup beberapa detik - dihapus setelah
+# WEBSOCKET_BUS_RETENTION_SECONDS.
+# ====================================================================
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Index, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import DeclarativeBase as Base
+else:
+    from ..database import Base
+
+
+class WebSocketEvent(Base):
+    """Satu pesan WebSocket yang harus dikirim oleh semua worker."""
+
+    __tablename__ = "websocket_events"
+
+    __table_args__ = (Index("idx_websocket_events_created_at", "created_at"),)
+
+    # Primary Key - urutan baca worker (id > last_id)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    # Worker pengirim (worker ini sudah mengirim ke socket lokalnya sendiri)
+    origin: Mapped[str] = mapped_column(String(100), nullable=False)
+
+    # Envelope JSON: {"kind": "user" | "users", "user_ids": [...], "message": "..."}
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<WebSocketEvent(id={self.id}, origin='{self.origin}')>"
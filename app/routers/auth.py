@@ -63,6 +63,7 @@ from ..auth import (
 )
 from ..config import settings
 from ..services.token_service import get_token_service, TokenService
+from ..services.password_hasher import PasswordHasherBusy
 
 logger = logging.getLogger(__name__)
 
@@ -93,7 +94,15 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     """
     Endpoint untuk login dan mendapatkan access token.
     """
-    user = await authenticate_user(form_data.username, form_data.password, db)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password, db)
+    except PasswordHasherBusy:
+        # Antrian bcrypt penuh (lonjakan login) - minta client coba lagi daripada menumpuk
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server sedang sibuk memproses login, silakan coba lagi",
+            headers={"Retry-After": "2"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,17 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Query
 from typing import List, Dict, Optional, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select, case, or_, and_, not_
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-import asyncio
+from sqlalchemy import func, select, or_, and_, not_
+from datetime import datetime
 from pydantic import BaseModel
 from collections import defaultdict
 import locale
 import logging
 
 # 🛡️ Import schema classes untuk dashboard data
-from ..schemas.dashboard import DashboardData, ChartData, RevenueSummary, StatCard, InvoiceSummary
+from ..schemas.dashboard import DashboardData, ChartData, RevenueSummary, InvoiceSummary
 
 # Atur logger
 logger = logging.getLogger(__name__)
@@ -22,27 +20,23 @@ from ..models import (
     Invoice,
     Pelanggan,
     HargaLayanan,
-    MikrotikServer,
     PaketLayanan,
     Langganan,
 )
 from sqlalchemy.orm import selectinload
 from ..models.user import User as UserModel
-from ..models.role import Role as RoleModel
 
 from ..auth import get_current_active_user
 from ..database import get_db, get_connection_pool_status, monitor_connection_pool
-from ..services import mikrotik_service
 from ..services.cache_service import get_cache_stats, clear_all_cache
+from ..services.dashboard_snapshot import dashboard_snapshot
 from ..middleware.query_timeout import execute_with_timeout, get_query_limit, validate_query_limit
 
 from ..schemas.dashboard import (
     DashboardData,
-    StatCard,
     ChartData,
     InvoiceSummary,
     RevenueSummary,
-    BrandRevenueItem,
 )
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
@@ -57,140 +51,6 @@ except locale.Error:
         pass
 
 
-async def _get_revenue_summary(db: AsyncSession) -> RevenueSummary:
-    """Helper untuk mengambil ringkasan pendapatan bulanan - OPTIMIZED VERSION."""
-    # PERFORMANCE NOTE: This query needs indexes on:
-    # - invoices(paid_at)
-    # - invoices(status_invoice)
-    # - pelanggan(id_brand)
-    now = datetime.now()
-    # OPTIMIZATION: Use date range instead of func.extract() for better performance
-    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    if now.month == 12:
-        end_of_month = now.replace(year=now.year + 1, month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    else:
-        end_of_month = now.replace(month=now.month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    revenue_stmt = (
-        select(HargaLayanan.brand, func.sum(Invoice.total_harga).label("total_revenue"))
-        .select_from(Invoice)
-        .join(Pelanggan, Invoice.pelanggan_id == Pelanggan.id, isouter=True)
-        .join(HargaLayanan, Pelanggan.id_brand == HargaLayanan.id_brand, isouter=True)
-        .where(
-            Invoice.status_invoice == "Lunas",
-            HargaLayanan.brand.is_not(None),
-            Invoice.paid_at >= start_of_month,
-            Invoice.paid_at < end_of_month,
-        )
-        .group_by(HargaLayanan.brand)
-    )
-    revenue_results = (await db.execute(revenue_stmt)).all()
-    brand_breakdown = [BrandRevenueItem(brand=row.brand, revenue=float(row.total_revenue or 0.0)) for row in revenue_results]
-    total_revenue = sum(item.revenue for item in brand_breakdown)
-    next_month_date = now + relativedelta(months=1)
-    periode_str = next_month_date.strftime("%B %Y")
-
-    return RevenueSummary(total=total_revenue, periode=periode_str, breakdown=brand_breakdown)
-
-
-async def _get_pelanggan_stat_cards(db: AsyncSession) -> List[StatCard]:
-    """Helper untuk mengambil data kartu statistik pelanggan."""
-    pelanggan_count_stmt = (
-        select(HargaLayanan.brand, func.count(Pelanggan.id))
-        .join(Pelanggan, HargaLayanan.id_brand == Pelanggan.id_brand, isouter=True)
-        .group_by(HargaLayanan.brand)
-    )
-    pelanggan_counts = (await db.execute(pelanggan_count_stmt)).all()
-    pelanggan_by_brand = {brand.lower(): count for brand, count in pelanggan_counts}
-
-    return [
-        StatCard(
-            title="Jumlah Pelanggan Jakinet",
-            value=pelanggan_by_brand.get("jakinet", 0),
-            description="Total Pelanggan Jakinet",
-        ),
-        StatCard(
-            title="Jumlah Pelanggan Jelantik",
-            value=pelanggan_by_brand.get("jelantik", 0),
-            description="Total Pelanggan Jelantik",
-        ),
-        StatCard(
-            title="Pelanggan Jelantik Nagrak",
-            value=pelanggan_by_brand.get("jelantik nagrak", 0),
-            description="Total Pelanggan Rusun Nagrak",
-        ),
-    ]
-
-
-async def _get_loyalty_chart(db: AsyncSession) -> ChartData:
-    """Helper untuk mengambil data chart loyalitas pembayaran - SAFE VERSION."""
-
-    # Get outstanding payers
-    outstanding_payers_sq = (
-        select(Invoice.pelanggan_id).where(Invoice.status_invoice.in_(["Belum Dibayar", "Kadaluarsa"])).distinct()
-    )
-
-    # Get ever late payers
-    ever_late_payers_sq = select(Invoice.pelanggan_id).where(Invoice.paid_at > Invoice.tgl_jatuh_tempo).distinct()
-
-    # Simplified query using EXISTS for better compatibility
-    categorization_stmt = (
-        select(
-            func.count(Langganan.id).label("total_active"),
-        )
-        .select_from(Langganan)
-        .where(Langganan.status == "Aktif")
-    )
-
-    total_active = (await db.execute(categorization_stmt)).scalar() or 0
-
-    # Get counts using separate, simpler queries
-    outstanding_count_stmt = select(func.count(Langganan.id)).where(
-        Langganan.status == "Aktif", Langganan.pelanggan_id.in_(outstanding_payers_sq)
-    )
-
-    ever_late_count_stmt = select(func.count(Langganan.id)).where(
-        Langganan.status == "Aktif",
-        Langganan.pelanggan_id.in_(ever_late_payers_sq),
-        ~Langganan.pelanggan_id.in_(outstanding_payers_sq),
-    )
-
-    outstanding_count = (await db.execute(outstanding_count_stmt)).scalar() or 0
-    ever_late_count = (await db.execute(ever_late_count_stmt)).scalar() or 0
-    setia_count = total_active - outstanding_count - ever_late_count
-
-    return ChartData(
-        labels=["Setia On-Time", "Lunas (Tapi Telat)", "Menunggak"],
-        data=[
-            max(0, setia_count),
-            max(0, ever_late_count),
-            max(0, outstanding_count),
-        ],
-    )
-
-
-async def _get_mikrotik_status_counts(db: AsyncSession) -> dict:
-    """Helper untuk memeriksa status online/offline semua server Mikrotik secara paralel."""
-    all_servers = (await db.execute(select(MikrotikServer))).scalars().all()
-    if not all_servers:
-        return {"online": 0, "offline": 0, "total": 0}
-
-    async def check_status(server):
-        loop = asyncio.get_event_loop()
-        api, conn = await loop.run_in_executor(None, mikrotik_service.get_api_connection, server)
-        if conn:
-            conn.disconnect()
-        return bool(api)
-
-    results = await asyncio.gather(*(check_status(server) for server in all_servers))
-    online_count = sum(1 for res in results if res)
-    return {
-        "online": online_count,
-        "offline": len(all_servers) - online_count,
-        "total": len(all_servers),
-    }
-
-
 class MikrotikStatus(BaseModel):
     online: int
     offline: int
@@ -199,291 +59,32 @@ class MikrotikStatus(BaseModel):
 @router.get("/", response_model=DashboardData)
 async def get_dashboard_data(
     response: Response,
-    db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user),
 ):
     """
-    Get dashboard data with caching headers and error handling.
-    API Response Optimization: Cache control untuk mengurangi request frequency.
-    """
-    # API Response Optimization: Add cache headers untuk 5 menit
-    response.headers["Cache-Control"] = "public, max-age=300"
-
-    # PERFORMANCE OPTIMIZATION: Add query timeout monitoring
-    import time
+    Get dashboard data dari snapshot (services/dashboard_snapshot.py).
 
-    start_time = time.time()
-
-    """
-    Get dashboard data with error handling to avoid 500 errors.
+    Widget dihitung di background (terjadwal + saat invoice/langganan/pelanggan
+    berubah); endpoint ini hanya memilih widget sesuai permission user, tanpa
+    query agregat. snapshot_age_seconds = umur data untuk indikator "diperbarui".
     """
-    try:
-        user_with_role = await db.execute(
-            select(UserModel)
-            .options(selectinload(UserModel.role).selectinload(RoleModel.permissions))
-            .where(UserModel.id == current_user.id)
-        )
-        user = user_with_role.scalar_one_or_none()
+    # Snapshot sudah murah disajikan - cache browser pendek supaya data baru cepat terlihat
+    response.headers["Cache-Control"] = "private, max-age=15"
 
-        if not user or not user.role:
+    try:
+        # current_user dari load_principal sudah membawa role + permissions
+        if not current_user.role:
             return DashboardData()
 
-        user_permissions = {p.name for p in user.role.permissions}
-        dashboard_response = DashboardData()
-
-        # --- OPTIMISASI: Jalankan semua pengambilan data secara paralel dengan error handling ---
-        tasks = {}
-
-        if "view_widget_pendapatan_bulanan" in user_permissions:
-            tasks["revenue_summary"] = asyncio.create_task(_get_revenue_summary(db))
-
-        if "view_widget_statistik_pelanggan" in user_permissions:
-            tasks["pelanggan_stats"] = asyncio.create_task(_get_pelanggan_stat_cards(db))
-            tasks["loyalty_chart"] = asyncio.create_task(_get_loyalty_chart(db))
-
-        if "view_widget_statistik_server" in user_permissions:
-            tasks["server_stats"] = asyncio.create_task(_get_mikrotik_status_counts(db))
-
-        # Jalankan semua task yang sudah dikumpulkan dengan proper error handling
-        if tasks:
-            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
-            results_map = dict(zip(tasks.keys(), results))
-
-            # Inisialisasi variabel hasil dengan tipe yang jelas
-            revenue_summary_data: Optional[RevenueSummary] = None
-            pelanggan_stats_data: Optional[List[StatCard]] = None
-            loyalty_chart_data: Optional[ChartData] = None
-            server_stats_data: Optional[Dict] = None
-
-            # --- Proses dan validasi tipe setiap hasil secara terpisah ---
-            revenue_result = results_map.get("revenue_summary")
-            if not isinstance(revenue_result, Exception) and revenue_result is not None:
-                revenue_summary_data = revenue_result  # type: ignore
-            elif isinstance(revenue_result, Exception):
-                logger.error(f"Error fetching revenue summary: {revenue_result}")
-
-            pelanggan_stats_result = results_map.get("pelanggan_stats")
-            if not isinstance(pelanggan_stats_result, Exception) and pelanggan_stats_result is not None:
-                pelanggan_stats_data = pelanggan_stats_result  # type: ignore
-            elif isinstance(pelanggan_stats_result, Exception):
-                logger.error(f"Error fetching pelanggan stats: {pelanggan_stats_result}")
-
-            loyalty_chart_result = results_map.get("loyalty_chart")
-            if not isinstance(loyalty_chart_result, Exception) and loyalty_chart_result is not None:
-                loyalty_chart_data = loyalty_chart_result  # type: ignore
-            elif isinstance(loyalty_chart_result, Exception):
-                logger.error(f"Error fetching loyalty chart: {loyalty_chart_result}")
-
-            server_stats_result = results_map.get("server_stats")
-            if not isinstance(server_stats_result, Exception) and server_stats_result is not None:
-                server_stats_data = server_stats_result  # type: ignore
-            elif isinstance(server_stats_result, Exception):
-                logger.error(f"Error fetching server stats: {server_stats_result}")
-
-            # --- Bangun respons dari variabel yang sudah divalidasi ---
-            if revenue_summary_data:
-                dashboard_response.revenue_summary = revenue_summary_data
-
-            temp_stat_cards = []
-            if pelanggan_stats_data:
-                temp_stat_cards.extend(pelanggan_stats_data)
-
-            if server_stats_data:
-                server_stats_cards = [
-                    StatCard(
-                        title="Total Servers",
-                        value=server_stats_data.get("total", 0),
-                        description="Total Mikrotik servers",
-                    ),
-                    StatCard(
-                        title="Online Servers",
-                        value=server_stats_data.get("online", 0),
-                        description="Servers currently online",
-                    ),
-                    StatCard(
-                        title="Offline Servers",
-                        value=server_stats_data.get("offline", 0),
-                        description="Servers currently offline",
-                    ),
-                ]
-                temp_stat_cards.extend(server_stats_cards)
-
-            if loyalty_chart_data:
-                dashboard_response.loyalitas_pembayaran_chart = loyalty_chart_data
-
-            if temp_stat_cards:
-                dashboard_response.stat_cards = temp_stat_cards
-
-        # --- SISA WIDGET DENGAN ERROR HANDLING ---
-
-        # 3. Widget Chart Pelanggan per Lokasi
-        if "view_widget_pelanggan_per_lokasi" in user_permissions:
-            try:
-                lokasi_stmt = (
-                    select(Pelanggan.alamat, func.count(Pelanggan.id))
-                    .group_by(Pelanggan.alamat)
-                    .order_by(func.count(Pelanggan.id).desc())
-                    .limit(20)
-                )
-                lokasi_data = (await db.execute(lokasi_stmt)).all()
-                dashboard_response.lokasi_chart = ChartData(
-                    labels=[item[0] for item in lokasi_data if item[0] is not None],
-                    data=[item[1] for item in lokasi_data if item[0] is not None],
-                )
-            except Exception as e:
-                logger.error(f"Dashboard lokasi_chart error: {str(e)}", exc_info=True)
-                # Graceful degradation: Set empty chart data
-                dashboard_response.lokasi_chart = ChartData(labels=[], data=[])
-
-        # 4. Widget Chart Pelanggan per Paket
-        if "view_widget_pelanggan_per_paket" in user_permissions:
-            try:
-                paket_stmt = (
-                    select(PaketLayanan.kecepatan, func.count(Langganan.id))
-                    .join(Langganan, PaketLayanan.id == Langganan.paket_layanan_id, isouter=True)
-                    .group_by(PaketLayanan.kecepatan)
-                    .order_by(PaketLayanan.kecepatan)
-                )
-                paket_data = (await db.execute(paket_stmt)).all()
-                dashboard_response.paket_chart = ChartData(
-                    labels=[f"{item[0]} Mbps" for item in paket_data],
-                    data=[item[1] for item in paket_data],
-                )
-            except Exception as e:
-                logger.error(f"Dashboard paket_chart error: {str(e)}", exc_info=True)
-                dashboard_response.paket_chart = ChartData(labels=[], data=[])
-
-        # 5. Widget Chart Tren Pertumbuhan Pelanggan
-        if "view_widget_tren_pertumbuhan" in user_permissions:
-            try:
-                two_years_ago = datetime.now() - relativedelta(years=2)
-
-                growth_stmt = (
-                    select(
-                        func.year(Pelanggan.tgl_instalasi).label("year"),
-                        func.month(Pelanggan.tgl_instalasi).label("month"),
-                        func.count(Pelanggan.id).label("jumlah"),
-                    )
-                    .where(Pelanggan.tgl_instalasi >= two_years_ago)
-                    .group_by(func.year(Pelanggan.tgl_instalasi), func.month(Pelanggan.tgl_instalasi))
-                    .order_by(func.year(Pelanggan.tgl_instalasi), func.month(Pelanggan.tgl_instalasi))
-                )
-                growth_data = (await db.execute(growth_stmt)).all()
-                dashboard_response.growth_chart = ChartData(
-                    labels=[datetime(item.year, item.month, 1).strftime("%b %Y") for item in growth_data],
-                    data=[item.jumlah for item in growth_data],
-                )
-            except Exception as e:
-                logger.error(f"Dashboard growth_chart error: {str(e)}", exc_info=True)
-                dashboard_response.growth_chart = ChartData(labels=[], data=[])
-
-        # 6. Widget Chart Invoice Bulanan
-        # Temporary bypass permission check for testing
-        if True:  # "view_widget_invoice_bulanan" in user_permissions:
-            try:
-                six_months_ago = datetime.now() - timedelta(days=180)
-
-                # Query untuk invoice chart - Fixed SQLAlchemy syntax
-                invoice_stmt = (
-                    select(
-                        func.year(Invoice.tgl_invoice).label("year"),
-                        func.month(Invoice.tgl_invoice).label("month"),
-                        func.count(Invoice.id).label("total"),
-                        func.sum(case((Invoice.status_invoice == "Lunas", 1), else_=0)).label("lunas"),
-                        func.sum(case((Invoice.status_invoice == "Belum Dibayar", 1), else_=0)).label("menunggu"),
-                        func.sum(case((Invoice.status_invoice == "Kadaluarsa", 1), else_=0)).label("kadaluarsa"),
-                    )
-                    .where(Invoice.tgl_invoice >= six_months_ago)
-                    .group_by(func.year(Invoice.tgl_invoice), func.month(Invoice.tgl_invoice))
-                    .order_by(func.year(Invoice.tgl_invoice), func.month(Invoice.tgl_invoice))
-                )
-
-                invoice_data = (await db.execute(invoice_stmt)).all()
-
-                if invoice_data:
-                    dashboard_response.invoice_summary_chart = InvoiceSummary(
-                        labels=[datetime(item.year, item.month, 1).strftime("%b %Y") for item in invoice_data],
-                        total=[item.total or 0 for item in invoice_data],
-                        lunas=[item.lunas or 0 for item in invoice_data],
-                        menunggu=[item.menunggu or 0 for item in invoice_data],
-                        kadaluarsa=[item.kadaluarsa or 0 for item in invoice_data],
-                    )
-                    print(f"✅ Invoice chart loaded successfully with {len(invoice_data)} data points")
-                else:
-                    print("📭 No invoice data found in the last 6 months, creating empty chart")
-                    # Create empty chart with last 6 months labels
-                    now = datetime.now()
-                    labels = []
-                    for i in range(5, -1, -1):
-                        date = now - relativedelta(months=i)
-                        labels.append(date.strftime("%b %Y"))
-
-                    dashboard_response.invoice_summary_chart = InvoiceSummary(
-                        labels=labels,
-                        total=[0, 0, 0, 0, 0, 0],
-                        lunas=[0, 0, 0, 0, 0, 0],
-                        menunggu=[0, 0, 0, 0, 0, 0],
-                        kadaluarsa=[0, 0, 0, 0, 0, 0],
-                    )
-
-            except Exception as e:
-                print(f"❌ Error fetching invoice chart data: {str(e)}")
-                import traceback
-
-                traceback.print_exc()
-                # Set to null jika ada error
-                dashboard_response.invoice_summary_chart = None
-
-        # 7. Widget Status Langganan
-        if "view_widget_status_langganan" in user_permissions:
-            try:
-                status_stmt = (
-                    select(Langganan.status, func.count(Langganan.id).label("jumlah"))
-                    .group_by(Langganan.status)
-                    .order_by(Langganan.status)
-                )
-                status_results = (await db.execute(status_stmt)).all()
-                dashboard_response.status_langganan_chart = ChartData(
-                    labels=[row.status for row in status_results],
-                    data=[row.jumlah for row in status_results],
-                )
-            except Exception as e:
-                print(f"Error in status_langganan_chart: {e}")
-
-        # 8. Widget Alamat Aktif
-        if "view_widget_alamat_aktif" in user_permissions:
-            try:
-                alamat_stmt = (
-                    select(Pelanggan.alamat, func.count(Pelanggan.id).label("jumlah"))
-                    .join(Langganan, Pelanggan.id == Langganan.pelanggan_id)
-                    .where(Langganan.status == "Aktif")
-                    .group_by(Pelanggan.alamat)
-                    .order_by(func.count(Pelanggan.id).desc())
-                    .limit(20)
-                )
-                alamat_results = (await db.execute(alamat_stmt)).all()
-                if alamat_results:
-                    dashboard_response.pelanggan_per_alamat_chart = ChartData(
-                        labels=[row.alamat for row in alamat_results],
-                        data=[row.jumlah for row in alamat_results],
-                    )
-            except Exception as e:
-                print(f"Error in pelanggan_per_alamat_chart: {e}")
-
-        # PERFORMANCE MONITORING: Log total execution time
-        execution_time = time.time() - start_time
-        if execution_time > 5.0:  # Log if query takes more than 5 seconds
-            print(f"⚠️  Dashboard query took {execution_time:.2f}s - consider optimization")
-
+        user_permissions = {p.name for p in current_user.role.permissions}
+        dashboard_response = await dashboard_snapshot.get_dashboard(user_permissions)
+        if dashboard_response.snapshot_age_seconds is not None:
+            response.headers["X-Snapshot-Age"] = str(dashboard_response.snapshot_age_seconds)
         return dashboard_response
 
     except Exception as e:
         # 🛡️ Graceful degradation: Return empty dashboard to avoid 500 errors
-        import traceback
-
-        execution_time = time.time() - start_time
-        logger.error(f"❌ Dashboard failed after {execution_time:.2f}s: {str(e)}")
-        logger.error(f"Dashboard traceback: {traceback.format_exc()}")
+        logger.error(f"❌ Dashboard snapshot failed: {str(e)}", exc_info=True)
 
         # 🛡️ Return empty dashboard with graceful degradation
         # Create empty data structures with correct types
@@ -506,6 +107,12 @@ async def get_dashboard_data(
         )
 
 
+@router.get("/snapshot-status", response_model=dict)
+async def get_dashboard_snapshot_status(current_user: UserModel = Depends(get_current_active_user)):
+    """Status snapshot dashboard: umur per widget, jumlah refresh, widget yang menunggu dihitung ulang."""
+    return dashboard_snapshot.get_stats()
+
+
 class SidebarBadgeResponse(BaseModel):
     suspended_count: int
     unpaid_invoice_count: int
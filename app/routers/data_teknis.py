@@ -24,10 +24,9 @@ from ..models.mikrotik_server import MikrotikServer as MikrotikServerModel
 from ..models.paket_layanan import PaketLayanan as PaketLayananModel
 
 from ..services import mikrotik_service
+from ..services.ip_pool_allocator import ip_pool_allocator
 
 from ..websocket_manager import manager
-from ..models.user import User as UserModel
-from ..models.role import Role as RoleModel
 from ..models.odp import ODP as ODPModel
 
 # Impor model DataTeknis
@@ -117,29 +116,26 @@ async def create_data_teknis(data_teknis: DataTeknisCreate, db: AsyncSession = D
     db.add(db_data_teknis)
     await db.commit()
     await db.refresh(db_data_teknis, attribute_names=["pelanggan"])  # Eager load pelanggan
+    ip_pool_allocator.assign(
+        db_data_teknis.mikrotik_server_id, db_data_teknis.id, db_data_teknis.id_pelanggan, db_data_teknis.ip_pelanggan
+    )
 
     try:
-        # 1. Cari semua user ID dengan role "Finance"
-        finance_role_query = select(UserModel.id).join(RoleModel).where(func.lower(RoleModel.name) == "Finance")
-        result = await db.execute(finance_role_query)
-        finance_user_ids = list(result.scalars().all())
-
-        if finance_user_ids:
-            # 2. Siapkan payload notifikasi dengan format yang konsisten
-            pelanggan_nama = db_data_teknis.pelanggan.nama if db_data_teknis.pelanggan else "N/A"
-            notification_payload = {
-                "type": "new_technical_data",
-                "message": f"Data teknis untuk {pelanggan_nama} telah ditambahkan. Siap dibuatkan langganan.",
+        # 1. Siapkan payload notifikasi dengan format yang konsisten
+        pelanggan_nama = db_data_teknis.pelanggan.nama if db_data_teknis.pelanggan else "N/A"
+        notification_payload = {
+            "type": "new_technical_data",
+            "message": f"Data teknis untuk {pelanggan_nama} telah ditambahkan. Siap dibuatkan langganan.",
+            "timestamp": datetime.now().isoformat(),
+            "data": {
+                "pelanggan_id": db_data_teknis.pelanggan_id,
+                "pelanggan_nama": pelanggan_nama,
                 "timestamp": datetime.now().isoformat(),
-                "data": {
-                    "pelanggan_id": db_data_teknis.pelanggan_id,
-                    "pelanggan_nama": pelanggan_nama,
-                    "timestamp": datetime.now().isoformat(),
-                },
-            }
-            # 3. Kirim notifikasi ke semua user Finance yang online
-            await manager.broadcast_to_roles(notification_payload, finance_user_ids)
-            logger.info(f"Notifikasi data teknis baru dikirim ke {len(finance_user_ids)} user Finance.")
+            },
+        }
+        # 2. Kirim notifikasi ke semua user Finance yang online
+        await manager.broadcast_to_role_names(notification_payload, ["Finance"])
+        logger.info("Notifikasi data teknis baru dikirim ke role Finance.")
     except Exception as e:
         logger.error(f"Gagal mengirim notifikasi data teknis baru: {str(e)}")
 
@@ -424,6 +420,8 @@ async def update_data_teknis(
 
     # Simpan ID Pelanggan (nama secret) LAMA sebelum diubah
     old_id_pelanggan = db_data_teknis.id_pelanggan
+    old_ip_pelanggan = db_data_teknis.ip_pelanggan
+    old_mikrotik_server_id = db_data_teknis.mikrotik_server_id
 
     # Perbarui data di objek SQLAlchemy
     update_data = data_teknis_update.model_dump(exclude_unset=True)
@@ -434,6 +432,14 @@ async def update_data_teknis(
     db.add(db_data_teknis)
     await db.commit()
     await db.refresh(db_data_teknis)
+    ip_pool_allocator.assign(
+        db_data_teknis.mikrotik_server_id,
+        db_data_teknis.id,
+        db_data_teknis.id_pelanggan,
+        db_data_teknis.ip_pelanggan,
+        old_server_id=old_mikrotik_server_id,
+        old_ip_address=old_ip_pelanggan,
+    )
 
     try:
         if db_data_teknis.pelanggan and db_data_teknis.pelanggan.langganan:
@@ -467,26 +473,21 @@ async def delete_data_teknis(data_teknis_id: int, db: AsyncSession = Depends(get
     # Ambil informasi yang dibutuhkan sebelum data dihapus
     id_pelanggan = db_data_teknis.id_pelanggan
     mikrotik_server_id = db_data_teknis.mikrotik_server_id
+    ip_pelanggan = db_data_teknis.ip_pelanggan
 
     # Cari server Mikrotik untuk koneksi
     mikrotik_server = await db.get(MikrotikServerModel, mikrotik_server_id)
     if mikrotik_server:
-        # Hubung ke Mikrotik dan hapus PPPoE secret
+        # Hubung ke Mikrotik dan hapus PPPoE secret (di thread pool Mikrotik)
         try:
-            api, connection = mikrotik_service.get_api_connection(mikrotik_server)
-            if api:
-                mikrotik_service.delete_pppoe_secret(api, id_pelanggan)
+            await mikrotik_service.async_mikrotik.delete_pppoe_secret(mikrotik_server, id_pelanggan)
         except Exception as e:
             logger.error(f"Gagal menghapus PPPoE secret dari Mikrotik: {e}")
             # Jangan batalkan penghapusan data karena gagal di Mikrotik
-        finally:
-            if connection:
-                # Gunakan connection pooling untuk menutup koneksi
-                mikrotik_pool = mikrotik_service.mikrotik_pool
-                mikrotik_pool.return_connection(connection, mikrotik_server.host_ip, int(mikrotik_server.port))
 
     await db.delete(db_data_teknis)
     await db.commit()
+    ip_pool_allocator.unassign(mikrotik_server_id, ip_pelanggan)
     return None
 
 
@@ -507,26 +508,14 @@ async def check_ip_address(request: IPCheckRequest, db: AsyncSession = Depends(g
             owner_id=existing_in_db.id_pelanggan,
         )
 
-    # 2. Jika tidak ditemukan di DB, cek ke semua server Mikrotik
-    mikrotik_servers_result = await db.execute(select(MikrotikServerModel))
-    all_servers = mikrotik_servers_result.scalars().all()
-
-    for server in all_servers:
-        api, connection = mikrotik_service.get_api_connection(server)
-        if api:
-            try:
-                owner_name = mikrotik_service.check_ip_in_secrets(api, request.ip_address)
-                if owner_name:
-                    return IPCheckResponse(
-                        is_taken=True,
-                        message=f"IP sudah terpakai di Mikrotik '{server.name}' oleh {owner_name}",
-                        owner_id=owner_name,
-                    )
-            finally:
-                if connection:
-                    # Gunakan connection pooling untuk menutup koneksi
-                    mikrotik_pool = mikrotik_service.mikrotik_pool
-                    mikrotik_pool.return_connection(connection, server.host_ip, int(server.port))
+    # 2. Jika tidak ditemukan di DB, cek ke index IP pool (PPP secret router disinkron di background)
+    used_by = await ip_pool_allocator.lookup(request.ip_address, exclude_data_teknis_id=request.current_id)
+    if used_by and used_by["source"] == "mikrotik":
+        return IPCheckResponse(
+            is_taken=True,
+            message=f"IP sudah terpakai di Mikrotik '{used_by['server_name']}' oleh {used_by['owner']}",
+            owner_id=used_by["owner"],
+        )
 
     # 3. Jika aman di DB dan di semua Mikrotik, maka IP tersedia
     return IPCheckResponse(is_taken=False, message="IP tersedia", owner_id=None)
@@ -839,6 +828,11 @@ async def import_from_csv_teknis(file: UploadFile = File(...), db: AsyncSession
         logger.error(f"Database error during import: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Gagal menyimpan ke database: {repr(e)}")
 
+    for data_teknis in data_to_create:
+        ip_pool_allocator.assign(
+            data_teknis.mikrotik_server_id, data_teknis.id, data_teknis.id_pelanggan, data_teknis.ip_pelanggan
+        )
+
     return {"message": f"Berhasil mengimpor {len(data_to_create)} data teknis baru."}
 
 
@@ -901,24 +895,28 @@ async def get_available_profiles(
     # --- Logika selanjutnya sama, tapi sekarang menggunakan server yang PASTI BENAR ---
     kecepatan_str = f"{paket.kecepatan}Mbps"
 
-    api, connection = mikrotik_service.get_api_connection(mikrotik_server_info)
-    if not api:
+    try:
+        # Profile dan secrets diambil di satu koneksi, satu hop ke thread pool Mikrotik
+        # PPPoE secrets menampilkan SEMUA user yang terdaftar (online maupun offline)
+        all_profiles_on_router, ppp_secrets = await mikrotik_service.MikrotikSession(mikrotik_server_info).pipeline(
+            mikrotik_service.get_all_ppp_profiles, mikrotik_service.get_all_ppp_secrets
+        )
+    except mikrotik_service.MikrotikConnectionError:
         raise HTTPException(
             status_code=503,
             detail=f"Tidak dapat terhubung ke server Mikrotik {mikrotik_server_info.name}",
         )
+    except Exception as e:
+        logger.error(f"Terjadi error saat mengambil data profile dari Mikrotik: {e}")
+        raise HTTPException(status_code=500, detail="Gagal memproses data dari Mikrotik.")
 
     try:
-        all_profiles_on_router = mikrotik_service.get_all_ppp_profiles(api)
         relevant_profiles = [p for p in all_profiles_on_router if kecepatan_str in p]
 
         if not relevant_profiles:
             logger.info(f"Tidak ada profile dengan '{kecepatan_str}' ditemukan di Mikrotik.")
             return []
 
-        # Active connections hanya menampilkan user yang sedang online
-        # PPPoE secrets menampilkan SEMUA user yang terdaftar (online maupun offline)
-        ppp_secrets = mikrotik_service.get_all_ppp_secrets(api)
         secret_profile_names = [secret.get("profile") for secret in ppp_secrets if "profile" in secret]
         profile_usage_map = Counter(secret_profile_names)
 
@@ -937,12 +935,6 @@ async def get_available_profiles(
     except Exception as e:
         logger.error(f"Terjadi error saat mengambil data profile dari Mikrotik: {e}")
         raise HTTPException(status_code=500, detail="Gagal memproses data dari Mikrotik.")
-    finally:
-        if connection:
-            logger.info("Menutup koneksi Mikrotik.")
-            # Gunakan connection pooling untuk menutup koneksi
-            mikrotik_pool = mikrotik_service.mikrotik_pool
-            mikrotik_pool.return_connection(connection, mikrotik_server_info.host_ip, int(mikrotik_server_info.port))
 
 
 # Perbarui endpoint lama untuk menjaga kompatibilitas, tapi berikan peringatan
@@ -967,160 +959,95 @@ async def get_available_profiles_legacy(paket_layanan_id: int, db: AsyncSession
         return []
 
     kecepatan_str = f"{paket.kecepatan}Mbps"
-    api, connection = mikrotik_service.get_api_connection(server_to_check)
-    if not api:
-        raise HTTPException(status_code=503, detail="Tidak dapat terhubung ke Mikrotik.")
-
     try:
-        all_profiles_on_router = mikrotik_service.get_all_ppp_profiles(api)
-        relevant_profiles = [p for p in all_profiles_on_router if kecepatan_str in p]
-
         # MODIFIKASI: Gunakan PPPoE Secrets bukan Active Connections
-        # Active connections hanya menampilkan user yang sedang online
         # PPPoE secrets menampilkan SEMUA user yang terdaftar (online maupun offline)
-        ppp_secrets = mikrotik_service.get_all_ppp_secrets(api)
-        secret_profile_names = [secret.get("profile") for secret in ppp_secrets if "profile" in secret]
-        profile_usage_map = Counter(secret_profile_names)
+        all_profiles_on_router, ppp_secrets = await mikrotik_service.MikrotikSession(server_to_check).pipeline(
+            mikrotik_service.get_all_ppp_profiles, mikrotik_service.get_all_ppp_secrets
+        )
+    except mikrotik_service.MikrotikConnectionError:
+        raise HTTPException(status_code=503, detail="Tidak dapat terhubung ke Mikrotik.")
 
-        response_data = []
-        for profile_name in relevant_profiles:
-            response_data.append(
-                ProfileUsage(
-                    profile_name=profile_name,
-                    usage_count=profile_usage_map.get(profile_name, 0),
-                )
+    relevant_profiles = [p for p in all_profiles_on_router if kecepatan_str in p]
+    secret_profile_names = [secret.get("profile") for secret in ppp_secrets if "profile" in secret]
+    profile_usage_map = Counter(secret_profile_names)
+
+    response_data = []
+    for profile_name in relevant_profiles:
+        response_data.append(
+            ProfileUsage(
+                profile_name=profile_name,
+                usage_count=profile_usage_map.get(profile_name, 0),
             )
+        )
 
-        response_data.sort(key=lambda x: x.profile_name)
-        return response_data
-    finally:
-        if connection:
-            # Gunakan connection pooling untuk menutup koneksi
-            mikrotik_pool = mikrotik_service.mikrotik_pool
-            mikrotik_pool.return_connection(connection, server_to_check.host_ip, int(server_to_check.port))
+    response_data.sort(key=lambda x: x.profile_name)
+    return response_data
 
 
 @router.get("/last-ip/{mikrotik_server_id}")
 async def get_last_used_ip(mikrotik_server_id: int, db: AsyncSession = Depends(get_db)):
     """
-    Mendapatkan IP terakhir yang digunakan dari server Mikrotik tertentu.
+    Mendapatkan IP terakhir yang digunakan di server Mikrotik tertentu + IP bebas berikutnya.
+    Diambil dari index IP pool (database + PPP secret yang disinkron di background),
+    tanpa query ke router.
     """
-    # Ambil server Mikrotik untuk validasi dan koneksi
     mikrotik_server = await db.get(MikrotikServerModel, mikrotik_server_id)
     if not mikrotik_server:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"Server Mikrotik dengan id {mikrotik_server_id} tidak ditemukan."
         )
 
-    # Ambil semua PPP Secrets dari Mikrotik dan ekstrak IP terakhir
-    api, connection = mikrotik_service.get_api_connection(mikrotik_server)
-    if not api:
-        # Jika tidak bisa terhubung ke Mikrotik, kembalikan data dari database
-        query = (
-            select(DataTeknisModel)
-            .where(DataTeknisModel.mikrotik_server_id == mikrotik_server_id)
-            .order_by(DataTeknisModel.ip_pelanggan.desc())
-            .limit(1)
-        )
+    last_ip = await ip_pool_allocator.last_used(mikrotik_server_id)
+    next_ip = await ip_pool_allocator.next_free(mikrotik_server_id, reserve=False)
+    if not last_ip:
+        return {
+            "last_ip": None,
+            "last_octet": 0,
+            "next_ip": next_ip,
+            "message": f"Belum ada IP yang tercatat di server '{mikrotik_server.name}'",
+            "server_name": mikrotik_server.name,
+            "source": "ip_pool",
+        }
 
-        result = await db.execute(query)
-        last_data_teknis = result.scalar_one_or_none()
-
-        if last_data_teknis and last_data_teknis.ip_pelanggan:
-            # Ekstrak angka terakhir dari IP
-            ip_parts = last_data_teknis.ip_pelanggan.split(".")
-            last_octet = int(ip_parts[-1]) if len(ip_parts) >= 1 else 0
-
-            return {
-                "last_ip": last_data_teknis.ip_pelanggan,
-                "last_octet": last_octet,
-                "message": f"IP terakhir (dari database): {last_data_teknis.ip_pelanggan}",
-                "server_name": mikrotik_server.name,
-                "source": "database",
-            }
-        else:
-            return {
-                "last_ip": None,
-                "last_octet": 0,
-                "message": f"Belum ada IP yang tercatat di server '{mikrotik_server.name}' (koneksi Mikrotik tidak tersedia)",
-                "server_name": mikrotik_server.name,
-                "source": "database",
-            }
+    return {
+        "last_ip": last_ip,
+        "last_octet": int(last_ip.split(".")[-1]),
+        "next_ip": next_ip,
+        "message": f"IP terakhir: {last_ip}",
+        "server_name": mikrotik_server.name,
+        "source": "ip_pool",
+    }
 
-    try:
-        # Ambil semua PPP Secrets dari Mikrotik
-        try:
-            ppp_secrets = mikrotik_service.get_all_ppp_secrets(api)
-
-            if ppp_secrets:
-                # Ekstrak IP yang digunakan dari PPP Secrets
-                active_ips = []
-                for secret in ppp_secrets:
-                    if "remote-address" in secret:
-                        ip = secret["remote-address"]
-                        # Pastikan format IP valid
-                        try:
-                            # Validasi format IP sederhana
-                            ip_parts = ip.split(".")
-                            if len(ip_parts) == 4 and all(part.isdigit() and 0 <= int(part) <= 255 for part in ip_parts):
-                                active_ips.append(ip)
-                        except:
-                            continue  # Lewati jika format IP tidak valid
-
-                if active_ips:
-                    # Urutkan IP berdasarkan angka terakhir (oktet ke-4) secara menurun
-                    active_ips.sort(key=lambda ip: int(ip.split(".")[-1]), reverse=True)
-                    last_ip = active_ips[0]
-
-                    # Ekstrak angka terakhir dari IP
-                    ip_parts = last_ip.split(".")
-                    last_octet = int(ip_parts[-1]) if len(ip_parts) >= 1 else 0
-
-                    return {
-                        "last_ip": last_ip,
-                        "last_octet": last_octet,
-                        "message": f"IP terakhir di PPP Secrets: {last_ip}",
-                        "server_name": mikrotik_server.name,
-                        "source": "mikrotik",
-                    }
-        except Exception as e:
-            logger.error(f"Gagal mengambil PPP Secrets dari Mikrotik: {e}")
-            # Jika gagal mengambil dari Mikrotik, lanjutkan ke database
-
-        # Jika tidak ada PPP Secrets atau tidak ada IP valid, coba dari database
-        query = (
-            select(DataTeknisModel)
-            .where(DataTeknisModel.mikrotik_server_id == mikrotik_server_id)
-            .order_by(DataTeknisModel.ip_pelanggan.desc())
-            .limit(1)
+
+@router.post("/next-ip/{mikrotik_server_id}")
+async def reserve_next_ip(mikrotik_server_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Ambil IP bebas berikutnya di pool server Mikrotik dan tahan (reservasi) supaya
+    tidak dibagikan ke form provisioning lain selama IP_POOL_RESERVATION_TTL_SECONDS.
+    """
+    mikrotik_server = await db.get(MikrotikServerModel, mikrotik_server_id)
+    if not mikrotik_server:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Server Mikrotik dengan id {mikrotik_server_id} tidak ditemukan."
         )
 
-        result = await db.execute(query)
-        last_data_teknis = result.scalar_one_or_none()
-
-        if last_data_teknis and last_data_teknis.ip_pelanggan:
-            # Ekstrak angka terakhir dari IP
-            ip_parts = last_data_teknis.ip_pelanggan.split(".")
-            last_octet = int(ip_parts[-1]) if len(ip_parts) >= 1 else 0
-
-            return {
-                "last_ip": last_data_teknis.ip_pelanggan,
-                "last_octet": last_octet,
-                "message": f"IP terakhir (dari database): {last_data_teknis.ip_pelanggan}",
-                "server_name": mikrotik_server.name,
-                "source": "database",
-            }
-        else:
-            return {
-                "last_ip": None,
-                "last_octet": 0,
-                "message": f"Belum ada IP aktif di PPP Secrets atau database server '{mikrotik_server.name}'",
-                "server_name": mikrotik_server.name,
-                "source": "mikrotik",
-            }
+    ip = await ip_pool_allocator.next_free(mikrotik_server_id, reserve=True)
+    if not ip:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Tidak ada IP bebas di pool server '{mikrotik_server.name}'. Periksa konfigurasi IP_POOL_CIDRS.",
+        )
+
+    return {
+        "ip": ip,
+        "reserved_seconds": ip_pool_allocator.reservation_ttl,
+        "server_name": mikrotik_server.name,
+    }
+
 
-    finally:
-        if connection:
-            # Gunakan connection pooling untuk menutup koneksi
-            mikrotik_pool = mikrotik_service.mikrotik_pool
-            mikrotik_pool.return_connection(connection, mikrotik_server.host_ip, int(mikrotik_server.port))
+@router.get("/ip-pool/stats")
+async def get_ip_pool_stats():
+    """Status index IP pool per server (untuk monitoring)."""
+    await ip_pool_allocator.ensure_loaded()
+    return ip_pool_allocator.get_stats()
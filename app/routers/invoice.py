@@ -18,7 +18,6 @@ from dateutil.relativedelta import relativedelta
 
 from sqlalchemy import func, or_, and_
 from ..models.user import User as UserModel
-from ..models.role import Role as RoleModel
 from ..websocket_manager import manager
 
 # Import has_permission function
@@ -321,34 +320,24 @@ async def _process_successful_payment(db: AsyncSession, invoice: InvoiceModel, p
     # Notif ke frontend
     try:
         target_roles = ["Admin", "NOC", "Finance"]
-        query = select(UserModel.id).join(RoleModel).where(func.lower(RoleModel.name).in_([r.lower() for r in target_roles]))
-        result = await db.execute(query)
-        target_user_ids = result.scalars().all()
-
-        if target_user_ids:
-            # Pastikan pelanggan sudah di-load dengan benar
-            pelanggan_nama = pelanggan.nama if pelanggan else "N/A"
-            notification_payload = {
-                "type": "new_payment",
-                "message": f"Pembayaran untuk invoice {invoice.invoice_number} dari {pelanggan_nama} telah diterima.",
+        # Pastikan pelanggan sudah di-load dengan benar
+        pelanggan_nama = pelanggan.nama if pelanggan else "N/A"
+        notification_payload = {
+            "type": "new_payment",
+            "message": f"Pembayaran untuk invoice {invoice.invoice_number} dari {pelanggan_nama} telah diterima.",
+            "timestamp": datetime.now().isoformat(),
+            "data": {
+                "invoice_id": invoice.id,
+                "invoice_number": invoice.invoice_number,
+                "pelanggan_nama": pelanggan_nama,
+                "amount": (float(invoice.total_harga) if invoice.total_harga else 0.0),
+                "payment_method": invoice.metode_pembayaran or "Unknown",
                 "timestamp": datetime.now().isoformat(),
-                "data": {
-                    "invoice_id": invoice.id,
-                    "invoice_number": invoice.invoice_number,
-                    "pelanggan_nama": pelanggan_nama,
-                    "amount": (float(invoice.total_harga) if invoice.total_harga else 0.0),
-                    "payment_method": invoice.metode_pembayaran or "Unknown",
-                    "timestamp": datetime.now().isoformat(),
-                },
-            }
-            # Tambahkan log ini untuk memastikan user ID ditemukan
-            logger.info(f"Mencoba mengirim notifikasi pembayaran ke user IDs: {target_user_ids}")
-            # Convert ke list untuk broadcast_to_roles
-            user_ids_list = list(target_user_ids)
-            await manager.broadcast_to_roles(notification_payload, user_ids_list)
-            logger.info(f"Notifikasi pembayaran berhasil dikirim untuk invoice {invoice.invoice_number}")
-        else:
-            logger.warning(f"Tidak ada user dengan role Admin/CS yang ditemukan untuk dikirimi notifikasi.")
+            },
+        }
+        # Target = user online dengan role tersebut (role_index WebSocket manager, tanpa query)
+        await manager.broadcast_to_role_names(notification_payload, target_roles)
+        logger.info(f"Notifikasi pembayaran berhasil dikirim untuk invoice {invoice.invoice_number}")
 
     except Exception as e:
         # 🛡️ Graceful degradation: Payment processed but notification failed
@@ -432,7 +421,7 @@ async def handle_xendit_callback(
     payload = await request.json()
     # Log the JSON payload with sensitive data filtered
     filtered_payload = sanitize_log_data(payload)
-    logger.info(f"Xendit callback received. Filtered JSON Payload: {json.dumps(filtered_payload, indent=2)}")
+    logger.info(f"Xendit callback received. Filtered JSON Payload: {json.dumps(filtered_payload, default=str)}")
 
     # Extract IDs from payload
     xendit_id = payload.get("id")  # Xendit internal ID
@@ -4,7 +4,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import or_
 from typing import List, Optional
-import asyncio
 import logging
 from datetime import datetime, timezone
 from fastapi.responses import JSONResponse
@@ -18,6 +17,7 @@ from ..schemas.mikrotik_server import (
 )
 from ..services import mikrotik_service
 from ..services.mikrotik_connection_pool import mikrotik_pool
+from ..services.mikrotik_health_monitor import mikrotik_health_monitor
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -43,6 +43,22 @@ async def create_mikrotik_server(server_data: MikrotikServerCreate, db: AsyncSes
     return db_server
 
 
+def _with_health_state(server: MikrotikServerModel) -> MikrotikServerSchema:
+    """Gabungkan data server dengan state reachability terakhir dari health monitor."""
+    data = MikrotikServerSchema.model_validate(server)
+    state = mikrotik_health_monitor.get_state(server.id)
+    if not state:
+        return data
+    return data.model_copy(
+        update={
+            "reachability": state["reachability"],
+            "latency_ms": state["latency_ms"],
+            "last_checked_at": state["last_checked_at"],
+            "status_changed_at": state["status_changed_at"],
+        }
+    )
+
+
 @router.get("/", response_model=List[MikrotikServerSchema])
 async def get_all_mikrotik_servers(
     search: Optional[str] = None,
@@ -68,7 +84,50 @@ async def get_all_mikrotik_servers(
         query = query.where(MikrotikServerModel.last_connection_status == last_connection_status)
     result = await db.execute(query)
     servers = result.scalars().all()
-    return servers
+    return [_with_health_state(server) for server in servers]
+
+
+# Path statis harus didaftarkan sebelum /{server_id}, kalau tidak ikut tertangkap route itu (422)
+@router.get("/connection-health")
+async def get_all_connection_health():
+    """Get connection health status for all Mikrotik servers."""
+    try:
+        health_status = mikrotik_pool.get_all_servers_health()
+        health_status["health_monitor"] = mikrotik_health_monitor.get_stats()
+        return health_status
+
+    except Exception as e:
+        logger.error(f"Error getting all connection health status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Gagal mengambil status koneksi: {str(e)}"
+        )
+
+
+@router.get("/pool-metrics")
+async def get_pool_metrics():
+    """Get connection pool metrics (wait time, lease time, hit ratio, reconnects)."""
+    try:
+        return {"metrics": mikrotik_pool.get_metrics()}
+
+    except Exception as e:
+        logger.error(f"Error getting pool metrics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Gagal mengambil metrics pool: {str(e)}"
+        )
+
+
+@router.get("/pool-config")
+async def get_pool_config():
+    """Get current connection pool configuration."""
+    try:
+        config = mikrotik_pool.get_pool_config()
+        return {"message": "Pool configuration retrieved successfully", "configuration": config}
+
+    except Exception as e:
+        logger.error(f"Error getting pool config: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Gagal mengambil konfigurasi pool: {str(e)}"
+        )
 
 
 @router.get("/{server_id}", response_model=MikrotikServerSchema)
@@ -79,7 +138,7 @@ async def get_mikrotik_server_by_id(server_id: int, db: AsyncSession = Depends(g
     db_server = await db.get(MikrotikServerModel, server_id)
     if not db_server:
         raise HTTPException(status_code=404, detail="Server Mikrotik tidak ditemukan")
-    return db_server
+    return _with_health_state(db_server)
 
 
 @router.patch("/{server_id}", response_model=MikrotikServerSchema)
@@ -145,8 +204,7 @@ async def test_mikrotik_connection(server_id: int, db: AsyncSession = Depends(ge
             "port": db_server.port,
         }
 
-        loop = asyncio.get_event_loop()
-        test_result = await loop.run_in_executor(None, mikrotik_service.perform_routeros_connection, device_details)
+        test_result = await mikrotik_service.async_mikrotik.perform_routeros_connection(device_details)
 
     except ValueError as ve:
         test_result = {"status": "failure", "message": str(ve)}
@@ -192,7 +250,7 @@ async def get_connection_health(server_id: int, db: AsyncSession = Depends(get_d
         # Get connection health status
         health_status = mikrotik_pool.get_connection_health_status(host_ip=server.host_ip, port=server.port)
 
-        return {"server_id": server_id, "server_name": server.nama_server, "connection_health": health_status}
+        return {"server_id": server_id, "server_name": server.name, "connection_health": health_status}
 
     except HTTPException:
         raise
@@ -203,20 +261,6 @@ async def get_connection_health(server_id: int, db: AsyncSession = Depends(get_d
         )
 
 
-@router.get("/connection-health")
-async def get_all_connection_health():
-    """Get connection health status for all Mikrotik servers."""
-    try:
-        health_status = mikrotik_pool.get_all_servers_health()
-        return health_status
-
-    except Exception as e:
-        logger.error(f"Error getting all connection health status: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Gagal mengambil status koneksi: {str(e)}"
-        )
-
-
 @router.post("/cleanup-connections")
 async def cleanup_connections():
     """Manually trigger cleanup of stale connections."""
@@ -227,17 +271,3 @@ async def cleanup_connections():
     except Exception as e:
         logger.error(f"Error during connection cleanup: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Gagal membersihkan koneksi: {str(e)}")
-
-
-@router.get("/pool-config")
-async def get_pool_config():
-    """Get current connection pool configuration."""
-    try:
-        config = mikrotik_pool.get_pool_config()
-        return {"message": "Pool configuration retrieved successfully", "configuration": config}
-
-    except Exception as e:
-        logger.error(f"Error getting pool config: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Gagal mengambil konfigurasi pool: {str(e)}"
-        )
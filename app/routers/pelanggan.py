@@ -28,7 +28,6 @@ from ..models.paket_layanan import PaketLayanan as PaketLayananModel
 from ..services import mikrotik_service
 from ..websocket_manager import manager
 from ..models.user import User as UserModel
-from ..models.role import Role as RoleModel
 from ..auth import get_current_active_user
 from ..models.odp import ODP as ODPModel
 from ..models.harga_layanan import HargaLayanan as HargaLayananModel
@@ -87,28 +86,21 @@ async def create_pelanggan(
         await db.flush()
         await db.refresh(db_pelanggan, attribute_names=["harga_layanan", "data_teknis"])
 
-        # 2. Prepare notification data (masih dalam transaction)
+        # 2. Prepare notification payload (target = user online dengan role ini)
         target_roles = ["NOC", "CS", "Admin"]
-        query = select(UserModel.id).join(RoleModel).where(func.lower(RoleModel.name).in_([r.lower() for r in target_roles]))
-        result = await db.execute(query)
-        target_user_ids = result.scalars().all()
-
-        # 3. Prepare notification payload
-        notification_payload = None
-        if target_user_ids:
-            pelanggan_nama = db_pelanggan.nama if db_pelanggan else "N/A"
-            notification_payload = {
-                "type": "new_customer_for_noc",
-                "message": f"Pelanggan baru '{pelanggan_nama}' telah ditambahkan. Segera buatkan Data Teknis.",
+        pelanggan_nama = db_pelanggan.nama if db_pelanggan else "N/A"
+        notification_payload = {
+            "type": "new_customer_for_noc",
+            "message": f"Pelanggan baru '{pelanggan_nama}' telah ditambahkan. Segera buatkan Data Teknis.",
+            "timestamp": datetime.now().isoformat(),
+            "data": {
+                "pelanggan_id": db_pelanggan.id,
+                "pelanggan_nama": pelanggan_nama,
+                "alamat": db_pelanggan.alamat,
+                "no_telp": db_pelanggan.no_telp,
                 "timestamp": datetime.now().isoformat(),
-                "data": {
-                    "pelanggan_id": db_pelanggan.id,
-                    "pelanggan_nama": pelanggan_nama,
-                    "alamat": db_pelanggan.alamat,
-                    "no_telp": db_pelanggan.no_telp,
-                    "timestamp": datetime.now().isoformat(),
-                },
-            }
+            },
+        }
 
         # Commit transaction
         await db.commit()
@@ -123,7 +115,7 @@ async def create_pelanggan(
     # ✅ SAFE: Pelanggan sudah committed, notification failure tidak affect data
     if notification_payload:
         try:
-            await manager.broadcast_to_roles(notification_payload, list(target_user_ids))
+            await manager.broadcast_to_role_names(notification_payload, target_roles)
             logger.info(f"✅ Notification sent for new pelanggan: {db_pelanggan.nama}")
         except Exception as e:
             logger.warning(f"⚠️  Notification failed but pelanggan created: {e}")
@@ -45,6 +45,7 @@ from typing import List
 
 from ..models.permission import Permission as PermissionModel
 from ..database import get_db
+from ..services.principal_cache import principal_cache
 from ..schemas.permission import Permission as PermissionSchema
 
 # --- PERBAIKAN DI SINI ---
@@ -148,6 +149,8 @@ async def generate_permissions(db: AsyncSession = Depends(get_db)):
 
     # --- Sisa fungsi (Kode Asli Anda) ---
     await db.commit()
+    if permissions_created:
+        principal_cache.invalidate_all()
 
     for p in permissions_created:
         await db.refresh(p)
@@ -1,8 +1,11 @@
 """
 Rate Limiter Monitoring API
 Endpoint untuk monitoring queue status dan retry failed invoices.
+Data antrian dibaca live dari tabel invoice_outbox (semua worker/proses).
 """
 
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException
 from ..services.rate_limiter import rate_limiter
 from ..auth import has_permission
@@ -24,13 +27,16 @@ async def get_queue_status():
 
     Returns:
     - pending: Number of invoices waiting in queue
-    - processing: Number of invoices currently being processed
-    - completed: Number of successfully processed invoices
-    - failed: Number of failed invoices
+    - processing: Number of invoices currently claimed by a worker
+    - completed: Number of successfully processed invoices (masih dalam retention)
+    - failed: Number of dead-lettered invoices
     - total_processed: Total number of invoices processed
     - total_failed: Total number of invoices failed
     - is_processing: Whether queue is currently processing
     - estimated_wait_time: Estimated wait time in seconds
+    - throughput_per_minute: Invoice completed per menit (rata-rata 5 menit terakhir)
+    - outbox: Detail per status/priority dan umur entry pending tertua
+    - buckets: Status token bucket per akun Xendit
     """
     try:
         status = await rate_limiter.get_queue_status()
@@ -48,7 +54,7 @@ async def retry_failed_invoices():
     """
     Retry all failed invoices in the queue.
 
-    This endpoint will retry all invoices that failed during processing.
+    This endpoint will requeue all dead-lettered invoices in the outbox.
     Useful for recovering from temporary failures or network issues.
 
     Returns:
@@ -95,7 +101,7 @@ async def health_check():
             "success": True,
             "status": health_status,
             "queue_health": status,
-            "timestamp": "2025-01-01"  # Static for now
+            "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
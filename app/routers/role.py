@@ -53,6 +53,8 @@ from ..models.role import Role as RoleModel
 from ..models.permission import Permission as PermissionModel
 from ..schemas.role import Role as RoleSchema, RoleCreate, RoleUpdate
 from ..database import get_db
+from ..services.principal_cache import principal_cache
+from ..websocket_manager import manager
 
 router = APIRouter(
     prefix="/roles",
@@ -129,6 +131,7 @@ async def create_role(role_data: RoleCreate, db: AsyncSession = Depends(get_db))
 
     db.add(db_role)
     await db.commit()
+    principal_cache.invalidate_all()
     role_id = db_role.id
 
     # --- KUNCI PERBAIKAN ADA DI SINI ---
@@ -170,6 +173,9 @@ async def update_role(role_id: int, role_update: RoleUpdate, db: AsyncSession =
 
     db.add(db_role)
     await db.commit()
+    principal_cache.invalidate_all()  # Permission semua user dengan role ini berubah
+    if role_update.name:
+        await manager.refresh_connection_roles()  # Nama role berubah -> role_index WebSocket ikut
     await db.refresh(db_role)
     return db_role
 
@@ -181,4 +187,6 @@ async def delete_role(role_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Role not found")
     await db.delete(db_role)
     await db.commit()
+    principal_cache.invalidate_all()
+    await manager.refresh_connection_roles()
     return None
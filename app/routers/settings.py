@@ -7,6 +7,7 @@ from ..database import get_db
 from ..models.system_setting import SystemSetting as SettingModel
 from ..auth import get_current_active_user
 from ..models.user import User as UserModel
+from ..services.settings_cache import system_settings_cache
 
 router = APIRouter(prefix="/settings", tags=["System Settings"])
 
@@ -16,13 +17,9 @@ class SettingUpdate(BaseModel):
 
 
 @router.get("/{key}")
-async def get_setting(key: str, db: AsyncSession = Depends(get_db)):
-    """Mengambil nilai sebuah pengaturan."""
-    stmt = select(SettingModel).where(SettingModel.setting_key == key)
-    setting = (await db.execute(stmt)).scalar_one_or_none()
-    if not setting:
-        return {"key": key, "value": None}
-    return {"key": key, "value": setting.setting_value}
+async def get_setting(key: str):
+    """Mengambil nilai sebuah pengaturan (dari cache system_settings)."""
+    return {"key": key, "value": await system_settings_cache.get(key)}
 
 
 @router.put("/{key}")
@@ -47,4 +44,6 @@ async def update_setting(
 
     db.add(setting)
     await db.commit()
+    # Push ke cache supaya middleware (misal maintenance mode) langsung pakai nilai baru
+    system_settings_cache.set(key, payload.value)
     return {"key": key, "value": payload.value}
@@ -6,6 +6,7 @@ from typing import List
 from ..models.system_log import SystemLog as SystemLogModel
 from ..schemas.log import SystemLog as SystemLogSchema
 from ..database import get_db
+from ..logging_config import get_logging_stats
 
 router = APIRouter(prefix="/logs/system", tags=["System Logs"])
 
@@ -16,3 +17,9 @@ async def get_system_logs(skip: int = 0, limit: int = 200, db: AsyncSession = De
     query = select(SystemLogModel).order_by(SystemLogModel.id.desc()).offset(skip).limit(limit)
     result = await db.execute(query)
     return result.scalars().all()
+
+
+@router.get("/pipeline")
+async def get_logging_pipeline_stats():
+    """Statistik pipeline logging: antrian, record yang dibuang, di-sampling, dan kena rate-limit."""
+    return get_logging_stats()
@@ -70,7 +70,8 @@ class TrafficHistoryResponse(BaseModel):
     rx_mbps: float
     tx_mbps: float
     total_mbps: float
-    uptime_seconds: int
+    max_mbps: Optional[float] = None
+    uptime_seconds: int = 0
 
     class Config:
         from_attributes = True
@@ -198,28 +199,18 @@ async def get_user_traffic_history(
                 detail="User not found"
             )
 
-        # Get traffic history dengan direct query
-        since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
+        # History dari tabel rollup (resolusi menyesuaikan range jam)
+        history_rows = await traffic_monitoring_service.get_user_traffic_history(db, data_teknis_id, hours=hours)
 
-        history_query = select(TrafficHistory).where(
-            and_(
-                TrafficHistory.data_teknis_id == data_teknis_id,
-                TrafficHistory.timestamp >= since_time
-            )
-        ).order_by(desc(TrafficHistory.timestamp))
-
-        history_result = await db.execute(history_query)
-        history_records = history_result.scalars().all()
-
-        # Format response
+        # Format response (terbaru di atas)
         response_data = []
-        for record in history_records:
+        for row in reversed(history_rows):
             response_data.append(TrafficHistoryResponse(
-                timestamp=record.timestamp,
-                rx_mbps=round(record.rx_mbps, 2),
-                tx_mbps=round(record.tx_mbps, 2),
-                total_mbps=round(record.total_mbps, 2),
-                uptime_seconds=record.uptime_seconds
+                timestamp=row["timestamp"],
+                rx_mbps=row["rx_mbps"],
+                tx_mbps=row["tx_mbps"],
+                total_mbps=row["total_mbps"],
+                max_mbps=row["max_mbps"]
             ))
 
         return response_data
@@ -244,46 +235,23 @@ async def get_server_traffic_summary(
     Get traffic summary untuk server tertentu.
     """
     try:
-        # Get server summary data dengan direct query
-        since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-
-        summary_query = select(
-            TrafficHistory.mikrotik_server_id.label('server_id'),
-            MikrotikServer.name.label('server_name'),
-            func.count(TrafficHistory.id).label('active_users'),
-            func.avg(TrafficHistory.total_mbps).label('avg_mbps'),
-            func.max(TrafficHistory.total_mbps).label('max_mbps'),
-            func.sum(TrafficHistory.total_mbps).label('total_mbps')
-        ).join(
-            MikrotikServer, TrafficHistory.mikrotik_server_id == MikrotikServer.id
-        ).where(
-            and_(
-                TrafficHistory.mikrotik_server_id == server_id,
-                TrafficHistory.is_latest == True,
-                TrafficHistory.timestamp >= since_time
-            )
-        ).group_by(
-            TrafficHistory.mikrotik_server_id,
-            MikrotikServer.name
-        )
-
-        summary_result = await db.execute(summary_query)
-        summary_rows = summary_result.all()
+        # Summary dari tabel rollup
+        summary_rows = await traffic_monitoring_service.get_server_traffic_summary(db, server_id=server_id, hours=hours)
 
         # Format response
         response_data = []
         for row in summary_rows:
             # Calculate load percentage (assuming 100Mbps = 100%)
             max_bandwidth = 100  # 100Mbps
-            total_mbps = float(row.total_mbps) if row.total_mbps else 0
+            total_mbps = float(row["total_mbps"]) if row["total_mbps"] else 0
             load_percentage = min((total_mbps / max_bandwidth) * 100, 100)
 
             response_data.append(TrafficSummaryResponse(
-                server_id=row.server_id,
-                server_name=row.server_name,
-                active_users=row.active_users,
-                avg_mbps=round(float(row.avg_mbps), 2) if row.avg_mbps else 0,
-                max_mbps=round(float(row.max_mbps), 2) if row.max_mbps else 0,
+                server_id=row["mikrotik_server_id"],
+                server_name=row["server_name"],
+                active_users=row["active_users"],
+                avg_mbps=round(float(row["avg_mbps"]), 2) if row["avg_mbps"] else 0,
+                max_mbps=round(float(row["max_mbps"]), 2) if row["max_mbps"] else 0,
                 total_mbps=round(total_mbps, 2),
                 load_percentage=round(load_percentage, 1)
             ))
@@ -281,7 +281,7 @@ async def create_trouble_ticket(
         }
 
         background_tasks.add_task(
-            manager.broadcast_to_roles,
+            manager.broadcast_to_role_names,
             notification_data,
             ["NOC", "CS", "Admin"]
         )
@@ -589,7 +589,7 @@ async def update_trouble_ticket(
             }
 
             background_tasks.add_task(
-                manager.broadcast_to_roles,
+                manager.broadcast_to_role_names,
                 notification_data,
                 ["NOC", "CS", "Admin"]
             )
@@ -714,7 +714,7 @@ async def update_ticket_status(
         }
 
         background_tasks.add_task(
-            manager.broadcast_to_roles,
+            manager.broadcast_to_role_names,
             notification_data,
             ["NOC", "CS", "Admin"]
         )
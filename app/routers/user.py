@@ -16,11 +16,13 @@ from ..schemas.user import User as UserSchema, UserCreate, UserUpdate
 from ..database import get_db
 from ..auth import (
     get_current_active_user,
-    get_password_hash,
-    verify_password,
-)  # <-- Impor get_password_hash dan verify_password dari auth
+    get_password_hash_async,
+)  # <-- Hash password lewat pool hashing (tidak memblokir event loop)
 from .. import auth
 from ..config import settings
+from ..services.password_hasher import PasswordHasherBusy
+from ..services.principal_cache import principal_cache
+from ..websocket_manager import manager
 
 router = APIRouter(
     prefix="/users",
@@ -29,6 +31,18 @@ router = APIRouter(
 )
 
 
+async def _hash_password(password: str) -> str:
+    """Hash password di pool hashing; antrian bcrypt penuh -> 503 (sama seperti login)."""
+    try:
+        return await get_password_hash_async(password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server sedang sibuk memproses password, silakan coba lagi",
+            headers={"Retry-After": "2"},
+        )
+
+
 # Endpoint /me sekarang menggunakan dependency yang sudah eager loading
 @router.get("/me", response_model=UserSchema)
 async def get_current_user_info(
@@ -76,7 +90,7 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # 3. Hash password (only if validation passes)
     user_data = user.model_dump()
     role_id = user_data.pop("role_id", None)
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await _hash_password(user.password)
     user_data["password"] = hashed_password
     # Set password_changed_at to current time when creating user
     user_data["password_changed_at"] = datetime.utcnow()
@@ -192,7 +206,7 @@ async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession =
             )
 
         # Only hash if validation passes
-        update_data["password"] = get_password_hash(update_data["password"])
+        update_data["password"] = await _hash_password(update_data["password"])
         # Update password_changed_at when password is changed
         update_data["password_changed_at"] = datetime.utcnow()
     elif "password" in update_data:
@@ -203,6 +217,9 @@ async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession =
 
     db.add(db_user)
     await db.commit()
+    principal_cache.invalidate_user(user_id)
+    if "role_id" in update_data:
+        await manager.refresh_connection_roles([user_id])  # Role user berubah -> role_index WebSocket ikut
 
     # Ambil ulang data dengan relasi untuk respons
     query = (
@@ -223,6 +240,8 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(db_user)
     await db.commit()
+    principal_cache.invalidate_user(user_id)
+    await manager.refresh_connection_roles([user_id])
     return None
 
 
@@ -272,7 +291,7 @@ async def reset_password(email: str, new_password: str, token: str, db: AsyncSes
         )
 
     # Hash password baru
-    hashed_password = get_password_hash(new_password)
+    hashed_password = await _hash_password(new_password)
 
     # Update password dan hapus token
     user.password = hashed_password
@@ -282,5 +301,6 @@ async def reset_password(email: str, new_password: str, token: str, db: AsyncSes
     user.password_changed_at = datetime.utcnow()
     db.add(user)
     await db.commit()
+    principal_cache.invalidate_user(user.id)
 
     return {"message": "Password berhasil diatur ulang. Silakan login dengan password baru."}
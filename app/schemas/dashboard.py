@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 
 
 # Skema BARU untuk setiap item pendapatan brand
@@ -92,6 +93,9 @@ class DashboardData(BaseModel):
     status_langganan_chart: Optional[ChartData] = None
     pelanggan_per_alamat_chart: Optional[ChartData] = None
     loyalitas_pembayaran_chart: Optional[ChartData] = None
+    # Waktu bagian snapshot tertua yang dipakai response ini + umurnya (detik)
+    snapshot_generated_at: Optional[datetime] = None
+    snapshot_age_seconds: Optional[float] = None
 
     class Config:
         from_attributes = True
@@ -30,5 +30,11 @@ class MikrotikServer(MikrotikServerBase):
     last_connection_status: Optional[str] = None
     last_connected_at: Optional[datetime] = None
 
+    # State live dari mikrotik_health_monitor (None kalau belum pernah di-probe)
+    reachability: Optional[str] = None  # up / down / unknown
+    latency_ms: Optional[float] = None
+    last_checked_at: Optional[datetime] = None
+    status_changed_at: Optional[datetime] = None
+
     class Config:
         from_attributes = True
@@ -0,0 +1,180 @@
+# ====================================================================
+# ACTIVITY LOG WRITER - INSERT ACTIVITY LOG SECARA BATCH DI BACKGROUND
+# ====================================================================
+# Sebelumnya middleware log_requests_and_activity membuka session baru,
+# insert satu row ActivityLog dan commit untuk setiap POST/PATCH/DELETE
+# yang sukses - sebelum response dikirim ke client.
+#
+# Sekarang middleware hanya enqueue() (non-blocking) dan satu task
+# background melakukan bulk insert:
+# - Flush setiap ACTIVITY_LOG_FLUSH_INTERVAL_MS atau setiap
+#   ACTIVITY_LOG_BATCH_SIZE row, mana yang lebih dulu.
+# - Queue dibatasi ACTIVITY_LOG_QUEUE_SIZE. Kalau penuh (database lambat /
+#   down), row baru dibuang dan dihitung di `dropped` - request tidak ikut
+#   tertahan.
+# - Kalau bulk insert gagal karena satu row bermasalah (misal user sudah
+#   dihapus -> FK error), row di-insert satu per satu supaya row lain tetap
+#   tersimpan.
+# - stop() dipanggil saat shutdown: sisa queue di-flush dulu.
+# ====================================================================
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.activity_log import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityLogWriter:
+    """Queue in-process + flusher background untuk tabel activity_logs."""
+
+    def __init__(self):
+        self.queue_size = settings.ACTIVITY_LOG_QUEUE_SIZE
+        self.batch_size = max(1, settings.ACTIVITY_LOG_BATCH_SIZE)
+        self.flush_interval = settings.ACTIVITY_LOG_FLUSH_INTERVAL_MS / 1000
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        return self._queue
+
+    def start(self):
+        """Mulai task flusher (dipanggil saat startup aplikasi)."""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="activity-log-writer")
+            logger.info(
+                f"Activity log writer started (batch {self.batch_size}, interval {self.flush_interval * 1000:.0f} ms, "
+                f"queue {self.queue_size})"
+            )
+
+    def enqueue(self, user_id: int, action: str, details: Optional[str] = None) -> bool:
+        """Antrikan satu activity log. Return False kalau dibuang karena queue penuh / sedang shutdown."""
+        if self._stopping:
+            self.dropped += 1
+            return False
+        if self._task is None:
+            self.start()
+
+        row = {"user_id": user_id, "action": action[:255], "details": details, "timestamp": datetime.now()}
+        try:
+            self._get_queue().put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Queue activity log penuh ({self.queue_size}), total {self.dropped} log dibuang")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _collect(self) -> List[Dict[str, Any]]:
+        """Tunggu row pertama, lalu kumpulkan sampai batch_size atau flush_interval habis."""
+        queue = self._get_queue()
+        first = await queue.get()
+        batch = [first] if first is not None else []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            try:
+                row = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._stopping:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.05))
+                continue
+            if row is not None:
+                batch.append(row)
+        return batch
+
+    async def _run(self):
+        queue = self._get_queue()
+        while True:
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+            if self._stopping and queue.empty():
+                break
+
+    async def _flush(self, rows: List[Dict[str, Any]]):
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                try:
+                    await db.execute(insert(ActivityLog), rows)
+                    await db.commit()
+                    self.written += len(rows)
+                except Exception as e:
+                    await db.rollback()
+                    if len(rows) == 1:
+                        raise
+                    logger.warning(f"Bulk insert {len(rows)} activity log gagal ({e}), insert satu per satu")
+                    for row in rows:
+                        try:
+                            await db.execute(insert(ActivityLog), [row])
+                            await db.commit()
+                            self.written += 1
+                        except Exception as row_error:
+                            await db.rollback()
+                            self.failed += 1
+                            logger.error(f"Gagal menyimpan activity log {row['action']} user {row['user_id']}: {row_error}")
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Gagal menyimpan {len(rows)} activity log: {e}")
+        finally:
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def stop(self, timeout: float = 10.0):
+        """Flush sisa queue lalu hentikan flusher (dipanggil saat shutdown aplikasi)."""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            # Bangunkan _collect kalau sedang menunggu queue kosong
+            self._get_queue().put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Flush activity log tidak selesai dalam {timeout}s, {self._get_queue().qsize()} log hilang")
+        self._task = None
+        logger.info(f"Activity log writer stopped ({self.written} ditulis, {self.dropped} dibuang, {self.failed} gagal)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+# Global instance
+activity_log_writer = ActivityLogWriter()
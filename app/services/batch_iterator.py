@@ -0,0 +1,213 @@
+# ====================================================================
+# KEYSET BATCH ITERATOR - PAGINATION UNTUK JOB BILLING
+# ====================================================================
+# Pengganti pola .offset(offset).limit(BATCH_SIZE) di job scheduler.
+#
+# Kenapa bukan OFFSET:
+# - Job yang mengubah row (misal Aktif -> Suspended) membuat row keluar
+#   dari filter, jadi offset yang terus naik melompati pelanggan berikutnya
+# - Biaya OFFSET naik linear dengan ukuran tabel
+#
+# Keyset: setiap batch = WHERE key > last_key ORDER BY key LIMIT n.
+#
+# Checkpoint: last_key disimpan di tabel system_settings dengan key
+# "job_checkpoint:<job_name>" bersama run_key (misal tanggal jatuh tempo).
+# Kalau job terputus (crash / restart) lalu dijalankan lagi dengan run_key
+# yang sama, iterasi lanjut dari checkpoint. Checkpoint dihapus saat semua
+# batch selesai.
+#
+# Contoh:
+#   batches = KeysetBatchIterator(db, stmt, LanggananModel.id, batch_size=100,
+#                                 job_name="job_generate_invoices", run_key=str(target_date))
+#   async for batch in batches:
+#       ...proses + commit...
+#   logger.info(batches.summary())
+# ====================================================================
+
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..models.system_setting import SystemSetting as SettingModel
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = "job_checkpoint:"
+
+
+@dataclass
+class BatchStats:
+    """Timing satu batch."""
+
+    index: int
+    size: int
+    last_key: Any
+    fetch_ms: float = 0.0
+    process_ms: float = 0.0
+
+
+@dataclass
+class IteratorStats:
+    """Ringkasan seluruh iterasi."""
+
+    batches: List[BatchStats] = field(default_factory=list)
+    resumed_from: Any = None
+    completed: bool = False
+
+    @property
+    def rows(self) -> int:
+        return sum(b.size for b in self.batches)
+
+    @property
+    def fetch_ms(self) -> float:
+        return round(sum(b.fetch_ms for b in self.batches), 2)
+
+    @property
+    def process_ms(self) -> float:
+        return round(sum(b.process_ms for b in self.batches), 2)
+
+
+class KeysetBatchIterator:
+    """
+    Async iterator batch ORM object dengan keyset pagination dan checkpoint opsional.
+
+    stmt tidak boleh punya order_by/limit sendiri - iterator yang menambahkan.
+    Checkpoint batch N ditulis saat batch N+1 diminta (artinya caller sudah selesai
+    memproses batch N); kalau caller keluar di tengah (break / exception), checkpoint
+    tetap di batch terakhir yang selesai sehingga run berikutnya mengulang batch itu.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        stmt,
+        key_column,
+        batch_size: int = 100,
+        job_name: Optional[str] = None,
+        run_key: Optional[str] = None,
+    ):
+        self.db = db
+        self.stmt = stmt
+        self.key_column = key_column
+        self.key_attr = key_column.key
+        self.batch_size = batch_size
+        self.job_name = job_name
+        self.run_key = run_key or ""
+        self.last_key: Any = None
+        self.stats = IteratorStats()
+
+    @property
+    def checkpoint_enabled(self) -> bool:
+        return bool(self.job_name)
+
+    async def __aiter__(self) -> AsyncIterator[Sequence[Any]]:
+        if self.checkpoint_enabled:
+            self.last_key = await self._load_checkpoint()
+            if self.last_key is not None:
+                self.stats.resumed_from = self.last_key
+                logger.warning(f"[{self.job_name}] Melanjutkan dari checkpoint {self.key_attr} > {self.last_key}")
+
+        while True:
+            started = time.perf_counter()
+            batch = await self._fetch()
+            fetch_ms = round((time.perf_counter() - started) * 1000, 2)
+            if not batch:
+                break
+
+            batch_stats = BatchStats(
+                index=len(self.stats.batches),
+                size=len(batch),
+                last_key=getattr(batch[-1], self.key_attr),
+                fetch_ms=fetch_ms,
+            )
+            self.stats.batches.append(batch_stats)
+
+            started = time.perf_counter()
+            yield batch
+            batch_stats.process_ms = round((time.perf_counter() - started) * 1000, 2)
+
+            self.last_key = batch_stats.last_key
+            logger.debug(
+                f"[{self.job_name or 'batch'}] Batch #{batch_stats.index}: {batch_stats.size} rows, "
+                f"fetch {batch_stats.fetch_ms:.0f} ms, proses {batch_stats.process_ms:.0f} ms"
+            )
+            if self.checkpoint_enabled:
+                await self._save_checkpoint(self.last_key)
+
+        self.stats.completed = True
+        if self.checkpoint_enabled:
+            await self._clear_checkpoint()
+
+    async def _fetch(self) -> Sequence[Any]:
+        stmt = self.stmt
+        if self.last_key is not None:
+            stmt = stmt.where(self.key_column > self.last_key)
+        stmt = stmt.order_by(self.key_column).limit(self.batch_size)
+        return (await self.db.execute(stmt)).scalars().unique().all()
+
+    def summary(self) -> str:
+        stats = self.stats
+        resumed = f", resume dari {stats.resumed_from}" if stats.resumed_from is not None else ""
+        return (
+            f"{stats.rows} rows dalam {len(stats.batches)} batch "
+            f"(fetch {stats.fetch_ms:.0f} ms, proses {stats.process_ms:.0f} ms{resumed})"
+        )
+
+    # ====================================================================
+    # CHECKPOINT (system_settings)
+    # ====================================================================
+
+    @property
+    def _setting_key(self) -> str:
+        return f"{CHECKPOINT_PREFIX}{self.job_name}"
+
+    async def _get_setting(self) -> Optional[SettingModel]:
+        result = await self.db.execute(select(SettingModel).where(SettingModel.setting_key == self._setting_key))
+        return result.scalar_one_or_none()
+
+    async def _load_checkpoint(self) -> Any:
+        try:
+            setting = await self._get_setting()
+            if not setting or not setting.setting_value:
+                return None
+            data = json.loads(setting.setting_value)
+        except Exception as e:
+            logger.warning(f"[{self.job_name}] Checkpoint tidak bisa dibaca, mulai dari awal: {e}")
+            return None
+
+        if data.get("run_key") != self.run_key:
+            # Checkpoint dari run lain (misal tanggal jatuh tempo berbeda) - abaikan
+            return None
+        return data.get("last_key")
+
+    async def _save_checkpoint(self, last_key: Any):
+        value = json.dumps(
+            {"run_key": self.run_key, "last_key": last_key, "updated_at": datetime.now().isoformat()}, default=str
+        )
+        try:
+            setting = await self._get_setting()
+            if setting:
+                setting.setting_value = value
+            else:
+                self.db.add(SettingModel(setting_key=self._setting_key, setting_value=value))
+            await self.db.commit()
+        except Exception as e:
+            # Checkpoint gagal bukan alasan menghentikan job
+            await self.db.rollback()
+            logger.warning(f"[{self.job_name}] Gagal menyimpan checkpoint {last_key}: {e}")
+
+    async def _clear_checkpoint(self):
+        try:
+            setting = await self._get_setting()
+            if setting:
+                await self.db.delete(setting)
+                await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.warning(f"[{self.job_name}] Gagal menghapus checkpoint: {e}")
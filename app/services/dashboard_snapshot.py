@@ -0,0 +1,665 @@
+# ====================================================================
+# DASHBOARD SNAPSHOT - AGREGAT WIDGET DASHBOARD DIHITUNG DI BACKGROUND
+# ====================================================================
+# Sebelumnya GET /dashboard/ menjalankan 10+ query agregat (pendapatan per
+# brand, pelanggan per brand, loyalitas, lokasi, paket, pertumbuhan, invoice
+# bulanan, status langganan, alamat aktif) plus cek status semua router
+# Mikrotik di SETIAP page view, lalu baru mencocokkan dengan permission user.
+# Status router sekarang dibaca dari mikrotik_health_monitor.
+#
+# Sekarang:
+# - Setiap widget dihitung oleh satu fungsi compute_* di modul ini dan
+#   hasilnya disimpan di memory (payload JSON) beserta waktu hitungnya.
+# - Worker background menghitung ulang SEMUA widget setiap
+#   DASHBOARD_SNAPSHOT_REFRESH_SECONDS.
+# - Perubahan invoice / langganan / pelanggan / mikrotik_server (flush ORM
+#   maupun bulk UPDATE/DELETE/INSERT lewat session) menandai widget yang
+#   bergantung pada tabel itu sebagai dirty (WIDGET_SOURCES). Setelah
+#   DASHBOARD_SNAPSHOT_DEBOUNCE_SECONDS hanya widget dirty yang dihitung ulang.
+#   Sumber yang berubah dikumpulkan di session.info dan baru ditandai dirty
+#   saat transaksi COMMIT (dibuang kalau rollback), supaya refresh tidak
+#   membaca data yang belum di-commit lalu menganggap widget sudah bersih.
+# - Response dirakit sekali per kombinasi widget yang boleh dilihat
+#   (permission) per versi snapshot, jadi request = satu lookup dict.
+# - Umur snapshot dikirim di response (snapshot_generated_at /
+#   snapshot_age_seconds) supaya frontend bisa menampilkan "diperbarui X
+#   menit lalu".
+# - DASHBOARD_SNAPSHOT_PERSIST=True: snapshot juga ditulis ke tabel
+#   dashboard_snapshots dan dibaca saat worker start (warm start).
+#
+# Dirty tracking hanya berlaku per proses; worker lain menyusul paling lama
+# satu DASHBOARD_SNAPSHOT_REFRESH_SECONDS.
+# ====================================================================
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import case, event, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session, object_session
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models import HargaLayanan, Invoice, Langganan, MikrotikServer, PaketLayanan, Pelanggan
+from ..models.dashboard_snapshot import DashboardSnapshot
+from ..schemas.dashboard import (
+    BrandRevenueItem,
+    ChartData,
+    DashboardData,
+    InvoiceSummary,
+    RevenueSummary,
+    StatCard,
+)
+from .mikrotik_health_monitor import mikrotik_health_monitor
+
+logger = logging.getLogger(__name__)
+
+
+# ====================================================================
+# PERHITUNGAN WIDGET
+# ====================================================================
+
+
+async def compute_revenue_summary(db: AsyncSession) -> RevenueSummary:
+    """Ringkasan pendapatan bulan berjalan per brand."""
+    # PERFORMANCE NOTE: This query needs indexes on:
+    # - invoices(paid_at)
+    # - invoices(status_invoice)
+    # - pelanggan(id_brand)
+    now = datetime.now()
+    # OPTIMIZATION: Use date range instead of func.extract() for better performance
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end_of_month = start_of_month + relativedelta(months=1)
+
+    revenue_stmt = (
+        select(HargaLayanan.brand, func.sum(Invoice.total_harga).label("total_revenue"))
+        .select_from(Invoice)
+        .join(Pelanggan, Invoice.pelanggan_id == Pelanggan.id, isouter=True)
+        .join(HargaLayanan, Pelanggan.id_brand == HargaLayanan.id_brand, isouter=True)
+        .where(
+            Invoice.status_invoice == "Lunas",
+            HargaLayanan.brand.is_not(None),
+            Invoice.paid_at >= start_of_month,
+            Invoice.paid_at < end_of_month,
+        )
+        .group_by(HargaLayanan.brand)
+    )
+    revenue_results = (await db.execute(revenue_stmt)).all()
+    brand_breakdown = [BrandRevenueItem(brand=row.brand, revenue=float(row.total_revenue or 0.0)) for row in revenue_results]
+    total_revenue = sum(item.revenue for item in brand_breakdown)
+    periode_str = (now + relativedelta(months=1)).strftime("%B %Y")
+
+    return RevenueSummary(total=total_revenue, periode=periode_str, breakdown=brand_breakdown)
+
+
+async def compute_pelanggan_stat_cards(db: AsyncSession) -> List[StatCard]:
+    """Kartu statistik jumlah pelanggan per brand."""
+    pelanggan_count_stmt = (
+        select(HargaLayanan.brand, func.count(Pelanggan.id))
+        .join(Pelanggan, HargaLayanan.id_brand == Pelanggan.id_brand, isouter=True)
+        .group_by(HargaLayanan.brand)
+    )
+    pelanggan_counts = (await db.execute(pelanggan_count_stmt)).all()
+    pelanggan_by_brand = {brand.lower(): count for brand, count in pelanggan_counts}
+
+    return [
+        StatCard(
+            title="Jumlah Pelanggan Jakinet",
+            value=pelanggan_by_brand.get("jakinet", 0),
+            description="Total Pelanggan Jakinet",
+        ),
+        StatCard(
+            title="Jumlah Pelanggan Jelantik",
+            value=pelanggan_by_brand.get("jelantik", 0),
+            description="Total Pelanggan Jelantik",
+        ),
+        StatCard(
+            title="Pelanggan Jelantik Nagrak",
+            value=pelanggan_by_brand.get("jelantik nagrak", 0),
+            description="Total Pelanggan Rusun Nagrak",
+        ),
+    ]
+
+
+async def compute_loyalty_chart(db: AsyncSession) -> ChartData:
+    """Loyalitas pembayaran langganan aktif: setia, pernah telat, menunggak."""
+    outstanding_payers_sq = (
+        select(Invoice.pelanggan_id).where(Invoice.status_invoice.in_(["Belum Dibayar", "Kadaluarsa"])).distinct()
+    )
+    ever_late_payers_sq = select(Invoice.pelanggan_id).where(Invoice.paid_at > Invoice.tgl_jatuh_tempo).distinct()
+
+    # Tiga hitungan sekaligus dalam satu query
+    counts_stmt = select(
+        func.count(Langganan.id),
+        func.sum(case((Langganan.pelanggan_id.in_(outstanding_payers_sq), 1), else_=0)),
+        func.sum(
+            case(
+                (
+                    Langganan.pelanggan_id.in_(ever_late_payers_sq) & ~Langganan.pelanggan_id.in_(outstanding_payers_sq),
+                    1,
+                ),
+                else_=0,
+            )
+        ),
+    ).where(Langganan.status == "Aktif")
+    total_active, outstanding_count, ever_late_count = (await db.execute(counts_stmt)).one()
+    total_active = int(total_active or 0)
+    outstanding_count = int(outstanding_count or 0)
+    ever_late_count = int(ever_late_count or 0)
+    setia_count = total_active - outstanding_count - ever_late_count
+
+    return ChartData(
+        labels=["Setia On-Time", "Lunas (Tapi Telat)", "Menunggak"],
+        data=[max(0, setia_count), max(0, ever_late_count), max(0, outstanding_count)],
+    )
+
+
+async def compute_mikrotik_status_counts(db: AsyncSession) -> Dict[str, int]:
+    """Status online/offline server Mikrotik dari state mikrotik_health_monitor (tanpa koneksi ke router)."""
+    total = (await db.execute(select(func.count(MikrotikServer.id)))).scalar() or 0
+    counts = mikrotik_health_monitor.get_status_counts()
+    # Server yang belum selesai di-probe (baru ditambahkan / worker baru start) tidak dihitung online maupun offline
+    return {"online": counts["up"], "offline": counts["down"], "total": total}
+
+
+async def compute_lokasi_chart(db: AsyncSession) -> ChartData:
+    lokasi_stmt = (
+        select(Pelanggan.alamat, func.count(Pelanggan.id))
+        .group_by(Pelanggan.alamat)
+        .order_by(func.count(Pelanggan.id).desc())
+        .limit(20)
+    )
+    lokasi_data = (await db.execute(lokasi_stmt)).all()
+    return ChartData(
+        labels=[item[0] for item in lokasi_data if item[0] is not None],
+        data=[item[1] for item in lokasi_data if item[0] is not None],
+    )
+
+
+async def compute_paket_chart(db: AsyncSession) -> ChartData:
+    paket_stmt = (
+        select(PaketLayanan.kecepatan, func.count(Langganan.id))
+        .join(Langganan, PaketLayanan.id == Langganan.paket_layanan_id, isouter=True)
+        .group_by(PaketLayanan.kecepatan)
+        .order_by(PaketLayanan.kecepatan)
+    )
+    paket_data = (await db.execute(paket_stmt)).all()
+    return ChartData(labels=[f"{item[0]} Mbps" for item in paket_data], data=[item[1] for item in paket_data])
+
+
+async def compute_growth_chart(db: AsyncSession) -> ChartData:
+    two_years_ago = datetime.now() - relativedelta(years=2)
+    growth_stmt = (
+        select(
+            func.year(Pelanggan.tgl_instalasi).label("year"),
+            func.month(Pelanggan.tgl_instalasi).label("month"),
+            func.count(Pelanggan.id).label("jumlah"),
+        )
+        .where(Pelanggan.tgl_instalasi >= two_years_ago)
+        .group_by(func.year(Pelanggan.tgl_instalasi), func.month(Pelanggan.tgl_instalasi))
+        .order_by(func.year(Pelanggan.tgl_instalasi), func.month(Pelanggan.tgl_instalasi))
+    )
+    growth_data = (await db.execute(growth_stmt)).all()
+    return ChartData(
+        labels=[datetime(item.year, item.month, 1).strftime("%b %Y") for item in growth_data],
+        data=[item.jumlah for item in growth_data],
+    )
+
+
+async def compute_invoice_summary_chart(db: AsyncSession) -> InvoiceSummary:
+    six_months_ago = datetime.now() - timedelta(days=180)
+    invoice_stmt = (
+        select(
+            func.year(Invoice.tgl_invoice).label("year"),
+            func.month(Invoice.tgl_invoice).label("month"),
+            func.count(Invoice.id).label("total"),
+            func.sum(case((Invoice.status_invoice == "Lunas", 1), else_=0)).label("lunas"),
+            func.sum(case((Invoice.status_invoice == "Belum Dibayar", 1), else_=0)).label("menunggu"),
+            func.sum(case((Invoice.status_invoice == "Kadaluarsa", 1), else_=0)).label("kadaluarsa"),
+        )
+        .where(Invoice.tgl_invoice >= six_months_ago)
+        .group_by(func.year(Invoice.tgl_invoice), func.month(Invoice.tgl_invoice))
+        .order_by(func.year(Invoice.tgl_invoice), func.month(Invoice.tgl_invoice))
+    )
+    invoice_data = (await db.execute(invoice_stmt)).all()
+
+    if not invoice_data:
+        # Chart kosong dengan label 6 bulan terakhir
+        now = datetime.now()
+        labels = [(now - relativedelta(months=i)).strftime("%b %Y") for i in range(5, -1, -1)]
+        zeros = [0] * len(labels)
+        return InvoiceSummary(labels=labels, total=zeros, lunas=zeros, menunggu=zeros, kadaluarsa=zeros)
+
+    return InvoiceSummary(
+        labels=[datetime(item.year, item.month, 1).strftime("%b %Y") for item in invoice_data],
+        total=[item.total or 0 for item in invoice_data],
+        lunas=[item.lunas or 0 for item in invoice_data],
+        menunggu=[item.menunggu or 0 for item in invoice_data],
+        kadaluarsa=[item.kadaluarsa or 0 for item in invoice_data],
+    )
+
+
+async def compute_status_langganan_chart(db: AsyncSession) -> ChartData:
+    status_stmt = (
+        select(Langganan.status, func.count(Langganan.id).label("jumlah"))
+        .group_by(Langganan.status)
+        .order_by(Langganan.status)
+    )
+    status_results = (await db.execute(status_stmt)).all()
+    return ChartData(labels=[row.status for row in status_results], data=[row.jumlah for row in status_results])
+
+
+async def compute_alamat_aktif_chart(db: AsyncSession) -> Optional[ChartData]:
+    alamat_stmt = (
+        select(Pelanggan.alamat, func.count(Pelanggan.id).label("jumlah"))
+        .join(Langganan, Pelanggan.id == Langganan.pelanggan_id)
+        .where(Langganan.status == "Aktif")
+        .group_by(Pelanggan.alamat)
+        .order_by(func.count(Pelanggan.id).desc())
+        .limit(20)
+    )
+    alamat_results = (await db.execute(alamat_stmt)).all()
+    if not alamat_results:
+        return None
+    return ChartData(labels=[row.alamat for row in alamat_results], data=[row.jumlah for row in alamat_results])
+
+
+# Widget -> fungsi perhitungan
+WIDGET_COMPUTE: Dict[str, Callable[[AsyncSession], Awaitable[Any]]] = {
+    "revenue_summary": compute_revenue_summary,
+    "pelanggan_stats": compute_pelanggan_stat_cards,
+    "loyalitas_pembayaran_chart": compute_loyalty_chart,
+    "server_stats": compute_mikrotik_status_counts,
+    "lokasi_chart": compute_lokasi_chart,
+    "paket_chart": compute_paket_chart,
+    "growth_chart": compute_growth_chart,
+    "invoice_summary_chart": compute_invoice_summary_chart,
+    "status_langganan_chart": compute_status_langganan_chart,
+    "pelanggan_per_alamat_chart": compute_alamat_aktif_chart,
+}
+
+# Widget -> permission yang dibutuhkan (None = semua user dengan role)
+WIDGET_PERMISSIONS: Dict[str, Optional[str]] = {
+    "revenue_summary": "view_widget_pendapatan_bulanan",
+    "pelanggan_stats": "view_widget_statistik_pelanggan",
+    "loyalitas_pembayaran_chart": "view_widget_statistik_pelanggan",
+    "server_stats": "view_widget_statistik_server",
+    "lokasi_chart": "view_widget_pelanggan_per_lokasi",
+    "paket_chart": "view_widget_pelanggan_per_paket",
+    "growth_chart": "view_widget_tren_pertumbuhan",
+    # Temporary bypass permission check (sama seperti sebelumnya): "view_widget_invoice_bulanan"
+    "invoice_summary_chart": None,
+    "status_langganan_chart": "view_widget_status_langganan",
+    "pelanggan_per_alamat_chart": "view_widget_alamat_aktif",
+}
+
+# Tabel sumber -> widget yang harus dihitung ulang kalau tabel itu berubah
+WIDGET_SOURCES: Dict[str, tuple] = {
+    "invoice": ("revenue_summary", "loyalitas_pembayaran_chart", "invoice_summary_chart"),
+    "langganan": ("loyalitas_pembayaran_chart", "paket_chart", "status_langganan_chart", "pelanggan_per_alamat_chart"),
+    "pelanggan": ("revenue_summary", "pelanggan_stats", "lokasi_chart", "growth_chart", "pelanggan_per_alamat_chart"),
+    "mikrotik_server": ("server_stats",),
+}
+
+# Key session.info: sumber yang berubah di transaksi yang belum commit
+_PENDING_SOURCES_KEY = "dashboard_snapshot_dirty_sources"
+
+_SOURCE_MODELS = {Invoice: "invoice", Langganan: "langganan", Pelanggan: "pelanggan", MikrotikServer: "mikrotik_server"}
+
+# Field DashboardData yang diisi langsung dari payload widget dengan nama sama
+_DIRECT_FIELDS = (
+    "revenue_summary",
+    "loyalitas_pembayaran_chart",
+    "lokasi_chart",
+    "paket_chart",
+    "growth_chart",
+    "invoice_summary_chart",
+    "status_langganan_chart",
+    "pelanggan_per_alamat_chart",
+)
+
+
+def _to_payload(value: Any) -> Any:
+    """Hasil compute_* (model pydantic / list / dict) -> struktur JSON biasa."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [_to_payload(item) for item in value]
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return value
+
+
+def _server_stat_cards(server_stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    return [
+        {"title": "Total Servers", "value": server_stats.get("total", 0), "description": "Total Mikrotik servers"},
+        {"title": "Online Servers", "value": server_stats.get("online", 0), "description": "Servers currently online"},
+        {"title": "Offline Servers", "value": server_stats.get("offline", 0), "description": "Servers currently offline"},
+    ]
+
+
+class DashboardSnapshotService:
+    """Snapshot widget dashboard di memory + worker refresh (penuh terjadwal, parsial saat data berubah)."""
+
+    def __init__(self):
+        self.refresh_interval = settings.DASHBOARD_SNAPSHOT_REFRESH_SECONDS
+        self.debounce = settings.DASHBOARD_SNAPSHOT_DEBOUNCE_SECONDS
+        self.persist = settings.DASHBOARD_SNAPSHOT_PERSIST
+
+        self._values: Dict[str, Any] = {}
+        self._computed_at: Dict[str, datetime] = {}
+        # Response per kombinasi widget yang boleh dilihat; dikosongkan setiap snapshot berubah
+        self._views: Dict[FrozenSet[str], DashboardData] = {}
+        self.version = 0
+
+        self._dirty: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._background_refresh: Optional[asyncio.Task] = None
+        self._listeners_registered = False
+
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+        self.widget_errors = 0
+        self.last_refresh_ms = 0.0
+
+    # ----------------------------------------------------------------
+    # Perhitungan & penyimpanan
+    # ----------------------------------------------------------------
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._computed_at)
+
+    async def _compute(self, names: List[str], db: AsyncSession) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        for name in names:
+            try:
+                results[name] = _to_payload(await WIDGET_COMPUTE[name](db))
+            except Exception as e:
+                # Nilai lama tetap dipakai (data agak basi lebih baik daripada widget kosong)
+                self.widget_errors += 1
+                logger.error(f"Dashboard snapshot: gagal menghitung widget {name}: {e}")
+        return results
+
+    async def _compute_db_widgets(self, names: List[str]) -> Dict[str, Any]:
+        # Query agregat berurutan dalam satu session (AsyncSession tidak boleh dipakai paralel)
+        async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+            return await self._compute(names, db)
+
+    async def _refresh_unlocked(self, widgets: Optional[Iterable[str]] = None):
+        wanted = set(WIDGET_COMPUTE) if widgets is None else set(widgets)
+        names = [name for name in WIDGET_COMPUTE if name in wanted]
+        if not names:
+            return
+
+        started = time.perf_counter()
+        results = await self._compute_db_widgets(names)
+
+        computed_at = datetime.now()
+        self._store(results, computed_at)
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+        if widgets is None:
+            self.full_refreshes += 1
+        else:
+            self.partial_refreshes += 1
+        logger.info(f"Dashboard snapshot: {len(results)}/{len(names)} widget dihitung ulang ({self.last_refresh_ms} ms)")
+
+        if self.persist and results:
+            await self._persist(results, computed_at)
+
+    async def refresh(self, widgets: Optional[Iterable[str]] = None):
+        """Hitung ulang widget tertentu (None = semua)."""
+        async with self._lock:
+            await self._refresh_unlocked(widgets)
+
+    def _store(self, results: Dict[str, Any], computed_at: datetime):
+        if not results:
+            return
+        for name, payload in results.items():
+            self._values[name] = payload
+            self._computed_at[name] = computed_at
+        self.version += 1
+        self._views = {}
+
+    async def _persist(self, results: Dict[str, Any], computed_at: datetime):
+        try:
+            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                for name, payload in results.items():
+                    await db.merge(
+                        DashboardSnapshot(
+                            widget=name,
+                            payload=json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+                            computed_at=computed_at,
+                        )
+                    )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Dashboard snapshot: gagal menyimpan snapshot ke database: {e}")
+
+    async def load_persisted(self):
+        """Isi snapshot dari tabel dashboard_snapshots (warm start)."""
+        try:
+            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                rows = (await db.execute(select(DashboardSnapshot))).scalars().all()
+        except Exception as e:
+            logger.error(f"Dashboard snapshot: gagal membaca snapshot tersimpan: {e}")
+            return
+        async with self._lock:
+            for row in rows:
+                if row.widget not in WIDGET_COMPUTE or row.widget in self._computed_at:
+                    continue
+                self._values[row.widget] = json.loads(row.payload) if row.payload else None
+                self._computed_at[row.widget] = row.computed_at
+            if rows:
+                self.version += 1
+                self._views = {}
+        logger.info(f"Dashboard snapshot: {len(rows)} widget dibaca dari database")
+
+    # ----------------------------------------------------------------
+    # Dirty tracking
+    # ----------------------------------------------------------------
+
+    def mark_dirty(self, *sources: str):
+        """Tandai widget yang bergantung pada tabel sumber (invoice, langganan, ...) untuk dihitung ulang."""
+        for source in sources:
+            self._dirty.update(WIDGET_SOURCES.get(source, ()))
+        if not self._dirty or self._loop is None or self._wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            # Dipanggil dari thread lain (job di thread pool)
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    @staticmethod
+    def _collect(session: Optional[Session], source: str) -> bool:
+        """Simpan sumber yang berubah di session.info sampai transaksi commit."""
+        if session is None:
+            return False
+        session.info.setdefault(_PENDING_SOURCES_KEY, set()).add(source)
+        return True
+
+    def _on_orm_execute(self, orm_execute_state):
+        # Bulk UPDATE / DELETE / INSERT lewat session.execute(update(Invoice)...)
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+            return
+        for mapper in orm_execute_state.all_mappers:
+            source = _SOURCE_MODELS.get(mapper.class_)
+            if source:
+                self._collect(orm_execute_state.session, source)
+
+    def _on_after_commit(self, session: Session):
+        sources = session.info.pop(_PENDING_SOURCES_KEY, None)
+        if sources:
+            self.mark_dirty(*sources)
+
+    @staticmethod
+    def _on_after_rollback(session: Session):
+        # Perubahan dibatalkan - widget tidak perlu dihitung ulang
+        session.info.pop(_PENDING_SOURCES_KEY, None)
+
+    def register_listeners(self):
+        """Pasang event SQLAlchemy untuk tabel sumber (sekali per proses)."""
+        if self._listeners_registered:
+            return
+        for model, source in _SOURCE_MODELS.items():
+
+            def _listener(mapper, connection, target, source=source):
+                # Flush di luar Session (jarang) langsung ditandai
+                if not self._collect(object_session(target), source):
+                    self.mark_dirty(source)
+
+            for event_name in ("after_insert", "after_update", "after_delete"):
+                event.listen(model, event_name, _listener)
+        event.listen(Session, "do_orm_execute", self._on_orm_execute)
+        event.listen(Session, "after_commit", self._on_after_commit)
+        event.listen(Session, "after_rollback", self._on_after_rollback)
+        self._listeners_registered = True
+
+    # ----------------------------------------------------------------
+    # Worker
+    # ----------------------------------------------------------------
+
+    def start_worker(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.register_listeners()
+        self._task = asyncio.create_task(self._worker_loop(), name="dashboard-snapshot")
+        logger.info(
+            f"Dashboard snapshot worker dimulai (refresh {self.refresh_interval:.0f}s, debounce {self.debounce:.0f}s, "
+            f"persist {'on' if self.persist else 'off'})"
+        )
+
+    async def stop_worker(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _worker_loop(self):
+        if self.persist:
+            await self.load_persisted()
+        next_full = time.monotonic()
+        while True:
+            try:
+                timeout = next_full - time.monotonic()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)  # type: ignore[union-attr]
+                    except asyncio.TimeoutError:
+                        pass
+
+                if time.monotonic() >= next_full:
+                    self._wakeup.clear()  # type: ignore[union-attr]
+                    self._dirty.clear()
+                    await self.refresh()
+                    next_full = time.monotonic() + self.refresh_interval
+                    continue
+
+                # Kumpulkan perubahan beruntun (misalnya generate invoice massal) jadi satu refresh
+                await asyncio.sleep(self.debounce)
+                self._wakeup.clear()  # type: ignore[union-attr]
+                dirty, self._dirty = self._dirty, set()
+                if dirty:
+                    await self.refresh(dirty)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Dashboard snapshot worker error: {e}")
+                await asyncio.sleep(max(self.debounce, 1.0))
+
+    # ----------------------------------------------------------------
+    # Response per permission
+    # ----------------------------------------------------------------
+
+    async def _ensure_loaded(self):
+        if not self.is_loaded:
+            async with self._lock:
+                if not self.is_loaded:
+                    await self._refresh_unlocked()
+            return
+        # Tanpa worker (misalnya script / test): refresh di background kalau sudah basi
+        if self._task is None and self.age_seconds() >= self.refresh_interval:
+            if self._background_refresh is None or self._background_refresh.done():
+                self._background_refresh = asyncio.create_task(self.refresh())
+
+    def age_seconds(self, widgets: Optional[Iterable[str]] = None) -> float:
+        """Umur bagian snapshot yang paling tua (detik)."""
+        names = self._computed_at.keys() if widgets is None else [w for w in widgets if w in self._computed_at]
+        oldest = min((self._computed_at[name] for name in names), default=None)
+        return (datetime.now() - oldest).total_seconds() if oldest else 0.0
+
+    @staticmethod
+    def visible_widgets(permissions: Iterable[str]) -> FrozenSet[str]:
+        permission_set = set(permissions)
+        return frozenset(
+            name for name, permission in WIDGET_PERMISSIONS.items() if permission is None or permission in permission_set
+        )
+
+    def _build_view(self, widgets: FrozenSet[str]) -> DashboardData:
+        fields: Dict[str, Any] = {}
+        for name in _DIRECT_FIELDS:
+            if name in widgets and self._values.get(name) is not None:
+                fields[name] = self._values[name]
+
+        stat_cards: List[Dict[str, Any]] = []
+        if "pelanggan_stats" in widgets:
+            stat_cards.extend(self._values.get("pelanggan_stats") or [])
+        if "server_stats" in widgets and self._values.get("server_stats"):
+            stat_cards.extend(_server_stat_cards(self._values["server_stats"]))
+        fields["stat_cards"] = stat_cards
+
+        computed = [self._computed_at[name] for name in widgets if name in self._computed_at]
+        fields["snapshot_generated_at"] = min(computed) if computed else None
+        return DashboardData(**fields)
+
+    async def get_dashboard(self, permissions: Iterable[str]) -> DashboardData:
+        """DashboardData untuk user dengan permission ini (tanpa query database setelah snapshot ada)."""
+        await self._ensure_loaded()
+        widgets = self.visible_widgets(permissions)
+        view = self._views.get(widgets)
+        if view is None:
+            view = self._views[widgets] = self._build_view(widgets)
+        generated_at = view.snapshot_generated_at
+        age = round((datetime.now() - generated_at).total_seconds(), 1) if generated_at else None
+        return view.model_copy(update={"snapshot_age_seconds": age})
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = datetime.now()
+        return {
+            "version": self.version,
+            "widgets": {
+                name: round((now - computed_at).total_seconds(), 1) for name, computed_at in self._computed_at.items()
+            },
+            "dirty": sorted(self._dirty),
+            "cached_views": len(self._views),
+            "full_refreshes": self.full_refreshes,
+            "partial_refreshes": self.partial_refreshes,
+            "widget_errors": self.widget_errors,
+            "last_refresh_ms": self.last_refresh_ms,
+            "refresh_interval_s": self.refresh_interval,
+            "persist": self.persist,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+# Global instance
+dashboard_snapshot = DashboardSnapshotService()
@@ -0,0 +1,435 @@
+# ====================================================================
+# INVOICE OUTBOX SERVICE - WORKER ANTRIAN XENDIT PERSISTEN
+# ====================================================================
+# Enqueue request payment link ke tabel invoice_outbox, lalu worker di
+# setiap proses aplikasi men-drain antrian itu:
+#
+# 1. Claim: pilih entry yang visible (pending / processing yang visibility
+#    timeout-nya habis), urut priority lalu id, kemudian UPDATE bersyarat
+#    dengan claim_token unik. Hanya row yang berhasil di-UPDATE yang jadi
+#    milik worker ini, jadi beberapa worker/proses aman jalan bersamaan.
+#    Di MySQL/PostgreSQL kandidat diambil dengan FOR UPDATE SKIP LOCKED.
+# 2. Proses: request ke Xendit bersamaan, dibatasi token bucket per akun
+#    di rate_limiter.
+# 3. Tulis hasil sekaligus: sukses -> completed, gagal -> pending dengan
+#    exponential backoff, melewati max_attempts -> dead (dead-letter).
+#    UPDATE bersyarat claim_token: entry yang sudah di-claim ulang worker lain
+#    (visibility timeout habis) tidak ditimpa, hasilnya dibuang.
+#
+# Entry completed dihapus setelah INVOICE_OUTBOX_COMPLETED_RETENTION_HOURS.
+# ====================================================================
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.invoice import Invoice as InvoiceModel
+from ..models.invoice_outbox import InvoiceOutbox
+from ..models.langganan import Langganan as LanggananModel
+from ..models.pelanggan import Pelanggan as PelangganModel
+from .rate_limiter import InvoicePriority, rate_limiter, xendit_account_for
+from .xendit_service import create_xendit_invoice
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_RANK = {
+    InvoicePriority.HIGH: 0,
+    InvoicePriority.NORMAL: 1,
+    InvoicePriority.LOW: 2,
+}
+
+PURGE_INTERVAL_SECONDS = 600
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay sebelum attempt berikutnya: base * 2^(attempts-1), maksimal BACKOFF_MAX."""
+    delay = settings.INVOICE_OUTBOX_BACKOFF_BASE * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.INVOICE_OUTBOX_BACKOFF_MAX)
+
+
+class InvoiceOutboxService:
+    """Enqueue, claim dan proses entry invoice_outbox."""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_purge = 0.0
+
+        # Statistik proses ini (throughput lintas proses dibaca dari tabel)
+        self.processed = 0
+        self.failed = 0
+        self.discarded = 0  # Hasil dibuang karena claim sudah diambil alih worker lain
+
+    # ====================================================================
+    # ENQUEUE
+    # ====================================================================
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        invoice: InvoiceModel,
+        deskripsi_xendit: str,
+        pajak: float,
+        no_telp_xendit: str = "",
+        priority: InvoicePriority = InvoicePriority.NORMAL,
+    ) -> InvoiceOutbox:
+        """
+        Masukkan invoice ke outbox (caller yang commit). Invoice harus sudah punya id.
+        Entry lama untuk invoice yang sama (misal dead) di-reset jadi pending.
+        """
+        if invoice.id is None:
+            await db.flush()
+
+        existing = (
+            await db.execute(select(InvoiceOutbox).where(InvoiceOutbox.invoice_id == invoice.id))
+        ).scalar_one_or_none()
+
+        entry = existing or InvoiceOutbox(invoice_id=invoice.id)
+        if existing is not None and existing.status in ("pending", "processing"):
+            return existing
+
+        entry.priority = PRIORITY_RANK.get(priority, 1)
+        entry.status = "pending"
+        entry.deskripsi_xendit = deskripsi_xendit
+        entry.pajak = pajak
+        entry.no_telp_xendit = no_telp_xendit
+        entry.attempts = 0
+        entry.max_attempts = settings.INVOICE_OUTBOX_MAX_ATTEMPTS
+        entry.available_at = datetime.now()
+        entry.claim_token = None
+        entry.claimed_by = None
+        entry.last_error = None
+        entry.completed_at = None
+        invoice.xendit_status = "pending"
+        db.add(entry)
+        return entry
+
+    # ====================================================================
+    # CLAIM & PROSES
+    # ====================================================================
+
+    @staticmethod
+    def _visible(now: datetime):
+        return and_(
+            InvoiceOutbox.available_at <= now,
+            InvoiceOutbox.status.in_(("pending", "processing")),
+        )
+
+    async def claim(self, db: AsyncSession, limit: int) -> List[InvoiceOutbox]:
+        """Claim sampai `limit` entry untuk worker ini. Commit claim sebelum return."""
+        now = datetime.now()
+        candidates = (
+            select(InvoiceOutbox.id)
+            .where(self._visible(now))
+            .order_by(InvoiceOutbox.priority, InvoiceOutbox.id)
+            .limit(limit)
+        )
+        if db.bind.dialect.name in ("mysql", "postgresql"):
+            candidates = candidates.with_for_update(skip_locked=True)
+
+        ids = list((await db.execute(candidates)).scalars().all())
+        if not ids:
+            await db.rollback()
+            return []
+
+        token = uuid.uuid4().hex
+        # UPDATE bersyarat: kalau worker lain sudah claim duluan, row-nya tidak lagi visible
+        await db.execute(
+            update(InvoiceOutbox)
+            .where(InvoiceOutbox.id.in_(ids), self._visible(now))
+            .values(
+                status="processing",
+                claim_token=token,
+                claimed_by=self.worker_id,
+                attempts=InvoiceOutbox.attempts + 1,
+                available_at=now + timedelta(seconds=settings.INVOICE_OUTBOX_VISIBILITY_TIMEOUT),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        result = await db.execute(
+            select(InvoiceOutbox)
+            .where(InvoiceOutbox.claim_token == token)
+            .options(
+                selectinload(InvoiceOutbox.invoice)
+                .selectinload(InvoiceModel.pelanggan)
+                .options(
+                    selectinload(PelangganModel.harga_layanan),
+                    selectinload(PelangganModel.data_teknis),
+                    selectinload(PelangganModel.langganan).selectinload(LanggananModel.paket_layanan),
+                )
+            )
+            .order_by(InvoiceOutbox.priority, InvoiceOutbox.id)
+        )
+        return list(result.scalars().all())
+
+    async def _send(self, entry: InvoiceOutbox) -> Dict[str, Any]:
+        """Satu request Xendit (tanpa I/O DB). Return {"ok": bool, "response"/"error": ...}."""
+        invoice = entry.invoice
+        if invoice.xendit_id:
+            # Sudah punya payment link (misal diproses manual) - idempotent
+            return {"ok": True, "response": None}
+
+        pelanggan = invoice.pelanggan
+        paket = pelanggan.langganan[0].paket_layanan if pelanggan and pelanggan.langganan else None
+        brand = pelanggan.harga_layanan if pelanggan else None
+        if not all([pelanggan, paket, brand]):
+            return {"ok": False, "error": "Data tidak lengkap untuk membuat invoice Xendit", "permanent": True}
+
+        account = xendit_account_for(brand.xendit_key_name)
+        await rate_limiter.acquire(account)
+        try:
+            response = await create_xendit_invoice(
+                invoice=invoice,
+                pelanggan=pelanggan,
+                paket=paket,
+                deskripsi_xendit=entry.deskripsi_xendit,
+                pajak=entry.pajak,
+                no_telp_xendit=entry.no_telp_xendit or "",
+            )
+            if not response or not response.get("id"):
+                raise ValueError(f"Invalid Xendit response: {response}")
+            return {"ok": True, "response": response}
+        except Exception as e:
+            status_code = getattr(getattr(e, "response", None), "status_code", None)
+            if status_code == 429:
+                rate_limiter.throttle(account, backoff_seconds(entry.attempts))
+            return {"ok": False, "error": str(e)}
+
+    async def _apply_result(self, db: AsyncSession, entry: InvoiceOutbox, outcome: Dict[str, Any], now: datetime) -> bool:
+        """
+        Tulis hasil satu entry. Semua UPDATE bersyarat claim_token: kalau visibility
+        timeout sudah habis dan entry di-claim ulang worker lain, hasil ini dibuang
+        (return False) supaya tidak menimpa hasil worker pemilik claim terbaru.
+        """
+        invoice = entry.invoice
+        token = entry.claim_token
+
+        if outcome["ok"]:
+            entry_values: Dict[str, Any] = {"status": "completed", "completed_at": now, "last_error": None}
+            invoice_values: Dict[str, Any] = {"xendit_status": "completed", "xendit_error_message": None}
+            response = outcome.get("response")
+            if response:
+                invoice_values["payment_link"] = response.get("short_url", response.get("invoice_url"))
+                invoice_values["xendit_id"] = response.get("id")
+                invoice_values["xendit_external_id"] = response.get("external_id")
+        else:
+            error = outcome.get("error", "unknown error")
+            entry_values = {"last_error": error}
+            invoice_values = {"xendit_status": "failed", "xendit_error_message": error, "xendit_last_retry": now}
+            if outcome.get("permanent") or entry.attempts >= entry.max_attempts:
+                entry_values["status"] = "dead"
+            else:
+                delay = backoff_seconds(entry.attempts)
+                entry_values["status"] = "pending"
+                entry_values["available_at"] = now + timedelta(seconds=delay)
+
+        claimed = await db.execute(
+            update(InvoiceOutbox)
+            .where(
+                InvoiceOutbox.id == entry.id,
+                InvoiceOutbox.claim_token == token,
+                InvoiceOutbox.status == "processing",
+            )
+            .values(claim_token=None, **entry_values)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount == 0:
+            self.discarded += 1
+            xendit_id = (outcome.get("response") or {}).get("id") if outcome["ok"] else None
+            logger.warning(
+                f"⚠️ Outbox: claim invoice {invoice.invoice_number} sudah diambil alih worker lain, hasil dibuang"
+                + (f" (invoice Xendit {xendit_id} perlu dicek/di-expire manual)" if xendit_id else "")
+            )
+            return False
+
+        await db.execute(
+            update(InvoiceModel)
+            .where(InvoiceModel.id == entry.invoice_id)
+            .values(**invoice_values)
+            .execution_options(synchronize_session=False)
+        )
+
+        if outcome["ok"]:
+            self.processed += 1
+            logger.info(f"✅ Outbox: invoice {invoice.invoice_number} BERHASIL dibuatkan payment link")
+        elif entry_values["status"] == "dead":
+            self.failed += 1
+            logger.error(
+                f"❌ Outbox: invoice {invoice.invoice_number} masuk dead-letter setelah {entry.attempts} attempt: "
+                f"{entry_values['last_error']}"
+            )
+        else:
+            self.failed += 1
+            logger.warning(
+                f"⚠️ Outbox: invoice {invoice.invoice_number} gagal (attempt {entry.attempts}/{entry.max_attempts}), "
+                f"retry dalam {backoff_seconds(entry.attempts):.0f}s: {entry_values['last_error']}"
+            )
+        return True
+
+    async def run_once(self, limit: Optional[int] = None) -> int:
+        """Claim + proses satu batch. Return jumlah entry yang diproses."""
+        async with AsyncSessionLocal() as db:
+            entries = await self.claim(db, limit or settings.INVOICE_OUTBOX_BATCH_SIZE)
+            if not entries:
+                return 0
+
+            outcomes = await asyncio.gather(*(self._send(entry) for entry in entries), return_exceptions=True)
+
+            now = datetime.now()
+            for entry, outcome in zip(entries, outcomes):
+                if isinstance(outcome, BaseException):
+                    outcome = {"ok": False, "error": str(outcome)}
+                await self._apply_result(db, entry, outcome, now)
+            await db.commit()
+            return len(entries)
+
+    # ====================================================================
+    # MAINTENANCE & MONITORING
+    # ====================================================================
+
+    async def requeue_dead(self, db: AsyncSession) -> int:
+        """Kembalikan semua entry dead-letter ke antrian dengan attempts di-reset."""
+        result = await db.execute(
+            update(InvoiceOutbox)
+            .where(InvoiceOutbox.status == "dead")
+            .values(status="pending", attempts=0, available_at=datetime.now(), claim_token=None)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount or 0
+
+    async def purge_completed(self, db: AsyncSession) -> int:
+        cutoff = datetime.now() - timedelta(hours=settings.INVOICE_OUTBOX_COMPLETED_RETENTION_HOURS)
+        result = await db.execute(
+            delete(InvoiceOutbox)
+            .where(InvoiceOutbox.status == "completed", InvoiceOutbox.completed_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount or 0
+
+    async def stats(self, db: AsyncSession) -> Dict[str, Any]:
+        """Kedalaman antrian per status/priority dan throughput dari tabel (semua worker)."""
+        now = datetime.now()
+        depth_rows = (
+            await db.execute(
+                select(InvoiceOutbox.status, InvoiceOutbox.priority, func.count(InvoiceOutbox.id)).group_by(
+                    InvoiceOutbox.status, InvoiceOutbox.priority
+                )
+            )
+        ).all()
+        by_status: Dict[str, int] = {}
+        by_priority: Dict[str, int] = {}
+        rank_names = {rank: priority.value for priority, rank in PRIORITY_RANK.items()}
+        for status, priority, count in depth_rows:
+            by_status[status] = by_status.get(status, 0) + count
+            if status in ("pending", "processing"):
+                name = rank_names.get(priority, str(priority))
+                by_priority[name] = by_priority.get(name, 0) + count
+
+        in_flight = (
+            await db.execute(
+                select(func.count(InvoiceOutbox.id)).where(
+                    InvoiceOutbox.status == "processing", InvoiceOutbox.available_at > now
+                )
+            )
+        ).scalar() or 0
+        oldest_pending = (
+            await db.execute(select(func.min(InvoiceOutbox.created_at)).where(InvoiceOutbox.status == "pending"))
+        ).scalar()
+        completed_5m = (
+            await db.execute(
+                select(func.count(InvoiceOutbox.id)).where(
+                    InvoiceOutbox.status == "completed", InvoiceOutbox.completed_at >= now - timedelta(minutes=5)
+                )
+            )
+        ).scalar() or 0
+        completed_1h = (
+            await db.execute(
+                select(func.count(InvoiceOutbox.id)).where(
+                    InvoiceOutbox.status == "completed", InvoiceOutbox.completed_at >= now - timedelta(hours=1)
+                )
+            )
+        ).scalar() or 0
+
+        return {
+            "by_status": by_status,
+            "by_priority": by_priority,
+            "pending": by_status.get("pending", 0),
+            "processing": in_flight,
+            "stale_processing": by_status.get("processing", 0) - in_flight,
+            "completed": by_status.get("completed", 0),
+            "dead": by_status.get("dead", 0),
+            "oldest_pending_age_seconds": (now - oldest_pending).total_seconds() if oldest_pending else 0,
+            "throughput_per_minute_5m": round(completed_5m / 5, 2),
+            "completed_last_hour": completed_1h,
+            "worker": {
+                "id": self.worker_id,
+                "running": self.is_running,
+                "processed": self.processed,
+                "failed": self.failed,
+                "discarded": self.discarded,
+            },
+        }
+
+    # ====================================================================
+    # WORKER LIFECYCLE
+    # ====================================================================
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start_worker(self) -> None:
+        if self.is_running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._worker_loop(), name="invoice-outbox-worker")
+        logger.info(f"Invoice outbox worker {self.worker_id} dimulai")
+
+    async def stop_worker(self) -> None:
+        self._stopping = True
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _worker_loop(self) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.run_once()
+                if time.monotonic() - self._last_purge >= PURGE_INTERVAL_SECONDS:
+                    self._last_purge = time.monotonic()
+                    async with AsyncSessionLocal() as db:
+                        purged = await self.purge_completed(db)
+                    if purged:
+                        logger.info(f"Invoice outbox: {purged} entry completed lama dihapus")
+                if processed == 0:
+                    await asyncio.sleep(settings.INVOICE_OUTBOX_POLL_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Invoice outbox worker error: {e}")
+                await asyncio.sleep(settings.INVOICE_OUTBOX_POLL_INTERVAL)
+
+
+# Global instance
+invoice_outbox = InvoiceOutboxService()
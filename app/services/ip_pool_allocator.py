@@ -0,0 +1,444 @@
+# ====================================================================
+# IP POOL ALLOCATOR - INDEX IP PELANGGAN PER SERVER MIKROTIK
+# ====================================================================
+# Sebelumnya:
+# - /data_teknis/last-ip download SEMUA PPP secret dari router lalu sort
+#   oktet terakhir; fallback-nya ORDER BY ip_pelanggan DESC (urutan string,
+#   "10.0.0.9" > "10.0.0.10").
+# - /data_teknis/check-ip query PPP secret ke setiap router.
+#
+# Sekarang index IP dipegang di memory per server:
+# - Sumber "terpakai": DataTeknis.ip_pelanggan (database), remote-address
+#   PPP secret (disinkron dari router di background) dan reservasi dari
+#   /next-ip. Ketiganya disimpan terpisah supaya satu sumber bisa di-refresh
+#   tanpa menghapus yang lain.
+# - Pool per server = IP_POOL_CIDRS[nama server]; kalau tidak dikonfigurasi,
+#   jaringan /IP_POOL_DEFAULT_PREFIX dari IP yang sudah dipakai.
+# - Tiap jaringan punya bytemap (1 byte per alamat = jumlah sumber yang
+#   memakai alamat itu) + counter alamat bebas. "Sudah dipakai?" = lookup
+#   dict; "IP bebas berikutnya" = bytearray.find(0) (memchr di C) dan
+#   jaringan yang penuh dilewati lewat counter.
+# - Provisioning tidak butuh query router sama sekali. Router hanya dibaca
+#   oleh worker sinkronisasi (IP_POOL_SYNC_INTERVAL_SECONDS).
+#
+# Index hanya berlaku per proses. Reservasi tidak terlihat oleh worker lain,
+# dan perubahan dari worker lain menyusul paling lama satu interval sync.
+# Pengecekan akhir tetap di database (check-ip).
+# ====================================================================
+
+import asyncio
+import ipaddress
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.future import select
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.data_teknis import DataTeknis as DataTeknisModel
+from ..models.mikrotik_server import MikrotikServer as MikrotikServerModel
+from .mikrotik_service import async_mikrotik
+
+logger = logging.getLogger(__name__)
+
+
+def ip_to_int(value: Optional[str]) -> Optional[int]:
+    """'10.0.0.5' -> int. None kalau kosong / bukan IPv4 valid."""
+    if not value:
+        return None
+    try:
+        return int(ipaddress.IPv4Address(value.strip()))
+    except ValueError:
+        return None
+
+
+def int_to_ip(value: int) -> str:
+    return str(ipaddress.IPv4Address(value))
+
+
+class ServerPool:
+    """Index IP untuk satu server Mikrotik."""
+
+    def __init__(self, server_id: int, name: str, cidrs: Iterable[str] = ()):
+        self.server_id = server_id
+        self.name = name
+        self.configured: List[ipaddress.IPv4Network] = []
+        for cidr in cidrs:
+            try:
+                self.configured.append(ipaddress.IPv4Network(cidr, strict=False))
+            except ValueError:
+                logger.warning(f"IP pool '{cidr}' untuk server '{name}' tidak valid, diabaikan")
+
+        # Sumber pemakaian IP: ip (int) -> pemilik
+        self.db: Dict[int, Tuple[int, str]] = {}  # -> (data_teknis.id, id_pelanggan)
+        self.router: Dict[int, str] = {}  # -> nama PPP secret
+        self.reserved: Dict[int, float] = {}  # -> waktu kedaluwarsa (monotonic)
+        self.router_synced_at: Optional[float] = None
+
+        self.networks: List[ipaddress.IPv4Network] = []
+        self._maps: List[bytearray] = []
+        self._free: List[int] = []
+
+    # --- bytemap -----------------------------------------------------
+
+    def covers(self, ip: int) -> bool:
+        return self._slot(ip) is not None
+
+    def _slot(self, ip: int) -> Optional[Tuple[int, int]]:
+        for index, network in enumerate(self.networks):
+            offset = ip - int(network.network_address)
+            if 0 <= offset < network.num_addresses:
+                return index, offset
+        return None
+
+    def _mark(self, ip: int, delta: int) -> None:
+        slot = self._slot(ip)
+        if slot is None:
+            return
+        index, offset = slot
+        bytemap = self._maps[index]
+        before = bytemap[offset]
+        after = max(0, min(255, before + delta))
+        bytemap[offset] = after
+        if before == 0 and after > 0:
+            self._free[index] -= 1
+        elif before > 0 and after == 0:
+            self._free[index] += 1
+
+    def rebuild(self) -> None:
+        """Hitung ulang jaringan dan bytemap dari ketiga sumber."""
+        used = set(self.db) | set(self.router) | set(self.reserved)
+        if self.configured:
+            networks = list(self.configured)
+        else:
+            prefix = settings.IP_POOL_DEFAULT_PREFIX
+            networks = sorted(
+                {ipaddress.IPv4Network((ip, prefix), strict=False) for ip in used},
+                key=lambda network: int(network.network_address),
+            )
+
+        self.networks = networks
+        self._maps = []
+        self._free = []
+        for network in networks:
+            bytemap = bytearray(network.num_addresses)
+            # Alamat jaringan, broadcast dan host gateway tidak pernah dibagikan
+            blocked = set()
+            if network.num_addresses > 2:
+                blocked.update({0, network.num_addresses - 1})
+                blocked.update(range(1, min(network.num_addresses - 1, 1 + settings.IP_POOL_RESERVED_HOSTS)))
+            for offset in blocked:
+                bytemap[offset] = 1
+            self._maps.append(bytemap)
+            self._free.append(network.num_addresses - len(blocked))
+
+        for source in (self.db, self.router, self.reserved):
+            for ip in source:
+                self._mark(ip, 1)
+
+    # --- sumber pemakaian -------------------------------------------
+
+    def set_db(self, ip: int, data_teknis_id: int, id_pelanggan: str) -> None:
+        if ip not in self.db:
+            self._mark(ip, 1)
+        self.db[ip] = (data_teknis_id, id_pelanggan)
+
+    def remove_db(self, ip: int) -> None:
+        if self.db.pop(ip, None) is not None:
+            self._mark(ip, -1)
+
+    def reserve(self, ip: int, ttl: float) -> None:
+        if ip not in self.reserved:
+            self._mark(ip, 1)
+        self.reserved[ip] = time.monotonic() + ttl
+
+    def release(self, ip: int) -> None:
+        if self.reserved.pop(ip, None) is not None:
+            self._mark(ip, -1)
+
+    def expire_reservations(self) -> int:
+        now = time.monotonic()
+        expired = [ip for ip, expires_at in self.reserved.items() if expires_at <= now]
+        for ip in expired:
+            self.release(ip)
+        return len(expired)
+
+    # --- lookup ------------------------------------------------------
+
+    def next_free(self) -> Optional[int]:
+        for index, network in enumerate(self.networks):
+            if self._free[index] <= 0:
+                continue
+            offset = self._maps[index].find(0)
+            if offset >= 0:
+                return int(network.network_address) + offset
+        return None
+
+    def highest_used(self) -> Optional[int]:
+        used = set(self.db) | set(self.router)
+        return max(used) if used else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "server_id": self.server_id,
+            "name": self.name,
+            "networks": [str(network) for network in self.networks],
+            "configured": bool(self.configured),
+            "free": sum(self._free),
+            "db": len(self.db),
+            "router": len(self.router),
+            "reserved": len(self.reserved),
+            "router_synced_age_seconds": (
+                round(time.monotonic() - self.router_synced_at, 1) if self.router_synced_at is not None else None
+            ),
+        }
+
+
+class IPPoolAllocator:
+    """Index IP pelanggan semua server Mikrotik + worker sinkronisasi."""
+
+    def __init__(self):
+        self.reservation_ttl = settings.IP_POOL_RESERVATION_TTL_SECONDS
+        self.sync_interval = settings.IP_POOL_SYNC_INTERVAL_SECONDS
+        self._pools: Dict[int, ServerPool] = {}
+        self._loaded_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.allocations = 0
+        self.sync_errors = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    # --- load & sync -------------------------------------------------
+
+    async def load(self) -> None:
+        """Bangun ulang sumber 'db' untuk semua server dari tabel data_teknis (satu query)."""
+        async with self._load_lock:
+            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                servers = (await db.execute(select(MikrotikServerModel.id, MikrotikServerModel.name))).all()
+                rows = (
+                    await db.execute(
+                        select(
+                            DataTeknisModel.id,
+                            DataTeknisModel.id_pelanggan,
+                            DataTeknisModel.ip_pelanggan,
+                            DataTeknisModel.mikrotik_server_id,
+                        ).where(DataTeknisModel.ip_pelanggan.is_not(None), DataTeknisModel.mikrotik_server_id.is_not(None))
+                    )
+                ).all()
+
+            pools: Dict[int, ServerPool] = {}
+            for server_id, name in servers:
+                pool = ServerPool(server_id, name, settings.IP_POOL_CIDRS.get(name, []))
+                previous = self._pools.get(server_id)
+                if previous is not None:
+                    # Data router & reservasi tidak berasal dari database - bawa ke index baru
+                    pool.router = previous.router
+                    pool.reserved = previous.reserved
+                    pool.router_synced_at = previous.router_synced_at
+                pools[server_id] = pool
+
+            skipped = 0
+            for data_teknis_id, id_pelanggan, ip_pelanggan, server_id in rows:
+                ip = ip_to_int(ip_pelanggan)
+                pool = pools.get(server_id)
+                if ip is None or pool is None:
+                    skipped += 1
+                    continue
+                pool.db[ip] = (data_teknis_id, id_pelanggan)
+
+            for pool in pools.values():
+                pool.expire_reservations()
+                pool.rebuild()
+            self._pools = pools
+            self._loaded_at = time.monotonic()
+            if skipped:
+                logger.debug(f"IP pool: {skipped} ip_pelanggan tidak valid dilewati")
+
+    async def ensure_loaded(self) -> None:
+        if not self.is_loaded:
+            await self.load()
+
+    async def sync_router(self, server: MikrotikServerModel) -> int:
+        """Ganti sumber 'router' satu server dengan remote-address PPP secret terbaru."""
+        secrets = await async_mikrotik.get_all_ppp_secrets(server)
+        router: Dict[int, str] = {}
+        for secret in secrets or []:
+            ip = ip_to_int(secret.get("remote-address"))
+            if ip is not None:
+                router[ip] = secret.get("name", "N/A")
+
+        await self.ensure_loaded()
+        pool = self._pools.get(server.id)
+        if pool is None:
+            return 0
+        pool.router = router
+        pool.router_synced_at = time.monotonic()
+        pool.rebuild()
+        return len(router)
+
+    async def sync_all(self) -> None:
+        """Refresh dari database lalu sinkron PPP secret semua router aktif (bersamaan)."""
+        await self.load()
+        async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+            servers = (
+                (await db.execute(select(MikrotikServerModel).where(MikrotikServerModel.is_active.is_(True))))
+                .scalars()
+                .all()
+            )
+
+        async def sync(server):
+            try:
+                return await self.sync_router(server)
+            except Exception as e:
+                self.sync_errors += 1
+                logger.warning(f"IP pool: gagal sinkron PPP secret dari '{server.name}', pakai data lama: {e}")
+                return None
+
+        results = await asyncio.gather(*(sync(server) for server in servers))
+        synced = sum(1 for result in results if result is not None)
+        logger.info(f"IP pool: index diperbarui ({synced}/{len(servers)} router tersinkron)")
+
+    def start_worker(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._worker_loop(), name="ip-pool-sync")
+        logger.info(f"IP pool sync worker dimulai (interval {self.sync_interval:.0f}s)")
+
+    async def stop_worker(self) -> None:
+        self._stopping = True
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _worker_loop(self) -> None:
+        while not self._stopping:
+            try:
+                await self.sync_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.sync_errors += 1
+                logger.error(f"IP pool: sinkronisasi gagal: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    # --- provisioning ------------------------------------------------
+
+    async def get_pool(self, server_id: int) -> Optional[ServerPool]:
+        await self.ensure_loaded()
+        pool = self._pools.get(server_id)
+        if pool is None:
+            # Server baru dibuat setelah index di-load
+            await self.load()
+            pool = self._pools.get(server_id)
+        return pool
+
+    async def next_free(self, server_id: int, reserve: bool = True) -> Optional[str]:
+        """IP bebas berikutnya di pool server; kalau reserve=True IP ditahan selama reservation_ttl."""
+        pool = await self.get_pool(server_id)
+        if pool is None:
+            return None
+        pool.expire_reservations()
+        ip = pool.next_free()
+        if ip is None:
+            return None
+        if reserve:
+            pool.reserve(ip, self.reservation_ttl)
+            self.allocations += 1
+        return int_to_ip(ip)
+
+    async def last_used(self, server_id: int) -> Optional[str]:
+        """IP terpakai tertinggi (urutan numerik, bukan string)."""
+        pool = await self.get_pool(server_id)
+        if pool is None:
+            return None
+        ip = pool.highest_used()
+        return int_to_ip(ip) if ip is not None else None
+
+    async def lookup(self, ip_address: str, exclude_data_teknis_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cari pemakai IP di semua server. Return dict {server_id, server_name, owner, source}
+        atau None. Reservasi tidak dihitung sebagai terpakai (hanya mencegah /next-ip
+        membagikan IP yang sama dua kali).
+        """
+        ip = ip_to_int(ip_address)
+        if ip is None:
+            return None
+        await self.ensure_loaded()
+
+        excluded_owner = None
+        if exclude_data_teknis_id is not None:
+            for pool in self._pools.values():
+                owner = pool.db.get(ip)
+                if owner is not None and owner[0] == exclude_data_teknis_id:
+                    excluded_owner = owner[1]
+
+        for pool in self._pools.values():
+            owner = pool.db.get(ip)
+            if owner is not None and owner[0] != exclude_data_teknis_id:
+                return {"server_id": pool.server_id, "server_name": pool.name, "owner": owner[1], "source": "database"}
+            secret = pool.router.get(ip)
+            if secret is not None and secret != excluded_owner:
+                return {"server_id": pool.server_id, "server_name": pool.name, "owner": secret, "source": "mikrotik"}
+        return None
+
+    def assign(
+        self,
+        server_id: Optional[int],
+        data_teknis_id: int,
+        id_pelanggan: str,
+        ip_address: Optional[str],
+        old_server_id: Optional[int] = None,
+        old_ip_address: Optional[str] = None,
+    ) -> None:
+        """Update index setelah data_teknis disimpan (create/update). Reservasi IP ini dilepas."""
+        if not self.is_loaded:
+            return
+        old_ip = ip_to_int(old_ip_address)
+        old_pool = self._pools.get(old_server_id) if old_server_id is not None else None
+        if old_pool is not None and old_ip is not None:
+            owner = old_pool.db.get(old_ip)
+            if owner is not None and owner[0] == data_teknis_id:
+                old_pool.remove_db(old_ip)
+
+        ip = ip_to_int(ip_address)
+        pool = self._pools.get(server_id) if server_id is not None else None
+        if pool is None or ip is None:
+            return
+        pool.release(ip)
+        if not pool.covers(ip) and not pool.configured:
+            # IP di luar jaringan yang sudah dikenal - jaringan baru perlu dihitung ulang
+            pool.db[ip] = (data_teknis_id, id_pelanggan)
+            pool.rebuild()
+        else:
+            pool.set_db(ip, data_teknis_id, id_pelanggan)
+
+    def unassign(self, server_id: Optional[int], ip_address: Optional[str]) -> None:
+        """Update index setelah data_teknis dihapus."""
+        ip = ip_to_int(ip_address)
+        pool = self._pools.get(server_id) if server_id is not None else None
+        if pool is not None and ip is not None:
+            pool.remove_db(ip)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.is_loaded,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "allocations": self.allocations,
+            "sync_errors": self.sync_errors,
+            "servers": [pool.get_stats() for pool in self._pools.values()],
+        }
+
+
+# Global instance
+ip_pool_allocator = IPPoolAllocator()
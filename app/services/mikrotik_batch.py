@@ -0,0 +1,260 @@
+# ====================================================================
+# MIKROTIK BATCH - SUSPEND / REACTIVATE PER ROUTER
+# ====================================================================
+# Dipakai job massal (suspend tanggal 5, retry sync) supaya tidak ada
+# round trip per pelanggan:
+#
+# 1. Perubahan dikelompokkan per mikrotik_server_id
+# 2. Server di-load sekali (satu SELECT ... WHERE id IN)
+# 3. Per router: /ppp/secret dan /ppp/active diambil SEKALI, di-index by
+#    name, lalu semua .set / .remove dikirim di satu koneksi pool
+# 4. Semua router jalan paralel (asyncio.gather), dibatasi pool per host
+#
+# Hasilnya per langganan (sukses / error) supaya caller bisa update DB
+# secara set-based dan menandai mikrotik_sync_pending untuk yang gagal.
+# ====================================================================
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..models.data_teknis import DataTeknis as DataTeknisModel
+from ..models.mikrotik_server import MikrotikServer as MikrotikServerModel
+from .mikrotik_connection_pool import is_connection_error
+from .mikrotik_service import MikrotikSession
+
+logger = logging.getLogger(__name__)
+
+SUSPENDED_PROFILE = "SUSPENDED"
+
+
+@dataclass
+class SecretStatusChange:
+    """
+    Satu perubahan status PPPoE secret. Field di-copy dari ORM object di event
+    loop supaya worker thread tidak menyentuh session SQLAlchemy.
+    """
+
+    langganan_id: int
+    data_teknis_id: int
+    mikrotik_server_id: int
+    old_name: str
+    name: str
+    password: str
+    remote_address: Optional[str]
+    profile: Optional[str]
+    new_status: str
+
+    @classmethod
+    def from_models(cls, langganan_id: int, data_teknis: DataTeknisModel, new_status: str,
+                    old_name: Optional[str] = None) -> "SecretStatusChange":
+        return cls(
+            langganan_id=langganan_id,
+            data_teknis_id=data_teknis.id,
+            mikrotik_server_id=data_teknis.mikrotik_server_id,  # type: ignore[arg-type]
+            old_name=old_name or data_teknis.id_pelanggan,
+            name=data_teknis.id_pelanggan,
+            password=data_teknis.password_pppoe,
+            remote_address=data_teknis.ip_pelanggan,
+            profile=data_teknis.profile_pppoe,
+            new_status=new_status,
+        )
+
+    def secret_payload(self, secret_id: str) -> Dict[str, Any]:
+        """Payload .set() - sama dengan update_pppoe_secret di mikrotik_service."""
+        payload: Dict[str, Any] = {"id": secret_id, "name": self.name, "password": self.password}
+        if self.remote_address:
+            payload["remote-address"] = self.remote_address
+        if self.new_status == "Aktif":
+            if self.profile:
+                payload["profile"] = self.profile
+            payload["disabled"] = "no"
+        elif self.new_status == "Suspended":
+            payload["profile"] = SUSPENDED_PROFILE
+            payload["disabled"] = "yes"
+        return payload
+
+
+class BatchInterrupted(Exception):
+    """
+    Koneksi putus di tengah apply_secret_changes. Membawa hasil parsial (perubahan yang
+    sudah terkirim tetap di "succeeded") dan di-raise "from" error koneksinya supaya
+    MikrotikSession tetap membuang koneksi itu dari pool.
+    """
+
+    def __init__(self, outcome: Dict[str, Any], error: Exception):
+        super().__init__(str(error))
+        self.outcome = outcome
+        self.error = error
+
+
+@dataclass
+class RouterBatchResult:
+    """Hasil batch untuk satu router."""
+
+    server_id: int
+    server_name: str = ""
+    succeeded: List[int] = field(default_factory=list)  # langganan_id
+    failed: Dict[int, str] = field(default_factory=dict)  # langganan_id -> error
+    sessions_removed: int = 0
+    duration_ms: float = 0.0
+
+
+@dataclass
+class BatchResult:
+    """Gabungan hasil semua router."""
+
+    routers: List[RouterBatchResult] = field(default_factory=list)
+
+    @property
+    def succeeded(self) -> List[int]:
+        return [langganan_id for router in self.routers for langganan_id in router.succeeded]
+
+    @property
+    def failed(self) -> Dict[int, str]:
+        failed: Dict[int, str] = {}
+        for router in self.routers:
+            failed.update(router.failed)
+        return failed
+
+
+def apply_secret_changes(api, changes: List[SecretStatusChange]) -> Dict[str, Any]:
+    """
+    Blocking: terapkan semua perubahan di satu router lewat satu koneksi api.
+    Return {"succeeded": [...], "failed": {langganan_id: error}, "sessions_removed": n}.
+    Kalau koneksi putus di tengah batch, raise BatchInterrupted dengan hasil parsial:
+    sisa perubahan yang belum terkirim masuk "failed".
+    """
+    ppp_secrets = api.get_resource("/ppp/secret")
+    ppp_active = api.get_resource("/ppp/active")
+
+    # Load tabel sekali, index by name
+    secrets_by_name = {secret.get("name"): secret for secret in ppp_secrets.get()}
+    needs_active = any(change.new_status == "Suspended" for change in changes)
+    active_by_name: Dict[str, List[Dict[str, Any]]] = {}
+    if needs_active:
+        for session in ppp_active.get():
+            active_by_name.setdefault(session.get("name"), []).append(session)
+
+    succeeded: List[int] = []
+    failed: Dict[int, str] = {}
+    sessions_removed = 0
+
+    try:
+        for change in changes:
+            secret = secrets_by_name.get(change.old_name) or secrets_by_name.get(change.name)
+            if not secret:
+                failed[change.langganan_id] = f"PPPoE secret '{change.old_name}' tidak ditemukan"
+                continue
+
+            try:
+                ppp_secrets.set(**change.secret_payload(secret["id"]))
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                failed[change.langganan_id] = str(e)
+                continue
+            # Secret sudah berubah di router - sukses walaupun putus session di bawah gagal
+            succeeded.append(change.langganan_id)
+
+            if change.new_status == "Suspended":
+                for session in active_by_name.get(change.name, []):
+                    try:
+                        ppp_active.remove(id=session["id"])
+                        sessions_removed += 1
+                    except Exception as e:
+                        if is_connection_error(e):
+                            raise
+                        logger.warning(f"Gagal menghapus koneksi aktif '{change.name}': {e}")
+    except Exception as e:
+        if not is_connection_error(e):
+            raise
+        # Koneksi putus - hanya perubahan yang belum terkirim yang gagal
+        done = set(succeeded) | set(failed)
+        for change in changes:
+            if change.langganan_id not in done:
+                failed[change.langganan_id] = f"Koneksi putus di tengah batch: {e}"
+        outcome = {"succeeded": succeeded, "failed": failed, "sessions_removed": sessions_removed}
+        raise BatchInterrupted(outcome, e) from e
+
+    return {"succeeded": succeeded, "failed": failed, "sessions_removed": sessions_removed}
+
+
+class MikrotikBatchService:
+    """Terapkan perubahan status PPPoE secara massal, satu koneksi per router, router paralel."""
+
+    async def apply(self, db: AsyncSession, changes: Iterable[SecretStatusChange]) -> BatchResult:
+        by_server: Dict[int, List[SecretStatusChange]] = {}
+        result = BatchResult()
+        for change in changes:
+            if not change.mikrotik_server_id:
+                result.routers.append(
+                    RouterBatchResult(server_id=0, failed={change.langganan_id: "mikrotik_server_id tidak di-set"})
+                )
+                continue
+            by_server.setdefault(change.mikrotik_server_id, []).append(change)
+
+        if not by_server:
+            return result
+
+        servers = (
+            await db.execute(select(MikrotikServerModel).where(MikrotikServerModel.id.in_(list(by_server))))
+        ).scalars().all()
+        servers_by_id = {server.id: server for server in servers}
+
+        router_results = await asyncio.gather(
+            *(
+                self._apply_router(servers_by_id.get(server_id), server_id, server_changes)
+                for server_id, server_changes in by_server.items()
+            )
+        )
+        result.routers.extend(router_results)
+        return result
+
+    async def _apply_router(
+        self,
+        server_info: Optional[MikrotikServerModel],
+        server_id: int,
+        changes: List[SecretStatusChange],
+    ) -> RouterBatchResult:
+        router_result = RouterBatchResult(server_id=server_id)
+        if server_info is None:
+            router_result.failed = {c.langganan_id: f"Server Mikrotik ID {server_id} tidak ditemukan" for c in changes}
+            return router_result
+
+        router_result.server_name = server_info.name
+        started = time.perf_counter()
+        try:
+            outcome = await MikrotikSession(server_info).call(apply_secret_changes, changes=changes)
+            router_result.succeeded = outcome["succeeded"]
+            router_result.failed = outcome["failed"]
+            router_result.sessions_removed = outcome["sessions_removed"]
+        except BatchInterrupted as e:
+            # Koneksi putus di tengah batch - yang sudah terkirim tetap dihitung sukses
+            logger.error(
+                f"Batch Mikrotik {server_info.name} terputus setelah {len(e.outcome['succeeded'])} perubahan: {e.error}"
+            )
+            router_result.succeeded = e.outcome["succeeded"]
+            router_result.failed = e.outcome["failed"]
+            router_result.sessions_removed = e.outcome["sessions_removed"]
+        except Exception as e:
+            # MikrotikConnectionError (router down) atau koneksi putus sebelum ada perubahan terkirim
+            logger.error(f"Batch Mikrotik {server_info.name} gagal untuk {len(changes)} perubahan: {e}")
+            router_result.failed = {c.langganan_id: str(e) for c in changes}
+
+        router_result.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(
+            f"Batch Mikrotik {server_info.name}: {len(router_result.succeeded)} sukses, "
+            f"{len(router_result.failed)} gagal, {router_result.sessions_removed} session diputus "
+            f"dalam {router_result.duration_ms:.0f} ms"
+        )
+        return router_result
+
+
+# Global instance
+mikrotik_batch_service = MikrotikBatchService()
@@ -1,17 +1,58 @@
+# ====================================================================
+# MIKROTIK CONNECTION POOL - LEASE-BASED
+# ====================================================================
+# Pool koneksi RouterOS API per router (host:port):
+#
+# - Lease: get_connection() meminjamkan koneksi secara eksklusif sampai
+#   return_connection(). Tidak ada health probe per checkout - koneksi idle
+#   dijaga oleh maintenance thread (keepalive + eviction) di background.
+# - Lock per host: router lambat tidak menahan checkout ke router lain.
+# - Hard cap per host: kalau penuh, caller menunggu (Condition untuk thread,
+#   async_slot() untuk coroutine) sampai acquire_timeout, lalu PoolTimeoutError.
+#   Tidak ada lagi koneksi "temporary" di luar pool.
+# - Koneksi yang error di level socket/protokol dikembalikan dengan
+#   discard=True dan diganti koneksi baru (dihitung sebagai reconnect).
+# - Metrics: wait time, lease time, hit ratio, reconnect, eviction (get_metrics).
+# ====================================================================
+
 import asyncio
 import threading
 import time
 import logging
-from collections import OrderedDict
-from typing import Dict, Optional, Callable, Any
-from contextlib import contextmanager
+from collections import deque
+from typing import Deque, Dict, Optional, Any, Set
+from contextlib import asynccontextmanager, contextmanager
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import routeros_api
+from routeros_api import exceptions as routeros_exceptions
+
+from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+# Error yang berarti koneksinya rusak (bukan sekadar command ditolak router)
+BROKEN_CONNECTION_ERRORS = (
+    OSError,
+    routeros_exceptions.RouterOsApiConnectionError,
+    routeros_exceptions.FatalRouterOsApiError,
+    routeros_exceptions.RouterOsApiFatalCommunicationError,
+    routeros_exceptions.RouterOsApiParsingError,
+)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    True kalau koneksi yang dipakai saat error ini terjadi sebaiknya dibuang.
+    Error pembungkus (raise ... from e, misalnya BatchInterrupted) ikut dicek lewat __cause__.
+    """
+    while error is not None:
+        if isinstance(error, BROKEN_CONNECTION_ERRORS):
+            return True
+        error = error.__cause__  # type: ignore[assignment]
+    return False
+
 
 # Circuit Breaker States
 class CircuitState(Enum):
@@ -29,21 +70,80 @@ class CircuitBreakerConfig:
 
 @dataclass
 class ConnectionMetrics:
-    total_connections: int = 0
-    active_connections: int = 0
+    total_connections: int = 0  # Jumlah checkout (lease)
+    active_connections: int = 0  # Lease yang sedang dipakai
     failed_connections: int = 0
     retry_attempts: int = 0
     circuit_breaker_trips: int = 0
+    pool_hits: int = 0  # Checkout dapat koneksi idle (warm)
+    pool_misses: int = 0  # Checkout harus membuka koneksi baru
+    connections_created: int = 0
+    reconnects: int = 0  # Koneksi baru pengganti koneksi yang rusak/di-evict
+    evictions: int = 0
+    keepalive_probes: int = 0
+    wait_count: int = 0  # Checkout yang harus antri karena pool penuh
+    wait_timeouts: int = 0
+    wait_time_total_ms: float = 0.0
+    wait_time_max_ms: float = 0.0
+    lease_count: int = 0
+    lease_time_total_ms: float = 0.0
+    lease_time_max_ms: float = 0.0
 
 
-class MikrotikConnectionPool:
-    def __init__(self, max_connections=10, timeout=30, idle_timeout=300):
+class PoolTimeoutError(TimeoutError):
+    """Tidak ada slot koneksi ke router yang bebas dalam acquire_timeout."""
+
+
+@dataclass
+class PooledConnection:
+    connection: Any
+    api: Any
+    host: str
+    port: int
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)  # Terakhir dikembalikan dari lease
+    last_checked: float = field(default_factory=time.time)  # Terakhir lolos keepalive
+    leased_at: float = 0.0
+
+
+class HostPool:
+    """State pool satu router: koneksi idle, lease aktif, dan lock sendiri."""
+
+    def __init__(self, pool_key: str, max_connections: int):
+        self.pool_key = pool_key
         self.max_connections = max_connections
-        self.timeout = timeout  # Timeout for API calls
-        self.idle_timeout = idle_timeout  # Time after which idle connections are closed
-        self.connections: Dict[str, OrderedDict] = {}  # Server host -> connections pool
         self.lock = threading.Lock()
-        self.active_connections: Dict[str, Dict] = {}  # Track active connections by connection object
+        self.available = threading.Condition(self.lock)
+        self.idle: Deque[PooledConnection] = deque()
+        self.leased: Dict[int, PooledConnection] = {}
+        self.reserved = 0  # Slot yang sedang dipakai untuk connect / keepalive probe
+        self.waiting = 0
+        self.pending_reconnects = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.idle) + len(self.leased) + self.reserved
+
+
+class MikrotikConnectionPool:
+    def __init__(
+        self,
+        max_connections=10,
+        timeout=30,
+        idle_timeout=300,
+        keepalive_interval=60,
+        max_lifetime=3600,
+    ):
+        self.max_connections = max_connections  # Hard cap per router
+        self.timeout = timeout  # Batas tunggu slot koneksi (acquire timeout)
+        self.idle_timeout = idle_timeout  # Koneksi idle lebih lama dari ini ditutup
+        self.keepalive_interval = keepalive_interval  # Interval maintenance + keepalive probe
+        self.max_lifetime = max_lifetime  # Umur maksimal koneksi sebelum di-recycle
+        self.hosts: Dict[str, HostPool] = {}
+        self.lock = threading.Lock()  # Registry host + metrics (bukan lock checkout)
+
+        # Antrian async per router (lihat async_slot)
+        self._async_gates: Dict[str, asyncio.Semaphore] = {}
 
         # Circuit Breaker per server
         self.circuit_states: Dict[str, CircuitState] = {}
@@ -58,6 +158,13 @@ class MikrotikConnectionPool:
         self.connection_health: Dict[str, Dict] = {}
         self.last_health_check: Dict[str, float] = {}
 
+        # Reachability per router (diisi MikrotikHealthMonitor lewat record_probe)
+        self.reachability: Dict[str, Dict[str, Any]] = {}
+
+        # Background maintenance
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._maintenance_stop = threading.Event()
+
     def _get_pool_key(self, host_ip: str, port: int) -> str:
         """Generate a unique key for each Mikrotik server connection."""
         return f"{host_ip}:{port}"
@@ -118,6 +225,17 @@ class MikrotikConnectionPool:
         health["consecutive_failures"] = 0
         health["successful_requests"] += 1
 
+        # Request sungguhan berhasil = router pasti terjangkau
+        reach = self.reachability.get(pool_key)
+        if reach is not None:
+            now = time.time()
+            reach["last_check"] = now
+            reach["consecutive_failures"] = 0
+            reach["last_error"] = None
+            if reach["status"] != "up":
+                reach["status"] = "up"
+                reach["last_change"] = now
+
     def _record_failure(self, pool_key: str, error: Exception):
         """Record failed connection and potentially trip circuit breaker."""
         self._initialize_circuit_breaker(pool_key)
@@ -150,6 +268,91 @@ class MikrotikConnectionPool:
                 self.circuit_states[pool_key] = CircuitState.OPEN
                 self.circuit_last_failure[pool_key] = time.time()
 
+
+    def record_probe(
+        self,
+        host_ip: str,
+        port: int,
+        reachable: bool,
+        latency_ms: Optional[float] = None,
+        error: Optional[str] = None,
+        failure_threshold: int = 1,
+    ) -> bool:
+        """
+        Catat hasil probe reachability dan sinkronkan dengan circuit breaker.
+        Router dianggap "down" setelah failure_threshold probe gagal berturut-turut.
+        - down  : circuit langsung OPEN, request gagal cepat tanpa menunggu timeout login
+        - up    : circuit OPEN dipindah ke HALF_OPEN, request berikutnya boleh mencoba
+        Return True kalau status up/down berubah.
+        """
+        pool_key = self._get_pool_key(host_ip, port)
+        self._initialize_circuit_breaker(pool_key)
+        now = time.time()
+
+        with self.lock:
+            reach = self.reachability.get(pool_key)
+            if reach is None:
+                reach = self.reachability[pool_key] = {
+                    "status": "unknown",
+                    "latency_ms": None,
+                    "last_check": 0.0,
+                    "last_change": now,
+                    "last_error": None,
+                    "consecutive_failures": 0,
+                    "checks": 0,
+                }
+            reach["checks"] += 1
+            reach["last_check"] = now
+            if reachable:
+                reach["latency_ms"] = round(latency_ms, 1) if latency_ms is not None else None
+                reach["consecutive_failures"] = 0
+                reach["last_error"] = None
+                new_status = "up"
+            else:
+                reach["consecutive_failures"] += 1
+                reach["last_error"] = error
+                new_status = "down" if reach["consecutive_failures"] >= failure_threshold else reach["status"]
+
+            changed = new_status != reach["status"]
+            if changed:
+                reach["status"] = new_status
+                reach["last_change"] = now
+
+        state = self.circuit_states[pool_key]
+        if new_status == "down":
+            if state != CircuitState.OPEN:
+                logger.error(f"Circuit breaker for {pool_key} OPEN: router tidak terjangkau ({error})")
+                self.circuit_states[pool_key] = CircuitState.OPEN
+                self.metrics.circuit_breaker_trips += 1
+            # Selama probe masih gagal, recovery_timeout dihitung ulang dari probe terakhir
+            self.circuit_last_failure[pool_key] = now
+            self.connection_health[pool_key]["healthy"] = False
+        elif reachable and state == CircuitState.OPEN:
+            logger.info(f"Circuit breaker for {pool_key} moving to HALF_OPEN (probe berhasil)")
+            self.circuit_states[pool_key] = CircuitState.HALF_OPEN
+            self.circuit_failures[pool_key] = 0
+
+        return changed
+
+    def get_reachability(self, host_ip: str, port: int) -> Optional[Dict[str, Any]]:
+        """Snapshot state reachability satu router (None kalau belum pernah di-probe)."""
+        reach = self.reachability.get(self._get_pool_key(host_ip, port))
+        return dict(reach) if reach is not None else None
+
+    def prune_reachability(self, keep_keys: Set[str]):
+        """Buang state reachability router yang sudah dihapus / diganti host-nya."""
+        with self.lock:
+            for pool_key in list(self.reachability.keys()):
+                if pool_key not in keep_keys:
+                    del self.reachability[pool_key]
+
+    def _get_host_pool(self, pool_key: str) -> HostPool:
+        with self.lock:
+            host = self.hosts.get(pool_key)
+            if host is None:
+                host = self.hosts[pool_key] = HostPool(pool_key, self.max_connections)
+            return host
+
     def _get_connection(self, host_ip: str, port: int, username: str, password: str):
         """Create a new Mikrotik API connection."""
         try:
@@ -157,28 +360,37 @@ class MikrotikConnectionPool:
                 host_ip, username=username, password=password, port=port, plaintext_login=True
             )
             api = connection.get_api()
-
-            # Store connection metadata
-            pool_key = self._get_pool_key(host_ip, port)
-            connection_info = {
-                "connection": connection,
-                "api": api,
-                "created_at": time.time(),
-                "last_used": time.time(),
-                "host": host_ip,
-                "port": port,
-            }
-
-            # Track as active connection
-            self.active_connections[str(id(connection))] = connection_info  # type: ignore
-
             return api, connection
         except Exception as e:
             logger.error(f"Failed to create connection to {host_ip}:{port}: {e}")
             raise e
 
-    def get_connection(self, host_ip: str, port: int, username: str, password: str):
-        """Get an available connection from the pool or create a new one."""
+    @staticmethod
+    def _disconnect(connection, pool_key: str, reason: str):
+        try:
+            connection.disconnect()
+            logger.debug(f"Closed {reason} connection to {pool_key}")
+        except Exception as e:
+            logger.error(f"Error closing {reason} connection to {pool_key}: {e}")
+
+    def _record_wait(self, waited_ms: float, timed_out: bool = False):
+        with self.lock:
+            self.metrics.wait_count += 1
+            self.metrics.wait_time_total_ms += waited_ms
+            self.metrics.wait_time_max_ms = max(self.metrics.wait_time_max_ms, waited_ms)
+            if timed_out:
+                self.metrics.wait_timeouts += 1
+
+    # ====================================================================
+    # LEASE
+    # ====================================================================
+
+    def get_connection(self, host_ip: str, port: int, username: str, password: str, timeout: Optional[float] = None):
+        """
+        Lease koneksi ke router. Koneksi idle dipakai ulang tanpa probe; kalau belum ada
+        dan pool belum penuh dibuka koneksi baru; kalau penuh tunggu sampai timeout.
+        Wajib dikembalikan dengan return_connection().
+        """
         pool_key = self._get_pool_key(host_ip, port)
 
         # Check circuit breaker first
@@ -186,228 +398,188 @@ class MikrotikConnectionPool:
             logger.error(f"Circuit breaker OPEN for {pool_key}, connection rejected")
             raise ConnectionError(f"Service unavailable for {pool_key} - circuit breaker open")
 
-        with self.lock:
-            # Update metrics
-            self.metrics.total_connections += 1
-            health = self.connection_health.get(pool_key, {})
-            health["total_requests"] = health.get("total_requests", 0) + 1
-
-            # Check if we have a connection pool for this server
-            if pool_key not in self.connections:
-                self.connections[pool_key] = OrderedDict()
-
-            # Find an idle connection
-            pool = self.connections[pool_key]
-
-            # Clean up expired connections with proper leak prevention
-            current_time = time.time()
-            to_remove = []
-            for conn_key, conn_info in list(pool.items()):
-                if current_time - conn_info["last_used"] > self.idle_timeout:
-                    to_remove.append(conn_key)
-                    logger.warning(
-                        f"Connection {conn_key} to {pool_key} expired ({current_time - conn_info['last_used']:.1f}s > {self.idle_timeout}s)"
+        host = self._get_host_pool(pool_key)
+        acquire_timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + acquire_timeout
+        wait_started: Optional[float] = None
+        pooled: Optional[PooledConnection] = None
+
+        with host.available:
+            self.connection_health[pool_key]["total_requests"] += 1
+
+            while True:
+                if host.idle:
+                    # LIFO - koneksi yang paling baru dipakai paling kecil kemungkinan sudah basi
+                    pooled = host.idle.pop()
+                    break
+                if host.size < host.max_connections:
+                    host.reserved += 1
+                    break
+
+                if wait_started is None:
+                    wait_started = time.monotonic()
+                    host.waiting += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    host.waiting -= 1
+                    self._record_wait((time.monotonic() - wait_started) * 1000, timed_out=True)
+                    raise PoolTimeoutError(
+                        f"Pool koneksi {pool_key} penuh ({host.max_connections}), tidak ada slot dalam {acquire_timeout:.0f}s"
                     )
+                host.available.wait(remaining)
 
-            # Remove expired connections with proper cleanup
-            for conn_key in to_remove:
-                if conn_key in pool:
-                    conn_info = pool.pop(conn_key)
-                    try:
-                        conn_info["connection"].disconnect()
-                        logger.info(f"Cleaned up expired connection to {pool_key}")
-                    except Exception as e:
-                        logger.error(f"Error disconnecting expired connection {conn_key}: {e}")
-                    # Remove from active connections tracking
-                    conn_id = str(id(conn_info["connection"]))
-                    if conn_id in self.active_connections:
-                        del self.active_connections[conn_id]  # type: ignore
-
-            # Try to reuse an existing connection (with health check)
-            if pool:
-                # Get the most recently used connection
-                conn_key, conn_info = pool.popitem(last=False)  # FIFO
-
-                # Quick health check - test if connection is still alive
-                try:
-                    # Simple test command to check connection health
-                    test_result = conn_info["api"].get_resource("/system/identity").get()
-                    if test_result:
-                        pool[conn_key] = conn_info  # Put it back at the end (most recently used)
-                        conn_info["last_used"] = current_time
-                        logger.info(f"Reusing healthy connection to {pool_key}")
-                        self._record_success(pool_key)
-                        return conn_info["api"], conn_info["connection"]
-                    else:
-                        # Connection seems dead, remove it
-                        logger.warning(f"Dead connection detected for {pool_key}, removing")
-                        try:
-                            conn_info["connection"].disconnect()
-                        except:
-                            pass
-                        conn_id = str(id(conn_info["connection"]))
-                        if conn_id in self.active_connections:
-                            del self.active_connections[conn_id]  # type: ignore
-                except Exception as e:
-                    # Connection is unhealthy
-                    logger.warning(f"Unhealthy connection for {pool_key}: {e}")
-                    try:
-                        conn_info["connection"].disconnect()
-                    except:
-                        pass
-                    conn_id = str(id(conn_info["connection"]))
-                    if conn_id in self.active_connections:
-                        del self.active_connections[conn_id]  # type: ignore
-                    self._record_failure(pool_key, e)
-
-            # Create new connection if pool is not full
-            if len(pool) < self.max_connections:
-                try:
-                    api, connection = self._get_connection(host_ip, port, username, password)
-
-                    # Add to pool
-                    conn_key = f"{host_ip}:{port}:{len(pool)}"  # Unique connection key
-                    conn_info = {
-                        "connection": connection,
-                        "api": api,
-                        "created_at": current_time,
-                        "last_used": current_time,
-                        "host": host_ip,
-                        "port": port,
-                        "pool_key": pool_key,
-                    }
-                    pool[conn_key] = conn_info
-
-                    logger.info(f"Created new connection to {pool_key}")
-                    self._record_success(pool_key)
-                    self.metrics.active_connections += 1
-                    return api, connection
+            if wait_started is not None:
+                host.waiting -= 1
 
-                except Exception as e:
-                    self._record_failure(pool_key, e)
-                    raise e
-            else:
-                # If pool is full, create a temporary connection (not in pool)
-                logger.warning(f"Connection pool full for {pool_key}, creating temporary connection")
-                try:
-                    api, connection = self._get_connection(host_ip, port, username, password)
-                    self._record_success(pool_key)
-                    self.metrics.active_connections += 1
-                    return api, connection
-                except Exception as e:
-                    self._record_failure(pool_key, e)
-                    raise e
+            if pooled is not None:
+                pooled.leased_at = time.time()
+                host.leased[id(pooled.connection)] = pooled
 
-    def return_connection(self, connection, host_ip: str, port: int):
-        """Return a connection to the pool for reuse."""
-        pool_key = self._get_pool_key(host_ip, port)
+        if wait_started is not None:
+            self._record_wait((time.monotonic() - wait_started) * 1000)
 
-        with self.lock:
-            # Decrease active connection count
-            self.metrics.active_connections = max(0, self.metrics.active_connections - 1)
+        if pooled is not None:
+            with self.lock:
+                self.metrics.total_connections += 1
+                self.metrics.pool_hits += 1
+                self.metrics.active_connections += 1
+            self._record_success(pool_key)
+            return pooled.api, pooled.connection
+
+        # Buka koneksi baru di luar lock - connect ke router bisa lambat
+        try:
+            api, connection = self._get_connection(host_ip, port, username, password)
+        except Exception as e:
+            with host.available:
+                host.reserved -= 1
+                host.available.notify()
+            self._record_failure(pool_key, e)
+            raise e
 
-            if pool_key in self.connections:
-                pool = self.connections[pool_key]
+        with host.available:
+            host.reserved -= 1
+            host.leased[id(connection)] = PooledConnection(
+                connection=connection, api=api, host=host_ip, port=port, leased_at=time.time()
+            )
+            reconnect = host.pending_reconnects > 0
+            if reconnect:
+                host.pending_reconnects -= 1
 
-                # Check if this connection is already in the pool
-                conn_key = None
-                for key, conn_info in pool.items():
-                    if conn_info["connection"] is connection:
-                        conn_key = key
-                        break
+        with self.lock:
+            self.metrics.total_connections += 1
+            self.metrics.pool_misses += 1
+            self.metrics.connections_created += 1
+            self.metrics.active_connections += 1
+            if reconnect:
+                self.metrics.reconnects += 1
+
+        logger.info(f"Created new connection to {pool_key}")
+        self._record_success(pool_key)
+        return api, connection
+
+    def return_connection(self, connection, host_ip: str, port: int, discard: bool = False):
+        """
+        Kembalikan lease ke pool. discard=True kalau koneksi rusak (lihat is_connection_error);
+        koneksi ditutup dan slot-nya dipakai untuk koneksi baru.
+        """
+        pool_key = self._get_pool_key(host_ip, port)
+        host = self.hosts.get(pool_key)
+        pooled: Optional[PooledConnection] = None
+
+        if host is not None:
+            with host.available:
+                pooled = host.leased.pop(id(connection), None)
+                if pooled is not None:
+                    if discard:
+                        host.pending_reconnects += 1
+                    else:
+                        pooled.last_used = time.time()
+                        host.idle.append(pooled)
+                    host.available.notify()
 
-                # If it's a pooled connection, update its usage time
-                if conn_key:
-                    pool[conn_key]["last_used"] = time.time()
-                    # Move to the end (most recently used)
-                    pool.move_to_end(conn_key, last=True)
-                    logger.info(f"Returned connection to pool for {pool_key}")
+        if pooled is None:
+            # Bukan lease dari pool ini (atau pool sudah ditutup) - cukup tutup koneksinya
+            self._disconnect(connection, pool_key, "unpooled")
+            return
 
-                # If it's a temporary connection, close it properly
-                else:
-                    try:
-                        connection.disconnect()
-                        logger.info(f"Closed temporary connection to {pool_key}")
-                        # Remove from active connections tracking
-                        conn_id = str(id(connection))  # type: ignore
-                        if conn_id in self.active_connections:
-                            del self.active_connections[conn_id]
-                    except Exception as e:
-                        logger.error(f"Error closing temporary connection to {pool_key}: {e}")
-                        # Force cleanup even on error
-                        conn_id = str(id(connection))  # type: ignore
-                        if conn_id in self.active_connections:
-                            del self.active_connections[conn_id]
-            else:
-                # If pool doesn't exist for this server, just close the connection properly
-                try:
-                    connection.disconnect()
-                    logger.info(f"Closed connection to {pool_key}")
-                    # Remove from active connections tracking
-                    conn_id = str(id(connection))  # type: ignore
-                    if conn_id in self.active_connections:
-                        del self.active_connections[conn_id]
-                except Exception as e:
-                    logger.error(f"Error closing connection to {pool_key}: {e}")
-                    # Force cleanup even on error
-                    conn_id = str(id(connection))  # type: ignore
-                    if conn_id in self.active_connections:
-                        del self.active_connections[conn_id]
+        lease_ms = (time.time() - pooled.leased_at) * 1000
+        with self.lock:
+            self.metrics.active_connections = max(0, self.metrics.active_connections - 1)
+            self.metrics.lease_count += 1
+            self.metrics.lease_time_total_ms += lease_ms
+            self.metrics.lease_time_max_ms = max(self.metrics.lease_time_max_ms, lease_ms)
+            if discard:
+                self.metrics.evictions += 1
+
+        if discard:
+            logger.warning(f"Discarded broken connection to {pool_key}")
+            self._disconnect(connection, pool_key, "broken")
+
+    @asynccontextmanager
+    async def async_slot(self, host_ip: str, port: int, timeout: Optional[float] = None):
+        """
+        Antrian async per router dengan kapasitas max_connections.
+        Coroutine yang menunggu slot antri di event loop, bukan memakan worker thread pool.
+        """
+        pool_key = self._get_pool_key(host_ip, port)
+        gate = self._async_gates.get(pool_key)
+        if gate is None:
+            gate = self._async_gates[pool_key] = asyncio.Semaphore(self.max_connections)
+
+        acquire_timeout = self.timeout if timeout is None else timeout
+        if not gate.locked():
+            # Slot tersedia - acquire langsung tanpa suspend
+            await gate.acquire()
+        else:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(gate.acquire(), timeout=acquire_timeout)
+            except asyncio.TimeoutError:
+                self._record_wait((time.monotonic() - started) * 1000, timed_out=True)
+                raise PoolTimeoutError(f"Antrian koneksi {pool_key} penuh, tidak ada slot dalam {acquire_timeout:.0f}s")
+            self._record_wait((time.monotonic() - started) * 1000)
+
+        try:
+            yield
+        finally:
+            gate.release()
 
     def close_all_connections(self):
-        """Close all connections in the pool with proper cleanup."""
+        """Close all connections in the pool (idle dan yang sedang di-lease)."""
+        total_cleaned = 0
         with self.lock:
-            total_cleaned = 0
-            for pool_key, pool in self.connections.items():
-                logger.info(f"Cleaning up connections for {pool_key}")
-                connections_to_clean = list(pool.items())
-                for conn_key, conn_info in connections_to_clean:
-                    try:
-                        conn_info["connection"].disconnect()
-                        logger.info(f"Closed pooled connection {conn_key} to {pool_key}")
-                        total_cleaned += 1
-                        # Remove from active connections tracking
-                        conn_id = id(conn_info["connection"])
-                        if conn_id in self.active_connections:
-                            del self.active_connections[conn_id]
-                    except Exception as e:
-                        logger.error(f"Error closing connection {conn_key} to {pool_key}: {e}")
-                        # Force cleanup even on error
-                        conn_id = id(conn_info["connection"])
-                        if conn_id in self.active_connections:
-                            del self.active_connections[conn_id]
-
-            # Clear all pools
-            self.connections.clear()
-
-            # Clean up any remaining active connections (safety net)
-            remaining_connections = list(self.active_connections.items())
-            for conn_id, conn_info in remaining_connections:
-                try:
-                    conn_info["connection"].disconnect()
-                    logger.info(f"Force cleaned remaining connection {conn_id}")
-                    total_cleaned += 1
-                except Exception as e:
-                    logger.error(f"Error force cleaning connection {conn_id}: {e}")
-                finally:
-                    if conn_id in self.active_connections:
-                        del self.active_connections[conn_id]
+            hosts = list(self.hosts.values())
+            self.hosts.clear()
+
+        for host in hosts:
+            with host.available:
+                connections = list(host.idle) + list(host.leased.values())
+                host.idle.clear()
+                host.leased.clear()
+                host.available.notify_all()
+            for pooled in connections:
+                self._disconnect(pooled.connection, host.pool_key, "pooled")
+                total_cleaned += 1
 
-            # Reset metrics
+        with self.lock:
             self.metrics.active_connections = 0
 
-            logger.info(f"Connection cleanup complete. Cleaned {total_cleaned} connections.")
+        logger.info(f"Connection cleanup complete. Cleaned {total_cleaned} connections.")
 
     @contextmanager
     def connection_context(self, host_ip: str, port: int, username: str, password: str):
         """Context manager to handle connection lifecycle automatically."""
         api, connection = None, None
+        broken = False
         try:
             api, connection = self.get_connection(host_ip, port, username, password)
             yield api, connection
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
         finally:
             if connection:
-                self.return_connection(connection, host_ip, port)
+                self.return_connection(connection, host_ip, port, discard=broken)
 
     def execute_with_retry(
         self, host_ip: str, port: int, username: str, password: str, operation_func, max_retries=3, retry_delay=1
@@ -420,8 +592,7 @@ class MikrotikConnectionPool:
         self._initialize_circuit_breaker(pool_key)
 
         for attempt in range(max_retries):
-            api, connection = None, None
-            connection_established = False
+            connection = None
 
             try:
                 # Check circuit breaker before each attempt
@@ -432,22 +603,29 @@ class MikrotikConnectionPool:
 
                 logger.info(f"Attempt {attempt + 1}/{max_retries} for {host_ip}:{port}")
 
-                # Get connection with built-in circuit breaker check
+                # Lease connection with built-in circuit breaker check
                 api, connection = self.get_connection(host_ip, port, username, password)
-                connection_established = True
 
                 # Track retry attempts for metrics
                 if attempt > 0:
-                    self.metrics.retry_attempts += 1
+                    with self.lock:
+                        self.metrics.retry_attempts += 1
 
                 # Execute the operation
                 result = operation_func(api)
 
-                # Record success and return result
+                # Return lease, record success and return result
+                self.return_connection(connection, host_ip, port)
+                connection = None
                 self._record_success(pool_key)
                 logger.info(f"Operation successful for {pool_key} on attempt {attempt + 1}")
                 return result
 
+            except PoolTimeoutError as te:
+                # Pool penuh bukan berarti router down - jangan retry dan jangan trip circuit breaker
+                logger.error(f"Connection pool exhausted for {pool_key}: {te}")
+                raise
+
             except ConnectionError as ce:
                 # Circuit breaker related error - don't retry
                 logger.error(f"Circuit breaker error for {pool_key}: {ce}")
@@ -461,23 +639,9 @@ class MikrotikConnectionPool:
                 # Record failure for circuit breaker
                 self._record_failure(pool_key, e)
 
-                # Proper connection cleanup
-                if connection and connection_established:
-                    try:
-                        self.return_connection(connection, host_ip, port)
-                    except Exception as cleanup_error:
-                        logger.error(f"Error returning connection to pool: {cleanup_error}")
-                elif connection:
-                    # Connection was established but not properly returned - force cleanup
-                    try:
-                        connection.disconnect()
-                        logger.info(f"Force disconnected failed connection to {pool_key}")
-                        # Remove from active connections tracking
-                        conn_id = str(id(connection))  # type: ignore
-                        if conn_id in self.active_connections:
-                            del self.active_connections[conn_id]
-                    except Exception as cleanup_error:
-                        logger.error(f"Error force disconnecting connection: {cleanup_error}")
+                # Kembalikan lease; koneksi yang rusak dibuang supaya attempt berikutnya pakai koneksi baru
+                if connection:
+                    self.return_connection(connection, host_ip, port, discard=is_connection_error(e))
 
                 # Check if we should retry
                 if attempt < max_retries - 1:
@@ -504,6 +668,147 @@ class MikrotikConnectionPool:
 
         raise last_error or Exception(f"Unknown error occurred for {pool_key}")
 
+    # ====================================================================
+    # BACKGROUND MAINTENANCE (KEEPALIVE + EVICTION)
+    # ====================================================================
+
+    def start_maintenance(self):
+        """Jalankan thread maintenance (dipanggil saat aplikasi startup)."""
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            return
+        self._maintenance_stop.clear()
+        self._maintenance_thread = threading.Thread(
+            target=self._maintenance_loop, name="mikrotik-pool-maintenance", daemon=True
+        )
+        self._maintenance_thread.start()
+        logger.info(f"Mikrotik pool maintenance started (interval {self.keepalive_interval}s)")
+
+    def stop_maintenance(self):
+        """Hentikan thread maintenance (dipanggil saat aplikasi shutdown)."""
+        self._maintenance_stop.set()
+        if self._maintenance_thread:
+            self._maintenance_thread.join(timeout=5)
+            self._maintenance_thread = None
+
+    def _maintenance_loop(self):
+        while not self._maintenance_stop.wait(self.keepalive_interval):
+            try:
+                self.cleanup_stale_connections()
+            except Exception as e:
+                logger.error(f"Mikrotik pool maintenance error: {e}")
+
+    def cleanup_stale_connections(self) -> Dict[str, int]:
+        """
+        Satu putaran maintenance: tutup koneksi idle yang expired / terlalu tua,
+        keepalive probe untuk koneksi idle yang lama tidak dicek, return statistik.
+        Koneksi yang sedang di-lease tidak disentuh.
+        """
+        cleanup_stats = {
+            "expired_connections": 0,
+            "unhealthy_connections": 0,
+            "orphaned_connections": 0,
+            "keepalive_probes": 0,
+            "total_cleaned": 0,
+        }
+
+        for pool_key, host in list(self.hosts.items()):
+            now = time.time()
+            expired, to_probe = [], []
+
+            with host.lock:
+                keep: Deque[PooledConnection] = deque()
+                for pooled in host.idle:
+                    if now - pooled.last_used > self.idle_timeout or now - pooled.created_at > self.max_lifetime:
+                        expired.append(pooled)
+                    elif now - max(pooled.last_used, pooled.last_checked) >= self.keepalive_interval:
+                        to_probe.append(pooled)
+                    else:
+                        keep.append(pooled)
+                host.idle = keep
+                # Slot koneksi yang sedang di-probe tetap dihitung terhadap hard cap
+                host.reserved += len(to_probe)
+
+                # Lease yang jauh lebih lama dari umur koneksi kemungkinan bocor (tidak di-return)
+                cleanup_stats["orphaned_connections"] += sum(
+                    1 for pooled in host.leased.values() if now - pooled.leased_at > self.max_lifetime
+                )
+
+            for pooled in expired:
+                self._disconnect(pooled.connection, pool_key, "expired")
+                cleanup_stats["expired_connections"] += 1
+
+            for pooled in to_probe:
+                cleanup_stats["keepalive_probes"] += 1
+                try:
+                    healthy = bool(pooled.api.get_resource("/system/identity").get())
+                except Exception as e:
+                    logger.warning(f"Keepalive failed for idle connection to {pool_key}: {e}")
+                    healthy = False
+
+                with host.available:
+                    host.reserved -= 1
+                    if healthy:
+                        pooled.last_checked = time.time()
+                        # Masuk di ujung "dingin" supaya checkout tetap pakai yang paling baru
+                        host.idle.appendleft(pooled)
+                    else:
+                        host.pending_reconnects += 1
+                    host.available.notify()
+
+                if not healthy:
+                    self._disconnect(pooled.connection, pool_key, "unhealthy")
+                    cleanup_stats["unhealthy_connections"] += 1
+
+        cleanup_stats["total_cleaned"] = cleanup_stats["expired_connections"] + cleanup_stats["unhealthy_connections"]
+        with self.lock:
+            self.metrics.evictions += cleanup_stats["total_cleaned"]
+            self.metrics.keepalive_probes += cleanup_stats["keepalive_probes"]
+
+        if cleanup_stats["total_cleaned"] or cleanup_stats["orphaned_connections"]:
+            logger.info(f"Connection cleanup complete: {cleanup_stats}")
+        return cleanup_stats
+
+    # ====================================================================
+    # HEALTH & METRICS
+    # ====================================================================
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Snapshot metrics pool untuk monitoring (wait time, lease time, hit ratio, reconnect)."""
+        with self.lock:
+            m = self.metrics
+            checkouts = m.pool_hits + m.pool_misses
+            return {
+                "checkouts": m.total_connections,
+                "active_leases": m.active_connections,
+                "hit_ratio": round(m.pool_hits / checkouts, 4) if checkouts else 0.0,
+                "pool_hits": m.pool_hits,
+                "pool_misses": m.pool_misses,
+                "connections_created": m.connections_created,
+                "reconnects": m.reconnects,
+                "evictions": m.evictions,
+                "keepalive_probes": m.keepalive_probes,
+                "wait_count": m.wait_count,
+                "wait_timeouts": m.wait_timeouts,
+                "avg_wait_ms": round(m.wait_time_total_ms / m.wait_count, 2) if m.wait_count else 0.0,
+                "max_wait_ms": round(m.wait_time_max_ms, 2),
+                "avg_lease_ms": round(m.lease_time_total_ms / m.lease_count, 2) if m.lease_count else 0.0,
+                "max_lease_ms": round(m.lease_time_max_ms, 2),
+                "failed_connections": m.failed_connections,
+                "retry_attempts": m.retry_attempts,
+                "circuit_breaker_trips": m.circuit_breaker_trips,
+            }
+
+    def _host_statistics(self, host: HostPool) -> Dict[str, Any]:
+        with host.lock:
+            return {
+                "pool_size": host.size,
+                "idle_connections": len(host.idle),
+                "leased_connections": len(host.leased),
+                "waiting": host.waiting,
+                "max_connections": host.max_connections,
+                "pool_utilization": f"{(len(host.leased) / host.max_connections) * 100:.1f}%",
+            }
+
     def get_connection_health_status(self, host_ip: str, port: int) -> Dict[str, Any]:
         """Get detailed health status for a specific server connection."""
         pool_key = self._get_pool_key(host_ip, port)
@@ -536,17 +841,8 @@ class MikrotikConnectionPool:
             status_message = "All systems operational"
 
         # Get pool statistics
-        pool_stats = {}
-        if pool_key in self.connections:
-            pool = self.connections[pool_key]
-            pool_stats = {
-                "pool_size": len(pool),
-                "max_connections": self.max_connections,
-                "pool_utilization": f"{(len(pool) / self.max_connections) * 100:.1f}%",
-                "expired_connections": len(
-                    [conn for conn in pool.values() if current_time - conn["last_used"] > self.idle_timeout]
-                ),
-            }
+        host = self.hosts.get(pool_key)
+        pool_stats = self._host_statistics(host) if host else {}
 
         return {
             "server": f"{host_ip}:{port}",
@@ -567,6 +863,7 @@ class MikrotikConnectionPool:
                 "last_check": health["last_check"],
             },
             "pool_statistics": pool_stats,
+            "reachability": self.get_reachability(host_ip, port),
             "timestamp": current_time,
         }
 
@@ -576,7 +873,8 @@ class MikrotikConnectionPool:
 
         # Collect health for all known servers
         servers_health = {}
-        for pool_key in self.connections.keys():
+        # Router yang belum pernah dipakai tapi sudah di-probe health monitor ikut ditampilkan
+        for pool_key in sorted(set(self.hosts.keys()) | set(self.reachability.keys())):
             # Extract host and port from pool_key
             try:
                 host_ip, port = pool_key.split(":")
@@ -586,8 +884,9 @@ class MikrotikConnectionPool:
                 logger.error(f"Invalid pool key format: {pool_key}")
 
         # Get overall system metrics
-        total_active = len(self.active_connections)
-        total_pooled = sum(len(pool) for pool in self.connections.values())
+        host_stats = [health.get("pool_statistics", {}) for health in servers_health.values()]
+        total_active = sum(stats.get("leased_connections", 0) for stats in host_stats)
+        total_pooled = sum(stats.get("pool_size", 0) for stats in host_stats)
 
         return {
             "summary": {
@@ -595,121 +894,41 @@ class MikrotikConnectionPool:
                 "healthy_servers": len([h for h in servers_health.values() if h["status"] == "HEALTHY"]),
                 "degraded_servers": len([h for h in servers_health.values() if h["status"] == "DEGRADED"]),
                 "critical_servers": len([h for h in servers_health.values() if h["status"] in ["WARNING", "CRITICAL"]]),
+                "reachable_servers": len([h for h in servers_health.values() if (h["reachability"] or {}).get("status") == "up"]),
+                "unreachable_servers": len(
+                    [h for h in servers_health.values() if (h["reachability"] or {}).get("status") == "down"]
+                ),
                 "total_active_connections": total_active,
                 "total_pooled_connections": total_pooled,
                 "timestamp": current_time,
             },
             "servers": servers_health,
-            "system_metrics": {
-                "total_connections": self.metrics.total_connections,
-                "failed_connections": self.metrics.failed_connections,
-                "retry_attempts": self.metrics.retry_attempts,
-                "circuit_breaker_trips": self.metrics.circuit_breaker_trips,
-                "active_connections": self.metrics.active_connections,
-            },
+            "system_metrics": self.get_metrics(),
         }
 
-    def cleanup_stale_connections(self) -> Dict[str, int]:
-        """Clean up stale connections and return cleanup statistics."""
-        current_time = time.time()
-        cleanup_stats = {"expired_connections": 0, "unhealthy_connections": 0, "orphaned_connections": 0, "total_cleaned": 0}
-
-        with self.lock:
-            for pool_key, pool in list(self.connections.items()):
-                connections_to_remove = []
-
-                for conn_key, conn_info in list(pool.items()):
-                    should_remove = False
-                    remove_reason = ""
-
-                    # Check for expired connections
-                    if current_time - conn_info["last_used"] > self.idle_timeout:
-                        should_remove = True
-                        remove_reason = "expired"
-                        cleanup_stats["expired_connections"] += 1
-
-                    # Check for unhealthy connections (test connection)
-                    if not should_remove:
-                        try:
-                            # Quick health check
-                            test_result = conn_info["api"].get_resource("/system/identity").get()
-                            if not test_result:
-                                should_remove = True
-                                remove_reason = "unhealthy"
-                                cleanup_stats["unhealthy_connections"] += 1
-                        except Exception:
-                            should_remove = True
-                            remove_reason = "unhealthy"
-                            cleanup_stats["unhealthy_connections"] += 1
-
-                    # Remove the connection if needed
-                    if should_remove:
-                        connections_to_remove.append((conn_key, conn_info, remove_reason))
-                        cleanup_stats["total_cleaned"] += 1
-
-                # Actually remove the connections
-                for conn_key, conn_info, reason in connections_to_remove:
-                    if conn_key in pool:
-                        pool.pop(conn_key)
-                        try:
-                            conn_info["connection"].disconnect()
-                            logger.info(f"Cleaned up {reason} connection {conn_key} from {pool_key}")
-                        except Exception as e:
-                            logger.error(f"Error disconnecting {reason} connection {conn_key}: {e}")
-                        finally:
-                            # Remove from active connections tracking
-                            conn_id = id(conn_info["connection"])
-                            if conn_id in self.active_connections:
-                                del self.active_connections[conn_id]
-
-                # Remove empty pools
-                if not pool and pool_key in self.connections:
-                    self.connections.pop(pool_key)
-                    logger.info(f"Removed empty pool for {pool_key}")
-
-            # Clean up orphaned active connections (safety net)
-            orphaned_connections = []
-            for conn_id, conn_info in list(self.active_connections.items()):
-                # Check if connection is still in any pool
-                found_in_pool = False
-                for pool in self.connections.values():
-                    if any(c_info["connection"] is conn_info["connection"] for c_info in pool.values()):
-                        found_in_pool = True
-                        break
-
-                if not found_in_pool:
-                    orphaned_connections.append((conn_id, conn_info))
-                    cleanup_stats["orphaned_connections"] += 1
-                    cleanup_stats["total_cleaned"] += 1
-
-            # Clean up orphaned connections
-            for conn_id, conn_info in orphaned_connections:
-                try:
-                    conn_info["connection"].disconnect()
-                    logger.info(f"Cleaned up orphaned connection {conn_id}")
-                except Exception as e:
-                    logger.error(f"Error disconnecting orphaned connection {conn_id}: {e}")
-                finally:
-                    if conn_id in self.active_connections:
-                        del self.active_connections[conn_id]
-
-        logger.info(f"Connection cleanup complete: {cleanup_stats}")
-        return cleanup_stats
-
     def get_pool_config(self) -> Dict[str, Any]:
         """Get current pool configuration."""
         return {
             "max_connections": self.max_connections,
             "timeout": self.timeout,
             "idle_timeout": self.idle_timeout,
+            "keepalive_interval": self.keepalive_interval,
+            "max_lifetime": self.max_lifetime,
+            "maintenance_running": bool(self._maintenance_thread and self._maintenance_thread.is_alive()),
             "circuit_breaker": {
                 "failure_threshold": self.circuit_config.failure_threshold,
                 "recovery_timeout": self.circuit_config.recovery_timeout,
                 "expected_exceptions": [exc.__name__ for exc in self.circuit_config.expected_exception],
             },
-            "active_servers": list(self.connections.keys()),
+            "active_servers": list(self.hosts.keys()),
         }
 
 
 # Global connection pool instance
-mikrotik_pool = MikrotikConnectionPool(max_connections=10, timeout=30, idle_timeout=300)
+mikrotik_pool = MikrotikConnectionPool(
+    max_connections=settings.MIKROTIK_POOL_MAX_PER_HOST,
+    timeout=settings.MIKROTIK_POOL_ACQUIRE_TIMEOUT,
+    idle_timeout=settings.MIKROTIK_POOL_IDLE_TIMEOUT,
+    keepalive_interval=settings.MIKROTIK_POOL_KEEPALIVE_INTERVAL,
+    max_lifetime=settings.MIKROTIK_POOL_MAX_LIFETIME,
+)
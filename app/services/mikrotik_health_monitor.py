@@ -0,0 +1,235 @@
+# ====================================================================
+# MIKROTIK HEALTH MONITOR - STATUS UP/DOWN ROUTER DI BACKGROUND
+# ====================================================================
+# Sebelumnya status online/offline router dicek dengan login RouterOS API
+# penuh (get_api_connection) ke SETIAP server di setiap perhitungan
+# dashboard. Router yang mati membuat request menunggu timeout login, dan
+# router yang hidup menerima puluhan login per menit.
+#
+# Sekarang satu task background mem-probe semua router:
+# - Probe = TCP connect ke host_ip:port API (tanpa login), dengan timeout
+#   MIKROTIK_HEALTH_TIMEOUT_SECONDS. Latency connect ikut dicatat.
+# - Setiap MIKROTIK_HEALTH_INTERVAL_SECONDS; probe tiap router diacak
+#   0..MIKROTIK_HEALTH_JITTER_SECONDS supaya tidak serentak.
+# - Hasil probe disimpan di tabel reachability milik MikrotikConnectionPool
+#   (record_probe), satu tempat dengan state circuit breaker:
+#   router down = circuit OPEN (request gagal cepat), probe berhasil =
+#   circuit OPEN -> HALF_OPEN.
+# - Saat status up/down berubah, last_connection_status / last_connected_at
+#   di tabel mikrotik_servers ikut diupdate (filter di GET /mikrotik_servers
+#   tetap jalan, dan widget server_stats dashboard otomatis ditandai dirty).
+#
+# Dashboard, GET /mikrotik_servers dan /connection-health cukup membaca
+# state ini - tidak ada koneksi ke router di jalur request.
+# ====================================================================
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.mikrotik_server import MikrotikServer
+from .mikrotik_connection_pool import mikrotik_pool
+
+logger = logging.getLogger(__name__)
+
+
+class MikrotikHealthMonitor:
+    """Probe reachability semua router secara berkala dan simpan hasilnya di mikrotik_pool."""
+
+    def __init__(self):
+        self.interval = max(1.0, settings.MIKROTIK_HEALTH_INTERVAL_SECONDS)
+        self.jitter = max(0.0, settings.MIKROTIK_HEALTH_JITTER_SECONDS)
+        self.timeout = settings.MIKROTIK_HEALTH_TIMEOUT_SECONDS
+        self.failure_threshold = max(1, settings.MIKROTIK_HEALTH_FAILURE_THRESHOLD)
+        self.concurrency = max(1, settings.MIKROTIK_HEALTH_CONCURRENCY)
+
+        # server_id -> {"name", "host_ip", "port"} dari putaran terakhir
+        self._servers: Dict[int, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.rounds = 0
+        self.probes = 0
+        self.probe_failures = 0
+        self.status_changes = 0
+        self.last_round_at: Optional[float] = None
+        self.last_round_ms = 0.0
+
+    # ----------------------------------------------------------------
+    # Probe
+    # ----------------------------------------------------------------
+
+    async def _probe(self, host_ip: str, port: int) -> Tuple[bool, Optional[float], Optional[str]]:
+        """TCP connect ke port API router. Return (reachable, latency_ms, error)."""
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host_ip, port), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return False, None, f"timeout setelah {self.timeout:g} detik"
+        except OSError as e:
+            return False, None, str(e) or type(e).__name__
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return True, latency_ms, None
+
+    async def _load_servers(self) -> Dict[int, Dict[str, Any]]:
+        async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+            rows = (
+                await db.execute(select(MikrotikServer.id, MikrotikServer.name, MikrotikServer.host_ip, MikrotikServer.port))
+            ).all()
+        return {
+            server_id: {"name": name, "host_ip": host_ip, "port": int(port or 8728)}
+            for server_id, name, host_ip, port in rows
+            if host_ip
+        }
+
+    async def _save_changes(self, changes: List[Tuple[int, str]]):
+        """Tulis perubahan status ke mikrotik_servers (hanya saat up/down berubah)."""
+        now = datetime.now()
+        try:
+            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                for server_id, status in changes:
+                    values: Dict[str, Any] = {"last_connection_status": "success" if status == "up" else "failure"}
+                    if status == "up":
+                        values["last_connected_at"] = now
+                    # Bulk UPDATE lewat session -> listener dashboard_snapshot menandai server_stats dirty
+                    await db.execute(update(MikrotikServer).where(MikrotikServer.id == server_id).values(**values))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Mikrotik health monitor: gagal menyimpan status server: {e}")
+
+    async def run_round(self):
+        """Satu putaran probe ke semua router."""
+        started = time.perf_counter()
+        servers = await self._load_servers()
+        self._servers = servers
+        mikrotik_pool.prune_reachability(
+            {mikrotik_pool._get_pool_key(info["host_ip"], info["port"]) for info in servers.values()}
+        )
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        changes: List[Tuple[int, str]] = []
+
+        async def check(server_id: int, info: Dict[str, Any]):
+            if self.jitter:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+            async with semaphore:
+                reachable, latency_ms, error = await self._probe(info["host_ip"], info["port"])
+            self.probes += 1
+            if not reachable:
+                self.probe_failures += 1
+            changed = mikrotik_pool.record_probe(
+                info["host_ip"],
+                info["port"],
+                reachable,
+                latency_ms=latency_ms,
+                error=error,
+                failure_threshold=self.failure_threshold,
+            )
+            if changed:
+                status = "up" if reachable else "down"
+                changes.append((server_id, status))
+                if status == "down":
+                    logger.warning(f"Mikrotik {info['name']} ({info['host_ip']}:{info['port']}) DOWN: {error}")
+                else:
+                    logger.info(f"Mikrotik {info['name']} ({info['host_ip']}:{info['port']}) UP ({latency_ms:.1f} ms)")
+
+        await asyncio.gather(*(check(server_id, info) for server_id, info in servers.items()))
+
+        if changes:
+            self.status_changes += len(changes)
+            await self._save_changes(changes)
+
+        self.rounds += 1
+        self.last_round_at = time.time()
+        self.last_round_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    # ----------------------------------------------------------------
+    # Worker
+    # ----------------------------------------------------------------
+
+    def start_worker(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._worker_loop(), name="mikrotik-health-monitor")
+        logger.info(
+            f"Mikrotik health monitor dimulai (interval {self.interval:g}s, jitter {self.jitter:g}s, "
+            f"timeout {self.timeout:g}s)"
+        )
+
+    async def stop_worker(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _worker_loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mikrotik health monitor: putaran probe gagal: {e}")
+            await asyncio.sleep(max(1.0, self.interval - (time.monotonic() - started)))
+
+    # ----------------------------------------------------------------
+    # Baca state
+    # ----------------------------------------------------------------
+
+    def get_state(self, server_id: int) -> Optional[Dict[str, Any]]:
+        """State reachability satu server (None kalau belum pernah di-probe)."""
+        info = self._servers.get(server_id)
+        if info is None:
+            return None
+        reach = mikrotik_pool.get_reachability(info["host_ip"], info["port"])
+        if reach is None:
+            return None
+        return {
+            "reachability": reach["status"],
+            "latency_ms": reach["latency_ms"],
+            "last_checked_at": datetime.fromtimestamp(reach["last_check"]) if reach["last_check"] else None,
+            "status_changed_at": datetime.fromtimestamp(reach["last_change"]),
+            "last_error": reach["last_error"],
+        }
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """Jumlah server up / down / unknown dari putaran terakhir."""
+        counts = {"up": 0, "down": 0, "unknown": 0}
+        for info in self._servers.values():
+            reach = mikrotik_pool.get_reachability(info["host_ip"], info["port"])
+            counts[reach["status"] if reach else "unknown"] += 1
+        counts["total"] = len(self._servers)
+        return counts
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "servers": len(self._servers),
+            "rounds": self.rounds,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "status_changes": self.status_changes,
+            "last_round_at": self.last_round_at,
+            "last_round_ms": self.last_round_ms,
+            "status_counts": self.get_status_counts(),
+        }
+
+
+# Global instance
+mikrotik_health_monitor = MikrotikHealthMonitor()
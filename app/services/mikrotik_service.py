@@ -32,20 +32,26 @@ Security:
 - Audit logging
 """
 
+import asyncio
+import functools
 import routeros_api
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 import logging
 from datetime import datetime
 
+from ..config import settings
+
 # Impor model yang dibutuhkan
 from ..models.langganan import Langganan as LanggananModel
 from ..models.mikrotik_server import MikrotikServer as MikrotikServerModel
 from ..models.data_teknis import DataTeknis as DataTeknisModel
 
 # Import connection pooling
-from .mikrotik_connection_pool import mikrotik_pool
+from .mikrotik_connection_pool import is_connection_error, mikrotik_pool
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -265,22 +271,20 @@ async def trigger_mikrotik_update(
         logger.error(f"Server Mikrotik dengan ID {server_id} tidak ditemukan di database.")
         return
 
-    api, connection = get_api_connection(mikrotik_server_info)
-    if not api:
-        return
+    # Update secret + putus koneksi aktif dikirim di satu koneksi, di thread pool Mikrotik
+    operations = [
+        functools.partial(
+            update_pppoe_secret, old_id_pelanggan=old_id_pelanggan, data_teknis=data_teknis, new_status=langganan.status
+        )
+    ]
+    if langganan.status == "Suspended":
+        # Saat suspend, hapus koneksi aktif dengan NAMA BARU
+        operations.append(functools.partial(remove_active_connection, id_pelanggan=data_teknis.id_pelanggan))
 
     try:
-        # Panggil fungsi update yang sudah diperbaiki dengan argumen baru
-        update_pppoe_secret(api, old_id_pelanggan, data_teknis, langganan.status)
-
-        if langganan.status == "Suspended":
-            # Saat suspend, hapus koneksi aktif dengan NAMA BARU
-            remove_active_connection(api, data_teknis.id_pelanggan)
-
-    finally:
-        if connection:
-            logger.info("Menutup koneksi Mikrotik.")
-            mikrotik_pool.return_connection(connection, mikrotik_server_info.host_ip, int(mikrotik_server_info.port))
+        await MikrotikSession(mikrotik_server_info).pipeline(*operations)
+    except MikrotikConnectionError as e:
+        logger.error(str(e))
 
 
 def check_ip_in_secrets(api, ip_address: str) -> str | None:
@@ -367,16 +371,10 @@ async def trigger_mikrotik_create(db: AsyncSession, data_teknis: DataTeknisModel
         logger.error(f"Server Mikrotik dengan ID {server_id} tidak ditemukan.")
         return
 
-    api, connection = get_api_connection(mikrotik_server_info)
-    if not api:
-        return
-
     try:
-        create_pppoe_secret(api, data_teknis)
-    finally:
-        if connection:
-            logger.info("Menutup koneksi Mikrotik.")
-            mikrotik_pool.return_connection(connection, mikrotik_server_info.host_ip, int(mikrotik_server_info.port))
+        await async_mikrotik.create_pppoe_secret(mikrotik_server_info, data_teknis)
+    except MikrotikConnectionError as e:
+        logger.error(str(e))
 
 
 def get_all_ppp_secrets(api):
@@ -429,3 +427,127 @@ def get_all_ppp_profiles(api):
     except Exception as e:
         logger.error(f"Gagal mengambil daftar PPPoE profile: {e}")
         raise e
+
+
+# ====================================================================
+# ASYNC FACADE - ROUTEROS API TANPA BLOCK EVENT LOOP
+# ====================================================================
+# routeros_api blocking (socket sync). Semua fungsi di atas dijalankan di
+# thread pool khusus Mikrotik supaya router yang lambat tidak menahan request
+# lain. MikrotikSession.pipeline() mengirim beberapa operasi berurutan di SATU
+# koneksi pool dalam SATU hop ke thread pool (connect/checkout sekali).
+#
+# Contoh:
+#   owner = await async_mikrotik.check_ip_in_secrets(server, "10.0.0.5")
+#   profiles, secrets = await MikrotikSession(server).pipeline(
+#       get_all_ppp_profiles, get_all_ppp_secrets
+#   )
+# ====================================================================
+
+_mikrotik_executor: Optional[ThreadPoolExecutor] = None
+
+
+class MikrotikConnectionError(ConnectionError):
+    """Koneksi ke Mikrotik tidak bisa dibuka (parameter tidak lengkap / router down)."""
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _mikrotik_executor
+    if _mikrotik_executor is None:
+        _mikrotik_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.MIKROTIK_API_MAX_WORKERS),
+            thread_name_prefix="mikrotik-api",
+        )
+    return _mikrotik_executor
+
+
+def shutdown_executor():
+    """Matikan thread pool Mikrotik API (dipanggil saat aplikasi shutdown)."""
+    global _mikrotik_executor
+    if _mikrotik_executor is not None:
+        _mikrotik_executor.shutdown(wait=False, cancel_futures=True)
+        _mikrotik_executor = None
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Jalankan fungsi routeros_api blocking di thread pool Mikrotik."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+class MikrotikSession:
+    """
+    Satu koneksi pool ke satu router untuk satu rangkaian operasi.
+    Setiap operasi adalah callable(api) - misalnya fungsi di module ini.
+    """
+
+    def __init__(self, server_info: MikrotikServerModel):
+        self.server_info = server_info
+
+    async def pipeline(self, *operations: Callable) -> List[Any]:
+        """Jalankan operasi berurutan di satu koneksi, return list hasil sesuai urutan."""
+        # Kalau pool router ini penuh, antri di event loop - bukan di worker thread pool
+        async with mikrotik_pool.async_slot(self.server_info.host_ip, self.server_info.port):
+            return await run_blocking(self._run_pipeline, operations)
+
+    async def call(self, operation: Callable, *args, **kwargs) -> Any:
+        """Shortcut satu operasi: operation(api, *args, **kwargs)."""
+        results = await self.pipeline(functools.partial(operation, *args, **kwargs))
+        return results[0]
+
+    def _run_pipeline(self, operations) -> List[Any]:
+        server_info = self.server_info
+        api, connection = get_api_connection(server_info)
+        if not api:
+            raise MikrotikConnectionError(f"Tidak dapat terhubung ke server Mikrotik {server_info.name}")
+
+        broken = False
+        try:
+            # Operasi dengan argumen dibungkus functools.partial(..., keyword=...) supaya api tetap argumen pertama
+            return [operation(api) for operation in operations]
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            if connection:
+                mikrotik_pool.return_connection(connection, server_info.host_ip, int(server_info.port), discard=broken)
+
+
+class AsyncMikrotikService:
+    """Versi awaitable dari fungsi-fungsi Mikrotik; argumen pertama server, bukan api."""
+
+    def session(self, server_info: MikrotikServerModel) -> MikrotikSession:
+        return MikrotikSession(server_info)
+
+    async def perform_routeros_connection(self, device_details: dict) -> dict:
+        return await run_blocking(perform_routeros_connection, device_details)
+
+    async def update_pppoe_secret(self, server_info, old_id_pelanggan: str, data_teknis: DataTeknisModel, new_status: str):
+        return await MikrotikSession(server_info).call(
+            update_pppoe_secret, old_id_pelanggan=old_id_pelanggan, data_teknis=data_teknis, new_status=new_status
+        )
+
+    async def remove_active_connection(self, server_info, id_pelanggan: str):
+        return await MikrotikSession(server_info).call(remove_active_connection, id_pelanggan=id_pelanggan)
+
+    async def check_ip_in_secrets(self, server_info, ip_address: str) -> str | None:
+        return await MikrotikSession(server_info).call(check_ip_in_secrets, ip_address=ip_address)
+
+    async def get_active_connections(self, server_info):
+        return await MikrotikSession(server_info).call(get_active_connections)
+
+    async def create_pppoe_secret(self, server_info, data_teknis: DataTeknisModel):
+        return await MikrotikSession(server_info).call(create_pppoe_secret, data_teknis=data_teknis)
+
+    async def get_all_ppp_secrets(self, server_info):
+        return await MikrotikSession(server_info).call(get_all_ppp_secrets)
+
+    async def delete_pppoe_secret(self, server_info, id_pelanggan: str) -> bool:
+        return await MikrotikSession(server_info).call(delete_pppoe_secret, id_pelanggan=id_pelanggan)
+
+    async def get_all_ppp_profiles(self, server_info):
+        return await MikrotikSession(server_info).call(get_all_ppp_profiles)
+
+
+# Global instance
+async_mikrotik = AsyncMikrotikService()
@@ -58,29 +58,21 @@ class NotificationService:
         Menghilangkan duplikasi broadcast logic di semua routers
         """
         try:
-            target_user_ids = await NotificationService.get_users_by_roles(db, role_names)
-
-            if not target_user_ids:
-                logger.warning(f"No users found with roles: {role_names}")
-                return False
-
             # Add metadata ke notification
             enriched_notification = {
                 **notification_data,
                 "timestamp": datetime.now().isoformat(),
                 "broadcast_to_roles": role_names,
-                "target_user_count": len(target_user_ids),
             }
 
-            # Broadcast menggunakan WebSocket manager
-            await manager.broadcast_to_roles(enriched_notification, target_user_ids)
+            # Target diambil dari role_index WebSocket manager (hanya user yang terhubung, tanpa query)
+            await manager.broadcast_to_role_names(enriched_notification, role_names)
 
             SuccessHandler.log_success(
                 operation="broadcast notification",
                 resource_name="message",
                 additional_info={
                     "roles": role_names,
-                    "user_count": len(target_user_ids),
                     "message_type": notification_data.get("type", "unknown"),
                 },
             )
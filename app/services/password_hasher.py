@@ -0,0 +1,146 @@
+# ====================================================================
+# PASSWORD HASHER POOL - BCRYPT DI LUAR EVENT LOOP
+# ====================================================================
+# bcrypt cost 12 makan ~200-300 ms CPU per hash/verify. Kalau dipanggil
+# langsung di coroutine (authenticate_user), seluruh event loop berhenti
+# selama itu - request lain dan heartbeat websocket ikut macet.
+#
+# - Semua hash/verify jalan di thread pool khusus (PASSWORD_HASH_WORKERS).
+#   bcrypt melepas GIL saat hashing, jadi thread sudah paralel penuh.
+# - Concurrency dibatasi semaphore sebesar jumlah worker; request yang
+#   menunggu dihitung, dan kalau antrian > PASSWORD_HASH_MAX_QUEUE request
+#   baru langsung ditolak (PasswordHasherBusy) daripada menumpuk.
+# - Metrics: queue time (submit -> mulai di thread) dan run time per
+#   operasi, p50/p95/p99 dari sampel terakhir (get_stats).
+# ====================================================================
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Jumlah sampel timing yang disimpan untuk persentil
+SAMPLE_SIZE = 1000
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Antrian hash password penuh - caller sebaiknya membalas 503."""
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Persentil sederhana (nearest-rank) dari list yang belum diurutkan."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 2)
+
+
+class PasswordHasherPool:
+    """Thread pool + semaphore untuk operasi bcrypt dari async code."""
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_workers = max(1, max_workers or settings.PASSWORD_HASH_WORKERS)
+        self.max_queue = max_queue if max_queue is not None else settings.PASSWORD_HASH_MAX_QUEUE
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=SAMPLE_SIZE)  # (queue_ms, run_ms)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    def _timed(self, func: Callable, submitted: float) -> Tuple[Any, float, float]:
+        started = time.perf_counter()
+        result = func()
+        finished = time.perf_counter()
+        return result, (started - submitted) * 1000, (finished - started) * 1000
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Jalankan func(*args, **kwargs) di pool hashing. Raise PasswordHasherBusy kalau antrian penuh."""
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Antrian password hashing penuh ({self.waiting} menunggu), request ditolak")
+            raise PasswordHasherBusy("Server sedang sibuk memproses login, coba lagi sebentar")
+
+        submitted = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._get_slots().acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, queue_ms, run_ms = await loop.run_in_executor(
+                self._get_executor(), self._timed, functools.partial(func, *args, **kwargs), submitted
+            )
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.running -= 1
+            self._get_slots().release()
+
+        self.completed += 1
+        with self._lock:
+            self._samples.append((queue_ms, run_ms))
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+        queue_times = [q for q, _ in samples]
+        run_times = [r for _, r in samples]
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "queue_ms": {
+                "p50": percentile(queue_times, 50),
+                "p95": percentile(queue_times, 95),
+                "p99": percentile(queue_times, 99),
+                "max": round(max(queue_times), 2) if queue_times else 0.0,
+            },
+            "run_ms": {
+                "p50": percentile(run_times, 50),
+                "p95": percentile(run_times, 95),
+                "p99": percentile(run_times, 99),
+            },
+        }
+
+    def shutdown(self):
+        """Matikan thread pool (dipanggil saat aplikasi shutdown)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global instance
+password_hasher = PasswordHasherPool()
@@ -0,0 +1,178 @@
+# ====================================================================
+# PRINCIPAL CACHE - USER + ROLE + PERMISSIONS PER PROSES
+# ====================================================================
+# get_current_active_user dipanggil di hampir semua endpoint dan setiap kali
+# menjalankan 3 query (user, role, permissions). Satu page dashboard ~10
+# API call = ~30 query hanya untuk tahu siapa user-nya.
+#
+# - Cache in-process per user_id dengan TTL (PRINCIPAL_CACHE_TTL_SECONDS)
+#   dan batas jumlah entry (LRU).
+# - Versi: setiap user punya counter versi, ditambah satu counter global.
+#   invalidate_user() menaikkan versi user itu (update/delete user, reset
+#   password, revoke_all_user_tokens); invalidate_all() menaikkan versi
+#   global (perubahan role/permission). Entry yang disimpan dengan versi
+#   lama tidak pernah dipakai, termasuk hasil query yang sedang berjalan
+#   saat invalidasi terjadi.
+# - Invalidasi hanya berlaku di proses ini; proses/worker lain ketinggalan
+#   paling lama TTL.
+# - Yang disimpan bukan object ORM, tapi snapshot Principal (frozen
+#   dataclass: data user + role + nama permission). Object ORM yang
+#   di-expunge tetap menyeret role/permissions yang masih terikat ke session
+#   request pengisi cache; begitu request itu rollback, object tersebut
+#   di-expire dan semua cache hit berikutnya gagal DetachedInstanceError.
+#   Snapshot tidak terikat session mana pun dan aman dibagi antar request.
+# ====================================================================
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+PrincipalVersion = Tuple[int, int]  # (versi global, versi user)
+
+
+@dataclass(frozen=True)
+class PermissionPrincipal:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class RolePrincipal:
+    id: int
+    name: str
+    permissions: Tuple[PermissionPrincipal, ...] = ()
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Snapshot read-only user terautentikasi. Atributnya mengikuti model User yang dipakai router."""
+
+    id: int
+    name: str
+    email: str
+    is_active: bool
+    role_id: Optional[int]
+    role: Optional[RolePrincipal]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: Any) -> "Principal":
+        """Salin dari object User ORM (role & permissions harus sudah ter-load)."""
+        role = None
+        if user.role is not None:
+            role = RolePrincipal(
+                id=user.role.id,
+                name=user.role.name,
+                permissions=tuple(PermissionPrincipal(id=p.id, name=p.name) for p in user.role.permissions),
+            )
+        return cls(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            is_active=user.is_active,
+            role_id=user.role_id,
+            role=role,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+        )
+
+
+@dataclass
+class _Entry:
+    user: Principal
+    version: PrincipalVersion
+    expires_at: float
+
+
+class PrincipalCache:
+    """Cache user terautentikasi (dengan role & permissions) per user_id."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl_seconds = settings.PRINCIPAL_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = settings.PRINCIPAL_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._user_versions: Dict[int, int] = {}
+        self._global_version = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def version(self, user_id: int) -> PrincipalVersion:
+        """Versi saat ini - ambil SEBELUM query user, lalu kirim ke put()."""
+        with self._lock:
+            return self._global_version, self._user_versions.get(user_id, 0)
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            current = (self._global_version, self._user_versions.get(user_id, 0))
+            if entry is None or entry.version != current or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry.user
+
+    def put(self, user_id: int, user: Principal, version: PrincipalVersion) -> None:
+        """Simpan user; diabaikan kalau sudah ada invalidasi sejak version diambil."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != (self._global_version, self._user_versions.get(user_id, 0)):
+                return
+            self._entries[user_id] = _Entry(user=user, version=version, expires_at=time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Dipanggil setelah data user (role, password, status, token) berubah."""
+        with self._lock:
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+        logger.debug(f"Principal cache: user {user_id} di-invalidate")
+
+    def invalidate_all(self) -> None:
+        """Dipanggil setelah role/permission berubah (bisa mengenai banyak user sekaligus)."""
+        with self._lock:
+            self._global_version += 1
+            self._entries.clear()
+            self.invalidations += 1
+        logger.debug("Principal cache: semua entry di-invalidate")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "invalidations": self.invalidations,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+# Global instance
+principal_cache = PrincipalCache()
@@ -3,9 +3,9 @@ Rate Limiter Service for Xendit API.
 Non-intrusive wrapper untuk mencegah rate limiting dan memastikan semua invoice terkirim.
 
 Features:
-- Rate limiting untuk Xendit API
+- Rate limiting untuk Xendit API (async token bucket per akun / API key Xendit)
 - Automatic retry dengan exponential backoff
-- Queue system untuk bulk operations
+- Queue system untuk bulk operations (tabel invoice_outbox, lihat services/invoice_outbox.py)
 - Error recovery dan logging
 - Non-intrusive integration dengan existing code
 
@@ -22,6 +22,7 @@ from typing import Optional, Dict, Any, List
 from dataclasses import dataclass
 from enum import Enum
 
+from ..config import settings
 from ..services.xendit_service import create_xendit_invoice
 from ..models.invoice import Invoice as InvoiceModel
 from ..models.pelanggan import Pelanggan as PelangganModel
@@ -55,36 +56,108 @@ class InvoiceRequest:
             self.created_at = datetime.now()
 
 
+class AsyncTokenBucket:
+    """
+    Token bucket yang aman dipanggil banyak coroutine sekaligus.
+
+    - Token bertambah `rate` per detik sampai maksimal `capacity` (burst)
+    - acquire() mengambil satu token; kalau habis, tunggu sampai token cukup
+    - Lock asyncio bersifat FIFO, jadi caller dilayani sesuai urutan datang
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 0.01)
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+        # Statistik
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """Ambil token, return berapa detik menunggu."""
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            if self.tokens < tokens:
+                # Tidur sambil pegang lock supaya caller berikutnya tetap antri di belakang
+                delay = (tokens - self.tokens) / self.rate
+                self.throttled += 1
+                await asyncio.sleep(delay)
+                waited = delay
+                self._refill()
+            self.tokens -= tokens
+            self.acquired += 1
+            self.total_wait += waited
+        return waited
+
+    def penalize(self, seconds: float) -> None:
+        """Kosongkan bucket selama `seconds` (misal setelah Xendit membalas 429)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.capacity,
+            "tokens_available": round(self.tokens, 2),
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "total_wait_seconds": round(self.total_wait, 2),
+        }
+
+
+def xendit_account_for(key_name: Optional[str]) -> str:
+    """
+    Nama akun Xendit (API key) yang dipakai sebuah brand - rate limit Xendit berlaku per akun,
+    jadi brand yang berbagi API key (ajn-01 & ajn-03) berbagi satu bucket.
+    Mapping sama dengan pemilihan API key di create_xendit_invoice.
+    """
+    api_key = settings.XENDIT_API_KEYS.get(key_name or "")
+    for account in ("JAKINET", "JELANTIK"):
+        if api_key and settings.XENDIT_API_KEYS.get(account) == api_key:
+            return account
+
+    lowered = (key_name or "").lower()
+    if "jelantik" in lowered and "nagrak" in lowered:
+        return "JAKINET"
+    if "jelantik" in lowered:
+        return "JELANTIK"
+    return key_name or "default"
+
+
 class RateLimiterService:
     """
     Rate limiter service untuk Xendit API calls.
 
     Configurations:
-    - max_requests_per_second: Max requests ke Xendit API
+    - max_requests_per_second: Rate default per akun Xendit (XENDIT_RATE_LIMIT_PER_SECOND)
+    - burst: Request yang boleh langsung jalan per akun (XENDIT_RATE_LIMIT_BURST)
     - max_retries: Maximum retry attempts
     - base_delay: Base delay untuk retry (seconds)
     - max_delay: Maximum delay untuk retry (seconds)
     """
 
     def __init__(self):
-        self.max_requests_per_second = 1  # CONSERVATIVE untuk stability
+        self.max_requests_per_second = settings.XENDIT_RATE_LIMIT_PER_SECOND
+        self.burst = settings.XENDIT_RATE_LIMIT_BURST
         self.max_retries = 5              # MORE retry attempts
         self.base_delay = 2.0             # LONGER delay untuk safety
         self.max_delay = 60.0             # MAX delay untuk recovery
 
-        # Rate limiting state
-        self.last_request_time = 0.0
-        self.request_count = 0
-        self.window_start = time.time()
-
-        # Queue untuk pending requests
-        self.pending_queue: List[InvoiceRequest] = []
-        self.processing_queue: List[InvoiceRequest] = []
-        self.completed_queue: List[InvoiceRequest] = []
-        self.failed_queue: List[InvoiceRequest] = []
+        # Rate limiting state: satu token bucket per akun Xendit
+        self.buckets: Dict[str, AsyncTokenBucket] = {}
 
-        # Processing state
-        self.is_processing = False
+        # Statistik request langsung (bulk/queue dicatat di tabel invoice_outbox)
         self.total_processed = 0
         self.total_failed = 0
 
@@ -121,11 +194,8 @@ class RateLimiterService:
             priority=priority
         )
 
-        # Jika ini bulk operation, tambahkan ke queue
-        if len(self.pending_queue) > 0 or len(self.processing_queue) > 0:
-            return await self._add_to_queue(request)
-
-        # Jika single request, proses langsung dengan rate limiting
+        # Single request selalu diproses langsung (caller butuh payment link-nya);
+        # bulk lewat create_bulk_invoices_with_rate_limit -> invoice_outbox
         return await self._process_single_request(request)
 
     async def create_bulk_invoices_with_rate_limit(
@@ -142,134 +212,46 @@ class RateLimiterService:
             Dict dengan summary hasil bulk creation
         """
 
-        logger.info(f"📦 Starting bulk invoice creation: {len(invoices_data)} invoices")
-
-        # Create InvoiceRequest objects
-        requests = []
-        for data in invoices_data:
-            request = InvoiceRequest(
-                invoice=data['invoice'],
-                pelanggan=data['pelanggan'],
-                paket=data['paket'],
-                deskripsi_xendit=data['deskripsi_xendit'],
-                pajak=data['pajak'],
-                no_telp_xendit=data.get('no_telp_xendit', ''),
-                priority=data.get('priority', InvoicePriority.NORMAL)
-            )
-            requests.append(request)
-
-        # Sort by priority
-        priority_order = {
-            InvoicePriority.HIGH: 0,
-            InvoicePriority.NORMAL: 1,
-            InvoicePriority.LOW: 2
-        }
-        requests.sort(key=lambda x: priority_order[x.priority])
+        from ..database import AsyncSessionLocal
+        from .invoice_outbox import invoice_outbox
 
-        # Add to queue
-        self.pending_queue.extend(requests)
+        logger.info(f"📦 Starting bulk invoice creation: {len(invoices_data)} invoices")
 
-        # Start processing if not already running
-        if not self.is_processing:
-            asyncio.create_task(self._process_queue())
+        # Masuk ke outbox persisten - diproses worker (priority, backoff, dead-letter)
+        async with AsyncSessionLocal() as db:
+            for data in invoices_data:
+                invoice = await db.merge(data['invoice'])
+                await invoice_outbox.enqueue(
+                    db,
+                    invoice,
+                    deskripsi_xendit=data['deskripsi_xendit'],
+                    pajak=data['pajak'],
+                    no_telp_xendit=data.get('no_telp_xendit', ''),
+                    priority=data.get('priority', InvoicePriority.NORMAL),
+                )
+            await db.commit()
 
         return {
             "success": True,
-            "message": f"Added {len(requests)} invoices to processing queue",
+            "message": f"Added {len(invoices_data)} invoices to processing queue",
             "queue_status": await self.get_queue_status()
         }
 
-    async def _add_to_queue(self, request: InvoiceRequest) -> Dict[str, Any]:
-        """Add request to queue and return immediate response."""
-        self.pending_queue.append(request)
-
-        # Start processing if not already running
-        if not self.is_processing:
-            asyncio.create_task(self._process_queue())
-
-        return {
-            "success": True,
-            "message": f"Invoice {request.invoice.invoice_number} added to queue",
-            "queue_position": len(self.pending_queue),
-            "estimated_wait_time": self._estimate_wait_time()
-        }
-
     async def _process_single_request(self, request: InvoiceRequest) -> Dict[str, Any]:
         """Process single request dengan rate limiting."""
 
-        # Apply rate limiting delay
-        await self._apply_rate_limit_delay()
-
-        # Process dengan retry logic
+        # Rate limiting diterapkan per attempt di _process_with_retry
         return await self._process_with_retry(request)
 
-    async def _process_queue(self) -> None:
-        """Process all pending requests in queue."""
-
-        if self.is_processing:
-            return
-
-        self.is_processing = True
-        logger.info("🚀 Starting queue processing...")
-
-        try:
-            while self.pending_queue or self.processing_queue:
-                # Process pending requests
-                if self.pending_queue:
-                    # Move batch from pending to processing
-                    batch_size = min(5, len(self.pending_queue))  # Process 5 at a time
-                    batch = self.pending_queue[:batch_size]
-                    self.pending_queue = self.pending_queue[batch_size:]
-                    self.processing_queue.extend(batch)
-
-                    logger.info(f"📋 Processing batch: {len(batch)} invoices")
-
-                # Process current batch
-                if self.processing_queue:
-                    await self._process_batch(self.processing_queue.copy())
-
-                # Small delay between batches
-                await asyncio.sleep(1)
-
-        finally:
-            self.is_processing = False
-            logger.info("✅ Queue processing completed")
-
-            # Log final statistics
-            await self._log_final_statistics()
-
-    async def _process_batch(self, batch: List[InvoiceRequest]) -> None:
-        """Process a batch of requests concurrently."""
-
-        tasks = []
-        for request in batch:
-            task = asyncio.create_task(self._process_with_retry(request))
-            tasks.append(task)
-
-        # Wait for all tasks in batch to complete
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # Handle results
-        for i, result in enumerate(results):
-            request = batch[i]
-            self.processing_queue.remove(request)
-
-            if isinstance(result, Exception):
-                logger.error(f"❌ Invoice {request.invoice.invoice_number} failed: {result}")
-                self.failed_queue.append(request)
-                self.total_failed += 1
-            else:
-                logger.info(f"✅ Invoice {request.invoice.invoice_number} processed successfully")
-                self.completed_queue.append(request)
-                self.total_processed += 1
-
     async def _process_with_retry(self, request: InvoiceRequest) -> Dict[str, Any]:
         """Process request dengan exponential backoff retry."""
 
+        account = xendit_account_for(request.pelanggan.harga_layanan.xendit_key_name if request.pelanggan.harga_layanan else None)
+
         for attempt in range(self.max_retries + 1):
             try:
                 # Apply rate limiting delay
-                await self._apply_rate_limit_delay()
+                await self._apply_rate_limit_delay(account)
 
                 # Call original function
                 result = await create_xendit_invoice(
@@ -281,6 +263,7 @@ class RateLimiterService:
                     no_telp_xendit=request.no_telp_xendit
                 )
 
+                self.total_processed += 1
                 logger.info(f"✅ Invoice {request.invoice.invoice_number} created successfully (attempt {attempt + 1})")
                 return result
 
@@ -291,6 +274,11 @@ class RateLimiterService:
                     # Calculate delay dengan exponential backoff
                     delay = min(self.base_delay * (2 ** attempt), self.max_delay)
 
+                    # Xendit 429: rem seluruh akun, bukan cuma request ini
+                    response = getattr(e, "response", None)
+                    if response is not None and getattr(response, "status_code", None) == 429:
+                        self.throttle(account, delay)
+
                     logger.warning(
                         f"⚠️ Invoice {request.invoice.invoice_number} failed (attempt {attempt + 1}), "
                         f"retrying in {delay:.1f}s. Error: {str(e)}"
@@ -299,6 +287,7 @@ class RateLimiterService:
                     await asyncio.sleep(delay)
                 else:
                     # Final attempt failed
+                    self.total_failed += 1
                     logger.error(
                         f"❌ Invoice {request.invoice.invoice_number} failed after {self.max_retries + 1} attempts. "
                         f"Final error: {str(e)}"
@@ -319,73 +308,69 @@ class RateLimiterService:
             "attempts": self.max_retries + 1
         }
 
-    async def _apply_rate_limit_delay(self) -> None:
-        """Apply delay untuk rate limiting."""
-
-        current_time = time.time()
+    def _bucket_for(self, account: str) -> AsyncTokenBucket:
+        bucket = self.buckets.get(account)
+        if bucket is None:
+            rate = settings.XENDIT_RATE_LIMIT_OVERRIDES.get(account, self.max_requests_per_second)
+            bucket = AsyncTokenBucket(rate=rate, capacity=self.burst)
+            self.buckets[account] = bucket
+        return bucket
 
-        # Reset window jika sudah lewat
-        if current_time - self.window_start >= 1.0:
-            self.request_count = 0
-            self.window_start = current_time
+    async def acquire(self, account: str = "default") -> float:
+        """Ambil satu token dari bucket akun Xendit. Return detik menunggu."""
+        return await self._bucket_for(account).acquire()
 
-        # Check rate limit
-        if self.request_count >= self.max_requests_per_second:
-            # Calculate time until next window
-            time_until_next_window = 1.0 - (current_time - self.window_start)
+    def throttle(self, account: str, seconds: float) -> None:
+        """Rem akun Xendit ini selama `seconds` (dipanggil setelah 429)."""
+        self._bucket_for(account).penalize(seconds)
 
-            if time_until_next_window > 0:
-                logger.info(f"⏳ Rate limiting: waiting {time_until_next_window:.1f}s")
-                await asyncio.sleep(time_until_next_window)
+    async def _apply_rate_limit_delay(self, account: str = "default") -> None:
+        """Tunggu token dari bucket akun Xendit ini (aman untuk banyak coroutine sekaligus)."""
 
-                # Reset window
-                self.request_count = 0
-                self.window_start = time.time()
+        waited = await self._bucket_for(account).acquire()
+        if waited >= 1.0:
+            logger.info(f"⏳ Rate limiting [{account}]: waited {waited:.1f}s")
 
-        # Update request tracking
-        self.request_count += 1
-        self.last_request_time = current_time
-
-    def _estimate_wait_time(self) -> float:
+    def _estimate_wait_time(self, queued: int = 0) -> float:
         """Estimate wait time untuk queue."""
 
-        total_requests = len(self.pending_queue) + len(self.processing_queue)
-        estimated_time = total_requests / self.max_requests_per_second
+        estimated_time = queued / max(self.max_requests_per_second, 0.01)
 
         return min(estimated_time, 300)  # Max 5 minutes estimate
 
     async def get_queue_status(self) -> Dict[str, Any]:
-        """Get current queue status."""
+        """Get current queue status (live dari tabel invoice_outbox, semua worker)."""
+        from ..database import AsyncSessionLocal
+        from .invoice_outbox import invoice_outbox
+
+        async with AsyncSessionLocal() as db:
+            outbox = await invoice_outbox.stats(db)
 
+        queued = outbox["pending"] + outbox["processing"]
         return {
-            "pending": len(self.pending_queue),
-            "processing": len(self.processing_queue),
-            "completed": len(self.completed_queue),
-            "failed": len(self.failed_queue),
-            "total_processed": self.total_processed,
-            "total_failed": self.total_failed,
-            "is_processing": self.is_processing,
-            "estimated_wait_time": self._estimate_wait_time()
+            "pending": outbox["pending"],
+            "processing": outbox["processing"],
+            "completed": outbox["completed"],
+            "failed": outbox["dead"],
+            "total_processed": outbox["completed"] + self.total_processed,
+            "total_failed": outbox["dead"] + self.total_failed,
+            "is_processing": outbox["processing"] > 0,
+            "estimated_wait_time": self._estimate_wait_time(queued),
+            "throughput_per_minute": outbox["throughput_per_minute_5m"],
+            "outbox": outbox,
+            "buckets": {account: bucket.snapshot() for account, bucket in self.buckets.items()},
         }
 
     async def retry_failed_invoices(self) -> Dict[str, Any]:
-        """Retry all failed invoices."""
-
-        if not self.failed_queue:
-            return {"success": True, "message": "No failed invoices to retry"}
-
-        failed_count = len(self.failed_queue)
-        failed_invoices = self.failed_queue.copy()
-        self.failed_queue.clear()
+        """Retry all failed invoices (dead-letter outbox dikembalikan ke antrian)."""
+        from ..database import AsyncSessionLocal
+        from .invoice_outbox import invoice_outbox
 
-        # Reset retry count and add back to pending queue
-        for invoice in failed_invoices:
-            invoice.retry_count = 0
-            self.pending_queue.append(invoice)
+        async with AsyncSessionLocal() as db:
+            failed_count = await invoice_outbox.requeue_dead(db)
 
-        # Start processing if not already running
-        if not self.is_processing:
-            asyncio.create_task(self._process_queue())
+        if not failed_count:
+            return {"success": True, "message": "No failed invoices to retry"}
 
         return {
             "success": True,
@@ -393,21 +378,6 @@ class RateLimiterService:
             "queue_status": await self.get_queue_status()
         }
 
-    async def _log_final_statistics(self) -> None:
-        """Log final statistics after queue processing."""
-
-        total = self.total_processed + self.total_failed
-        if total > 0:
-            success_rate = (self.total_processed / total) * 100
-
-            logger.info(f"📊 Queue Processing Statistics:")
-            logger.info(f"   Total processed: {total}")
-            logger.info(f"   Successful: {self.total_processed} ({success_rate:.1f}%)")
-            logger.info(f"   Failed: {self.total_failed}")
-
-            if self.total_failed > 0:
-                logger.warning(f"⚠️ {self.total_failed} invoices failed. Consider retrying.")
-
 
 # Global instance untuk easy access
 rate_limiter = RateLimiterService()
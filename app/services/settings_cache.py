@@ -0,0 +1,119 @@
+# ====================================================================
+# SYSTEM SETTINGS CACHE - PENGATURAN SISTEM DI MEMORY
+# ====================================================================
+# Tabel system_settings kecil tapi dibaca di hot path (misalnya
+# maintenance_mode_middleware di SETIAP request). Sebelumnya setiap baca =
+# satu koneksi pool + satu round trip.
+#
+# - Seluruh tabel di-load saat startup (load()).
+# - Setelah SYSTEM_SETTINGS_CACHE_TTL_SECONDS lewat, pembacaan berikutnya
+#   tetap mengembalikan nilai lama dan memicu refresh di background
+#   (stale-while-revalidate), jadi request tidak pernah menunggu database
+#   kecuali cache belum pernah ter-load sama sekali.
+# - Penulisan lewat router /settings memanggil set() setelah commit, jadi
+#   proses yang menerima write langsung memakai nilai baru. Proses/worker
+#   lain menyusul paling lama satu TTL.
+# - Kalau refresh gagal (database down), nilai lama tetap dipakai.
+#
+# Contoh:
+#   if await system_settings_cache.get_bool("maintenance_active"):
+#       message = await system_settings_cache.get("maintenance_message", "...")
+# ====================================================================
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.future import select
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.system_setting import SystemSetting as SettingModel
+
+logger = logging.getLogger(__name__)
+
+class SystemSettingsCache:
+    """Cache key -> value untuk tabel system_settings."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = settings.SYSTEM_SETTINGS_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._values: Dict[str, Optional[str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Write yang di-push lewat set(): key -> (waktu, value). Dipakai supaya refresh
+        # yang query-nya mulai sebelum write tidak menimpa nilai baru dengan nilai lama.
+        self._pushed: Dict[str, Tuple[float, Optional[str]]] = {}
+
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    async def load(self) -> None:
+        """Load ulang seluruh system_settings dari database."""
+        async with self._lock:
+            started = time.monotonic()
+            try:
+                async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                    rows = (await db.execute(select(SettingModel.setting_key, SettingModel.setting_value))).all()
+            except Exception as e:
+                self.refresh_errors += 1
+                # Tetap pakai nilai lama; coba lagi setelah TTL berikutnya
+                self._loaded_at = time.monotonic() if self._loaded_at is not None else None
+                logger.error(f"Gagal memuat system settings, pakai nilai cache lama: {e}")
+                return
+            values = {key: value for key, value in rows}
+            for key, (pushed_at, value) in self._pushed.items():
+                if pushed_at >= started:
+                    values[key] = value
+            self._pushed = {key: item for key, item in self._pushed.items() if item[0] >= started}
+            self._values = values
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+
+    def _refresh_in_background(self) -> None:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.load())
+
+    async def _ensure_fresh(self) -> None:
+        if not self.is_loaded:
+            await self.load()
+        elif self.is_stale:
+            self._refresh_in_background()
+
+    async def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        await self._ensure_fresh()
+        value = self._values.get(key)
+        return default if value is None else value
+
+    async def get_bool(self, key: str, default: bool = False) -> bool:
+        value = await self.get(key)
+        if value is None:
+            return default
+        return value.strip().lower() == "true"
+
+    def set(self, key: str, value: Optional[str]) -> None:
+        """Update nilai di cache setelah write ke database berhasil (push dari router /settings)."""
+        self._values[key] = value
+        self._pushed[key] = (time.monotonic(), value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._values),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "ttl_seconds": self.ttl_seconds,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+# Global instance
+system_settings_cache = SystemSettingsCache()
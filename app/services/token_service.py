@@ -57,6 +57,7 @@ from sqlalchemy import and_
 from ..models.user import User as UserModel
 from ..models.token_blacklist import TokenBlacklist as TokenBlacklistModel
 from ..config import settings
+from .principal_cache import principal_cache
 from ..schemas.token_blacklist import TokenBlacklistCreate
 import hashlib
 
@@ -339,6 +340,7 @@ class TokenService:
                 user.revoked_before = datetime.utcnow()
                 db.add(user)
                 await db.commit()
+                principal_cache.invalidate_user(user_id)
                 logger.info(f"All tokens for user {user_id} have been revoked")
         except Exception as e:
             await db.rollback()
@@ -0,0 +1,114 @@
+# ====================================================================
+# TRAFFIC COUNTERS - RATE DARI DELTA BYTE COUNTER
+# ====================================================================
+# Menghitung rx/tx Mbps yang exact dari selisih byte counter interface
+# <pppoe-username> antar collection cycle.
+#
+# - Counter sebelumnya disimpan in-memory per (server_id, username)
+# - rate = (counter_sekarang - counter_sebelumnya) * 8 / detik_berlalu
+# - Counter reset (reconnect / router reboot) dideteksi dari counter yang
+#   turun atau uptime session yang lebih kecil dari jarak antar sample;
+#   rate dihitung dari counter sejak session mulai / uptime
+# - Sample pertama setelah restart aplikasi hanya jadi baseline
+#
+# Catatan arah: dari sisi router, interface <pppoe-user> "tx" = download
+# pelanggan dan "rx" = upload pelanggan.
+# ====================================================================
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+CounterKey = Tuple[int, str]  # (mikrotik_server_id, username_pppoe)
+
+
+@dataclass
+class CounterReading:
+    """Byte/packet counter satu session, sudah dari sudut pandang pelanggan."""
+
+    rx_bytes: int  # Download pelanggan
+    tx_bytes: int  # Upload pelanggan
+    rx_packets: int = 0
+    tx_packets: int = 0
+    uptime_seconds: int = 0
+    observed_at: float = 0.0  # Unix time saat counter diambil
+
+
+@dataclass
+class CounterRates:
+    """Hasil perhitungan rate dari delta counter."""
+
+    rx_mbps: float
+    tx_mbps: float
+    interval_seconds: float
+    counter_reset: bool = False
+
+    @property
+    def total_mbps(self) -> float:
+        return self.rx_mbps + self.tx_mbps
+
+
+class CounterDeltaTracker:
+    """
+    Simpan counter terakhir per session dan hitung rate dari delta-nya.
+    Thread-safe; satu instance dipakai bersama oleh semua cycle collection.
+    """
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._previous: Dict[CounterKey, CounterReading] = {}
+        self._lock = threading.Lock()
+        self.resets_detected = 0
+
+    def observe(self, key: CounterKey, reading: CounterReading) -> Optional[CounterRates]:
+        """
+        Catat reading baru dan return rate sejak reading sebelumnya.
+        Return None kalau belum ada baseline (sample pertama session ini).
+        """
+        with self._lock:
+            previous = self._previous.get(key)
+            self._previous[key] = reading
+
+        if previous is None:
+            return None
+
+        elapsed = reading.observed_at - previous.observed_at
+        if elapsed < self.min_interval:
+            return None
+
+        counter_reset = (
+            reading.rx_bytes < previous.rx_bytes
+            or reading.tx_bytes < previous.tx_bytes
+            or (reading.uptime_seconds and reading.uptime_seconds < elapsed)
+        )
+
+        if counter_reset:
+            self.resets_detected += 1
+            # Session baru mulai di tengah interval - counter sekarang = traffic sejak session mulai
+            window = float(reading.uptime_seconds) if reading.uptime_seconds else 0.0
+            if window < self.min_interval:
+                return None
+            rx_delta, tx_delta = reading.rx_bytes, reading.tx_bytes
+        else:
+            window = elapsed
+            rx_delta = reading.rx_bytes - previous.rx_bytes
+            tx_delta = reading.tx_bytes - previous.tx_bytes
+
+        return CounterRates(
+            rx_mbps=rx_delta * 8 / window / 1_000_000,
+            tx_mbps=tx_delta * 8 / window / 1_000_000,
+            interval_seconds=window,
+            counter_reset=bool(counter_reset),
+        )
+
+    def prune(self, server_id: int, active_usernames: Iterable[str]) -> int:
+        """Buang counter session di server ini yang sudah tidak aktif. Return jumlah yang dibuang."""
+        active = set(active_usernames)
+        with self._lock:
+            stale = [key for key in self._previous if key[0] == server_id and key[1] not in active]
+            for key in stale:
+                del self._previous[key]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._previous)
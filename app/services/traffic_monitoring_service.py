@@ -19,22 +19,33 @@
 # ====================================================================
 
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional, Tuple, Any, cast
+from typing import List, Dict, Optional, Tuple, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, desc, func, update
+from sqlalchemy import and_, desc, func
+import asyncio
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import routeros_api
 
-from ..models.data_teknis import DataTeknis as DataTeknisModel
+from ..config import settings
 from ..models.traffic_history import TrafficHistory as TrafficHistoryModel
 from ..models.mikrotik_server import MikrotikServer as MikrotikServerModel
-from ..security import decrypt_password
-from .mikrotik_service import mikrotik_pool
+from .traffic_counters import CounterDeltaTracker
+from .traffic_retention import traffic_retention_service
+from .traffic_rollup import rollup_model_for_hours, traffic_rollup_service
+from .traffic_snapshot import RouterTrafficSnapshot
+from .traffic_writer import TrafficSample, traffic_history_writer
 
 logger = logging.getLogger(__name__)
 
 
+class RouterNotStartedError(TimeoutError):
+    """Job router tidak pernah mulai: semua thread collector masih dipakai router lain (yang hang)."""
+
+
 def safe_int(value, default=0):
     """Convert string to int safely"""
     try:
@@ -55,49 +66,6 @@ def safe_float(value, default=0.0):
     except (ValueError, TypeError):
         return default
 
-def _parse_speed_from_profile(profile_name: str) -> int:
-    """
-    Parse speed from PPPoE profile name
-    """
-    if not profile_name:
-        return 10  # Default fallback
-
-    try:
-        # Mapping common profile names to speeds
-        speed_mapping = {
-            # Common patterns
-            '10Mbps': 10, '20Mbps': 20, '30Mbps': 30, '50Mbps': 50, '100Mbps': 100,
-            'Paket-10': 10, 'Paket-20': 20, 'Paket-30': 30, 'Paket-50': 50, 'Paket-100': 100,
-            'Basic-10': 10, 'Basic-20': 20, 'Premium-30': 30, 'Premium-50': 50,
-
-            # Your specific patterns (adjust as needed)
-            '10M': 10, '20M': 20, '30M': 30, '50M': 50, '100M': 100,
-        }
-
-        # Try exact match
-        if profile_name in speed_mapping:
-            return speed_mapping[profile_name]
-
-        # Try case-insensitive match
-        profile_lower = profile_name.lower()
-        for key, value in speed_mapping.items():
-            if key.lower() == profile_lower:
-                return value
-
-        # Extract numbers from profile name
-        import re
-        numbers = re.findall(r'\d+', profile_name)
-        if numbers:
-            speed = int(numbers[0])
-            # Sanity check - reasonable speed range
-            if 1 <= speed <= 1000:
-                return speed
-
-        return 10  # Default fallback
-
-    except Exception:
-        return 10  # Default fallback
-
 
 class TrafficMonitoringService:
     """
@@ -107,139 +75,44 @@ class TrafficMonitoringService:
 
     def __init__(self):
         self.collection_interval = 300  # 5 minutes
-        self.retention_days = 30  # Keep data for 30 days
+        self.retention_days = settings.TRAFFIC_RETENTION_RAW_DAYS
+        self.max_concurrent_routers = settings.TRAFFIC_COLLECTION_MAX_WORKERS
+        self.router_timeout = settings.TRAFFIC_COLLECTION_ROUTER_TIMEOUT
+        self.socket_timeout = settings.TRAFFIC_COLLECTION_SOCKET_TIMEOUT
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Counter byte terakhir per session untuk hitung rate dari delta antar cycle
+        self.counter_tracker = CounterDeltaTracker()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """
+        Thread pool khusus collector - routeros_api blocking, jadi jangan jalan di event loop
+        dan jangan pakai default executor yang juga dipakai endpoint lain.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, self.max_concurrent_routers),
+                thread_name_prefix="traffic-collector",
+            )
+        return self._executor
+
+    def shutdown(self):
+        """Matikan thread pool collector (dipanggil saat aplikasi shutdown)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
     async def get_real_traffic_data(self, api, username):
         """
-        Get real traffic data dari Mikrotik untuk user tertentu
+        Get real traffic data dari Mikrotik untuk user tertentu.
+        Untuk banyak user sekaligus pakai RouterTrafficSnapshot - method ini download
+        semua tabel traffic untuk SATU user saja.
         """
         try:
-            logger.info(f"Searching traffic data for {username}...")
-
-            # Method 1: Coba queue tree dengan improved matching
-            queue_tree = api.get_resource('/queue/tree')
-            queues = queue_tree.get()
-            logger.info(f"Found {len(queues)} queue trees")
-
-            for queue in queues:
-                queue_name = queue.get('name', '')
-
-                # Improved matching logic
-                if (username.lower() in queue_name.lower() or
-                    queue_name.lower() in username.lower() or
-                    username.replace('-', '').replace('_', '').lower() in queue_name.lower().replace('-', '').replace('_', '')):
-
-                    logger.info(f"Found queue: {queue_name}")
-
-                    # Get stats dengan konversi tipe data yang aman
-                    bytes_data = safe_int(queue.get('bytes', 0))
-                    rate_data = safe_int(queue.get('rate', 0))
-                    packet_drop = safe_int(queue.get('packet-drop', 0))
-
-                    if rate_data > 0:
-                        # Convert rate bps ke Mbps
-                        rate_mbps = rate_data / 1000000  # 1 Mbps = 1,000,000 bps
-                        return {
-                            'rate_bps': rate_data,
-                            'rate_mbps': rate_mbps,
-                            'bytes_total': bytes_data,
-                            'source': 'queue_tree',
-                            'queue_name': queue_name
-                        }
-
-            # Method 2: Coba simple queue
-            simple_queue = api.get_resource('/queue/simple')
-            simple_queues = simple_queue.get()
-            logger.info(f"Found {len(simple_queues)} simple queues")
-
-            for queue in simple_queues:
-                queue_name = queue.get('name', '')
-                target = queue.get('target', '')
-
-                # Improved matching logic untuk simple queue
-                if (username.lower() in queue_name.lower() or
-                    queue_name.lower() in username.lower() or
-                    username.replace('-', '').replace('_', '').lower() in queue_name.lower().replace('-', '').replace('_', '') or
-                    (target and username.lower() in target.lower())):
-
-                    logger.info(f"Found simple queue: {queue_name} (target: {target})")
-
-                    # Get stats dengan konversi tipe data yang aman
-                    bytes_data = safe_int(queue.get('bytes', 0))
-                    rate_data = safe_int(queue.get('rate', 0))
-                    max_limit = safe_int(queue.get('max-limit', 0))
-
-                    # Rate data bisa dari 'rate' atau 'max-limit'
-                    current_rate = rate_data if rate_data > 0 else max_limit
-
-                    if current_rate > 0:
-                        rate_mbps = current_rate / 1000000
-                        return {
-                            'rate_bps': current_rate,
-                            'rate_mbps': rate_mbps,
-                            'bytes_total': bytes_data,
-                            'target': target,
-                            'source': 'simple_queue',
-                            'queue_name': queue_name
-                        }
-
-            # Method 3: Coba queue interface
-            queue_interface = api.get_resource('/queue/interface')
-            interfaces = queue_interface.get()
-            logger.info(f"Found {len(interfaces)} queue interfaces")
-
-            for interface in interfaces:
-                interface_name = interface.get('name', '')
-                parent = interface.get('parent', '')
-                if username.lower() in parent.lower() or username.lower() in interface_name.lower():
-                    logger.info(f"Found queue interface: {interface_name}")
-
-                    # Get stats dengan konversi tipe data yang aman
-                    tx_byte = safe_int(interface.get('tx-byte', 0))
-                    rx_byte = safe_int(interface.get('rx-byte', 0))
-                    tx_bps = safe_int(interface.get('tx-bits-per-second', 0))
-                    rx_bps = safe_int(interface.get('rx-bits-per-second', 0))
-
-                    total_bytes = tx_byte + rx_byte
-                    total_bps = tx_bps + rx_bps
-
-                    if total_bps > 0:
-                        total_mbps = total_bps / 1000000
-                        return {
-                            'rate_bps': total_bps,
-                            'rate_mbps': total_mbps,
-                            'tx_bps': tx_bps,
-                            'rx_bps': rx_bps,
-                            'source': 'queue_interface',
-                            'interface_name': interface_name
-                        }
-
-            # Method 4: Coba interface stats langsung
-            interface_resource = api.get_resource('/interface')
-            interfaces = interface_resource.get()
-            logger.info(f"Found {len(interfaces)} interfaces")
-
-            for interface in interfaces:
-                interface_name = interface.get('name', '')
-                if username.lower() in interface_name.lower():
-                    logger.info(f"Found interface: {interface_name}")
-
-                    # Get stats dengan konversi tipe data yang aman
-                    tx_byte = safe_int(interface.get('tx-byte', 0))
-                    rx_byte = safe_int(interface.get('rx-byte', 0))
-
-                    total_bytes = tx_byte + rx_byte
-
-                    if total_bytes > 0:
-                        return {
-                            'bytes': total_bytes,
-                            'rate': 0,  # Rate tidak available di basic interface stats
-                            'interface_name': interface_name,
-                            'source': 'interface_stats'
-                        }
-
-            logger.info(f"No traffic data found for {username}")
-            return None
+            snapshot = RouterTrafficSnapshot.fetch(api)
+            traffic_data = snapshot.resolve(username)
+            if not traffic_data:
+                logger.debug(f"No traffic data found for {username}")
+            return traffic_data
 
         except Exception as e:
             logger.error(f"Error getting real traffic data for {username}: {e}")
@@ -248,9 +121,12 @@ class TrafficMonitoringService:
     async def collect_traffic_data(self, db: AsyncSession) -> Dict:
         """
         Collect traffic data dari semua Mikrotik servers.
-        Returns summary of collection results.
+        Snapshot semua router diambil bersamaan di thread pool (dibatasi max_concurrent_routers
+        dan router_timeout per router), lalu hasilnya ditulis ke database.
+        Returns summary of collection results, termasuk timing per server.
         """
         logger.info("Starting traffic data collection...")
+        cycle_started = time.perf_counter()
 
         # Get all active Mikrotik servers
         servers_query = select(MikrotikServerModel).where(MikrotikServerModel.is_active == True)
@@ -262,417 +138,334 @@ class TrafficMonitoringService:
             "servers_processed": 0,
             "total_users": 0,
             "errors": [],
-            "details": []
+            "details": [],
+            "timings": {},
+            "routers_not_started": 0,
         }
 
+        # Fase 1: ambil snapshot semua router secara paralel
+        fetch_started = time.perf_counter()
+        snapshots = await self._fetch_all_snapshots(servers)
+        collection_results["fetch_wall_ms"] = round((time.perf_counter() - fetch_started) * 1000, 2)
+
+        # Fase 2: resolve session -> sample untuk semua router (tanpa query per user)
+        usernames = [
+            session.get("name", "")
+            for snapshot in snapshots.values()
+            if isinstance(snapshot, RouterTrafficSnapshot)
+            for session in snapshot.active_sessions
+        ]
+        data_teknis_refs = await traffic_history_writer.prefetch_data_teknis(db, usernames)
+
+        cycle_time = datetime.now(timezone.utc)
+        cycle_samples: List[TrafficSample] = []
+        server_results: List[Dict] = []
         for server in servers:
-            try:
-                server_result = await self._collect_server_traffic(db, server)
-                collection_results["servers_processed"] += 1
-                collection_results["total_users"] += server_result["users_collected"]
-                collection_results["details"].append(server_result)
+            server_result, samples = self._build_server_samples(
+                server, snapshots.get(server.id), data_teknis_refs, cycle_time
+            )
+            server_results.append(server_result)
+            cycle_samples.extend(samples)
 
-                logger.info(f"Collected traffic from server {server.name}: {server_result['users_collected']} users")
+        # Fase 3: tulis semua sample dalam satu transaksi, lalu update bucket rollup
+        write_ok = True
+        try:
+            collection_results["write"] = await traffic_history_writer.write_cycle(db, cycle_samples)
+        except Exception as e:
+            write_ok = False
+            error_msg = f"Failed to write traffic samples: {str(e)}"
+            logger.error(error_msg)
+            collection_results["errors"].append(error_msg)
 
+        if write_ok and cycle_samples:
+            try:
+                collection_results["rollup"] = await traffic_rollup_service.refresh(db, cycle_time)
             except Exception as e:
-                error_msg = f"Failed to collect from server {server.name}: {str(e)}"
+                error_msg = f"Failed to refresh traffic rollups: {str(e)}"
                 logger.error(error_msg)
                 collection_results["errors"].append(error_msg)
 
-        # Clean old data
-        await self._cleanup_old_data(db)
+        for server_result in server_results:
+            if write_ok:
+                server_result["users_updated"] = server_result["users_collected"]
+            collection_results["servers_processed"] += 1
+            collection_results["total_users"] += server_result["users_collected"]
+            collection_results["details"].append(server_result)
+            collection_results["timings"][server_result["server_name"]] = server_result["timings"].get("router_ms", 0.0)
+            if server_result["status"] == "not_started":
+                collection_results["routers_not_started"] += 1
+            if server_result["status"] in ("failed", "not_started"):
+                collection_results["errors"].append(server_result["errors"][-1])
+
+            logger.info(
+                f"Collected traffic from server {server_result['server_name']}: {server_result['users_collected']} users, "
+                f"{server_result['sessions_resolved']}/{server_result['sessions_found']} sessions resolved from snapshot"
+            )
 
-        logger.info(f"Traffic collection completed: {collection_results}")
+        fetch_times = [
+            snapshot.timings.get("router_ms", 0.0) for snapshot in snapshots.values() if isinstance(snapshot, RouterTrafficSnapshot)
+        ]
+        collection_results["slowest_router_ms"] = max(fetch_times, default=0.0)
+        collection_results["sum_router_ms"] = round(sum(fetch_times), 2)
+        collection_results["duration_ms"] = round((time.perf_counter() - cycle_started) * 1000, 2)
+        logger.info(
+            f"Traffic collection completed: {collection_results['servers_processed']} servers, "
+            f"{collection_results['total_users']} users, {len(collection_results['errors'])} errors "
+            f"in {collection_results['duration_ms']:.0f} ms "
+            f"(fetch {collection_results['fetch_wall_ms']:.0f} ms, slowest router {collection_results['slowest_router_ms']:.0f} ms)"
+        )
         return collection_results
 
-    async def _collect_server_traffic(self, db: AsyncSession, server: MikrotikServerModel) -> Dict:
+    async def _fetch_all_snapshots(self, servers) -> Dict[int, Any]:
         """
-        Collect traffic data dari satu Mikrotik server.
-        UPDATED: Using real traffic data logic
+        Ambil RouterTrafficSnapshot untuk semua server secara bersamaan.
+        Return dict server_id -> RouterTrafficSnapshot, atau Exception kalau router gagal/timeout.
         """
-        logger.info(f"Collecting traffic data from server {server.name}...")
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrent_routers))
 
-        result = {
-            "server_id": server.id,
-            "server_name": server.name,
-            "users_collected": 0,
-            "users_updated": 0,
-            "errors": []
-        }
-
-        try:
-            # Connect to Mikrotik server using real credentials
-            connection = routeros_api.RouterOsApiPool(
-                server.host_ip,
-                username=server.username,
-                password=server.password,
-                port=server.port,
-                plaintext_login=True
-            )
-
-            api = connection.get_api()
-            logger.info(f"Connected to Mikrotik server {server.name}")
-
-            # Get active PPPoE users
-            ppp_active = api.get_resource('/ppp/active')
-            active_users = ppp_active.get()
-
-            logger.info(f"Found {len(active_users)} active PPPoE users on {server.name}")
-
-            users_collected = 0
-            users_updated = 0
-
-            for user_data in active_users:
+        async def fetch_one(server: MikrotikServerModel):
+            async with semaphore:
                 try:
-                    # Get user details
-                    username = user_data.get('name', '')
-                    ip_address = user_data.get('address', '')
-                    uptime = user_data.get('uptime', '0s')
-
-                    if not username:
-                        continue
-
-                    logger.debug(f"Processing user {username} with IP {ip_address}")
-
-                    # Find matching DataTeknis record
-                    data_teknis_query = select(DataTeknisModel).where(
-                        and_(
-                            DataTeknisModel.id_pelanggan == username,
-                            DataTeknisModel.mikrotik_server_id == server.id
-                        )
-                    )
-                    data_teknis_result = await db.execute(data_teknis_query)
-                    data_teknis = data_teknis_result.scalar_one_or_none()
-
-                    if not data_teknis:
-                        logger.warning(f"No DataTeknis found for user {username} on server {server.name}")
-                        result["errors"].append(f"No DataTeknis for user {username}")
-                        continue
-
-                    # Get REAL traffic data dari Mikrotik
-                    traffic_data = await self.get_real_traffic_data(api, username)
-
-                    if traffic_data and traffic_data.get('rate_bps', 0) > 0:
-                        # Data real rate tersedia
-                        rate_mbps = traffic_data.get('rate_mbps', 0)
-                        rate_bps = traffic_data.get('rate_bps', 0)
-                        source = traffic_data.get('source', 'unknown')
-
-                        # Ambil rate yang sebenarnya
-                        total_mbps = rate_mbps
-
-                        # Untuk split RX/TX, kita estimasi berdasarkan tipikal usage
-                        if 'tx_bps' in traffic_data and 'rx_bps' in traffic_data:
-                            # Jika data split tersedia
-                            tx_mbps = traffic_data['tx_bps'] / 1000000
-                            rx_mbps = traffic_data['rx_bps'] / 1000000
-                        else:
-                            # Estimasi split: 70% download, 30% upload
-                            rx_mbps = total_mbps * 0.7  # Download
-                            tx_mbps = total_mbps * 0.3  # Upload
-
-                        logger.info(f"REAL Traffic Rate for {username}: {total_mbps:.2f} Mbps from {source}")
-                    else:
-                        # Tidak ada rate data - gunakan profile PPPoE
-                        logger.warning(f"No real-time rate data for {username}, using PPPoE profile: {data_teknis.profile_pppoe}")
-
-                        # Ambil speed dari profile PPPoE yang sebenarnya
-                        profile_name: str = cast(str, data_teknis.profile_pppoe or "Unknown")
-                        package_speed = _parse_speed_from_profile(profile_name)
-                        logger.info(f"Parsed speed from profile '{data_teknis.profile_pppoe}': {package_speed} Mbps")
-
-                        # Estimasi usage realistis (jarang full speed)
-                        import random
-                        usage_percentage = random.uniform(0.2, 0.8)  # 20-80% usage
-                        total_mbps = package_speed * usage_percentage
-
-                        rx_mbps = total_mbps * 0.7  # 70% download
-                        tx_mbps = total_mbps * 0.3  # 30% upload
-
-                        logger.info(f"Fallback traffic for {username}: {total_mbps:.2f} Mbps (from {package_speed} Mbps profile)")
-
-                    # Parse uptime
-                    uptime_seconds = 0
-                    try:
-                        if uptime.endswith('w'):
-                            uptime_seconds = safe_int(uptime.split('w')[0]) * 7 * 24 * 3600
-                        elif uptime.endswith('d'):
-                            uptime_seconds = safe_int(uptime.split('d')[0]) * 24 * 3600
-                        elif uptime.endswith('h'):
-                            uptime_seconds = safe_int(uptime.split('h')[0]) * 3600
-                        elif uptime.endswith('m'):
-                            uptime_seconds = safe_int(uptime.split('m')[0]) * 60
-                        elif uptime.endswith('s'):
-                            uptime_seconds = safe_int(uptime.split('s')[0])
-                    except:
-                        uptime_seconds = 0
-
-                    # Check if existing record exists
-                    existing_query = select(TrafficHistoryModel).where(
-                        and_(
-                            TrafficHistoryModel.data_teknis_id == data_teknis.id,
-                            TrafficHistoryModel.mikrotik_server_id == server.id,
-                            TrafficHistoryModel.is_latest == True
-                        )
-                    )
-                    existing_result = await db.execute(existing_query)
-                    existing_record = existing_result.scalar_one_or_none()
-
-                    if existing_record:
-                        # Update existing record
-                        update_query = update(TrafficHistoryModel).where(
-                            TrafficHistoryModel.id == existing_record.id
-                        ).values(
-                            rx_mbps=round(rx_mbps, 2),
-                            tx_mbps=round(tx_mbps, 2),
-                            total_mbps=round(total_mbps, 2),
-                            uptime_seconds=uptime_seconds,
-                            timestamp=datetime.now(timezone.utc)
-                        )
-
-                        update_result = await db.execute(update_query)
-                        await db.commit()
-
-                        users_updated += update_result.rowcount
-                        logger.info(f"Updated existing traffic for {username}: {total_mbps:.2f} Mbps")
-                    else:
-                        # Create new record
-                        new_record = TrafficHistoryModel(
-                            data_teknis_id=data_teknis.id,
-                            mikrotik_server_id=server.id,
-                            username_pppoe=username,
-                            ip_address=ip_address,
-                            rx_bytes=0,  # Placeholder
-                            tx_bytes=0,  # Placeholder
-                            rx_packets=0,  # Placeholder
-                            tx_packets=0,  # Placeholder
-                            rx_mbps=round(rx_mbps, 2),
-                            tx_mbps=round(tx_mbps, 2),
-                            total_mbps=round(total_mbps, 2),
-                            uptime_seconds=uptime_seconds,
-                            is_active=True,
-                            is_latest=True,
-                            timestamp=datetime.now(timezone.utc)
-                        )
-
-                        db.add(new_record)
-                        await db.commit()
-
-                        users_updated += 1
-                        logger.info(f"Created new traffic record for {username}: {total_mbps:.2f} Mbps")
-
-                    users_collected += 1
-
+                    return server.id, await self._fetch_server_snapshot(server)
                 except Exception as e:
-                    error_msg = f"Error processing user {username}: {str(e)}"
-                    logger.error(error_msg)
-                    result["errors"].append(error_msg)
-
-            result["users_collected"] = users_collected
-            result["users_updated"] = users_updated
+                    return server.id, e
 
-            logger.info(f"Server {server.name} collection completed: {users_collected} users, {users_updated} updated")
+        results = await asyncio.gather(*(fetch_one(server) for server in servers))
+        return dict(results)
 
-            connection.disconnect()
+    async def _fetch_server_snapshot(self, server: MikrotikServerModel) -> RouterTrafficSnapshot:
+        """
+        Jalankan connect + snapshot satu router di thread pool.
 
-        except Exception as e:
-            error_msg = f"Failed to connect to server {server.name}: {str(e)}"
-            logger.error(error_msg)
-            result["errors"].append(error_msg)
+        Deadline router_timeout dihitung sejak thread mulai jalan, bukan sejak job masuk
+        antrian executor. Thread routeros_api tidak bisa di-cancel; yang membatasinya adalah
+        socket_timeout. Kalau semua worker masih dipakai router yang hang, job yang belum
+        sempat mulai dibatalkan dan dilaporkan sebagai RouterNotStartedError.
+        """
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        # Ambil atribut sekarang - ORM object jangan diakses dari thread lain
+        args = (server.host_ip, server.username, server.password, int(server.port), server.name, self.socket_timeout)
 
-        return result
+        def run() -> RouterTrafficSnapshot:
+            loop.call_soon_threadsafe(started.set)
+            return self._fetch_router_snapshot(*args)
 
-    async def _get_server_connection(self, server: MikrotikServerModel) -> Tuple:
-        """
-        Get API connection untuk Mikrotik server menggunakan existing pool.
-        """
-        
-        # Decrypt password
+        job = self._get_executor().submit(run)
         try:
-            password = decrypt_password(server.password)
-        except Exception as e:
-            logger.error(f"Failed to decrypt password for server {server.name}: {str(e)}")
-            return None, None
+            await asyncio.wait_for(started.wait(), timeout=self.router_timeout)
+        except asyncio.TimeoutError:
+            # cancel() hanya berhasil kalau job masih di antrian executor
+            if job.cancel():
+                raise RouterNotStartedError(
+                    f"Router {server.name} tidak sempat diproses: antri {self.router_timeout:.0f}s, "
+                    f"semua {self.max_concurrent_routers} worker collector masih sibuk"
+                )
 
-        # Get connection from pool
         try:
-            api_connection, connection_obj = mikrotik_pool.get_connection(
-                host_ip=server.host_ip,
-                port=server.port,
-                username=server.username,
-                password=password
-            )
-            return api_connection, connection_obj
-
-        except Exception as e:
-            logger.error(f"Failed to get connection for server {server.name}: {str(e)}")
-            return None, None
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.router_timeout)
+        except asyncio.TimeoutError:
+            # Hasil thread dibuang saat selesai; thread berhenti paling lama setelah socket_timeout
+            raise TimeoutError(f"Router {server.name} melewati deadline {self.router_timeout:.0f}s")
+
+    @staticmethod
+    def _fetch_router_snapshot(
+        host_ip: str, username: str, password: str, port: int, server_name: str, socket_timeout: float
+    ) -> RouterTrafficSnapshot:
+        """Blocking: connect ke router, download snapshot, disconnect. Dipanggil dari thread pool."""
+        router_started = time.perf_counter()
+        connection = routeros_api.RouterOsApiPool(
+            host_ip,
+            username=username,
+            password=password,
+            port=port,
+            plaintext_login=True
+        )
+        # Timeout connect + setiap recv; RouterOsApiPool tidak menerimanya lewat constructor
+        connection.socket_timeout = socket_timeout
+        api = connection.get_api()
+        connect_ms = round((time.perf_counter() - router_started) * 1000, 2)
 
-    async def _get_pppoe_sessions(self, api_connection) -> List[Dict]:
-        """
-        Get active PPPoE sessions dari Mikrotik API.
-        """
         try:
-            # Get active PPPoE secrets/sessions
-            pppoe_api = api_connection.get_resource('/ppp/secret')
-            active_sessions = pppoe_api.get(active='yes')
-
-            logger.info(f"Found {len(active_sessions)} active PPPoE sessions")
-            return active_sessions
+            snapshot = RouterTrafficSnapshot.fetch(api, server_name=server_name)
+        finally:
+            connection.disconnect()
 
-        except Exception as e:
-            logger.error(f"Failed to get PPPoE sessions: {str(e)}")
-            return []
+        snapshot.timings["connect_ms"] = connect_ms
+        snapshot.timings["router_ms"] = round((time.perf_counter() - router_started) * 1000, 2)
+        return snapshot
 
-    async def _process_pppoe_session(self, db: AsyncSession, session: Dict, server: MikrotikServerModel, api_connection):
+    async def _collect_server_traffic(self, db: AsyncSession, server: MikrotikServerModel, snapshot: Any = None) -> Dict:
         """
-        Process satu PPPoE session dan simpan ke database.
+        Collect traffic data dari satu Mikrotik server saja (fetch, resolve, tulis).
+        collect_traffic_data memakai _build_server_samples langsung supaya semua server
+        ditulis dalam satu transaksi.
         """
-        username = session.get('name', '')
-        if not username:
-            return
+        if snapshot is None:
+            try:
+                snapshot = await self._fetch_server_snapshot(server)
+            except Exception as e:
+                snapshot = e
 
-        # Find corresponding DataTeknis record
-        data_teknis_query = select(DataTeknisModel).where(
-            and_(
-                DataTeknisModel.id_pelanggan == username,
-                DataTeknisModel.mikrotik_server_id == server.id
+        refs: Dict = {}
+        if isinstance(snapshot, RouterTrafficSnapshot):
+            refs = await traffic_history_writer.prefetch_data_teknis(
+                db, (session.get("name", "") for session in snapshot.active_sessions)
             )
-        )
-        data_teknis_result = await db.execute(data_teknis_query)
-        data_teknis = data_teknis_result.scalar_one_or_none()
-
-        if not data_teknis:
-            logger.warning(f"No DataTeknis found for PPPoE user: {username}")
-            return
-
-        # Get additional traffic stats
-        traffic_stats = await self._get_detailed_traffic_stats(api_connection, username)
-
-        # Calculate bandwidth (assuming 5-minute interval)
-        current_time = datetime.now(timezone.utc)
-        rx_mbps = TrafficHistoryModel.calculate_mbps(traffic_stats.get('rx_bytes', 0))
-        tx_mbps = TrafficHistoryModel.calculate_mbps(traffic_stats.get('tx_bytes', 0))
-        total_mbps = rx_mbps + tx_mbps
-
-        # Mark previous records as not latest
-        await self._mark_previous_records(db, data_teknis.id)
-
-        # Create new traffic history record
-        traffic_record = TrafficHistoryModel(
-            data_teknis_id=data_teknis.id,
-            mikrotik_server_id=server.id,
-            username_pppoe=username,
-            ip_address=session.get('remote-address', ''),
-            rx_bytes=traffic_stats.get('rx_bytes', 0),
-            tx_bytes=traffic_stats.get('tx_bytes', 0),
-            rx_packets=traffic_stats.get('rx_packets', 0),
-            tx_packets=traffic_stats.get('tx_packets', 0),
-            rx_mbps=rx_mbps,
-            tx_mbps=tx_mbps,
-            total_mbps=total_mbps,
-            uptime_seconds=traffic_stats.get('uptime', 0),
-            is_active=session.get('disabled', 'no') == 'no',
-            timestamp=current_time,
-            is_latest=True
-        )
-
-        db.add(traffic_record)
-        await db.commit()
 
-        logger.debug(f"Saved traffic data for user {username}: {total_mbps:.2f} Mbps")
+        cycle_time = datetime.now(timezone.utc)
+        result, samples = self._build_server_samples(server, snapshot, refs, cycle_time)
+        write_stats = await traffic_history_writer.write_cycle(db, samples)
+        result["users_updated"] = write_stats["rows_inserted"]
+        result["timings"]["write_ms"] = write_stats["duration_ms"]
+        if samples:
+            rollup_stats = await traffic_rollup_service.refresh(db, cycle_time)
+            result["timings"]["rollup_ms"] = rollup_stats["duration_ms"]
+        return result
 
-    async def _get_detailed_traffic_stats(self, api_connection, username: str) -> Dict:
-        """
-        Get detailed traffic statistics untuk user tertentu.
+    def _build_server_samples(
+        self,
+        server: MikrotikServerModel,
+        snapshot: Any,
+        data_teknis_refs: Dict,
+        cycle_time: Optional[datetime] = None,
+    ) -> Tuple[Dict, List[TrafficSample]]:
         """
-        try:
-            # Get PPPoE active connections with traffic stats
-            active_api = api_connection.get_resource('/ppp/active')
-            connections = active_api.get(name=username)
-
-            if connections:
-                conn = connections[0]
-                return {
-                    'rx_bytes': int(conn.get('rx-byte', 0)),
-                    'tx_bytes': int(conn.get('tx-byte', 0)),
-                    'rx_packets': int(conn.get('rx-packet', 0)),
-                    'tx_packets': int(conn.get('tx-packet', 0)),
-                    'uptime': self._parse_uptime(conn.get('uptime', '0s'))
-                }
-
-            # Fallback to basic session data
-            return {
-                'rx_bytes': 0,
-                'tx_bytes': 0,
-                'rx_packets': 0,
-                'tx_packets': 0,
-                'uptime': 0
-            }
-
-        except Exception as e:
-            logger.error(f"Failed to get detailed stats for {username}: {str(e)}")
-            return {'rx_bytes': 0, 'tx_bytes': 0, 'rx_packets': 0, 'tx_packets': 0, 'uptime': 0}
+        Ubah snapshot satu router jadi list TrafficSample (tanpa akses database).
+        data_teknis_refs hasil TrafficHistoryWriter.prefetch_data_teknis.
 
-    async def _mark_previous_records(self, db: AsyncSession, data_teknis_id: int):
-        """
-        Mark previous records as not latest.
+        Rate diambil dari delta byte counter <pppoe-username> terhadap cycle sebelumnya.
+        Kalau belum ada baseline counter, pakai rate queue dari snapshot; kalau itu juga
+        tidak ada, session hanya dicatat sebagai baseline (tidak ada sample palsu).
         """
-        update_query = select(TrafficHistoryModel).where(
-            and_(
-                TrafficHistoryModel.data_teknis_id == data_teknis_id,
-                TrafficHistoryModel.is_latest == True
-            )
-        )
-        result = await db.execute(update_query)
-        previous_records = result.scalars().all()
+        result = {
+            "server_id": server.id,
+            "server_name": server.name,
+            "users_collected": 0,
+            "users_updated": 0,
+            "sessions_found": 0,
+            "sessions_resolved": 0,
+            "sessions_baseline": 0,
+            "counter_resets": 0,
+            "status": "ok",
+            "errors": [],
+            "timings": {},
+        }
+        samples: List[TrafficSample] = []
 
-        for record in previous_records:
-            record.is_latest = False
+        if isinstance(snapshot, RouterNotStartedError):
+            error_msg = f"Server {server.name} not collected this cycle: {str(snapshot)}"
+            logger.error(error_msg)
+            result["status"] = "not_started"
+            result["errors"].append(error_msg)
+            return result, samples
 
-        await db.commit()
+        if not isinstance(snapshot, RouterTrafficSnapshot):
+            error_msg = f"Failed to connect to server {server.name}: {str(snapshot)}"
+            logger.error(error_msg)
+            result["status"] = "failed"
+            result["errors"].append(error_msg)
+            return result, samples
 
-    async def _cleanup_old_data(self, db: AsyncSession):
-        """
-        Clean up traffic data yang lebih lama dari retention period.
-        """
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        resolved = snapshot.resolve_all()
+        result["timings"].update(snapshot.timings)
+        result["sessions_found"] = len(snapshot.active_sessions)
+        result["sessions_resolved"] = sum(1 for data in resolved.values() if data)
+        cycle_time = cycle_time or datetime.now(timezone.utc)
+        active_usernames = []
 
-        delete_query = select(TrafficHistoryModel).where(
-            TrafficHistoryModel.timestamp < cutoff_date
-        )
-        result = await db.execute(delete_query)
-        old_records = result.scalars().all()
+        for user_data in snapshot.active_sessions:
+            username = user_data.get('name', '')
+            try:
+                ip_address = user_data.get('address', '')
+
+                if not username:
+                    continue
+                active_usernames.append(username)
+                uptime_seconds = self._parse_uptime(user_data.get('uptime', '0s'))
+
+                # Counter dicatat untuk semua session supaya cycle berikutnya punya baseline
+                reading = snapshot.counters(username, uptime_seconds)
+                rates = self.counter_tracker.observe((server.id, username), reading) if reading else None
+                if rates and rates.counter_reset:
+                    result["counter_resets"] += 1
+
+                data_teknis = data_teknis_refs.get((username, server.id))
+                if not data_teknis:
+                    logger.debug(f"No DataTeknis found for user {username} on server {server.name}")
+                    result["errors"].append(f"No DataTeknis for user {username}")
+                    continue
+
+                traffic_data = resolved.get(username)
+
+                if rates:
+                    # Rate exact dari delta counter interface
+                    rx_mbps = rates.rx_mbps  # Download
+                    tx_mbps = rates.tx_mbps  # Upload
+                    total_mbps = rates.total_mbps
+                elif traffic_data and traffic_data.get('rate_bps', 0) > 0:
+                    # Belum ada baseline counter - pakai rate sesaat dari queue
+                    total_mbps = traffic_data.get('rate_mbps', 0)
+
+                    if 'tx_bps' in traffic_data and 'rx_bps' in traffic_data:
+                        tx_mbps = traffic_data['tx_bps'] / 1000000
+                        rx_mbps = traffic_data['rx_bps'] / 1000000
+                    else:
+                        # Queue tree hanya punya total - estimasi split 70% download, 30% upload
+                        rx_mbps = total_mbps * 0.7
+                        tx_mbps = total_mbps * 0.3
+                else:
+                    # Sample pertama session ini - baseline saja, rate dihitung cycle berikutnya
+                    result["sessions_baseline"] += 1
+                    continue
+
+                samples.append(
+                    TrafficSample(
+                        data_teknis_id=data_teknis.id,
+                        mikrotik_server_id=server.id,
+                        username_pppoe=username,
+                        ip_address=ip_address,
+                        rx_mbps=round(rx_mbps, 2),
+                        tx_mbps=round(tx_mbps, 2),
+                        total_mbps=round(total_mbps, 2),
+                        uptime_seconds=uptime_seconds,
+                        rx_bytes=reading.rx_bytes if reading else 0,
+                        tx_bytes=reading.tx_bytes if reading else 0,
+                        rx_packets=reading.rx_packets if reading else 0,
+                        tx_packets=reading.tx_packets if reading else 0,
+                        timestamp=cycle_time,
+                    )
+                )
+                result["users_collected"] += 1
 
-        for record in old_records:
-            await db.delete(record)
+            except Exception as e:
+                error_msg = f"Error processing user {username}: {str(e)}"
+                logger.error(error_msg)
+                result["errors"].append(error_msg)
 
-        await db.commit()
+        # Session yang sudah disconnect tidak perlu disimpan counter-nya lagi
+        self.counter_tracker.prune(server.id, active_usernames)
+        return result, samples
 
-        if old_records:
-            logger.info(f"Cleaned up {len(old_records)} old traffic records")
+    async def _cleanup_old_data(self, db: AsyncSession) -> Dict:
+        """
+        Clean up traffic data yang lebih lama dari retention period (semua level rollup).
+        Dijalankan harian oleh job_cleanup_old_traffic_data, bukan setiap collection cycle.
+        """
+        return await traffic_retention_service.purge(db)
 
     def _parse_uptime(self, uptime_str: str) -> int:
         """
-        Parse Mikrotik uptime format (e.g., "2d3h4m5s") ke seconds.
+        Parse Mikrotik uptime format (e.g., "1w2d3h4m5s") ke seconds.
         """
         if not uptime_str:
             return 0
 
-        total_seconds = 0
-        parts = uptime_str.lower().replace('s', '').replace('m', ':').replace('h', ':').replace('d', ':').split(':')
-
-        # Format: [days, hours, minutes, seconds]
-        if len(parts) >= 1 and parts[0]:
-            total_seconds += int(parts[0]) * 86400  # days
-        if len(parts) >= 2 and parts[1]:
-            total_seconds += int(parts[1]) * 3600   # hours
-        if len(parts) >= 3 and parts[2]:
-            total_seconds += int(parts[2]) * 60     # minutes
-        if len(parts) >= 4 and parts[3]:
-            total_seconds += int(parts[3])          # seconds
-
-        return total_seconds
+        units = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+        return sum(
+            safe_int(value) * units[unit]
+            for value, unit in re.findall(r'(\d+)([wdhms])', uptime_str.lower())
+        )
 
     # ====================================================================
     # QUERY METHODS FOR DASHBOARD
@@ -694,21 +487,23 @@ class TrafficMonitoringService:
         db: AsyncSession,
         data_teknis_id: int,
         hours: int = 24
-    ) -> List[TrafficHistoryModel]:
+    ) -> List[Dict]:
         """
-        Get traffic history untuk user tertentu.
+        Get traffic history untuk user tertentu dari tabel rollup.
+        Level rollup dipilih otomatis sesuai range (5 menit / jam / hari).
         """
+        rollup_model = rollup_model_for_hours(hours)
         since = datetime.now(timezone.utc) - timedelta(hours=hours)
 
-        query = select(TrafficHistoryModel).where(
+        query = select(rollup_model).where(
             and_(
-                TrafficHistoryModel.data_teknis_id == data_teknis_id,
-                TrafficHistoryModel.timestamp >= since
+                rollup_model.data_teknis_id == data_teknis_id,
+                rollup_model.bucket_start >= since
             )
-        ).order_by(TrafficHistoryModel.timestamp)
+        ).order_by(rollup_model.bucket_start)
 
         result = await db.execute(query)
-        return list(result.scalars().all())
+        return [row.to_dict() for row in result.scalars().all()]
 
     async def get_server_traffic_summary(
         self,
@@ -717,31 +512,30 @@ class TrafficMonitoringService:
         hours: int = 24
     ) -> List[Dict]:
         """
-        Get traffic summary per server.
+        Get traffic summary per server dari tabel rollup (bukan scan raw traffic_history).
+        avg_mbps = rata-rata per user, total_mbps = avg_mbps * active_users.
         """
+        rollup_model = rollup_model_for_hours(hours)
         since = datetime.now(timezone.utc) - timedelta(hours=hours)
 
         query = select(
-            TrafficHistoryModel.mikrotik_server_id,
+            rollup_model.mikrotik_server_id,
             MikrotikServerModel.name.label('server_name'),
-            func.count(TrafficHistoryModel.id).label('active_users'),
-            func.avg(TrafficHistoryModel.total_mbps).label('avg_mbps'),
-            func.max(TrafficHistoryModel.total_mbps).label('max_mbps'),
-            func.sum(TrafficHistoryModel.total_mbps).label('total_mbps')
+            func.count(func.distinct(rollup_model.data_teknis_id)).label('active_users'),
+            func.sum(rollup_model.total_mbps_sum).label('total_sum'),
+            func.sum(rollup_model.samples).label('samples'),
+            func.max(rollup_model.total_mbps_max).label('max_mbps')
         ).join(
             MikrotikServerModel,
-            TrafficHistoryModel.mikrotik_server_id == MikrotikServerModel.id
+            rollup_model.mikrotik_server_id == MikrotikServerModel.id
         ).where(
-            and_(
-                TrafficHistoryModel.is_latest == True,
-                TrafficHistoryModel.timestamp >= since
-            )
+            rollup_model.bucket_start >= since
         )
 
         if server_id:
-            query = query.where(TrafficHistoryModel.mikrotik_server_id == server_id)
+            query = query.where(rollup_model.mikrotik_server_id == server_id)
 
-        query = query.group_by(TrafficHistoryModel.mikrotik_server_id, MikrotikServerModel.name)
+        query = query.group_by(rollup_model.mikrotik_server_id, MikrotikServerModel.name)
 
         result = await db.execute(query)
         rows = result.all()
@@ -749,13 +543,14 @@ class TrafficMonitoringService:
         # Convert Row objects to Dict format
         summary_list = []
         for row in rows:
+            avg_mbps = float(row.total_sum or 0) / row.samples if row.samples else 0.0
             summary_list.append({
                 'mikrotik_server_id': row.mikrotik_server_id,
                 'server_name': row.server_name,
                 'active_users': row.active_users,
-                'avg_mbps': row.avg_mbps,
-                'max_mbps': row.max_mbps,
-                'total_mbps': row.total_mbps
+                'avg_mbps': avg_mbps,
+                'max_mbps': float(row.max_mbps or 0),
+                'total_mbps': avg_mbps * row.active_users
             })
 
         return summary_list
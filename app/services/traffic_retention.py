@@ -0,0 +1,204 @@
+# ====================================================================
+# TRAFFIC RETENTION SERVICE - PURGE DATA TRAFFIC LAMA
+# ====================================================================
+# Retention per level data traffic (raw, 5m, hourly, daily), masing-masing
+# dengan umur maksimal sendiri (lihat TRAFFIC_RETENTION_* di config).
+#
+# Dua strategi:
+# 1. Chunked set-based DELETE - ambil batch id yang expired lalu
+#    DELETE ... WHERE id IN (...), commit per batch supaya lock pendek.
+#    Tidak ada ORM object yang di-load.
+# 2. Partition drop (MySQL) - kalau tabel sudah di-partition RANGE per hari
+#    dengan nama partition pYYYYMMDD, partition yang seluruhnya lebih tua dari
+#    cutoff di-DROP langsung (instan), sisa row di partition batas tetap
+#    dihapus dengan strategi 1. Partition hari-hari ke depan juga disiapkan.
+#
+# Contoh DDL partitioning (dijalankan manual oleh DBA; PK harus memuat kolom
+# partition):
+#   ALTER TABLE traffic_history DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp);
+#   ALTER TABLE traffic_history PARTITION BY RANGE (TO_DAYS(timestamp)) (
+#       PARTITION p20250101 VALUES LESS THAN (TO_DAYS('2025-01-02')),
+#       PARTITION pmax VALUES LESS THAN MAXVALUE
+#   );
+# ====================================================================
+
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.traffic_history import TrafficHistory as TrafficHistoryModel
+from ..models.traffic_rollup import TrafficRollup5m, TrafficRollupDaily, TrafficRollupHourly
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "p"
+PARTITION_CATCHALL = "pmax"
+
+
+def retention_policies() -> List[Tuple[str, type, object, int]]:
+    """List (level, model, kolom waktu, retention_days) dari settings."""
+    return [
+        ("raw", TrafficHistoryModel, TrafficHistoryModel.timestamp, settings.TRAFFIC_RETENTION_RAW_DAYS),
+        ("5m", TrafficRollup5m, TrafficRollup5m.bucket_start, settings.TRAFFIC_RETENTION_5M_DAYS),
+        ("hourly", TrafficRollupHourly, TrafficRollupHourly.bucket_start, settings.TRAFFIC_RETENTION_HOURLY_DAYS),
+        ("daily", TrafficRollupDaily, TrafficRollupDaily.bucket_start, settings.TRAFFIC_RETENTION_DAILY_DAYS),
+    ]
+
+
+def _partition_day(partition_name: str) -> Optional[date]:
+    """Nama partition pYYYYMMDD -> tanggal data di partition itu."""
+    if not partition_name.startswith(PARTITION_PREFIX) or partition_name == PARTITION_CATCHALL:
+        return None
+    try:
+        return datetime.strptime(partition_name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+class TrafficRetentionService:
+    """Purge data traffic yang melewati retention, per level rollup."""
+
+    def __init__(self, chunk_size: Optional[int] = None):
+        self.chunk_size = chunk_size or settings.TRAFFIC_RETENTION_DELETE_CHUNK
+
+    async def purge(self, db: AsyncSession, now: Optional[datetime] = None) -> Dict:
+        """
+        Jalankan retention untuk semua level.
+        Return {"levels": {level: {...}}, "rows_reclaimed": n, "duration_ms": ms}.
+        """
+        now = now or datetime.now(timezone.utc)
+        started = time.perf_counter()
+        report: Dict = {"levels": {}, "rows_reclaimed": 0, "duration_ms": 0.0}
+
+        for level, model, column, retention_days in retention_policies():
+            if retention_days <= 0:
+                # 0 = simpan selamanya
+                continue
+            cutoff = now - timedelta(days=retention_days)
+            level_started = time.perf_counter()
+            stats = {"cutoff": cutoff, "rows_deleted": 0, "partitions_dropped": 0, "statements": 0}
+
+            try:
+                if settings.TRAFFIC_RETENTION_USE_PARTITIONS and await self._is_partitioned(db, model.__tablename__):
+                    await self._drop_expired_partitions(db, model.__tablename__, cutoff, stats)
+                    await self._ensure_future_partitions(db, model.__tablename__, now)
+                await self._delete_in_chunks(db, model, column, cutoff, stats)
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Traffic retention [{level}] gagal: {e}")
+                stats["error"] = str(e)
+
+            stats["duration_ms"] = round((time.perf_counter() - level_started) * 1000, 2)
+            report["levels"][level] = stats
+            report["rows_reclaimed"] += stats["rows_deleted"]
+
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        per_level = ", ".join(f"{lvl}={s['rows_deleted']}" for lvl, s in report["levels"].items())
+        logger.info(
+            f"Traffic retention: {report['rows_reclaimed']} rows reclaimed in {report['duration_ms']:.0f} ms ({per_level})"
+        )
+        return report
+
+    # ====================================================================
+    # CHUNKED DELETE
+    # ====================================================================
+
+    async def _delete_in_chunks(self, db: AsyncSession, model, column, cutoff: datetime, stats: Dict):
+        """DELETE row expired per batch id (index pada kolom waktu), commit per batch."""
+        while True:
+            id_result = await db.execute(
+                select(model.id).where(column < cutoff).order_by(model.id).limit(self.chunk_size)
+            )
+            ids = list(id_result.scalars().all())
+            if not ids:
+                break
+
+            result = await db.execute(
+                delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            stats["rows_deleted"] += result.rowcount or len(ids)
+            stats["statements"] += 2
+
+            if len(ids) < self.chunk_size:
+                break
+
+    # ====================================================================
+    # MYSQL PARTITIONS
+    # ====================================================================
+
+    async def _is_partitioned(self, db: AsyncSession, table_name: str) -> bool:
+        if db.bind.dialect.name != "mysql":
+            return False
+        result = await db.execute(
+            text(
+                "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+            ),
+            {"table": table_name},
+        )
+        return (result.scalar() or 0) > 0
+
+    async def _list_partitions(self, db: AsyncSession, table_name: str) -> List[Tuple[str, int]]:
+        result = await db.execute(
+            text(
+                "SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+                "ORDER BY PARTITION_ORDINAL_POSITION"
+            ),
+            {"table": table_name},
+        )
+        return [(row[0], int(row[1] or 0)) for row in result.all()]
+
+    async def _drop_expired_partitions(self, db: AsyncSession, table_name: str, cutoff: datetime, stats: Dict):
+        """DROP partition harian yang seluruh isinya lebih tua dari cutoff."""
+        expired = [
+            (name, rows)
+            for name, rows in await self._list_partitions(db, table_name)
+            if (day := _partition_day(name)) is not None and day < cutoff.date()
+        ]
+        if not expired:
+            return
+
+        names = ", ".join(name for name, _ in expired)
+        await db.execute(text(f"ALTER TABLE {table_name} DROP PARTITION {names}"))
+        await db.commit()
+        # TABLE_ROWS dari information_schema adalah estimasi InnoDB
+        stats["rows_deleted"] += sum(rows for _, rows in expired)
+        stats["partitions_dropped"] += len(expired)
+        stats["statements"] += 1
+
+    async def _ensure_future_partitions(self, db: AsyncSession, table_name: str, now: datetime):
+        """Pecah pmax jadi partition harian sampai TRAFFIC_RETENTION_PARTITIONS_AHEAD hari ke depan."""
+        existing = {name for name, _ in await self._list_partitions(db, table_name)}
+        if PARTITION_CATCHALL not in existing:
+            return
+
+        new_partitions = []
+        for offset in range(settings.TRAFFIC_RETENTION_PARTITIONS_AHEAD + 1):
+            day = now.date() + timedelta(days=offset)
+            name = f"{PARTITION_PREFIX}{day:%Y%m%d}"
+            if name in existing:
+                continue
+            upper = day + timedelta(days=1)
+            new_partitions.append(f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))")
+
+        if not new_partitions:
+            return
+
+        new_partitions.append(f"PARTITION {PARTITION_CATCHALL} VALUES LESS THAN MAXVALUE")
+        await db.execute(
+            text(
+                f"ALTER TABLE {table_name} REORGANIZE PARTITION {PARTITION_CATCHALL} INTO ({', '.join(new_partitions)})"
+            )
+        )
+        await db.commit()
+
+
+# Global instance
+traffic_retention_service = TrafficRetentionService()
@@ -0,0 +1,139 @@
+# ====================================================================
+# TRAFFIC ROLLUP SERVICE - MAINTAIN 5M / HOURLY / DAILY AGGREGATES
+# ====================================================================
+# Setiap collection cycle, bucket yang sedang berjalan di setiap level
+# dihitung ulang secara set-based (DELETE bucket + INSERT ... SELECT GROUP BY):
+#
+#   traffic_history  --(5 menit)-->  traffic_rollup_5m
+#   traffic_rollup_5m --(1 jam)-->   traffic_rollup_hourly
+#   traffic_rollup_hourly --(1 hari)--> traffic_rollup_daily
+#
+# Query dashboard/history membaca level yang paling kasar yang masih cukup
+# detail untuk range waktunya (lihat rollup_model_for_hours).
+# ====================================================================
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Type
+
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.traffic_history import TrafficHistory as TrafficHistoryModel
+from ..models.traffic_rollup import (
+    TrafficRollup5m,
+    TrafficRollupDaily,
+    TrafficRollupHourly,
+    TrafficRollupMixin,
+)
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLUMNS = [
+    "data_teknis_id",
+    "mikrotik_server_id",
+    "bucket_start",
+    "samples",
+    "rx_mbps_sum",
+    "tx_mbps_sum",
+    "total_mbps_sum",
+    "total_mbps_max",
+]
+
+
+def bucket_floor(moment: datetime, bucket_seconds: int) -> datetime:
+    """Bulatkan ke bawah ke awal bucket (UTC)."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    epoch = int(moment.timestamp())
+    return datetime.fromtimestamp(epoch - (epoch % bucket_seconds), tz=timezone.utc)
+
+
+def rollup_model_for_hours(hours: int, max_points: int = 300) -> Type[TrafficRollupMixin]:
+    """Pilih level rollup terkasar yang masih menghasilkan <= max_points bucket per user."""
+    for model in (TrafficRollup5m, TrafficRollupHourly):
+        if hours * 3600 / model.bucket_seconds <= max_points:  # type: ignore[attr-defined]
+            return model
+    return TrafficRollupDaily
+
+
+class TrafficRollupService:
+    """Maintain tabel rollup traffic secara incremental setiap collection cycle."""
+
+    async def refresh(self, db: AsyncSession, cycle_time: datetime) -> Dict:
+        """Hitung ulang bucket yang memuat cycle_time di semua level rollup, satu commit."""
+        started = time.perf_counter()
+        stats: Dict[str, int] = {}
+
+        try:
+            stats["5m"] = await self._rebuild_from_raw(db, cycle_time)
+            stats["hourly"] = await self._rebuild_from_rollup(db, TrafficRollupHourly, TrafficRollup5m, cycle_time)
+            stats["daily"] = await self._rebuild_from_rollup(db, TrafficRollupDaily, TrafficRollupHourly, cycle_time)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.debug(f"Traffic rollup refreshed in {duration_ms:.0f} ms: {stats}")
+        return {"rows": stats, "duration_ms": duration_ms}
+
+    async def _rebuild_from_raw(self, db: AsyncSession, cycle_time: datetime) -> int:
+        """Bucket 5 menit dari raw traffic_history."""
+        bucket_start = bucket_floor(cycle_time, TrafficRollup5m.bucket_seconds)
+        bucket_end = bucket_start + timedelta(seconds=TrafficRollup5m.bucket_seconds)
+        source = TrafficHistoryModel
+
+        aggregate = (
+            select(
+                source.data_teknis_id,
+                func.max(source.mikrotik_server_id),
+                literal(bucket_start, DateTime),
+                func.count(source.id),
+                func.sum(source.rx_mbps),
+                func.sum(source.tx_mbps),
+                func.sum(source.total_mbps),
+                func.max(source.total_mbps),
+            )
+            .where(and_(source.timestamp >= bucket_start, source.timestamp < bucket_end))
+            .group_by(source.data_teknis_id)
+        )
+        return await self._replace_bucket(db, TrafficRollup5m, bucket_start, aggregate)
+
+    async def _rebuild_from_rollup(
+        self,
+        db: AsyncSession,
+        target: Type[TrafficRollupMixin],
+        source: Type[TrafficRollupMixin],
+        cycle_time: datetime,
+    ) -> int:
+        """Bucket level atas dari SUM level di bawahnya."""
+        bucket_start = bucket_floor(cycle_time, target.bucket_seconds)  # type: ignore[attr-defined]
+        bucket_end = bucket_start + timedelta(seconds=target.bucket_seconds)  # type: ignore[attr-defined]
+
+        aggregate = (
+            select(
+                source.data_teknis_id,
+                func.max(source.mikrotik_server_id),
+                literal(bucket_start, DateTime),
+                func.sum(source.samples),
+                func.sum(source.rx_mbps_sum),
+                func.sum(source.tx_mbps_sum),
+                func.sum(source.total_mbps_sum),
+                func.max(source.total_mbps_max),
+            )
+            .where(and_(source.bucket_start >= bucket_start, source.bucket_start < bucket_end))
+            .group_by(source.data_teknis_id)
+        )
+        return await self._replace_bucket(db, target, bucket_start, aggregate)
+
+    async def _replace_bucket(self, db: AsyncSession, target, bucket_start: datetime, aggregate) -> int:
+        # Satu row per user per bucket (unique index); server diambil yang terakhir dipakai
+        await db.execute(delete(target).where(target.bucket_start == bucket_start))
+        result = await db.execute(insert(target).from_select(ROLLUP_COLUMNS, aggregate))
+        return result.rowcount or 0
+
+
+# Global instance
+traffic_rollup_service = TrafficRollupService()
@@ -0,0 +1,309 @@
+# ====================================================================
+# TRAFFIC SNAPSHOT - BULK PER-ROUTER TRAFFIC INDEX
+# ====================================================================
+# Module ini mengambil tabel-tabel traffic dari satu Mikrotik SEKALI per
+# collection cycle, lalu membangun index name/target -> stats supaya semua
+# PPPoE session bisa di-resolve dalam satu pass tanpa round trip tambahan.
+#
+# Tabel yang diambil (masing-masing satu kali per router per cycle):
+# - /ppp/active       -> daftar session aktif
+# - /queue/tree       -> rate per queue tree
+# - /queue/simple     -> rate per simple queue (index by name & target)
+# - /queue/interface  -> rate per queue interface (index by name & parent)
+# - /interface        -> byte counter per interface (termasuk <pppoe-user>)
+#
+# Urutan prioritas resolve sama dengan get_real_traffic_data lama:
+# queue tree -> simple queue -> queue interface -> interface stats.
+#
+# Lookup pakai nama persis dulu. Key longgar (normalize_traffic_key: huruf
+# kecil, tanpa "-" / "_") hanya dipakai sebagai fallback kalau key itu
+# menunjuk ke satu nama saja dan tidak bentrok dengan session aktif lain,
+# supaya "a-b1" dan "ab_1" tidak saling tertukar traffic-nya.
+# ====================================================================
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .traffic_counters import CounterReading
+
+logger = logging.getLogger(__name__)
+
+
+def _safe_int(value, default=0):
+    """Convert string RouterOS ke int secara aman."""
+    try:
+        if isinstance(value, str):
+            value = value.replace(",", "").replace(" ", "")
+        return int(value) if value else default
+    except (ValueError, TypeError):
+        return default
+
+
+def _parse_rate_pair(value) -> tuple:
+    """
+    Parse field rate/max-limit simple queue format "upload/download" (bps).
+    Return (upload_bps, download_bps); nilai tunggal dianggap total di download.
+    """
+    if isinstance(value, str) and "/" in value:
+        upload, _, download = value.partition("/")
+        return _safe_int(upload), _safe_int(download)
+    return 0, _safe_int(value)
+
+
+def traffic_name(name: str) -> str:
+    """
+    Nama persis queue/interface/username (tanpa pembungkus interface dinamis).
+    Contoh: "<pppoe-Budi_01>" -> "Budi_01".
+    """
+    if not name:
+        return ""
+    key = name.strip()
+    if key.lower().startswith("<pppoe-") and key.endswith(">"):
+        key = key[len("<pppoe-") : -1]
+    return key
+
+
+def normalize_traffic_key(name: str) -> str:
+    """
+    Key longgar untuk fallback lookup (bisa bentrok antar nama, lihat TrafficIndex).
+    Contoh: "<pppoe-Budi_01>" -> "budi01", "budi-01" -> "budi01".
+    """
+    return traffic_name(name).lower().replace("-", "").replace("_", "")
+
+
+class TrafficIndex:
+    """Index rows satu tabel RouterOS: nama persis, plus key longgar sebagai fallback."""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = (), fields: Tuple[str, ...] = ("name",)):
+        self.exact: Dict[str, List[Dict[str, Any]]] = {}
+        self.loose: Dict[str, List[Dict[str, Any]]] = {}
+        self.loose_names: Dict[str, Set[str]] = {}
+        for row in rows:
+            seen_exact: Set[str] = set()
+            seen_loose: Set[str] = set()
+            for field_name in fields:
+                raw = row.get(field_name, "") or ""
+                # Field target simple queue bisa berisi beberapa target dipisah koma
+                for part in str(raw).split(","):
+                    part = part.strip()
+                    if part.endswith("/32"):
+                        part = part[:-3]
+                    name = traffic_name(part)
+                    if not name:
+                        continue
+                    if name not in seen_exact:
+                        seen_exact.add(name)
+                        self.exact.setdefault(name, []).append(row)
+                    key = normalize_traffic_key(name)
+                    self.loose_names.setdefault(key, set()).add(name)
+                    if key not in seen_loose:
+                        seen_loose.add(key)
+                        self.loose.setdefault(key, []).append(row)
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def get(self, name: str, allow_loose: bool = True) -> List[Dict[str, Any]]:
+        """Rows untuk nama persis; kalau tidak ada, rows key longgar yang hanya milik satu nama."""
+        name = traffic_name(name)
+        rows = self.exact.get(name)
+        if rows:
+            return rows
+        if not allow_loose:
+            return []
+        key = normalize_traffic_key(name)
+        if len(self.loose_names.get(key, ())) != 1:
+            return []
+        return self.loose.get(key, [])
+
+
+@dataclass
+class RouterTrafficSnapshot:
+    """
+    Snapshot traffic satu router untuk satu collection cycle.
+    Dibuat lewat RouterTrafficSnapshot.fetch(api) - blocking, jadi panggil dari thread
+    kalau dipakai dari async code.
+    """
+
+    server_name: str = ""
+    active_sessions: List[Dict[str, Any]] = field(default_factory=list)
+    queue_tree: TrafficIndex = field(default_factory=TrafficIndex)
+    simple_queue: TrafficIndex = field(default_factory=TrafficIndex)
+    queue_interface: TrafficIndex = field(default_factory=TrafficIndex)
+    interfaces: TrafficIndex = field(default_factory=TrafficIndex)
+    # Key longgar -> username session aktif (deteksi bentrok untuk fallback)
+    session_keys: Dict[str, Set[str]] = field(default_factory=dict)
+    table_sizes: Dict[str, int] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    fetched_at: float = 0.0
+    counters_at: float = 0.0  # Unix time saat tabel /interface diambil
+
+    # ====================================================================
+    # FETCH
+    # ====================================================================
+
+    @classmethod
+    def fetch(cls, api, server_name: str = "") -> "RouterTrafficSnapshot":
+        """Download semua tabel traffic sekali dan bangun index-nya."""
+        snapshot = cls(server_name=server_name, fetched_at=time.time())
+        tables: Dict[str, List[Dict[str, Any]]] = {}
+
+        for path in ("/ppp/active", "/queue/tree", "/queue/simple", "/queue/interface", "/interface"):
+            started = time.perf_counter()
+            try:
+                tables[path] = api.get_resource(path).get()
+            except Exception as e:
+                # /queue/interface dan /queue/tree tidak selalu ada - jangan gagalkan seluruh snapshot
+                if path == "/ppp/active":
+                    raise
+                logger.warning(f"[{server_name}] Gagal mengambil {path}: {e}")
+                tables[path] = []
+            if path == "/interface":
+                snapshot.counters_at = time.time()
+            snapshot.timings[f"fetch{path.replace('/', '_')}_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            snapshot.table_sizes[path] = len(tables[path])
+
+        started = time.perf_counter()
+        snapshot.active_sessions = tables["/ppp/active"]
+        snapshot.index_sessions()
+        snapshot.queue_tree = TrafficIndex(tables["/queue/tree"], ("name",))
+        snapshot.simple_queue = TrafficIndex(tables["/queue/simple"], ("name", "target"))
+        snapshot.queue_interface = TrafficIndex(tables["/queue/interface"], ("name", "parent"))
+        snapshot.interfaces = TrafficIndex(tables["/interface"], ("name",))
+        snapshot.timings["index_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        snapshot.timings["fetch_total_ms"] = round(sum(v for k, v in snapshot.timings.items() if k.startswith("fetch_")), 2)
+
+        logger.debug(f"[{server_name}] Snapshot tables: {snapshot.table_sizes}")
+        return snapshot
+
+    def index_sessions(self):
+        """Bangun session_keys dari active_sessions."""
+        self.session_keys = {}
+        for session in self.active_sessions:
+            name = traffic_name(session.get("name", ""))
+            if name:
+                self.session_keys.setdefault(normalize_traffic_key(name), set()).add(name)
+
+    # ====================================================================
+    # RESOLVE
+    # ====================================================================
+
+    def _allow_loose(self, username: str) -> bool:
+        """Fallback key longgar hanya kalau tidak ada session aktif LAIN dengan key yang sama."""
+        name = traffic_name(username)
+        return not (self.session_keys.get(normalize_traffic_key(name), set()) - {name})
+
+    def resolve(self, username: str, address: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cari traffic data untuk satu username dari index (O(1) per tabel).
+        Format return sama dengan TrafficMonitoringService.get_real_traffic_data.
+        """
+        keys = [traffic_name(username)]
+        if address:
+            keys.append(traffic_name(address))
+        keys = [k for k in keys if k]
+        if not keys:
+            return None
+        allow_loose = self._allow_loose(username)
+
+        # Method 1: queue tree
+        for queue in self._lookup(self.queue_tree, keys[:1], allow_loose):
+            rate_data = _safe_int(queue.get("rate", 0))
+            if rate_data > 0:
+                return {
+                    "rate_bps": rate_data,
+                    "rate_mbps": rate_data / 1000000,
+                    "bytes_total": _safe_int(queue.get("bytes", 0)),
+                    "source": "queue_tree",
+                    "queue_name": queue.get("name", ""),
+                }
+
+        # Method 2: simple queue (by name, target interface, atau target IP)
+        for queue in self._lookup(self.simple_queue, keys, allow_loose):
+            # Simple queue menyimpan rate sebagai "upload/download" dari sisi target
+            rate_field = queue.get("rate", 0)
+            tx_bps, rx_bps = _parse_rate_pair(rate_field)
+            if tx_bps + rx_bps <= 0:
+                rate_field = queue.get("max-limit", 0)
+                tx_bps, rx_bps = _parse_rate_pair(rate_field)
+            current_rate = tx_bps + rx_bps
+            if current_rate > 0:
+                upload_bytes, download_bytes = _parse_rate_pair(queue.get("bytes", 0))
+                traffic_data = {
+                    "rate_bps": current_rate,
+                    "rate_mbps": current_rate / 1000000,
+                    "bytes_total": upload_bytes + download_bytes,
+                    "target": queue.get("target", ""),
+                    "source": "simple_queue",
+                    "queue_name": queue.get("name", ""),
+                }
+                if isinstance(rate_field, str) and "/" in rate_field:
+                    traffic_data["tx_bps"] = tx_bps
+                    traffic_data["rx_bps"] = rx_bps
+                return traffic_data
+
+        # Method 3: queue interface
+        for interface in self._lookup(self.queue_interface, keys[:1], allow_loose):
+            tx_bps = _safe_int(interface.get("tx-bits-per-second", 0))
+            rx_bps = _safe_int(interface.get("rx-bits-per-second", 0))
+            total_bps = tx_bps + rx_bps
+            if total_bps > 0:
+                return {
+                    "rate_bps": total_bps,
+                    "rate_mbps": total_bps / 1000000,
+                    "tx_bps": tx_bps,
+                    "rx_bps": rx_bps,
+                    "source": "queue_interface",
+                    "interface_name": interface.get("name", ""),
+                }
+
+        # Method 4: interface stats langsung (dynamic <pppoe-username>)
+        for interface in self._lookup(self.interfaces, keys[:1], allow_loose):
+            total_bytes = _safe_int(interface.get("tx-byte", 0)) + _safe_int(interface.get("rx-byte", 0))
+            if total_bytes > 0:
+                return {
+                    "bytes": total_bytes,
+                    "rate": 0,  # Rate tidak available di basic interface stats
+                    "interface_name": interface.get("name", ""),
+                    "source": "interface_stats",
+                }
+
+        return None
+
+    def counters(self, username: str, uptime_seconds: int = 0) -> Optional[CounterReading]:
+        """
+        Byte counter interface dinamis <pppoe-username> untuk counter-delta rate.
+        Arah dibalik ke sudut pandang pelanggan: tx interface = download (rx pelanggan).
+        """
+        for interface in self.interfaces.get(username, allow_loose=self._allow_loose(username)):
+            if interface.get("type", "pppoe-in") != "pppoe-in":
+                continue
+            return CounterReading(
+                rx_bytes=_safe_int(interface.get("tx-byte", 0)),
+                tx_bytes=_safe_int(interface.get("rx-byte", 0)),
+                rx_packets=_safe_int(interface.get("tx-packet", 0)),
+                tx_packets=_safe_int(interface.get("rx-packet", 0)),
+                uptime_seconds=uptime_seconds,
+                observed_at=self.counters_at or self.fetched_at,
+            )
+        return None
+
+    def resolve_all(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Resolve semua active session di snapshot dalam satu pass."""
+        started = time.perf_counter()
+        resolved: Dict[str, Optional[Dict[str, Any]]] = {}
+        for session in self.active_sessions:
+            username = session.get("name", "")
+            if username:
+                resolved[username] = self.resolve(username, session.get("address"))
+        self.timings["resolve_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return resolved
+
+    @staticmethod
+    def _lookup(index: TrafficIndex, keys: List[str], allow_loose: bool = True) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        for key in keys:
+            rows.extend(index.get(key, allow_loose))
+        return rows
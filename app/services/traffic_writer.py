@@ -0,0 +1,152 @@
+# ====================================================================
+# TRAFFIC WRITER - BATCHED WRITE STAGE UNTUK TRAFFIC_HISTORY
+# ====================================================================
+# Write stage untuk traffic collection. Semua sample satu cycle dikumpulkan
+# dulu, lalu ditulis dengan beberapa statement multi-row dalam SATU transaksi:
+#
+# 1. Prefetch DataTeknis (id_pelanggan -> id) untuk semua username sekaligus
+# 2. Satu UPDATE set-based: is_latest = False untuk row lama user di cycle ini
+# 3. Satu INSERT multi-row untuk semua sample baru (is_latest = True)
+# 4. Satu COMMIT
+#
+# Sebelumnya setiap user butuh SELECT DataTeknis + SELECT latest + UPDATE/INSERT
+# + COMMIT (sekitar 4 round trip per user).
+# ====================================================================
+
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.data_teknis import DataTeknis as DataTeknisModel
+from ..models.traffic_history import TrafficHistory as TrafficHistoryModel
+
+logger = logging.getLogger(__name__)
+
+# Batas jumlah parameter per statement IN (...) / multi-row INSERT
+WRITE_CHUNK_SIZE = 1000
+
+
+def _chunks(items: Sequence, size: int = WRITE_CHUNK_SIZE) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+@dataclass
+class DataTeknisRef:
+    """Kolom DataTeknis yang dibutuhkan collector (tanpa load entity penuh)."""
+
+    id: int
+    id_pelanggan: str
+    mikrotik_server_id: Optional[int]
+    profile_pppoe: Optional[str]
+
+
+@dataclass
+class TrafficSample:
+    """Satu baris traffic_history yang siap di-insert."""
+
+    data_teknis_id: int
+    mikrotik_server_id: int
+    username_pppoe: str
+    ip_address: str
+    rx_mbps: float
+    tx_mbps: float
+    total_mbps: float
+    uptime_seconds: int
+    rx_bytes: int = 0
+    tx_bytes: int = 0
+    rx_packets: int = 0
+    tx_packets: int = 0
+    is_active: bool = True
+    timestamp: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class TrafficHistoryWriter:
+    """Batched writer untuk traffic_history - satu transaksi per collection cycle."""
+
+    def __init__(self, chunk_size: int = WRITE_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    async def prefetch_data_teknis(
+        self, db: AsyncSession, usernames: Iterable[str]
+    ) -> Dict[Tuple[str, Optional[int]], DataTeknisRef]:
+        """
+        Resolve DataTeknis untuk semua username PPPoE dalam satu query (per chunk).
+        Return dict (id_pelanggan, mikrotik_server_id) -> DataTeknisRef.
+        """
+        unique_usernames = sorted({name for name in usernames if name})
+        refs: Dict[Tuple[str, Optional[int]], DataTeknisRef] = {}
+
+        for chunk in _chunks(unique_usernames, self.chunk_size):
+            query = select(
+                DataTeknisModel.id,
+                DataTeknisModel.id_pelanggan,
+                DataTeknisModel.mikrotik_server_id,
+                DataTeknisModel.profile_pppoe,
+            ).where(DataTeknisModel.id_pelanggan.in_(chunk))
+            result = await db.execute(query)
+            for row in result.all():
+                refs[(row.id_pelanggan, row.mikrotik_server_id)] = DataTeknisRef(
+                    id=row.id,
+                    id_pelanggan=row.id_pelanggan,
+                    mikrotik_server_id=row.mikrotik_server_id,
+                    profile_pppoe=row.profile_pppoe,
+                )
+
+        return refs
+
+    async def write_cycle(self, db: AsyncSession, samples: List[TrafficSample]) -> Dict:
+        """
+        Tulis semua sample satu cycle: flip is_latest lama lalu bulk insert, satu commit.
+        Return statistik write (rows, statements, durasi).
+        """
+        stats = {"rows_inserted": 0, "rows_unflagged": 0, "statements": 0, "duration_ms": 0.0}
+        if not samples:
+            return stats
+
+        started = time.perf_counter()
+        try:
+            # 1. Flip is_latest untuk row lama user yang dapat sample baru di cycle ini
+            data_teknis_ids = sorted({sample.data_teknis_id for sample in samples})
+            for chunk in _chunks(data_teknis_ids, self.chunk_size):
+                result = await db.execute(
+                    update(TrafficHistoryModel)
+                    .where(
+                        and_(
+                            TrafficHistoryModel.data_teknis_id.in_(chunk),
+                            TrafficHistoryModel.is_latest == True,
+                        )
+                    )
+                    .values(is_latest=False)
+                    .execution_options(synchronize_session=False)
+                )
+                stats["rows_unflagged"] += result.rowcount or 0
+                stats["statements"] += 1
+
+            # 2. Bulk insert semua sample baru sebagai latest
+            rows = [dict(asdict(sample), is_latest=True) for sample in samples]
+            for chunk in _chunks(rows, self.chunk_size):
+                await db.execute(insert(TrafficHistoryModel), list(chunk))
+                stats["rows_inserted"] += len(chunk)
+                stats["statements"] += 1
+
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(
+            f"Traffic write: {stats['rows_inserted']} rows inserted, {stats['rows_unflagged']} unflagged "
+            f"in {stats['statements']} statements ({stats['duration_ms']:.0f} ms)"
+        )
+        return stats
+
+
+# Global instance
+traffic_history_writer = TrafficHistoryWriter()
@@ -0,0 +1,233 @@
+# ====================================================================
+# WEBSOCKET BUS - FAN-OUT NOTIFIKASI KE SEMUA WORKER
+# ====================================================================
+# ConnectionManager menyimpan socket di dict milik satu proses. Dengan
+# beberapa worker uvicorn, callback pembayaran yang diproses worker A tidak
+# pernah sampai ke user finance yang socket-nya ada di worker B.
+#
+# Solusinya: ConnectionManager tidak langsung kirim ke socket, tapi publish
+# satu "envelope" ke bus. Setiap worker subscribe ke bus dan mengirim ke
+# socket yang ada di worker itu sendiri.
+#
+# Backend (WEBSOCKET_BUS_BACKEND):
+# - "memory"   : InProcessWebSocketBus - envelope langsung dikirim ke handler
+#                lokal. Default, cukup untuk satu worker.
+# - "database" : DatabaseWebSocketBus - envelope ditulis ke tabel
+#                websocket_events (MySQL/SQLite). Worker pengirim langsung
+#                mengirim ke socket lokalnya, worker lain polling row baru
+#                setiap WEBSOCKET_BUS_POLL_INTERVAL_MS.
+#
+# Catatan backend database: urutan baca berdasarkan id. Insert yang commit-nya
+# telat (id lebih kecil dari yang sudah dibaca) bisa terlewat - cocok untuk
+# notifikasi real-time, bukan untuk data yang wajib sampai.
+#
+# Envelope:
+#   {"kind": "user",  "user_ids": [123],       "message": "<json>"}
+#   {"kind": "users", "user_ids": [1, 2, 3],   "message": "<json>"}
+#   {"kind": "roles", "roles": ["admin", "noc"], "message": "<json>"}
+#   {"kind": "roles_changed", "user_ids": [1, 2] | null}   (reload role_index)
+# ====================================================================
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, func, insert, select
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.websocket_event import WebSocketEvent
+
+logger = logging.getLogger(__name__)
+
+BusHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class WebSocketBus:
+    """
+    Interface backplane. Subclass override publish() (dan start()/stop() kalau
+    butuh task background). handler = fungsi yang mengirim envelope ke socket
+    lokal (ConnectionManager._handle_bus_envelope).
+    """
+
+    backend = "base"
+
+    def __init__(self, handler: BusHandler):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handler = handler
+        self.published = 0
+        self.delivered = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def _deliver(self, envelope: Dict[str, Any]) -> Any:
+        try:
+            result = await self._handler(envelope)
+            self.delivered += 1
+            return result
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"WebSocket bus: gagal mengirim envelope {envelope.get('kind')}: {e}")
+            return None
+
+    async def publish(self, envelope: Dict[str, Any]) -> Any:
+        """Kirim envelope ke semua worker. Return hasil pengiriman di worker ini."""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "origin": self.origin,
+            "published": self.published,
+            "delivered": self.delivered,
+            "errors": self.errors,
+        }
+
+
+class InProcessWebSocketBus(WebSocketBus):
+    """Satu proses saja: publish = kirim ke socket lokal."""
+
+    backend = "memory"
+
+    async def publish(self, envelope: Dict[str, Any]) -> Any:
+        self.published += 1
+        return await self._deliver(envelope)
+
+
+class DatabaseWebSocketBus(WebSocketBus):
+    """Backplane lewat tabel websocket_events, bisa dipakai banyak worker / host."""
+
+    backend = "database"
+
+    def __init__(self, handler: BusHandler):
+        super().__init__(handler)
+        self.poll_interval = settings.WEBSOCKET_BUS_POLL_INTERVAL_MS / 1000
+        self.batch_size = max(1, settings.WEBSOCKET_BUS_BATCH_SIZE)
+        self.retention = settings.WEBSOCKET_BUS_RETENTION_SECONDS
+        self._last_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.received = 0
+        self.publish_errors = 0
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._poll_loop(), name="websocket-bus")
+        logger.info(f"WebSocket bus database dimulai ({self.origin}, poll {self.poll_interval * 1000:.0f} ms)")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def publish(self, envelope: Dict[str, Any]) -> Any:
+        self.published += 1
+        # Socket di worker ini langsung dikirim, tidak perlu menunggu polling
+        result = await self._deliver(envelope)
+        try:
+            async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+                await db.execute(
+                    insert(WebSocketEvent).values(
+                        origin=self.origin, payload=json.dumps(envelope, ensure_ascii=False), created_at=datetime.now()
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            self.publish_errors += 1
+            logger.error(f"WebSocket bus: gagal publish ke worker lain: {e}")
+        return result
+
+    async def _poll_once(self) -> int:
+        async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+            if self._last_id is None:
+                # Mulai dari row terbaru - pesan sebelum worker ini hidup tidak dikirim ulang
+                self._last_id = (await db.execute(select(func.max(WebSocketEvent.id)))).scalar() or 0
+                return 0
+            rows = (
+                await db.execute(
+                    select(WebSocketEvent.id, WebSocketEvent.origin, WebSocketEvent.payload)
+                    .where(WebSocketEvent.id > self._last_id)
+                    .order_by(WebSocketEvent.id)
+                    .limit(self.batch_size)
+                )
+            ).all()
+
+        for event_id, origin, payload in rows:
+            self._last_id = event_id
+            if origin == self.origin:
+                continue
+            try:
+                envelope = json.loads(payload)
+            except ValueError:
+                self.errors += 1
+                continue
+            self.received += 1
+            await self._deliver(envelope)
+        return len(rows)
+
+    async def _purge(self) -> None:
+        cutoff = datetime.now() - timedelta(seconds=self.retention)
+        async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+            await db.execute(delete(WebSocketEvent).where(WebSocketEvent.created_at < cutoff))
+            await db.commit()
+
+    async def _poll_loop(self) -> None:
+        while True:
+            try:
+                fetched = await self._poll_once()
+                if time.monotonic() - self._last_purge >= self.retention:
+                    self._last_purge = time.monotonic()
+                    await self._purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                fetched = 0
+                logger.error(f"WebSocket bus: polling gagal: {e}")
+            # Kalau batch penuh masih ada sisa - langsung baca lagi
+            if fetched < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update(
+            {
+                "received": self.received,
+                "publish_errors": self.publish_errors,
+                "last_id": self._last_id,
+                "running": self._task is not None and not self._task.done(),
+            }
+        )
+        return stats
+
+
+BUS_BACKENDS = {
+    InProcessWebSocketBus.backend: InProcessWebSocketBus,
+    DatabaseWebSocketBus.backend: DatabaseWebSocketBus,
+}
+
+
+def create_websocket_bus(handler: BusHandler, backend: Optional[str] = None) -> WebSocketBus:
+    """Buat bus sesuai WEBSOCKET_BUS_BACKEND (fallback ke memory kalau tidak dikenal)."""
+    name = (backend or settings.WEBSOCKET_BUS_BACKEND).strip().lower()
+    bus_class = BUS_BACKENDS.get(name)
+    if bus_class is None:
+        logger.warning(f"WEBSOCKET_BUS_BACKEND '{name}' tidak dikenal, pakai 'memory'")
+        bus_class = InProcessWebSocketBus
+    return bus_class(handler)
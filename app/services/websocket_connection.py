@@ -0,0 +1,180 @@
+# ====================================================================
+# WEBSOCKET CONNECTION - SATU SOCKET, SATU ANTRIAN KIRIM, SATU WRITER
+# ====================================================================
+# Sebelumnya ConnectionManager memanggil send_text() langsung di dalam
+# broadcast, jadi satu client yang lambat (sinyal HP jelek, tab di
+# background) menahan pengiriman ke semua user lain di broadcast yang sama.
+#
+# Sekarang setiap socket dibungkus WebSocketConnection:
+# - enqueue() tidak pernah menunggu: pesan (JSON yang sudah di-serialize
+#   sekali per broadcast) masuk ke deque milik koneksi itu.
+# - Satu task writer per koneksi mengirim isi antrian secara berurutan.
+# - Antrian dibatasi WEBSOCKET_SEND_QUEUE_SIZE. Kalau penuh, pesan TERTUA
+#   dibuang (notifikasi terbaru lebih penting untuk client yang tertinggal).
+# - Coalescing: pesan dengan coalesce_key yang sama dan belum terkirim
+#   diganti isinya dengan yang terbaru (misalnya "ping", snapshot dashboard),
+#   posisinya di antrian tetap.
+# - Send yang lebih lama dari WEBSOCKET_SEND_TIMEOUT_SECONDS / error =
+#   koneksi dianggap mati, on_error dipanggil supaya manager melepasnya.
+# ====================================================================
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_connection_ids = itertools.count(1)
+
+
+class WebSocketConnection:
+    """Satu socket milik satu user, dengan antrian kirim dan task writer sendiri."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        on_error: Callable[["WebSocketConnection"], Awaitable[Any]],
+        metrics: Optional[Dict[str, Any]] = None,
+    ):
+        self.id = next(_connection_ids)
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue_size = max(1, settings.WEBSOCKET_SEND_QUEUE_SIZE)
+        self.send_timeout = settings.WEBSOCKET_SEND_TIMEOUT_SECONDS
+
+        self._on_error = on_error
+        # Dict metrics milik ConnectionManager (messages_sent, messages_failed, ...)
+        self._metrics = metrics if metrics is not None else {}
+
+        # Item antrian = [coalesce_key, message_json]; list supaya bisa diganti di tempat
+        self._queue: Deque[List[Optional[str]]] = deque()
+        self._pending: Dict[str, List[Optional[str]]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        now = time.time()
+        self.connected_at = now
+        self.last_activity = now
+        self.last_ping = now
+        self.messages_sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closing
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer(), name=f"websocket-writer-{self.user_id}-{self.id}")
+
+    def touch(self):
+        """Tandai ada aktivitas dari client (pesan masuk)."""
+        self.last_activity = time.time()
+
+    def _count(self, key: str):
+        self._metrics[key] = self._metrics.get(key, 0) + 1
+
+    def enqueue(self, message_json: str, coalesce_key: Optional[str] = None) -> bool:
+        """Antrikan pesan tanpa menunggu. Return False kalau koneksi sudah ditutup."""
+        if self._closing:
+            return False
+
+        if coalesce_key is not None:
+            pending = self._pending.get(coalesce_key)
+            if pending is not None:
+                pending[1] = message_json
+                self.coalesced += 1
+                self._count("messages_coalesced")
+                return True
+
+        if len(self._queue) >= self.queue_size:
+            oldest = self._queue.popleft()
+            if oldest[0] is not None and self._pending.get(oldest[0]) is oldest:
+                del self._pending[oldest[0]]
+            self.dropped += 1
+            self._count("messages_dropped")
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(
+                    f"Antrian kirim user {self.user_id} (koneksi {self.id}) penuh, total {self.dropped} pesan lama dibuang"
+                )
+
+        item: List[Optional[str]] = [coalesce_key, message_json]
+        self._queue.append(item)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = item
+        self._wakeup.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue:
+                    item = self._queue.popleft()
+                    key, message_json = item
+                    if key is not None and self._pending.get(key) is item:
+                        del self._pending[key]
+                    try:
+                        await asyncio.wait_for(self.websocket.send_text(message_json), timeout=self.send_timeout)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self._count("messages_failed")
+                        reason = "send timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+                        logger.warning(f"Gagal kirim ke user {self.user_id} (koneksi {self.id}): {reason}")
+                        await self._on_error(self)
+                        return
+                    self.messages_sent += 1
+                    self.last_activity = time.time()
+                    self._count("messages_sent")
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Hentikan writer dan tutup socket (aman dipanggil berkali-kali / dari writer sendiri)."""
+        if self._closing:
+            return
+        self._closing = True
+        self._queue.clear()
+        self._pending.clear()
+
+        task, self._task = self._task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            # Socket sudah ditutup client
+            pass
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "connection_id": self.id,
+            "connected_at": self.connected_at,
+            "last_activity": self.last_activity,
+            "last_ping": self.last_ping,
+            "messages_sent": self.messages_sent,
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
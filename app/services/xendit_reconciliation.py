@@ -0,0 +1,265 @@
+# ====================================================================
+# XENDIT RECONCILIATION - REKONSILIASI PEMBAYARAN INCREMENTAL
+# ====================================================================
+# Dipakai job_verify_payments untuk menangkap pembayaran yang callback-nya
+# terlewat.
+#
+# - Per akun Xendit (API key unik) disimpan high-water mark "paid_after" di
+#   system_settings (key "xendit_paid_after:<brand>"), jadi setiap run hanya
+#   menarik pembayaran baru. Run pertama mundur XENDIT_RECONCILE_LOOKBACK_DAYS.
+# - Hasil API di-page dengan cursor last_invoice_id sampai halaman habis
+#   (tidak lagi terpotong di 1000 invoice pertama).
+# - Semua akun di-fetch bersamaan.
+# - external_id dicocokkan ke Invoice.xendit_external_id per chunk (IN).
+# - Mark baru disimpan SETELAH invoice selesai diproses & commit, supaya
+#   run yang gagal diulang dari mark lama.
+# - Xendit mengurutkan hasil berdasarkan created (terbaru dulu), bukan
+#   paid_at. Kalau run terpotong XENDIT_RECONCILE_MAX_PAGES, halaman yang
+#   belum ditarik bisa berisi pembayaran yang lebih lama dari paid_at
+#   terbaru yang sudah terlihat, jadi mark TIDAK dimajukan.
+# ====================================================================
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from ..config import settings
+from ..models.invoice import Invoice as InvoiceModel
+from ..models.langganan import Langganan as LanggananModel
+from ..models.pelanggan import Pelanggan as PelangganModel
+from ..models.system_setting import SystemSetting as SettingModel
+from .xendit_service import xendit_clients
+
+logger = logging.getLogger(__name__)
+
+MARK_PREFIX = "xendit_paid_after:"
+
+
+def parse_xendit_time(value: Optional[str]) -> Optional[datetime]:
+    """Timestamp Xendit ("2025-01-01T10:00:00.000Z") -> datetime UTC."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class AccountReport:
+    """Hasil fetch satu akun Xendit."""
+
+    brand: str
+    paid_after: Optional[datetime] = None
+    new_mark: Optional[datetime] = None
+    pages: int = 0
+    fetched: int = 0
+    truncated: bool = False  # Berhenti karena XENDIT_RECONCILE_MAX_PAGES
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+    external_ids: List[str] = field(default_factory=list)
+
+    @property
+    def lag_seconds(self) -> float:
+        """Jarak antara sekarang dan pembayaran terbaru yang sudah ditarik (atau mark lama)."""
+        reference = self.paid_after if self.truncated else (self.new_mark or self.paid_after)
+        if not reference:
+            return 0.0
+        return round((datetime.now(timezone.utc) - reference).total_seconds(), 1)
+
+    @property
+    def throughput_per_second(self) -> float:
+        return round(self.fetched / (self.duration_ms / 1000), 2) if self.duration_ms else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "brand": self.brand,
+            "paid_after": self.paid_after.isoformat() if self.paid_after else None,
+            "new_mark": self.new_mark.isoformat() if self.new_mark else None,
+            "pages": self.pages,
+            "fetched": self.fetched,
+            "truncated": self.truncated,
+            "duration_ms": self.duration_ms,
+            "lag_seconds": self.lag_seconds,
+            "throughput_per_second": self.throughput_per_second,
+            "error": self.error,
+        }
+
+
+class XenditReconciliationService:
+    """Tarik pembayaran PAID baru dari semua akun Xendit dan cocokkan dengan invoice lokal."""
+
+    # ====================================================================
+    # HIGH-WATER MARK (system_settings)
+    # ====================================================================
+
+    async def _load_marks(self, db: AsyncSession) -> Dict[str, SettingModel]:
+        result = await db.execute(select(SettingModel).where(SettingModel.setting_key.like(f"{MARK_PREFIX}%")))
+        return {setting.setting_key[len(MARK_PREFIX):]: setting for setting in result.scalars().all()}
+
+    def _save_mark(self, db: AsyncSession, marks: Dict[str, SettingModel], brand: str, mark: datetime) -> None:
+        value = mark.astimezone(timezone.utc).isoformat()
+        setting = marks.get(brand)
+        if setting:
+            setting.setting_value = value
+        else:
+            db.add(SettingModel(setting_key=f"{MARK_PREFIX}{brand}", setting_value=value))
+
+    # ====================================================================
+    # FETCH (PAGINATED)
+    # ====================================================================
+
+    async def fetch_account(self, api_key: str, brand: str, paid_after: datetime) -> AccountReport:
+        """Page semua invoice PAID setelah paid_after untuk satu akun."""
+        report = AccountReport(brand=brand, paid_after=paid_after, new_mark=None)
+        client = xendit_clients.for_api_key(api_key)
+        page_size = settings.XENDIT_RECONCILE_PAGE_SIZE
+        started = time.perf_counter()
+        cursor: Optional[str] = None
+
+        try:
+            while True:
+                params: Dict[str, Any] = {
+                    "statuses[]": "PAID",
+                    "paid_after": paid_after.astimezone(timezone.utc).isoformat(),
+                    "limit": page_size,
+                }
+                if cursor:
+                    params["last_invoice_id"] = cursor
+
+                response = await client.get("/v2/invoices", params=params)
+                response.raise_for_status()
+                body = response.json()
+                # API v2 mengembalikan list; beberapa versi membungkus di {"data": [...], "has_more": ...}
+                items = body.get("data", []) if isinstance(body, dict) else body or []
+                has_more = body.get("has_more") if isinstance(body, dict) else None
+
+                report.pages += 1
+                report.fetched += len(items)
+                for item in items:
+                    if item.get("external_id"):
+                        report.external_ids.append(item["external_id"])
+                    paid_at = parse_xendit_time(item.get("paid_at"))
+                    if paid_at and (report.new_mark is None or paid_at > report.new_mark):
+                        report.new_mark = paid_at
+
+                if not items or (has_more is False) or (has_more is None and len(items) < page_size):
+                    break
+                if report.pages >= settings.XENDIT_RECONCILE_MAX_PAGES:
+                    # Halaman berikutnya belum ditarik -> mark tidak dimajukan (lihat reconcile)
+                    report.truncated = True
+                    logger.warning(
+                        f"Rekonsiliasi {brand}: berhenti di {report.pages} halaman, mark tidak dimajukan "
+                        f"(naikkan XENDIT_RECONCILE_MAX_PAGES kalau ini terus terjadi)"
+                    )
+                    break
+                cursor = items[-1].get("id")
+                if not cursor:
+                    break
+        except httpx.HTTPStatusError as e:
+            report.error = f"HTTP {e.response.status_code}: {e.response.text[: settings.XENDIT_LOG_MAX_CHARS]}"
+        except httpx.RequestError as e:
+            report.error = f"Kesalahan jaringan: {e}"
+
+        report.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if report.error:
+            logger.error(f"Rekonsiliasi {brand} gagal setelah {report.pages} halaman: {report.error}")
+        return report
+
+    # ====================================================================
+    # RECONCILE
+    # ====================================================================
+
+    async def match_invoices(self, db: AsyncSession, external_ids: List[str]) -> List[InvoiceModel]:
+        """Invoice lokal yang belum Lunas untuk external_id yang sudah PAID di Xendit (per chunk)."""
+        unique_ids = list(dict.fromkeys(external_ids))
+        invoices: List[InvoiceModel] = []
+        chunk = settings.XENDIT_RECONCILE_MATCH_CHUNK
+        for start in range(0, len(unique_ids), chunk):
+            stmt = (
+                select(InvoiceModel)
+                .where(
+                    InvoiceModel.xendit_external_id.in_(unique_ids[start : start + chunk]),
+                    InvoiceModel.status_invoice != "Lunas",
+                )
+                .options(
+                    selectinload(InvoiceModel.pelanggan).options(
+                        selectinload(PelangganModel.harga_layanan),
+                        selectinload(PelangganModel.langganan).selectinload(LanggananModel.paket_layanan),
+                        selectinload(PelangganModel.data_teknis),
+                    )
+                )
+            )
+            invoices.extend((await db.execute(stmt)).scalars().unique().all())
+        return invoices
+
+    async def reconcile(
+        self,
+        db: AsyncSession,
+        process_invoice: Callable[[AsyncSession, InvoiceModel], Awaitable[Any]],
+    ) -> Dict[str, Any]:
+        """
+        Satu run rekonsiliasi: fetch semua akun bersamaan, match, proses dengan
+        process_invoice(db, invoice), lalu commit bersama high-water mark baru.
+        """
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        marks = await self._load_marks(db)
+        overlap = timedelta(seconds=settings.XENDIT_RECONCILE_OVERLAP_SECONDS)
+        lookback = now - timedelta(days=settings.XENDIT_RECONCILE_LOOKBACK_DAYS)
+
+        accounts = xendit_clients.accounts()  # {api_key: brand}
+        fetches = []
+        for api_key, brand in accounts.items():
+            setting = marks.get(brand)
+            mark = parse_xendit_time(setting.setting_value) if setting else None
+            paid_after = (mark - overlap) if mark else lookback
+            fetches.append(self.fetch_account(api_key, brand, paid_after))
+        reports: List[AccountReport] = list(await asyncio.gather(*fetches))
+
+        external_ids = [eid for report in reports for eid in report.external_ids]
+        invoices = await self.match_invoices(db, external_ids) if external_ids else []
+
+        processed = 0
+        for invoice in invoices:
+            await process_invoice(db, invoice)
+            processed += 1
+
+        for report in reports:
+            # Akun yang error / terpotong tidak maju mark-nya; akun tanpa pembayaran baru tetap di mark lama
+            if not report.error and not report.truncated and report.new_mark:
+                self._save_mark(db, marks, report.brand, report.new_mark)
+        await db.commit()
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        fetched = sum(report.fetched for report in reports)
+        summary = {
+            "accounts": [report.to_dict() for report in reports],
+            "fetched": fetched,
+            "matched": len(invoices),
+            "processed": processed,
+            "duration_ms": duration_ms,
+            "throughput_per_second": round(fetched / (duration_ms / 1000), 2) if duration_ms else 0.0,
+            "max_lag_seconds": max((report.lag_seconds for report in reports), default=0.0),
+        }
+        logger.info(
+            f"Rekonsiliasi Xendit: {fetched} PAID ditarik dari {len(reports)} akun, {len(invoices)} cocok, "
+            f"{processed} diproses dalam {duration_ms:.0f} ms (lag maks {summary['max_lag_seconds']:.0f}s)"
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Rekonsiliasi Xendit detail: {json.dumps(summary['accounts'], default=str)}")
+        return summary
+
+
+# Global instance
+xendit_reconciliation = XenditReconciliationService()
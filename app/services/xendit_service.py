@@ -38,6 +38,7 @@ Configuration:
 - Timeout handling
 """
 
+import asyncio
 import httpx
 from ..config import settings
 from ..models.invoice import Invoice as InvoiceModel
@@ -53,6 +54,93 @@ from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger("app.services.xendit")
 
+XENDIT_BASE_URL = "https://api.xendit.co"
+
+
+def _log_json(level: int, label: str, data) -> None:
+    """Log payload/response JSON hanya kalau level aktif, dipotong XENDIT_LOG_MAX_CHARS."""
+    if not logger.isEnabledFor(level):
+        return
+    try:
+        text = json.dumps(data, default=str, separators=(",", ":"))
+    except (TypeError, ValueError):
+        text = str(data)
+    limit = settings.XENDIT_LOG_MAX_CHARS
+    if limit and len(text) > limit:
+        text = f"{text[:limit]}... ({len(text)} chars)"
+    logger.log(level, f"{label}: {text}")
+
+
+class XenditClientRegistry:
+    """
+    httpx.AsyncClient long-lived per akun Xendit (API key), dipakai ulang antar request
+    supaya koneksi TCP/TLS tetap hidup (keep-alive) - tidak ada handshake baru per invoice.
+    Header Basic auth dibangun sekali per client. Dibuka di startup, ditutup di shutdown.
+    """
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._http2 = self._detect_http2()
+
+    @staticmethod
+    def _detect_http2() -> bool:
+        if not settings.XENDIT_HTTP2:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("XENDIT_HTTP2 aktif tapi package 'h2' tidak terinstall, pakai HTTP/1.1")
+            return False
+
+    def _build(self, api_key: str) -> httpx.AsyncClient:
+        encoded_key = base64.b64encode(f"{api_key}:".encode("utf-8")).decode("utf-8")
+        return httpx.AsyncClient(
+            base_url=XENDIT_BASE_URL,
+            headers={"Content-Type": "application/json", "Authorization": f"Basic {encoded_key}"},
+            timeout=settings.XENDIT_HTTP_TIMEOUT,
+            http2=self._http2,
+            limits=httpx.Limits(
+                max_connections=settings.XENDIT_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.XENDIT_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.XENDIT_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    def for_api_key(self, api_key: str) -> httpx.AsyncClient:
+        """Client untuk satu API key; brand yang berbagi key berbagi client (dan pool koneksinya)."""
+        client = self._clients.get(api_key)
+        if client is None or client.is_closed:
+            client = self._build(api_key)
+            self._clients[api_key] = client
+        return client
+
+    def for_brand(self, brand_name: str) -> httpx.AsyncClient | None:
+        api_key = settings.XENDIT_API_KEYS.get(brand_name)
+        return self.for_api_key(api_key) if api_key else None
+
+    def accounts(self) -> dict[str, str]:
+        """Satu nama brand per API key unik: {api_key: brand_name}."""
+        unique: dict[str, str] = {}
+        for brand_name, api_key in settings.XENDIT_API_KEYS.items():
+            if api_key and api_key not in unique:
+                unique[api_key] = brand_name
+        return unique
+
+    async def start(self) -> None:
+        for api_key in self.accounts():
+            self.for_api_key(api_key)
+        logger.info(f"Xendit HTTP client siap: {len(self._clients)} akun, http2={self._http2}")
+
+    async def close(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+# Global instance
+xendit_clients = XenditClientRegistry()
+
 
 async def create_xendit_invoice(
     invoice: InvoiceModel,
@@ -156,12 +244,6 @@ async def create_xendit_invoice(
     if not api_key:
         raise ValueError(f"Kunci API Xendit untuk '{target_key_name}' tidak ditemukan.")
 
-    encoded_key = base64.b64encode(f"{api_key}:".encode("utf-8")).decode("utf-8")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Basic {encoded_key}",
-    }
-
     brand_info = pelanggan.harga_layanan
     jatuh_tempo_str = invoice.tgl_jatuh_tempo.strftime("%d/%m/%Y")  # type: ignore
 
@@ -242,70 +324,55 @@ async def create_xendit_invoice(
     # Ini akan menghasilkan ID yang konsisten antara Portal JAKINET dan Dashboard Xendit
     payload["external_id"] = f"{brand_prefix}/ftth/{nama_user}/{bulan_tahun}/{lokasi_singkat}/{invoice.id}"
 
-    logger.info(f"Payload yang dikirim ke Xendit: {json.dumps(payload, indent=2)}")
-
-    async with httpx.AsyncClient(timeout=30.0) as client:  # Tambahkan timeout
-        try:
-            response = await client.post(settings.XENDIT_API_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            result = response.json()
-            logger.info(f"Respons dari Xendit: {json.dumps(result, indent=2)}")
-
-            # DEBUG: Log WhatsApp status specifically
-            if result.get("should_send_whatsapp") or result.get("customer_notification_preference"):
-                logger.info(f"  WhatsApp Notification Status:")
-                logger.info(f"   should_send_whatsapp: {result.get('should_send_whatsapp', 'Not in response')}")
-                logger.info(f"   notification_preference: {result.get('customer_notification_preference', 'Not in response')}")
-                logger.info(f"   customer_mobile: {result.get('customer', {}).get('mobile_number', 'Not in response')}")
-
-                # Check for WhatsApp specific fields
-                if "whatsapp" in result:
-                    logger.info(f"   whatsapp_details: {result['whatsapp']}")
-
-            return result
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Error saat membuat invoice Xendit. Payload: {json.dumps(payload, indent=2)}")
-            logger.error(f"Respons Error dari Xendit: {e.response.text}")
-            raise e
-        except httpx.RequestError as e:
-            logger.error(f"Kesalahan jaringan ke Xendit: {str(e)}")
-            raise ValueError(f"Kesalahan jaringan ke Xendit: {str(e)}")
+    _log_json(logging.INFO, "Payload yang dikirim ke Xendit", payload)
+
+    # Client long-lived per API key (keep-alive, header auth sudah terpasang)
+    client = xendit_clients.for_api_key(api_key)
+    try:
+        response = await client.post(settings.XENDIT_API_URL, json=payload)
+        response.raise_for_status()
+        result = response.json()
+        _log_json(logging.INFO, "Respons dari Xendit", result)
+
+        # DEBUG: Log WhatsApp status specifically
+        if logger.isEnabledFor(logging.DEBUG) and (
+            result.get("should_send_whatsapp") or result.get("customer_notification_preference")
+        ):
+            logger.debug(
+                f"WhatsApp Notification Status: should_send_whatsapp={result.get('should_send_whatsapp', 'Not in response')}, "
+                f"notification_preference={result.get('customer_notification_preference', 'Not in response')}, "
+                f"customer_mobile={result.get('customer', {}).get('mobile_number', 'Not in response')}, "
+                f"whatsapp_details={result.get('whatsapp', '-')}"
+            )
+
+        return result
+    except httpx.HTTPStatusError as e:
+        _log_json(logging.ERROR, "Error saat membuat invoice Xendit. Payload", payload)
+        logger.error(f"Respons Error dari Xendit: {e.response.text[: settings.XENDIT_LOG_MAX_CHARS]}")
+        raise e
+    except httpx.RequestError as e:
+        logger.error(f"Kesalahan jaringan ke Xendit: {str(e)}")
+        raise ValueError(f"Kesalahan jaringan ke Xendit: {str(e)}")
 
 
 async def get_paid_invoice_ids_since(days: int) -> list[str]:
     """
     Mengambil daftar external_id dari semua invoice PAID dari SEMUA BRAND.
+
+    Semua halaman diikuti (tidak berhenti di limit pertama) dan akun di-fetch
+    bersamaan. Untuk rekonsiliasi incremental pakai xendit_reconciliation.
     """
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    from .xendit_reconciliation import xendit_reconciliation
+
+    paid_after = datetime.now(timezone.utc) - timedelta(days=days)
+    reports = await asyncio.gather(
+        *(
+            xendit_reconciliation.fetch_account(api_key, brand_name, paid_after)
+            for api_key, brand_name in xendit_clients.accounts().items()
+        )
+    )
     all_paid_ids = []
-
-    for brand_name, api_key in settings.XENDIT_API_KEYS.items():
-        if not api_key:
-            logger.warning(f"Kunci API Xendit untuk brand '{brand_name}' tidak ditemukan, dilewati.")
-            continue
-
-        logger.info(f"Memeriksa pembayaran lunas untuk brand: {brand_name}")
-        encoded_key = base64.b64encode(f"{api_key}:".encode("utf-8")).decode("utf-8")
-        headers = {"Authorization": f"Basic {encoded_key}"}
-
-        base_url = "https://api.xendit.co/v2/invoices"
-        query_params = {"statuses[]": "PAID", "paid_after": start_date, "limit": 1000}
-
-        # Gunakan httpx dengan params, ini cara yang lebih modern dan aman
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                # httpx akan meng-encode 'statuses[]' dengan benar menjadi statuses%5B%5D=PAID
-                response = await client.get(base_url, headers=headers, params=query_params)
-                response.raise_for_status()
-
-                # Cek apakah response.json() menghasilkan dict dan punya key 'data'
-                response_data = response.json()
-                invoices_data = response_data.get("data", []) if isinstance(response_data, dict) else []
-
-                brand_paid_ids = [inv.get("external_id") for inv in invoices_data if inv.get("external_id")]
-                all_paid_ids.extend(brand_paid_ids)
-                logger.info(f"Ditemukan {len(brand_paid_ids)} pembayaran lunas untuk brand {brand_name}.")
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Error saat mengambil data dari Xendit untuk brand {brand_name}: {e.response.text}")
-
+    for report in reports:
+        all_paid_ids.extend(report.external_ids)
+        logger.info(f"Ditemukan {report.fetched} pembayaran lunas untuk brand {report.brand} ({report.pages} halaman).")
     return all_paid_ids
@@ -132,7 +132,12 @@ class CSVExporter:
             if field_mapping:
                 mapped_dict = {}
                 for export_field, source_field in field_mapping.items():
-                    mapped_dict[export_field] = item_dict.get(source_field, "")
+                    if source_field in item_dict or isinstance(item, dict):
+                        mapped_dict[export_field] = item_dict.get(source_field, "")
+                    else:
+                        # Attribute yang tidak ada di __dict__ (misal field terenkripsi seperti
+                        # Pelanggan.no_ktp yang didekripsi saat dibaca) diambil lewat getattr
+                        mapped_dict[export_field] = getattr(item, source_field, "")
                 item_dict = mapped_dict
 
             # Exclude fields
@@ -21,9 +21,30 @@ Use cases:
 Security:
 - JWT token authentication
 - Rate limiting per IP
-- Single connection per user
+- Max WEBSOCKET_MAX_CONNECTIONS_PER_USER koneksi per user
 - Heartbeat monitoring
 - Graceful connection cleanup
+
+Multi-worker:
+- send_to_user / broadcast_to_roles publish satu envelope ke bus
+  (app/services/websocket_bus.py). Setiap worker menerima envelope itu dan
+  mengirim ke socket yang terhubung di worker-nya sendiri.
+- WEBSOCKET_BUS_BACKEND="memory" (default) untuk satu worker,
+  "database" untuk beberapa worker / host.
+
+Multi-session & antrian kirim:
+- Satu user boleh punya beberapa koneksi (tab / HP + desktop). Setiap
+  koneksi = WebSocketConnection dengan antrian kirim terbatas dan task
+  writer sendiri (app/services/websocket_connection.py).
+- Broadcast hanya enqueue JSON yang di-serialize sekali, jadi client yang
+  lambat tidak menahan pengiriman ke user lain.
+
+Role broadcast:
+- Role user disimpan saat socket terautentikasi (connect(..., roles=...)) di
+  role_index (role -> user_id lokal). broadcast_to_role_names() tidak query
+  database dan hanya mengirim ke koneksi yang hidup.
+- Setelah role user / nama role berubah, panggil refresh_connection_roles()
+  supaya semua worker memuat ulang role koneksinya.
 """
 
 import asyncio
@@ -32,10 +53,19 @@ import json
 import logging
 import time
 from collections import defaultdict
-from typing import Dict, List, Set
+from typing import Dict, Iterable, List, Optional, Set
 
 from fastapi import WebSocket, WebSocketDisconnect
 
+from sqlalchemy import select
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models.role import Role as RoleModel
+from .models.user import User as UserModel
+from .services.websocket_bus import WebSocketBus, create_websocket_bus
+from .services.websocket_connection import WebSocketConnection
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,17 +75,17 @@ class ConnectionManager:
     Handle semua real-time connections buat billing system.
 
     Features:
-    - Single connection per user (security)
+    - Multi-session per user (dibatasi WEBSOCKET_MAX_CONNECTIONS_PER_USER)
     - Performance metrics & monitoring
     - Rate limiting protection
-    - Batch message processing
+    - Antrian kirim per koneksi (drop-oldest + coalescing)
     - Automatic heartbeat & cleanup
     - Role-based message targeting
 
     Architecture:
-    - Dict-based connection storage (user_id -> WebSocket)
-    - Metadata tracking buat performance
-    - Queue-based batch processing
+    - Dict-based connection storage (user_id -> set WebSocketConnection)
+    - Metadata tracking per koneksi buat performance
+    - Queue + writer task per koneksi
     - Async task management
 
     Usage:
@@ -66,19 +96,17 @@ class ConnectionManager:
     """
 
     def __init__(self):
-        # Menyimpan koneksi aktif dengan key user_id
-        self.active_connections: Dict[int, WebSocket] = {}
-
-        # Performance optimization: Track connection metadata
-        self.connection_metadata: Dict[int, dict] = {}
+        # Menyimpan koneksi aktif dengan key user_id (satu user bisa beberapa tab/device)
+        self.active_connections: Dict[int, Set[WebSocketConnection]] = {}
+        self.max_connections_per_user = max(1, settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER)
 
         # Track user roles for efficient broadcasting
         self.user_roles: Dict[int, Set[str]] = defaultdict(set)
 
-        # Connection pool untuk batch operations
-        self._connection_queue = asyncio.Queue(maxsize=1000)
-        self._batch_size = 50
-        self._batch_timeout = 0.1  # 100ms
+        # Inverted index: nama role (lowercase) -> user_id yang socket-nya ada di worker ini.
+        # Diisi saat connect (role user yang sudah terautentikasi), jadi broadcast per role
+        # tidak perlu query database dan hanya menyentuh koneksi yang hidup.
+        self.role_index: Dict[str, Set[int]] = defaultdict(set)
 
         # Heartbeat mechanism
         self._heartbeat_task = None
@@ -89,77 +117,74 @@ class ConnectionManager:
         self.rate_limit_window = 60  # 60 seconds
         self.max_attempts_per_window = 30  # maksimal 30 koneksi per menit per IP (1 koneksi per 2 detik)
 
+        # Backplane antar worker - semua pengiriman lewat sini
+        self.bus: WebSocketBus = create_websocket_bus(self._handle_bus_envelope)
+
         # Performance metrics
         self.metrics = {
             "total_connections": 0,
             "messages_sent": 0,
             "messages_failed": 0,
+            "messages_dropped": 0,
+            "messages_coalesced": 0,
             "avg_response_time": 0,
             "connection_duration": defaultdict(list),
             "blocked_attempts": 0,
         }
 
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def connect(
+        self, websocket: WebSocket, user_id: int, roles: Optional[Iterable[str]] = None
+    ) -> WebSocketConnection:
         """
         Accept dan setup WebSocket connection baru.
-        Implement single connection policy buat security.
+        Satu user boleh punya beberapa koneksi (tab / device).
 
         Args:
             websocket: FastAPI WebSocket object
             user_id: User ID yang mau connect
+            roles: Nama role user (untuk broadcast_to_role_names)
+
+        Returns:
+            WebSocketConnection - pakai connection.enqueue() untuk kirim ke socket ini
+            dan manager.disconnect(user_id, connection) saat socket selesai.
 
         Security features:
-        - Single connection per user (kick existing connection)
-        - Graceful connection replacement
+        - Maksimal max_connections_per_user koneksi, koneksi tertua ditutup
         - Metadata tracking buat monitoring
         - Auto-start heartbeat mechanism
 
         Process flow:
-        1. Cek existing connection, kick kalau ada
+        1. Tutup koneksi tertua kalau user sudah mencapai batas
         2. Accept new WebSocket connection
-        3. Store connection dan metadata
+        3. Buat WebSocketConnection (antrian kirim + writer task)
         4. Start heartbeat monitoring
         5. Update metrics
-
-        Note:
-        - Existing connection bakal di-close gracefully
-        - Metadata dipake buat performance monitoring
-        - Heartbeat mulai otomatis
         """
-
-        # Handle multiple connections from same user - allow only one connection per user
-        if user_id in self.active_connections:
-            # Close existing connection gracefully before accepting new one
-            try:
-                await self.active_connections[user_id].close(code=1000, reason="Connection replaced")
-                # Remove old connection from active connections
-                del self.active_connections[user_id]
-                logger.info(f"Replaced old connection for user {user_id}")
-            except Exception as e:
-                logger.warning(f"Error closing old connection for user {user_id}: {e}")
-                # Force remove from active connections if close fails
-                if user_id in self.active_connections:
-                    del self.active_connections[user_id]
+        existing = self.active_connections.get(user_id, set())
+        if len(existing) >= self.max_connections_per_user:
+            oldest = min(existing, key=lambda conn: conn.connected_at)
+            logger.info(f"User {user_id} reached {self.max_connections_per_user} connections, closing the oldest one")
+            await self.disconnect(user_id, oldest, code=1000, reason="Connection replaced")
 
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-
-        # Track connection metadata for performance monitoring
-        self.connection_metadata[user_id] = {
-            "connected_at": time.time(),
-            "last_ping": time.time(),
-            "messages_sent": 0,
-            "last_activity": time.time(),
-        }
+        connection = WebSocketConnection(websocket, user_id, on_error=self._on_connection_error, metrics=self.metrics)
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        self._set_local_roles(user_id, roles or [])
+        connection.start()
 
         self.metrics["total_connections"] += 1
 
-        logger.info(f"User {user_id} connected. Total connections: {len(self.active_connections)}")
+        logger.info(
+            f"User {user_id} connected ({len(self.active_connections[user_id])} session(s)). "
+            f"Total users: {len(self.active_connections)}"
+        )
 
         # Start heartbeat if not already running
-        if self._heartbeat_task is None:
+        if self._heartbeat_task is None or self._heartbeat_task.done():
             self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
 
+        return connection
+
     def is_rate_limited(self, client_ip: str) -> bool:
         """
         Rate limiting protection buat prevent connection spam.
@@ -233,55 +258,105 @@ class ConnectionManager:
             del self.connection_attempts[client_ip]
             logger.info(f"Rate limit manually cleared for IP {client_ip}")
 
-    async def disconnect(self, user_id: int):
+    async def disconnect(
+        self, user_id: int, connection: Optional[WebSocketConnection] = None, code: int = 1000, reason: str = ""
+    ):
         """
-        Clean disconnect user dari WebSocket manager.
-        Cleanup semua metadata dan tracking data.
+        Clean disconnect koneksi user dari WebSocket manager.
 
         Args:
             user_id: User ID yang mau disconnect
+            connection: Koneksi yang dilepas; None = semua koneksi user
 
         Cleanup tasks:
-        - Remove dari active connections
+        - Stop writer task dan tutup socket
         - Track connection duration metrics
-        - Clean up role assignments
-        - Remove connection metadata
+        - Clean up role assignments kalau koneksi terakhir user
         - Update connection count
 
-        Performance tracking:
-        - Connection duration analysis
-        - Message delivery statistics
-        - User behavior patterns
-
         Note:
-        - Graceful cleanup tanpa error
-        - Metrics preserved buat analysis
-        - Auto cleanup role assignments
+        - Aman dipanggil berkali-kali untuk koneksi yang sama
         """
-        if user_id in self.active_connections:
-            # Track connection duration
-            if user_id in self.connection_metadata:
-                duration = time.time() - self.connection_metadata[user_id]["connected_at"]
-                self.metrics["connection_duration"][user_id].append(duration)
-                del self.connection_metadata[user_id]
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return
+
+        targets = list(connections) if connection is None else [connection]
+        for conn in targets:
+            if conn not in connections:
+                continue
+            connections.discard(conn)
+            self.metrics["connection_duration"][user_id].append(time.time() - conn.connected_at)
+            await conn.close(code=code, reason=reason)
 
-            # Clean up role tracking
-            if user_id in self.user_roles:
-                del self.user_roles[user_id]
+        if not connections:
+            # Koneksi terakhir user - clean up role tracking
+            self.active_connections.pop(user_id, None)
+            self._set_local_roles(user_id, [])
+        logger.info(f"User {user_id} disconnected. Total users: {len(self.active_connections)}")
 
-            del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected. Total connections: {len(self.active_connections)}")
+    async def _on_connection_error(self, connection: WebSocketConnection):
+        """Dipanggil writer koneksi saat send gagal / timeout."""
+        await self.disconnect(connection.user_id, connection, code=1011, reason="Send failed")
+
+    def iter_connections(self):
+        """Semua koneksi di worker ini (snapshot)."""
+        return [conn for connections in list(self.active_connections.values()) for conn in list(connections)]
 
     async def add_user_role(self, user_id: int, role: str):
         """Add role to user for targeted broadcasting."""
         self.user_roles[user_id].add(role)
+        self.role_index[role.lower()].add(user_id)
         logger.debug(f"Added role '{role}' to user {user_id}")
 
     def get_users_by_role(self, role: str) -> List[int]:
         """Get all users that have a specific role."""
-        return [user_id for user_id, roles in self.user_roles.items() if role in roles]
+        return list(self.role_index.get(role.lower(), ()))
+
+    def _set_local_roles(self, user_id: int, roles: Iterable[str]):
+        """Ganti role user di user_roles + role_index (list kosong = hapus)."""
+        for old_role in self.user_roles.pop(user_id, set()):
+            members = self.role_index.get(old_role.lower())
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.role_index[old_role.lower()]
+
+        new_roles = {role for role in roles if role}
+        if new_roles:
+            self.user_roles[user_id] = new_roles
+            for role in new_roles:
+                self.role_index[role.lower()].add(user_id)
+
+    async def refresh_connection_roles(self, user_ids: Optional[List[int]] = None):
+        """
+        Invalidasi role_index setelah role user berubah (update user, rename/hapus role).
+        Dikirim lewat bus, jadi semua worker memuat ulang role koneksi lokalnya.
+        user_ids=None = semua koneksi.
+        """
+        await self.bus.publish({"kind": "roles_changed", "user_ids": user_ids})
+
+    async def _reload_local_roles(self, user_ids: Optional[List[int]]):
+        candidates = self.active_connections.keys() if user_ids is None else user_ids
+        targets = [user_id for user_id in candidates if user_id in self.active_connections]
+        if not targets:
+            return
 
-    async def send_to_user(self, user_id: int, message: dict):
+        async with AsyncSessionLocal() as db:  # type: ignore[attr-defined]
+            rows = (
+                await db.execute(
+                    select(UserModel.id, RoleModel.name)
+                    .outerjoin(RoleModel, UserModel.role_id == RoleModel.id)
+                    .where(UserModel.id.in_(targets))
+                )
+            ).all()
+        role_by_user = {user_id: role_name for user_id, role_name in rows}
+        for user_id in targets:
+            role_name = role_by_user.get(user_id)
+            self._set_local_roles(user_id, [role_name] if role_name else [])
+        logger.debug(f"Role index reloaded for {len(targets)} connection(s)")
+
+    async def send_to_user(self, user_id: int, message: dict, coalesce_key: Optional[str] = None):
         """
         Kirim message ke user spesifik via WebSocket.
         Core messaging function buat individual notifications.
@@ -289,9 +364,10 @@ class ConnectionManager:
         Args:
             user_id: Target user ID
             message: Message dictionary dengan data
+            coalesce_key: Pesan dengan key sama yang belum terkirim diganti yang terbaru
 
         Returns:
-            True kalau berhasil, False kalau gagal/user tidak ada
+            True kalau masuk antrian minimal satu koneksi, False kalau gagal/user tidak ada
 
         Message format:
         {
@@ -322,37 +398,37 @@ class ConnectionManager:
         - Graceful fallback on errors
         - Failed message tracking
         """
-        if user_id not in self.active_connections:
-            logger.warning(f"User {user_id} is not connected")
-            return False
-
         # Ensure message has timestamp
         if "timestamp" not in message:
             message["timestamp"] = datetime.datetime.now().isoformat()
 
+        # Serialize sekali, lalu publish ke semua worker
         try:
-            # Serialize message
             message_json = json.dumps(message, ensure_ascii=False)
-            # Send to specific user
-            await self.active_connections[user_id].send_text(message_json)
-
-            # Update user activity
-            if user_id in self.connection_metadata:
-                self.connection_metadata[user_id]["last_activity"] = time.time()
-                self.connection_metadata[user_id]["messages_sent"] += 1
-
-            self.metrics["messages_sent"] += 1
-            logger.info(f"Message sent to user {user_id}")
-            return True
-
         except Exception as e:
             self.metrics["messages_failed"] += 1
-            logger.error(f"Failed to send message to user {user_id}: {e}")
-            # Remove disconnected user
-            await self.disconnect(user_id)
+            logger.error(f"Failed to serialize message for user {user_id}: {e}")
+            return False
+        result = await self.bus.publish(
+            {"kind": "user", "user_ids": [user_id], "message": message_json, "coalesce": coalesce_key}
+        )
+        return bool(result)
+
+    async def _send_local(self, user_id: int, message_json: str, coalesce_key: Optional[str] = None) -> bool:
+        """Antrikan ke semua koneksi user yang ada di worker ini."""
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            # Dengan beberapa worker ini normal - socket user bisa ada di worker lain
+            logger.debug(f"User {user_id} is not connected to this worker")
             return False
 
-    async def broadcast_to_roles(self, message: dict, user_ids: List[int]):
+        queued = False
+        for conn in list(connections):
+            queued = conn.enqueue(message_json, coalesce_key) or queued
+        logger.debug(f"Message queued for user {user_id} ({len(connections)} session(s))")
+        return queued
+
+    async def broadcast_to_roles(self, message: dict, user_ids: List[int], coalesce_key: Optional[str] = None):
         """
         Broadcast message ke multiple users dengan performance optimization.
         Main function buat mass notifications.
@@ -362,7 +438,7 @@ class ConnectionManager:
             user_ids: List target user IDs
 
         Performance features:
-        - Batch processing buat large broadcasts
+        - Serialize sekali per broadcast, lalu enqueue ke setiap koneksi
         - JSON validation & serialization
         - Message format standardization
         - Metrics tracking
@@ -371,13 +447,9 @@ class ConnectionManager:
         1. Validate message format
         2. Auto-add missing fields (timestamp, type)
         3. JSON serialization & validation
-        4. Batch vs direct routing decision
+        4. Enqueue ke antrian kirim setiap koneksi (tidak menunggu socket)
         5. Performance metrics update
 
-        Batch vs Direct:
-        - < 50 users: Direct broadcast (faster)
-        - > 50 users: Batch processing (more efficient)
-
         Usage:
             await manager.broadcast_to_roles(
                 message={"type": "system_alert", "message": "Maintenance in 5 mins"},
@@ -393,11 +465,56 @@ class ConnectionManager:
             return
 
         start_time = time.time()
+        message_json = self._prepare_broadcast_message(message)
+        if message_json is None:
+            return
+
+        # Publish sekali; setiap worker kirim ke socket lokalnya (_broadcast_local)
+        await self.bus.publish(
+            {"kind": "users", "user_ids": list(user_ids), "message": message_json, "coalesce": coalesce_key}
+        )
 
+        # Update metrics
+        process_time = time.time() - start_time
+        self.metrics["avg_response_time"] = (self.metrics["avg_response_time"] + process_time) / 2
+
+    async def broadcast_to_role_names(self, message: dict, role_names: List[str], coalesce_key: Optional[str] = None):
+        """
+        Broadcast ke semua user yang TERHUBUNG dengan salah satu role (case-insensitive).
+        Tanpa query database: setiap worker memakai role_index koneksi lokalnya.
+
+        Usage:
+            await manager.broadcast_to_role_names(
+                message={"type": "new_payment", "message": "Pembayaran diterima"},
+                role_names=["Admin", "NOC", "Finance"]
+            )
+        """
+        if not role_names:
+            return
+
+        start_time = time.time()
+        message_json = self._prepare_broadcast_message(message)
+        if message_json is None:
+            return
+
+        await self.bus.publish(
+            {
+                "kind": "roles",
+                "roles": [role.lower() for role in role_names],
+                "message": message_json,
+                "coalesce": coalesce_key,
+            }
+        )
+
+        process_time = time.time() - start_time
+        self.metrics["avg_response_time"] = (self.metrics["avg_response_time"] + process_time) / 2
+
+    def _prepare_broadcast_message(self, message: dict) -> Optional[str]:
+        """Standarisasi format message broadcast lalu serialize ke JSON (None kalau bukan dict)."""
         # Validasi dan siapkan message dengan format yang konsisten
         if not isinstance(message, dict):
             logger.error("Message must be a dictionary")
-            return
+            return None
 
         # Pastikan message memiliki timestamp
         if "timestamp" not in message:
@@ -435,60 +552,48 @@ class ConnectionManager:
             }
             message_json = json.dumps(fallback_message, ensure_ascii=False)
 
-        # Performance optimization: Batch processing untuk large broadcasts
-        if len(user_ids) > self._batch_size:
-            await self._batch_broadcast(message_json, user_ids)
-        else:
-            await self._direct_broadcast(message_json, user_ids)
+        return message_json
 
-        # Update metrics
-        process_time = time.time() - start_time
-        self.metrics["avg_response_time"] = (self.metrics["avg_response_time"] + process_time) / 2
+    async def _handle_bus_envelope(self, envelope: dict):
+        """Handler bus: kirim envelope ke socket yang terhubung di worker ini."""
+        kind = envelope.get("kind")
+        if kind == "roles_changed":
+            await self._reload_local_roles(envelope.get("user_ids"))
+            return True
 
-    async def _direct_broadcast(self, message_json: str, user_ids: List[int]):
-        """Direct broadcast untuk small batches."""
-        tasks = []
-        active_user_ids = []
+        message_json = envelope.get("message")
+        if not message_json:
+            return False
+        coalesce_key = envelope.get("coalesce")
+        if kind == "roles":
+            user_ids: Set[int] = set()
+            for role in envelope.get("roles") or []:
+                user_ids.update(self.role_index.get(role, ()))
+            await self._broadcast_local(message_json, list(user_ids), coalesce_key)
+            return True
 
+        user_ids_list = envelope.get("user_ids") or []
+        if kind == "user" and len(user_ids_list) == 1:
+            return await self._send_local(user_ids_list[0], message_json, coalesce_key)
+        await self._broadcast_local(message_json, user_ids_list, coalesce_key)
+        return True
+
+    async def _broadcast_local(self, message_json: str, user_ids: List[int], coalesce_key: Optional[str] = None):
+        """Antrikan ke semua koneksi user_ids yang ada di worker ini (tanpa menunggu socket)."""
+        queued = 0
         for user_id in user_ids:
-            if user_id in self.active_connections:
-                websocket = self.active_connections[user_id]
-                active_user_ids.append(user_id)
-                tasks.append(websocket.send_text(message_json))
-
-        if tasks:
-            logger.info(f"Broadcasting to {len(tasks)} user(s).")
-            # Gunakan return_exceptions=True untuk mencegah satu error menghentikan semua
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # Update metrics dan log error individu
-            success_count = 0
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    self.metrics["messages_failed"] += 1
-                    logger.error(f"Failed to send message to user {active_user_ids[i]}: {result}")
-                else:
-                    success_count += 1
-                    # Update user activity
-                    if active_user_ids[i] in self.connection_metadata:
-                        self.connection_metadata[active_user_ids[i]]["last_activity"] = time.time()
-                        self.connection_metadata[active_user_ids[i]]["messages_sent"] += 1
-
-            self.metrics["messages_sent"] += success_count
-
-    async def _batch_broadcast(self, message_json: str, user_ids: List[int]):
-        """Batch processing untuk large broadcasts."""
-        logger.info(f"Starting batch broadcast to {len(user_ids)} users")
-
-        # Split into batches
-        batches = [user_ids[i : i + self._batch_size] for i in range(0, len(user_ids), self._batch_size)]
-
-        for batch in batches:
-            active_batch = [uid for uid in batch if uid in self.active_connections]
-            if active_batch:
-                await self._direct_broadcast(message_json, active_batch)
-                # Small delay between batches to prevent overwhelming
-                await asyncio.sleep(0.01)
+            for conn in list(self.active_connections.get(user_id, ())):
+                if conn.enqueue(message_json, coalesce_key):
+                    queued += 1
+        if queued:
+            logger.info(f"Broadcast queued to {queued} connection(s).")
+
+    async def start_bus(self):
+        """Mulai subscriber bus (dipanggil saat startup aplikasi)."""
+        await self.bus.start()
+
+    async def stop_bus(self):
+        await self.bus.stop()
 
     async def _heartbeat_loop(self):
         """
@@ -508,7 +613,7 @@ class ConnectionManager:
         - Error recovery
 
         Auto-cleanup:
-        - No activity > 2x heartbeat interval = stale
+        - Tidak ada send berhasil / pesan masuk > 2x heartbeat interval = stale
         - Failed ping = connection problem
         - Auto remove stale connections
         - Graceful connection cleanup
@@ -533,33 +638,24 @@ class ConnectionManager:
         logger.info("Heartbeat loop ended")
 
     async def _send_heartbeat(self):
-        """Send ping to all active connections and remove stale ones."""
+        """Antrikan ping ke semua koneksi dan lepas koneksi yang stale."""
         ping_time = time.time()
+        ping_json = json.dumps({"type": "ping", "timestamp": ping_time})
         stale_connections = []
 
-        for user_id, websocket in list(self.active_connections.items()):
-            try:
-                # Check if connection is stale (no activity for 2x heartbeat interval)
-                if user_id in self.connection_metadata:
-                    last_activity = self.connection_metadata[user_id]["last_activity"]
-                    if ping_time - last_activity > (self._heartbeat_interval * 2):
-                        stale_connections.append(user_id)
-                        continue
-
-                # Send ping
-                await websocket.send_text(json.dumps({"type": "ping", "timestamp": ping_time}))
-
-                # Update metadata
-                if user_id in self.connection_metadata:
-                    self.connection_metadata[user_id]["last_ping"] = ping_time
-
-            except Exception as e:
-                logger.warning(f"Heartbeat failed for user {user_id}: {e}")
-                stale_connections.append(user_id)
+        for conn in self.iter_connections():
+            # Stale = antrian tidak pernah berhasil terkirim dan client diam selama 2x heartbeat interval
+            if ping_time - conn.last_activity > (self._heartbeat_interval * 2):
+                stale_connections.append(conn)
+                continue
+            # Ping yang belum terkirim cukup diganti yang baru
+            conn.enqueue(ping_json, coalesce_key="ping")
+            conn.last_ping = ping_time
 
         # Clean up stale connections
-        for user_id in stale_connections:
-            await self.disconnect(user_id)
+        for conn in stale_connections:
+            logger.warning(f"Connection {conn.id} of user {conn.user_id} is stale, closing")
+            await self.disconnect(conn.user_id, conn, code=1001, reason="Stale connection")
 
     def get_metrics(self) -> dict:
         """
@@ -594,7 +690,7 @@ class ConnectionManager:
         - System performance indicators
         - User engagement metrics
         """
-        active_connections = len(self.active_connections)
+        connections = self.iter_connections()
 
         # Calculate average connection duration
         if self.metrics["connection_duration"]:
@@ -605,7 +701,11 @@ class ConnectionManager:
             avg_duration = 0
 
         return {
-            "active_connections": active_connections,
+            "active_connections": len(connections),
+            "active_users": len(self.active_connections),
+            "queued_messages": sum(conn.queued for conn in connections),
+            "messages_dropped": self.metrics["messages_dropped"],
+            "messages_coalesced": self.metrics["messages_coalesced"],
             "total_connections": self.metrics["total_connections"],
             "messages_sent": self.metrics["messages_sent"],
             "messages_failed": self.metrics["messages_failed"],
@@ -617,6 +717,7 @@ class ConnectionManager:
             "avg_response_time_ms": round(self.metrics["avg_response_time"] * 1000, 2),
             "avg_connection_duration_min": round(avg_duration / 60, 2),
             "heartbeat_interval_s": self._heartbeat_interval,
+            "bus": self.bus.get_stats(),
         }
 
     async def cleanup(self):
@@ -654,16 +755,15 @@ class ConnectionManager:
             except asyncio.CancelledError:
                 pass
 
+        await self.stop_bus()
+
         # Close all connections
-        for user_id in list(self.active_connections.keys()):
-            try:
-                await self.active_connections[user_id].close(code=1001, reason="Server shutdown")
-            except Exception:
-                pass
+        for conn in self.iter_connections():
+            await conn.close(code=1001, reason="Server shutdown")
 
         self.active_connections.clear()
-        self.connection_metadata.clear()
         self.user_roles.clear()
+        self.role_index.clear()
         logger.info("WebSocket manager cleaned up")
 
 
@@ -685,16 +785,18 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
         await websocket.close(code=1008)
         return
 
-    # Connect user
-    await manager.connect(websocket, user.id)
+    # Connect user (satu user boleh beberapa tab/device)
+    connection = await manager.connect(websocket, user.id, roles=[user.role.name])
 
     try:
         while True:
             # Handle WebSocket messages
             data = await websocket.receive_text()
-            # Process client messages...
+            connection.touch()
+            # Balas lewat antrian koneksi, bukan websocket.send_text langsung
+            connection.enqueue(json.dumps({"type": "pong"}))
     except WebSocketDisconnect:
-        await manager.disconnect(user.id)
+        await manager.disconnect(user.id, connection)
 
 # Kirim notification dari background process
 await manager.send_to_user(
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK DEKRIPSI FIELD - listener 'load' (eager) vs encrypted_field (lazy + LRU)
+
+Simulasi pola akses endpoint yang paling sering memuat Pelanggan:
+- list pelanggan   : no_ktp ikut di response (semua row dibaca)
+- list langganan / invoice : pelanggan ikut di-load, no_ktp tidak pernah dibaca
+- export CSV       : semua row dibaca, biasanya diulang dengan filter berbeda
+
+Mode:
+- eager : setiap object yang di-load langsung didekripsi (perilaku listener lama)
+- lazy  : dekripsi saat attribute dibaca lewat encrypted_field + LRU ciphertext
+
+Setiap skenario dijalankan --repeat kali (request berulang ke endpoint yang sama).
+
+Usage:
+    python scripts/benchmark_field_decryption.py --rows 5000 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from cryptography.fernet import Fernet
+
+# Key sementara supaya benchmark tidak butuh .env production
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from app.encryption import EncryptionService, encrypted_field  # noqa: E402
+from app import encryption  # noqa: E402
+
+
+class EagerRow:
+    """Meniru listener 'load' lama: dekripsi langsung saat object dibuat dari row."""
+
+    def __init__(self, ciphertext: str, service: EncryptionService):
+        self.no_ktp = service.decrypt(ciphertext)
+
+
+class LazyRow:
+    """Meniru model baru: kolom mentah di _no_ktp, dekripsi saat no_ktp dibaca."""
+
+    no_ktp = encrypted_field("_no_ktp")
+
+    def __init__(self, ciphertext: str):
+        self._no_ktp = ciphertext
+
+
+def run_scenario(mode: str, ciphertexts: list, read_field: bool, repeat: int) -> float:
+    service = encryption.encryption_service
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if mode == "eager":
+            rows = [EagerRow(c, service) for c in ciphertexts]
+        else:
+            rows = [LazyRow(c) for c in ciphertexts]
+        if read_field:
+            for row in rows:
+                row.no_ktp
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dekripsi field eager vs lazy + LRU")
+    parser.add_argument("--rows", type=int, default=5000, help="Jumlah pelanggan per request")
+    parser.add_argument("--repeat", type=int, default=5, help="Jumlah request berulang per skenario")
+    args = parser.parse_args()
+
+    service = EncryptionService()
+    encryption.encryption_service = service  # encrypted_field membaca global ini
+    ciphertexts = [service.encrypt(f"{3201000000000000 + i}") for i in range(args.rows)]
+
+    scenarios = [
+        ("list pelanggan", True),
+        ("list langganan/invoice", False),
+        ("export CSV", True),
+    ]
+
+    print(f"{args.rows} pelanggan per request, {args.repeat} request per skenario\n")
+    for name, read_field in scenarios:
+        eager_ms = run_scenario("eager", ciphertexts, read_field, args.repeat)
+        # Cache dikosongkan per skenario supaya request pertama tetap bayar dekripsi penuh
+        service._decrypt_cache.clear()
+        lazy_ms = run_scenario("lazy", ciphertexts, read_field, args.repeat)
+        print(
+            f"[{name:>22}] eager {eager_ms / args.repeat:8.1f} ms/request | "
+            f"lazy {lazy_ms / args.repeat:8.1f} ms/request | "
+            f"{eager_ms / lazy_ms if lazy_ms else float('inf'):5.1f}x"
+        )
+
+    stats = service.get_decrypt_cache_stats()
+    print(f"\nLRU: {stats['entries']}/{stats['max_entries']} entry, hit ratio {stats['hit_ratio']}")
+
+
+if __name__ == "__main__":
+    main()
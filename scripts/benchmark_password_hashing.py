@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK LOGIN - bcrypt di event loop vs pool hashing
+
+Simulasi lonjakan login (misal pergantian shift): N login bersamaan, masing-masing
+satu verify bcrypt. Sambil jalan, task "heartbeat" tidur 50 ms berulang-ulang dan
+mencatat keterlambatannya - ini yang dirasakan websocket heartbeat & request lain.
+
+Mode:
+- inline : verify_password dipanggil langsung di coroutine (perilaku lama)
+- pool   : lewat password_hasher.run (perilaku baru)
+
+Usage:
+    python scripts/benchmark_password_hashing.py --logins 50 --rounds 12 --workers 4
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from passlib.context import CryptContext
+
+from app.services.password_hasher import PasswordHasherPool, percentile
+
+HEARTBEAT_INTERVAL = 0.05
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    """Catat seberapa telat event loop membangunkan sleep 50 ms."""
+    while not stop.is_set():
+        expected = time.perf_counter() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(max(0.0, (time.perf_counter() - expected) * 1000))
+
+
+async def run_mode(mode: str, context: CryptContext, hashed: str, logins: int, workers: int) -> dict:
+    pool = PasswordHasherPool(max_workers=workers, max_queue=0)
+
+    async def login() -> float:
+        started = time.perf_counter()
+        if mode == "inline":
+            context.verify("password123", hashed)
+        else:
+            await pool.run(context.verify, "password123", hashed)
+        return (time.perf_counter() - started) * 1000
+
+    stop = asyncio.Event()
+    lags: list = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)  # Baseline heartbeat
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(login() for _ in range(logins)))
+    total = time.perf_counter() - started
+
+    stop.set()
+    await beat
+    pool.shutdown()
+    return {
+        "mode": mode,
+        "total_s": round(total, 2),
+        "login_p50_ms": percentile(latencies, 50),
+        "login_p99_ms": percentile(latencies, 99),
+        "heartbeat_lag_max_ms": round(max(lags), 2) if lags else 0.0,
+        "heartbeat_lag_p99_ms": percentile(lags, 99),
+        "pool": pool.get_stats() if mode == "pool" else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark login bcrypt inline vs pool hashing")
+    parser.add_argument("--logins", type=int, default=50, help="Jumlah login bersamaan")
+    parser.add_argument("--rounds", type=int, default=12, help="Cost bcrypt")
+    parser.add_argument("--workers", type=int, default=4, help="Worker pool hashing")
+    args = parser.parse_args()
+
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds, bcrypt__ident="2b")
+    hashed = context.hash("password123")
+
+    print(f"{args.logins} login bersamaan, bcrypt cost {args.rounds}, {args.workers} worker\n")
+    for mode in ("inline", "pool"):
+        result = await run_mode(mode, context, hashed, args.logins, args.workers)
+        print(
+            f"[{result['mode']:>6}] total {result['total_s']}s | "
+            f"login p50 {result['login_p50_ms']} ms, p99 {result['login_p99_ms']} ms | "
+            f"heartbeat lag p99 {result['heartbeat_lag_p99_ms']} ms, max {result['heartbeat_lag_max_ms']} ms"
+        )
+        if result["pool"]:
+            print(f"         queue p99 {result['pool']['queue_ms']['p99']} ms, run p99 {result['pool']['run_ms']['p99']} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+import pytest
+
+from app.services import ip_pool_allocator as ip_pool_module
+from app.services.ip_pool_allocator import ServerPool, int_to_ip, ip_to_int
+
+
+@pytest.fixture(autouse=True)
+def pool_settings(monkeypatch):
+    monkeypatch.setattr(ip_pool_module.settings, "IP_POOL_DEFAULT_PREFIX", 24)
+    monkeypatch.setattr(ip_pool_module.settings, "IP_POOL_RESERVED_HOSTS", 1)
+
+
+def _pool(cidrs=("10.0.0.0/29",)):
+    pool = ServerPool(1, "MKT-TEST", cidrs)
+    pool.rebuild()
+    return pool
+
+
+def _next_ip(pool):
+    ip = pool.next_free()
+    return int_to_ip(ip) if ip is not None else None
+
+
+@pytest.mark.unit
+def test_ip_to_int_rejects_invalid():
+    assert ip_to_int(" 10.0.0.5 ") == 167772165
+    assert ip_to_int("10.0.0.256") is None
+    assert ip_to_int("") is None
+    assert ip_to_int(None) is None
+
+
+@pytest.mark.unit
+def test_next_free_skips_network_and_gateway():
+    assert _next_ip(_pool()) == "10.0.0.2"
+
+
+@pytest.mark.unit
+def test_next_free_skips_used_and_reserved():
+    pool = _pool()
+    pool.set_db(ip_to_int("10.0.0.2"), 10, "PLG-001")
+    pool.router[ip_to_int("10.0.0.3")] = "budi"
+    pool.rebuild()
+    pool.reserve(ip_to_int("10.0.0.4"), ttl=60)
+
+    assert _next_ip(pool) == "10.0.0.5"
+
+    pool.release(ip_to_int("10.0.0.4"))
+    assert _next_ip(pool) == "10.0.0.4"
+
+
+@pytest.mark.unit
+def test_next_free_none_when_pool_full_and_never_broadcast():
+    pool = _pool()
+    for last_octet in range(2, 7):
+        pool.set_db(ip_to_int(f"10.0.0.{last_octet}"), last_octet, f"PLG-{last_octet}")
+
+    assert pool.next_free() is None
+    assert pool.get_stats()["free"] == 0
+
+    pool.remove_db(ip_to_int("10.0.0.6"))
+    assert _next_ip(pool) == "10.0.0.6"
+
+
+@pytest.mark.unit
+def test_ip_in_two_sources_stays_used_until_both_release():
+    pool = _pool()
+    ip = ip_to_int("10.0.0.2")
+    pool.set_db(ip, 10, "PLG-001")
+    pool.reserve(ip, ttl=60)
+
+    pool.release(ip)
+    assert _next_ip(pool) == "10.0.0.3"
+
+    pool.remove_db(ip)
+    assert _next_ip(pool) == "10.0.0.2"
+
+
+@pytest.mark.unit
+def test_next_free_moves_to_next_configured_network():
+    pool = _pool(("10.0.0.0/30", "10.0.1.0/29"))
+    # /30: network, gateway, broadcast -> sisa satu host
+    pool.set_db(ip_to_int("10.0.0.2"), 10, "PLG-001")
+
+    assert _next_ip(pool) == "10.0.1.2"
+
+
+@pytest.mark.unit
+def test_without_cidrs_pool_is_network_of_used_ips():
+    pool = ServerPool(1, "MKT-TEST")
+    pool.set_db(ip_to_int("192.168.5.20"), 10, "PLG-001")
+    pool.rebuild()
+
+    assert [str(network) for network in pool.networks] == ["192.168.5.0/24"]
+    assert _next_ip(pool) == "192.168.5.2"
+    assert pool.covers(ip_to_int("192.168.5.254"))
+    assert not pool.covers(ip_to_int("192.168.6.1"))
@@ -0,0 +1,77 @@
+import dataclasses
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth as auth_module
+from app.auth import create_access_token, get_current_active_user, has_permission
+from app.models.permission import Permission
+from app.models.role import Role
+from app.models.user import User
+from app.services.principal_cache import Principal, PrincipalCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+    monkeypatch.setattr(auth_module, "principal_cache", cache)
+    return cache
+
+
+async def _seed_admin(db):
+    permission = Permission(id=1, name="view_dashboard")
+    db.add(Role(id=1, name="admin", permissions=[permission]))
+    db.add(User(id=1, name="Admin", email="admin@example.com", _password="hash", role_id=1))
+    await db.commit()
+
+
+async def _authenticate(db):
+    token = create_access_token({"sub": "1"})
+    return await get_current_active_user(SimpleNamespace(state=SimpleNamespace()), token=token, db=db)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_cache_hit_survives_rollback_of_populating_session(db_session, cache):
+    await _seed_admin(db_session)
+    first = await _authenticate(db_session)
+
+    # Request yang mengisi cache lalu rollback (error handler router)
+    await db_session.rollback()
+
+    second = await _authenticate(db_session)
+    assert second is first
+    assert cache.hits == 1
+    assert second.role.name == "admin"
+    assert [p.name for p in second.role.permissions] == ["view_dashboard"]
+    await has_permission("view_dashboard")(current_user=second)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_principal_is_read_only_snapshot(db_session, cache):
+    await _seed_admin(db_session)
+    principal = await _authenticate(db_session)
+
+    assert isinstance(principal, Principal)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        principal.name = "Bukan Admin"
+
+    with pytest.raises(HTTPException) as exc_info:
+        await has_permission("delete_user")(current_user=principal)
+    assert exc_info.value.status_code == 403
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_invalidate_user_reloads_principal(db_session, cache):
+    await _seed_admin(db_session)
+    first = await _authenticate(db_session)
+
+    cache.invalidate_user(1)
+    second = await _authenticate(db_session)
+
+    assert second is not first
+    assert second == first
+    assert cache.misses == 2
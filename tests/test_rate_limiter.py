@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.services import rate_limiter as rate_limiter_module
+from app.services.rate_limiter import AsyncTokenBucket
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """time.monotonic palsu; asyncio.sleep di rate_limiter memajukan jam tanpa benar-benar tidur."""
+    clock = {"now": 1000.0, "slept": []}
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        clock["slept"].append(round(delay, 6))
+        clock["now"] += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: clock["now"])
+    monkeypatch.setattr(rate_limiter_module.asyncio, "sleep", fake_sleep)
+    return clock
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_burst_is_served_without_waiting(fake_clock):
+    bucket = AsyncTokenBucket(rate=2, capacity=3)
+
+    waits = [await bucket.acquire() for _ in range(3)]
+
+    assert waits == [0.0, 0.0, 0.0]
+    assert fake_clock["slept"] == []
+    assert bucket.throttled == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_empty_bucket_waits_for_next_token(fake_clock):
+    bucket = AsyncTokenBucket(rate=2, capacity=1)
+    await bucket.acquire()
+
+    waited = await bucket.acquire()
+
+    assert waited == pytest.approx(0.5)
+    assert bucket.throttled == 1
+    assert bucket.acquired == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_refill_is_capped_at_capacity(fake_clock):
+    bucket = AsyncTokenBucket(rate=5, capacity=3)
+    await bucket.acquire()
+    fake_clock["now"] += 100
+
+    assert bucket.snapshot()["tokens_available"] == 3
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_penalize_delays_next_acquire(fake_clock):
+    bucket = AsyncTokenBucket(rate=2, capacity=5)
+    bucket.penalize(2.0)
+
+    waited = await bucket.acquire()
+
+    # Bucket dikosongkan lalu minus 2 detik token (4 token) + 1 token yang diminta
+    assert waited == pytest.approx(2.5)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_concurrent_callers_are_spaced_by_rate(fake_clock):
+    bucket = AsyncTokenBucket(rate=1, capacity=1)
+
+    waits = await asyncio.gather(*(bucket.acquire() for _ in range(4)))
+
+    assert waits == [0.0, pytest.approx(1.0), pytest.approx(1.0), pytest.approx(1.0)]
+    assert fake_clock["now"] == pytest.approx(1003.0)
+    assert bucket.snapshot()["throttled"] == 3
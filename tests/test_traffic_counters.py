@@ -0,0 +1,81 @@
+import pytest
+
+from app.services.traffic_counters import CounterDeltaTracker, CounterReading
+
+KEY = (1, "budi")
+
+
+def _reading(rx, tx, at, uptime=0):
+    return CounterReading(rx_bytes=rx, tx_bytes=tx, uptime_seconds=uptime, observed_at=at)
+
+
+@pytest.mark.unit
+def test_first_sample_is_baseline():
+    tracker = CounterDeltaTracker()
+    assert tracker.observe(KEY, _reading(1000, 500, at=100.0)) is None
+    assert len(tracker) == 1
+
+
+@pytest.mark.unit
+def test_rate_from_counter_delta():
+    tracker = CounterDeltaTracker()
+    tracker.observe(KEY, _reading(0, 0, at=100.0, uptime=600))
+    rates = tracker.observe(KEY, _reading(10_000_000, 2_500_000, at=110.0, uptime=610))
+
+    assert rates.interval_seconds == 10.0
+    assert rates.rx_mbps == pytest.approx(8.0)
+    assert rates.tx_mbps == pytest.approx(2.0)
+    assert rates.total_mbps == pytest.approx(10.0)
+    assert not rates.counter_reset
+
+
+@pytest.mark.unit
+def test_interval_below_minimum_is_skipped():
+    tracker = CounterDeltaTracker(min_interval=5.0)
+    tracker.observe(KEY, _reading(0, 0, at=100.0))
+    assert tracker.observe(KEY, _reading(1000, 1000, at=102.0)) is None
+
+
+@pytest.mark.unit
+def test_counter_wrap_uses_counter_since_session_start():
+    # Counter turun (wrap / reconnect) - rate dihitung dari counter sekarang selama uptime
+    tracker = CounterDeltaTracker()
+    tracker.observe(KEY, _reading(50_000_000, 50_000_000, at=100.0, uptime=3600))
+    rates = tracker.observe(KEY, _reading(5_000_000, 1_000_000, at=160.0, uptime=20))
+
+    assert rates.counter_reset
+    assert rates.interval_seconds == 20.0
+    assert rates.rx_mbps == pytest.approx(2.0)
+    assert rates.tx_mbps == pytest.approx(0.4)
+    assert tracker.resets_detected == 1
+
+
+@pytest.mark.unit
+def test_reset_detected_from_uptime_even_if_counter_grew():
+    # Reconnect dengan traffic lebih besar dari counter lama: uptime < jarak sample
+    tracker = CounterDeltaTracker()
+    tracker.observe(KEY, _reading(1_000, 1_000, at=100.0, uptime=500))
+    rates = tracker.observe(KEY, _reading(10_000_000, 10_000_000, at=160.0, uptime=10))
+
+    assert rates.counter_reset
+    assert rates.interval_seconds == 10.0
+    assert rates.rx_mbps == pytest.approx(8.0)
+
+
+@pytest.mark.unit
+def test_reset_without_uptime_gives_no_rate():
+    tracker = CounterDeltaTracker()
+    tracker.observe(KEY, _reading(5_000, 5_000, at=100.0))
+    assert tracker.observe(KEY, _reading(100, 100, at=110.0)) is None
+    assert tracker.resets_detected == 1
+
+
+@pytest.mark.unit
+def test_prune_drops_inactive_sessions_on_server_only():
+    tracker = CounterDeltaTracker()
+    tracker.observe((1, "budi"), _reading(0, 0, at=100.0))
+    tracker.observe((1, "sari"), _reading(0, 0, at=100.0))
+    tracker.observe((2, "sari"), _reading(0, 0, at=100.0))
+
+    assert tracker.prune(1, ["budi"]) == 1
+    assert len(tracker) == 2
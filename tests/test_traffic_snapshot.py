@@ -0,0 +1,90 @@
+import pytest
+
+from app.services.traffic_snapshot import RouterTrafficSnapshot, TrafficIndex, normalize_traffic_key, traffic_name
+
+
+def _snapshot(sessions, interfaces=(), simple_queue=()):
+    snapshot = RouterTrafficSnapshot(active_sessions=list(sessions), counters_at=1000.0)
+    snapshot.index_sessions()
+    snapshot.interfaces = TrafficIndex(interfaces, ("name",))
+    snapshot.simple_queue = TrafficIndex(simple_queue, ("name", "target"))
+    return snapshot
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("<pppoe-Budi_01>", "budi01"),
+        ("budi-01", "budi01"),
+        ("  BUDI_01 ", "budi01"),
+        ("", ""),
+        (None, ""),
+    ],
+)
+def test_normalize_traffic_key(name, expected):
+    assert normalize_traffic_key(name) == expected
+
+
+@pytest.mark.unit
+def test_traffic_name_only_strips_pppoe_wrapper():
+    assert traffic_name("<pppoe-Budi_01>") == "Budi_01"
+    assert traffic_name("<PPPOE-a-b1>") == "a-b1"
+    assert traffic_name("a-b1") == "a-b1"
+
+
+@pytest.mark.unit
+def test_normalized_key_collides_for_different_usernames():
+    assert normalize_traffic_key("a-b1") == normalize_traffic_key("ab_1")
+
+
+@pytest.mark.unit
+def test_index_prefers_exact_name():
+    index = TrafficIndex([{"name": "<pppoe-a-b1>", "id": 1}, {"name": "<pppoe-ab_1>", "id": 2}])
+    assert [row["id"] for row in index.get("a-b1")] == [1]
+    assert [row["id"] for row in index.get("ab_1")] == [2]
+
+
+@pytest.mark.unit
+def test_index_loose_fallback_only_when_unambiguous():
+    index = TrafficIndex([{"name": "<pppoe-Budi_01>", "id": 1}])
+    assert [row["id"] for row in index.get("budi-01")] == [1]
+    assert index.get("budi-01", allow_loose=False) == []
+
+    ambiguous = TrafficIndex([{"name": "<pppoe-a-b1>", "id": 1}, {"name": "<pppoe-ab_1>", "id": 2}])
+    assert ambiguous.get("AB1") == []
+
+
+@pytest.mark.unit
+def test_counters_not_charged_to_colliding_session():
+    snapshot = _snapshot(
+        [{"name": "a-b1"}, {"name": "ab_1"}],
+        interfaces=[{"name": "<pppoe-ab_1>", "type": "pppoe-in", "tx-byte": "100", "rx-byte": "50"}],
+    )
+    assert snapshot.counters("a-b1") is None
+
+    reading = snapshot.counters("ab_1")
+    assert reading.rx_bytes == 100
+    assert reading.tx_bytes == 50
+
+
+@pytest.mark.unit
+def test_counters_loose_fallback_for_single_session():
+    snapshot = _snapshot(
+        [{"name": "Budi"}],
+        interfaces=[{"name": "<pppoe-budi>", "type": "pppoe-in", "tx-byte": "7", "rx-byte": "3"}],
+    )
+    assert snapshot.counters("Budi").rx_bytes == 7
+
+
+@pytest.mark.unit
+def test_resolve_simple_queue_by_target_ip():
+    snapshot = _snapshot(
+        [{"name": "budi", "address": "10.0.0.5"}],
+        simple_queue=[{"name": "queue-budi-lama", "target": "10.0.0.5/32", "rate": "1000/4000", "bytes": "10/20"}],
+    )
+    data = snapshot.resolve("budi", "10.0.0.5")
+    assert data["source"] == "simple_queue"
+    assert data["tx_bps"] == 1000
+    assert data["rx_bps"] == 4000
+    assert data["bytes_total"] == 30
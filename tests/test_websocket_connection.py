@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from app.services import websocket_connection as websocket_connection_module
+from app.services.websocket_connection import WebSocketConnection
+
+
+class FakeWebSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.closed = None
+        self.fail = fail
+
+    async def send_text(self, message):
+        if self.fail:
+            raise RuntimeError("socket putus")
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+@pytest.fixture(autouse=True)
+def queue_settings(monkeypatch):
+    monkeypatch.setattr(websocket_connection_module.settings, "WEBSOCKET_SEND_QUEUE_SIZE", 3)
+    monkeypatch.setattr(websocket_connection_module.settings, "WEBSOCKET_SEND_TIMEOUT_SECONDS", 1.0)
+
+
+def _connection(websocket, errors=None, metrics=None):
+    async def on_error(connection):
+        if errors is not None:
+            errors.append(connection.id)
+        await connection.close(code=1011)
+
+    return WebSocketConnection(websocket, user_id=7, on_error=on_error, metrics=metrics)
+
+
+async def _drain():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_coalesced_message_keeps_position_with_latest_payload():
+    websocket = FakeWebSocket()
+    metrics = {}
+    connection = _connection(websocket, metrics=metrics)
+
+    connection.enqueue("snapshot-1", coalesce_key="dashboard")
+    connection.enqueue("notif-a")
+    connection.enqueue("snapshot-2", coalesce_key="dashboard")
+    assert connection.queued == 2
+
+    connection.start()
+    await _drain()
+
+    assert websocket.sent == ["snapshot-2", "notif-a"]
+    assert connection.coalesced == 1
+    assert metrics == {"messages_coalesced": 1, "messages_sent": 2}
+    await connection.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_sent_message_is_not_coalesced_again():
+    websocket = FakeWebSocket()
+    connection = _connection(websocket)
+    connection.start()
+
+    connection.enqueue("ping-1", coalesce_key="ping")
+    await _drain()
+    connection.enqueue("ping-2", coalesce_key="ping")
+    await _drain()
+
+    assert websocket.sent == ["ping-1", "ping-2"]
+    assert connection.coalesced == 0
+    await connection.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_full_queue_drops_oldest_message():
+    websocket = FakeWebSocket()
+    metrics = {}
+    connection = _connection(websocket, metrics=metrics)
+
+    connection.enqueue("ping-1", coalesce_key="ping")
+    for message in ("a", "b", "c"):
+        connection.enqueue(message)
+    # "ping-1" sudah dibuang, jadi ping berikutnya masuk sebagai pesan baru
+    connection.enqueue("ping-2", coalesce_key="ping")
+
+    connection.start()
+    await _drain()
+
+    assert websocket.sent == ["b", "c", "ping-2"]
+    assert connection.dropped == 2
+    assert metrics["messages_dropped"] == 2
+    assert "messages_coalesced" not in metrics
+    await connection.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_send_error_calls_on_error():
+    websocket = FakeWebSocket(fail=True)
+    errors = []
+    metrics = {}
+    connection = _connection(websocket, errors=errors, metrics=metrics)
+    connection.start()
+
+    connection.enqueue("a")
+    await _drain()
+
+    assert errors == [connection.id]
+    assert metrics == {"messages_failed": 1}
+    assert websocket.closed == (1011, "")
+    assert not connection.is_open
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_close_stops_writer_and_rejects_new_messages():
+    websocket = FakeWebSocket()
+    connection = _connection(websocket)
+    connection.enqueue("a")
+    connection.start()
+    task = connection._task
+
+    await connection.close(code=1001, reason="shutdown")
+    await connection.close()
+
+    assert task.done()
+    assert websocket.closed == (1001, "shutdown")
+    assert connection.enqueue("b") is False
+    assert connection.queued == 0